@@ -0,0 +1,301 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+FastMCP server 的准入控制和按客户端限流
+
+server 原先接受任意数量的并发会话和工具调用，一波聊天流量就能耗尽 socket、在 wttr.in 前堆满请求。
+AdmissionMiddleware 在工具执行之前依次检查：
+1. 令牌桶限流：每个客户端 rate 次/秒，允许 burst 次突发，超出时立即返回限流错误
+2. 并发上限：每个客户端、每个工具各有同时执行的调用数上限
+3. 有界排队：达到并发上限的调用最多排队 max_queue 个、最多等 queue_timeout 秒，
+   队列已满或等待超时时立即返回"服务繁忙"错误，而不是无限等待
+被限流的请求返回 JSON-RPC 错误（code -32000），error.data 中带 {"status": 429, "reason": ..., "retry_after": 秒}；
+排队已满或超时的工具调用（AdmissionError，status 503）由 FastMCP 转成 isError 的工具结果，文本说明原因。
+
+客户端标识取对端 IP；内存传输下为 "local"。X-Client-Id 请求头由客户端自己设置，直连时每次换一个值就能绕过限流，
+所以只在对端是 MCP_TRUSTED_PROXIES 中的反向代理时才使用（没有时取 X-Forwarded-For 中代理追加的地址）。
+跟踪的客户端数超过 max_clients 时先淘汰最久未使用的空闲客户端，都不空闲时也淘汰最久未使用的
+（它正在执行的调用照常结束），内存占用有上限。
+指标（tracing.metrics）：按工具的 admission_in_flight / admission_queue_depth 仪表盘、
+admission_clients（跟踪中的客户端数）和 admission_rejections_total（按 reason 和 tool 的计数）。
+客户端数量不固定，不按客户端输出指标。
+
+HTTP 连接数由 uvicorn 的 limit_concurrency 限制（超出时直接返回 503），见 http_limits()。
+
+环境变量（均为可选）：
+    MCP_RATE_LIMIT           每个客户端每秒的请求数，默认 100，0 表示不限流
+    MCP_RATE_BURST           令牌桶容量，默认 2 倍 MCP_RATE_LIMIT
+    MCP_CLIENT_CONCURRENCY   每个客户端同时执行的工具调用数，默认 32
+    MCP_TOOL_CONCURRENCY     各工具同时执行的调用数，默认 "get_weather=20,calculate_bmi_batch=4"，空字符串表示不限制
+    MCP_QUEUE_SIZE           每个并发上限的排队长度，默认 64
+    MCP_QUEUE_TIMEOUT        排队最长等待时间（秒），默认 5
+    MCP_MAX_CONNECTIONS      uvicorn 的并发连接上限，默认 1000
+    MCP_TRUSTED_PROXIES      可信反向代理的 IP（逗号分隔），来自这些地址的请求按 X-Client-Id / X-Forwarded-For 区分客户端
+"""
+
+import asyncio
+import contextlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, FrozenSet, Iterable, Optional
+
+from fastmcp.server.middleware import Middleware, MiddlewareContext
+from mcp import McpError
+from mcp.types import ErrorData
+
+from tracing import metrics
+
+# 同时保留状态的客户端数上限，超出时优先丢弃最久未使用且空闲的客户端
+MAX_TRACKED_CLIENTS = 10000
+
+# 默认值，AdmissionMiddleware() 和 from_env() 共用
+DEFAULT_RATE_LIMIT = 100.0
+DEFAULT_CLIENT_CONCURRENCY = 32
+DEFAULT_TOOL_CONCURRENCY: Dict[str, int] = {"get_weather": 20, "calculate_bmi_batch": 4}
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_QUEUE_TIMEOUT = 5.0
+DEFAULT_MAX_CONNECTIONS = 1000
+
+
+class AdmissionError(McpError):
+    """请求被限流或因过载被拒绝"""
+
+    def __init__(self, message: str, status: int, reason: str, retry_after: float):
+        super().__init__(ErrorData(
+            code=-32000,
+            message=message,
+            data={"status": status, "reason": reason, "retry_after": round(retry_after, 3)},
+        ))
+
+
+class TokenBucket:
+    """令牌桶：容量 capacity，每秒补充 rate 个令牌"""
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def try_consume(self) -> float:
+        """取一个令牌，成功返回 0，否则返回需要等待的秒数"""
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class BoundedLimiter:
+    """
+    并发上限 + 有界等待队列
+
+    所有操作都在同一个事件循环里执行，计数不需要加锁
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    @property
+    def idle(self) -> bool:
+        return self.in_flight == 0 and self.waiting == 0
+
+    def _report(self, labels: Optional[Dict[str, str]]):
+        if labels is None:
+            return
+        metrics.set_gauge("admission_in_flight", self.in_flight, labels)
+        metrics.set_gauge("admission_queue_depth", self.waiting, labels)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, labels: Optional[Dict[str, str]] = None) -> AsyncIterator[None]:
+        """占用一个执行名额，队列已满或等待超时时抛出 AdmissionError；labels 为 None 时不记录仪表盘"""
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                raise AdmissionError(f"{self.name} 繁忙，排队已满", 503, "queue_full", self.queue_timeout)
+            self.waiting += 1
+            self._report(labels)
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise AdmissionError(
+                    f"{self.name} 繁忙，排队超过 {self.queue_timeout:g} 秒", 503, "queue_timeout", self.queue_timeout
+                ) from None
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        self._report(labels)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+            self._report(labels)
+
+
+class _ClientState:
+    def __init__(self, bucket: Optional[TokenBucket], limiter: BoundedLimiter):
+        self.bucket = bucket
+        self.limiter = limiter
+
+
+def client_id(context: MiddlewareContext, trusted_proxies: FrozenSet[str] = frozenset()) -> str:
+    """
+    对端 IP；对端是可信代理时取代理转发的 X-Client-Id，没有时取 X-Forwarded-For 的最后一个地址。
+    不是 HTTP 传输时为 local
+    """
+    request = None
+    if context.fastmcp_context is not None:
+        try:
+            request = context.fastmcp_context.request_context.request
+        except ValueError:
+            request = None
+    if request is None or not hasattr(request, "headers"):
+        return "local"
+    peer = request.client.host if request.client else "unknown"
+    if peer in trusted_proxies:
+        explicit = request.headers.get("x-client-id")
+        if explicit:
+            return explicit[:64]
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[-1].strip()[:64] or peer
+    return peer
+
+
+class AdmissionMiddleware(Middleware):
+    """
+    server 端的限流和准入控制
+
+    使用示例：
+        mcp.add_middleware(AdmissionMiddleware())  # 默认值与 from_env() 相同，见 DEFAULT_* 常量
+        mcp.add_middleware(AdmissionMiddleware(rate=20, tool_concurrency={"get_weather": 10}))
+    """
+
+    def __init__(
+        self,
+        rate: float = DEFAULT_RATE_LIMIT,
+        burst: Optional[float] = None,
+        client_concurrency: int = DEFAULT_CLIENT_CONCURRENCY,
+        tool_concurrency: Optional[Dict[str, int]] = None,
+        max_queue: int = DEFAULT_QUEUE_SIZE,
+        queue_timeout: float = DEFAULT_QUEUE_TIMEOUT,
+        trusted_proxies: Iterable[str] = (),
+        max_clients: int = MAX_TRACKED_CLIENTS,
+    ):
+        """
+        Args:
+            rate: 每个客户端每秒的请求数，<= 0 表示不限流
+            burst: 令牌桶容量（允许的突发请求数），默认 2 * rate
+            client_concurrency: 每个客户端同时执行的工具调用数
+            tool_concurrency: 各工具同时执行的调用数，未列出的工具不限制；None 表示 DEFAULT_TOOL_CONCURRENCY
+            max_queue: 每个并发上限前最多排队的调用数
+            queue_timeout: 排队最长等待时间（秒）
+            trusted_proxies: 可信反向代理的 IP，只有来自这些地址的请求才按 X-Client-Id 区分客户端
+            max_clients: 同时保留状态的客户端数上限
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, 2 * rate)
+        self.client_concurrency = client_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.tool_limiters = {
+            name: BoundedLimiter(f"工具 {name}", limit, max_queue, queue_timeout)
+            for name, limit in (DEFAULT_TOOL_CONCURRENCY if tool_concurrency is None else tool_concurrency).items()
+        }
+        self.trusted_proxies = frozenset(trusted_proxies)
+        self.max_clients = max(1, max_clients)
+        self._clients: "OrderedDict[str, _ClientState]" = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> "AdmissionMiddleware":
+        """根据环境变量创建中间件"""
+        rate = float(os.getenv("MCP_RATE_LIMIT", DEFAULT_RATE_LIMIT))
+        burst = os.getenv("MCP_RATE_BURST")
+        tool_concurrency = None
+        configured = os.getenv("MCP_TOOL_CONCURRENCY")
+        if configured is not None:
+            tool_concurrency = {}
+            for item in configured.split(","):
+                if "=" in item:
+                    name, limit = item.split("=", 1)
+                    tool_concurrency[name.strip()] = int(limit)
+        return cls(
+            rate=rate,
+            burst=float(burst) if burst else None,
+            client_concurrency=int(os.getenv("MCP_CLIENT_CONCURRENCY", DEFAULT_CLIENT_CONCURRENCY)),
+            tool_concurrency=tool_concurrency,
+            max_queue=int(os.getenv("MCP_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)),
+            queue_timeout=float(os.getenv("MCP_QUEUE_TIMEOUT", DEFAULT_QUEUE_TIMEOUT)),
+            trusted_proxies=[ip.strip() for ip in os.getenv("MCP_TRUSTED_PROXIES", "").split(",") if ip.strip()],
+        )
+
+    def _client(self, key: str) -> _ClientState:
+        state = self._clients.get(key)
+        if state is not None:
+            self._clients.move_to_end(key)
+            return state
+        if len(self._clients) >= self.max_clients:
+            victim = next((old_key for old_key, old in self._clients.items() if old.limiter.idle), None)
+            # 都不空闲时淘汰最久未使用的：它正在执行的调用持有自己的 limiter，照常结束
+            self._clients.pop(victim if victim is not None else next(iter(self._clients)))
+        bucket = TokenBucket(self.rate, self.burst) if self.rate > 0 else None
+        state = _ClientState(
+            bucket, BoundedLimiter(f"客户端 {key}", self.client_concurrency, self.max_queue, self.queue_timeout)
+        )
+        self._clients[key] = state
+        metrics.set_gauge("admission_clients", len(self._clients))
+        return state
+
+    async def on_request(self, context: MiddlewareContext, call_next):
+        """所有请求都先经过令牌桶"""
+        state = self._client(client_id(context, self.trusted_proxies))
+        if state.bucket is not None:
+            retry_after = state.bucket.try_consume()
+            if retry_after:
+                metrics.inc("admission_rejections_total", labels={"reason": "rate_limited", "tool": "-"})
+                raise AdmissionError(
+                    f"请求过于频繁，请 {max(retry_after, 0.01):.2f} 秒后重试", 429, "rate_limited", retry_after
+                )
+        return await call_next(context)
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        """工具调用先占用客户端名额，再占用该工具的名额"""
+        tool_name = context.message.name
+        key = client_id(context, self.trusted_proxies)
+        state = self._client(key)
+        tool_limiter = self.tool_limiters.get(tool_name)
+        try:
+            async with state.limiter.slot():
+                if tool_limiter is None:
+                    return await call_next(context)
+                async with tool_limiter.slot({"tool": tool_name}):
+                    return await call_next(context)
+        except AdmissionError as e:
+            metrics.inc("admission_rejections_total", labels={"reason": e.error.data["reason"], "tool": tool_name})
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self._clients),
+            "tools": {
+                name: {"in_flight": limiter.in_flight, "waiting": limiter.waiting}
+                for name, limiter in self.tool_limiters.items()
+            },
+        }
+
+
+def http_limits() -> Dict[str, Any]:
+    """uvicorn 的连接数上限：超过 MCP_MAX_CONNECTIONS 个并发连接时直接返回 503"""
+    return {"limit_concurrency": int(os.getenv("MCP_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS))}
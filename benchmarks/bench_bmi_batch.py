@@ -0,0 +1,79 @@
+"""
+calculate_bmi 逐条调用 vs calculate_bmi_batch 一次调用
+
+使用方法：python benchmarks/bench_bmi_batch.py [--rows 100000] [--single-calls 100000] [--concurrency 50]
+
+在本地启动 fastmcp_server_streamhttp.py 的 server，用 SimpleMCPClient（会话池）：
+- single: 逐条调用 calculate_bmi，single-calls 次（默认与 rows 相同，10 万次需要几分钟）
+- batch:  一次调用 calculate_bmi_batch 计算 rows 条记录
+输出总耗时和每条记录的平均耗时；single-calls 小于 rows 时按单次平均耗时折算 rows 条的总耗时。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from local_server import LocalMCPServer
+
+import fastmcp_server_streamhttp
+from simple_mcp_client import SimpleMCPClient
+
+
+async def run_single(client: SimpleMCPClient, weights, heights, calls: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            result = await client.call_tool("calculate_bmi", {"weight_kg": weights[i], "height_m": heights[i]})
+            assert result["success"], result["error"]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return time.perf_counter() - start
+
+
+async def run_batch(client: SimpleMCPClient, weights, heights) -> float:
+    start = time.perf_counter()
+    result = await client.call_tool("calculate_bmi_batch", {"weights_kg": weights, "heights_m": heights})
+    elapsed = time.perf_counter() - start
+    assert result["success"], result["error"]
+    payload = json.loads(result["result"])
+    assert payload["count"] == len(weights) and payload["valid"] == len(weights), payload["errors"][:3]
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="calculate_bmi 逐条调用 vs 批量调用")
+    parser.add_argument("--rows", type=int, default=100000, help="批量调用的记录数")
+    parser.add_argument("--single-calls", type=int, help="逐条调用的次数，默认与 rows 相同")
+    parser.add_argument("--concurrency", type=int, default=50, help="逐条调用的并发数")
+    args = parser.parse_args()
+    single_calls = min(args.single_calls or args.rows, args.rows)
+
+    rng = random.Random(0)
+    weights = [round(rng.uniform(40, 120), 1) for _ in range(args.rows)]
+    heights = [round(rng.uniform(1.4, 2.0), 2) for _ in range(args.rows)]
+
+    with LocalMCPServer(fastmcp_server_streamhttp.mcp, path="/my-custom-path/") as server:
+        async with SimpleMCPClient(server.url) as client:
+            # SimpleMCPClient 会打印每次调用的原始结果，这里屏蔽掉以免影响计时
+            with contextlib.redirect_stdout(io.StringIO()):
+                batch = await run_batch(client, weights, heights)
+                single = await run_single(client, weights, heights, single_calls, args.concurrency)
+
+    per_row = single / single_calls
+    print(f"[single] {single_calls} 次调用 {single:8.2f}s  每条 {per_row * 1e6:8.1f}us"
+          + (f"  折算 {args.rows} 条约 {per_row * args.rows:.1f}s" if single_calls < args.rows else ""))
+    print(f"[batch ] 1 次调用 {args.rows} 条 {batch:8.2f}s  每条 {batch / args.rows * 1e6:8.1f}us")
+    print(f"加速比约 {per_row * args.rows / batch:.0f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
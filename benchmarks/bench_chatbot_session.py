@@ -0,0 +1,77 @@
+"""
+聊天机器人每轮 MCP 开销对比：每次调用新建连接 vs 长连接会话
+
+使用方法：python benchmarks/bench_chatbot_session.py [--turns 50]
+
+在本地启动 fastmcp_server_streamhttp.py 的 server（streamable-http），
+模拟一轮对话中 MCP 侧的全部工作：list_tools + 调用 calculate_bmi + 调用 get_current_time。
+- baseline:   旧实现，每次 list_tools / call_tool 都 async with Client(url)
+- persistent: fastmcp_client_streamhttp_chatbot.MCPClient，复用 PersistentMCPSession
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from fastmcp import Client
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from local_server import LocalMCPServer
+
+# MCPClient 初始化时会创建 OpenAI 客户端，这里不会真正调用 LLM
+os.environ.setdefault("KIMI_API_KEY", "benchmark")
+
+import fastmcp_server_streamhttp
+from fastmcp_client_streamhttp_chatbot import MCPClient
+
+BMI_ARGS = {"weight_kg": 70, "height_m": 1.75}
+
+
+async def baseline_turn(url: str):
+    async with Client(url) as client:
+        await client.list_tools()
+    async with Client(url) as client:
+        await client.call_tool("calculate_bmi", BMI_ARGS)
+    async with Client(url) as client:
+        await client.call_tool("get_current_time", {})
+
+
+async def persistent_turn(chatbot: MCPClient):
+    await chatbot.get_mcp_tools()
+    await chatbot.mcp_session.call_tool("calculate_bmi", BMI_ARGS)
+    await chatbot.mcp_session.call_tool("get_current_time", {})
+
+
+async def measure(label: str, turn, turns: int):
+    samples = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        await turn()
+        samples.append((time.perf_counter() - start) * 1000)
+    ordered = sorted(samples)
+    print(
+        f"[{label:<10}] turns={turns} 首轮={samples[0]:7.1f}ms"
+        f" p50={statistics.median(samples):7.1f}ms"
+        f" p99={ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]:7.1f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="每轮 MCP 开销对比")
+    parser.add_argument("--turns", type=int, default=50, help="模拟的对话轮数")
+    args = parser.parse_args()
+
+    with LocalMCPServer(fastmcp_server_streamhttp.mcp, path="/my-custom-path/") as server:
+        await measure("baseline", lambda: baseline_turn(server.url), args.turns)
+
+        chatbot = MCPClient(server.url)
+        await measure("persistent", lambda: persistent_turn(chatbot), args.turns)
+        print(f"persistent 会话共握手 {chatbot.mcp_session.connect_count} 次")
+        await chatbot.clean()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,140 @@
+"""
+同步工具在事件循环 / 线程池 / 进程池中执行时，server 事件循环的延迟和其他会话的响应时间
+
+使用方法：python benchmarks/bench_event_loop_lag.py [--iterations 1000000] [--rows 20000] [--heavy-calls 20]
+                                                    [--concurrency 4] [--block-ms 50]
+
+在本进程的后台线程里启动 server（每个场景一个新的 FastMCP 实例和 tool_executor.ToolExecution），
+一个会话以固定并发反复调用重的工具，同时另一个会话逐个调用 get_current_time（代表其他用户的轻量请求）：
+- cpu:       纯 Python 计算、参数和结果都很小的工具（iterations 次循环），inline / thread / process
+- bmi_batch: calculate_bmi_batch（每次 rows 条记录），inline / thread / process。
+             计算本身只占一小部分，大部分时间花在 FastMCP 对参数的校验和结果的序列化上，这部分始终在事件循环里执行
+- blocking:  模拟同步 HTTP 请求的阻塞工具（time.sleep block-ms 毫秒），inline / thread
+输出重工具的吞吐、轻量请求的 p50 / p99 延迟，以及 tool_executor.loop_lag 测得的 server 事件循环延迟（p99 / 最大值）。
+客户端和 server 在同一个进程里，线程池场景下三者共享 GIL；进程池的工作进程在计时开始前预热。
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from local_server import LocalMCPServer
+
+from mcp_session import PersistentMCPSession
+from mcp_tools import create_mcp
+from tool_executor import ToolExecution, loop_lag
+
+
+def blocking_lookup(key: str, block_ms: float = 50.0) -> str:
+    """模拟用同步 HTTP 客户端查询外部服务的工具（阻塞 block_ms 毫秒）
+
+    Args:
+        key (str): 查询的键。
+        block_ms (float): 阻塞的毫秒数。
+
+    Returns:
+        str: 查询结果。
+    """
+    time.sleep(block_ms / 1000)
+    return f"{key}: ok"
+
+
+def cpu_burn(iterations: int = 1000000) -> int:
+    """模拟 CPU 密集的工具（纯 Python 循环）
+
+    Args:
+        iterations (int): 循环次数。
+
+    Returns:
+        int: 计算结果。
+    """
+    return sum(i * i for i in range(iterations)) % 1000003
+
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def run_scenario(label: str, policy: str, heavy_tool: str, heavy_args: dict, heavy_calls: int, concurrency: int):
+    execution = ToolExecution({name: policy for name in ("calculate_bmi_batch", "cpu_burn", "blocking_lookup")},
+                              process_workers=2)
+    mcp = create_mcp(tools=["calculate_bmi_batch", "get_current_time"], execution=execution)
+    mcp.tool(execution.wrap(cpu_burn))
+    mcp.tool(execution.wrap(blocking_lookup))
+    try:
+        with LocalMCPServer(mcp) as server:
+            heavy = PersistentMCPSession(server.url)
+            light = PersistentMCPSession(server.url)
+            # 预热：建立会话、启动事件循环延迟监测和工作进程
+            await asyncio.gather(heavy.call_tool(heavy_tool, heavy_args), light.call_tool("get_current_time", {}))
+            loop_lag.reset()
+
+            done = asyncio.Event()
+            light_samples = []
+
+            async def light_loop():
+                while not done.is_set():
+                    start = time.perf_counter()
+                    await light.call_tool("get_current_time", {})
+                    light_samples.append((time.perf_counter() - start) * 1000)
+                    await asyncio.sleep(0.01)
+
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def heavy_call():
+                async with semaphore:
+                    await heavy.call_tool(heavy_tool, heavy_args)
+
+            prober = asyncio.ensure_future(light_loop())
+            start = time.perf_counter()
+            await asyncio.gather(*(heavy_call() for _ in range(heavy_calls)))
+            wall = time.perf_counter() - start
+            done.set()
+            await prober
+            lag = loop_lag.stats()
+            print(
+                f"[{label:<16}] 重工具 {heavy_calls / wall:6.1f} 次/s | "
+                f"轻量请求 p50={statistics.median(light_samples):7.1f}ms p99={percentile(light_samples, 0.99):7.1f}ms "
+                f"(共 {len(light_samples)} 次) | 事件循环延迟 p99={lag['p99_ms']}ms max={lag['max_ms']}ms"
+            )
+            await asyncio.gather(heavy.close(), light.close())
+    finally:
+        execution.shutdown()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="同步工具的执行方式对事件循环延迟的影响")
+    parser.add_argument("--iterations", type=int, default=1000000, help="每次 cpu_burn 的循环次数")
+    parser.add_argument("--rows", type=int, default=20000, help="每次 calculate_bmi_batch 的记录数")
+    parser.add_argument("--heavy-calls", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--block-ms", type=float, default=50.0, help="阻塞工具每次阻塞的毫秒数")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    bmi_args = {
+        "weights_kg": [round(rng.uniform(40, 120), 1) for _ in range(args.rows)],
+        "heights_m": [round(rng.uniform(1.4, 2.0), 2) for _ in range(args.rows)],
+    }
+    print(f"cpu: cpu_burn {args.iterations} 次循环 x {args.heavy_calls}，并发 {args.concurrency}")
+    for policy in ("inline", "thread", "process"):
+        await run_scenario(f"cpu/{policy}", policy, "cpu_burn", {"iterations": args.iterations},
+                           args.heavy_calls, args.concurrency)
+    print(f"bmi_batch: calculate_bmi_batch {args.rows} 条 x {args.heavy_calls}，并发 {args.concurrency}")
+    for policy in ("inline", "thread", "process"):
+        await run_scenario(f"bmi_batch/{policy}", policy, "calculate_bmi_batch", bmi_args,
+                           args.heavy_calls, args.concurrency)
+    print(f"blocking: 阻塞 {args.block_ms:g}ms x {args.heavy_calls}，并发 {args.concurrency}")
+    block_args = {"key": "demo", "block_ms": args.block_ms}
+    for policy in ("inline", "thread"):
+        await run_scenario(f"blocking/{policy}", policy, "blocking_lookup", block_args, args.heavy_calls, args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""
+聊天机器人一轮对话的首 token 时间：流式 vs 非流式
+
+使用方法：python benchmarks/bench_llm_streaming.py [--turns 5] [--first-token-delay 0.3] [--token-delay 0.02]
+
+在本地启动假 LLM（OpenAI 兼容接口）和 fastmcp_server_streamhttp.py 的 server，
+用 fastmcp_client_streamhttp_chatbot.MCPClient 跑同一个需要调用工具的问题，
+分别统计 stream=True / False 时的首 token 时间和整轮耗时。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_llm import FakeLLM
+from local_server import LocalMCPServer
+from stub_upstream import StubUpstream
+
+QUERY = "北京今天天气怎么样？顺便算一下70公斤1.75米的BMI"
+
+
+async def run_turns(url: str, stream: bool, turns: int):
+    from fastmcp_client_streamhttp_chatbot import MCPClient
+
+    chatbot = MCPClient(url, stream=stream)
+    ttft, total = [], []
+    available_tools = await chatbot.get_mcp_tools()
+    for _ in range(turns):
+        chatbot.conversation_history.clear()
+        start = time.perf_counter()
+        # 屏蔽流式输出，只保留统计
+        with contextlib.redirect_stdout(io.StringIO()):
+            await chatbot.process_query(QUERY, available_tools)
+        total.append((time.perf_counter() - start) * 1000)
+        ttft.append(chatbot.last_turn_stats["time_to_first_token"] * 1000)
+    await chatbot.clean()
+    label = "stream" if stream else "blocking"
+    print(
+        f"[{label:<8}] 首token p50={statistics.median(ttft):7.1f}ms"
+        f"  整轮 p50={statistics.median(total):7.1f}ms"
+        f"  LLM请求/轮={chatbot.last_turn_stats['llm_calls']}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="流式 vs 非流式首 token 时间")
+    parser.add_argument("--turns", type=int, default=5, help="每种模式运行的轮数")
+    parser.add_argument("--first-token-delay", type=float, default=0.3, help="假 LLM 首个片段前的延迟（秒）")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="假 LLM 片段之间的延迟（秒）")
+    args = parser.parse_args()
+
+    with StubUpstream(delay=0.05) as upstream, FakeLLM(args.first_token_delay, args.token_delay) as llm:
+        os.environ["WTTR_ENDPOINT"] = upstream.url
+        os.environ["WTTR_CACHE_TTL"] = "0"
+        import fastmcp_server_streamhttp
+
+        server = LocalMCPServer(fastmcp_server_streamhttp.mcp, path="/my-custom-path/")
+        server.start()
+        os.environ["LLM_BASE_URL"] = llm.base_url
+        os.environ["KIMI_API_KEY"] = "benchmark"
+        await run_turns(server.url, stream=False, turns=args.turns)
+        await run_turns(server.url, stream=True, turns=args.turns)
+        server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+"""
+回放录制的 LLM / 工具流量，测量聊天机器人客户端自身的开销
+
+使用方法：python benchmarks/bench_replay.py [--log session.jsonl.gz] [--repeat 20] [--latency zero|original|both]
+                                            [--parallel-tool-calls]
+
+--log 指定的文件不存在（或没有指定）时先录制：在本地启动假 LLM、模拟 wttr.in 的上游和 fastmcp_server_streamhttp.py 的 server，
+用 traffic_replay.TrafficRecorder 跑一段多轮对话（BMI、时间、多城市天气、直接回答）。
+也可以回放用真实 LLM 录制的日志：MCP_RECORD_TRAFFIC=session.jsonl.gz python fastmcp_client_streamhttp_chatbot.py <server_url>
+
+回放时不启动任何服务、不访问网络，每次重复新建一个 fastmcp_client_streamhttp_chatbot.MCPClient，依次提出录制时的问题：
+- zero:     LLM 和工具立即返回，每轮耗时就是客户端开销（序列化、历史管理、工具调度、流式片段处理）
+- original: 按录制时的间隔返回，客户端开销 = 每轮耗时 - 录制的 LLM / 工具耗时
+输出每轮耗时的 p50 / p99，以及请求摘要与录制时不一致的次数（不为 0 说明客户端发出的请求变了）。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_llm import FakeLLM
+from local_server import LocalMCPServer
+from stub_upstream import StubUpstream
+
+from traffic_replay import TrafficRecorder, TrafficReplay
+
+QUERIES = [
+    "帮我算一下70公斤1.75米的BMI",
+    "现在是什么时间？",
+    "北京、上海和广州今天的天气怎么样？",
+    "你好，介绍一下你自己",
+    "London 的天气怎么样？顺便告诉我现在的日期",
+]
+
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def record(path: str, parallel_tool_calls: bool):
+    from fastmcp_client_streamhttp_chatbot import MCPClient
+
+    with StubUpstream(delay=0.05) as upstream, FakeLLM(first_token_delay=0.2, token_delay=0.01) as llm:
+        os.environ["WTTR_ENDPOINT"] = upstream.url
+        os.environ["WTTR_CACHE_TTL"] = "0"
+        os.environ["LLM_BASE_URL"] = llm.base_url
+        import fastmcp_server_streamhttp
+
+        with LocalMCPServer(fastmcp_server_streamhttp.mcp, path="/my-custom-path/") as server:
+            recorder = TrafficRecorder(path)
+            chatbot = MCPClient(server.url, parallel_tool_calls=parallel_tool_calls, traffic=recorder)
+            with contextlib.redirect_stdout(io.StringIO()):
+                for query in QUERIES:
+                    await chatbot.process_query(query, await chatbot.get_mcp_tools())
+            await chatbot.clean()
+            recorder.close()
+    print(f"已录制 {len(QUERIES)} 轮对话到 {path}（{os.path.getsize(path)} 字节）：{recorder.stats()['entries']}")
+
+
+def recorded_wait(replay: TrafficReplay) -> float:
+    """录制时等待 LLM 和工具的总时间（秒），按顺序执行时就是 original 回放需要等待的时间"""
+    total = 0.0
+    for entry in replay.entries:
+        if entry["k"] == "llm":
+            total += sum(item[0] for item in entry["chunks"]) if "chunks" in entry else entry.get("latency", 0)
+        elif entry["k"] in ("tool", "tools"):
+            total += entry.get("latency", 0)
+    return total
+
+
+async def run_replay(path: str, latency: str, repeat: int, parallel_tool_calls: bool):
+    from fastmcp_client_streamhttp_chatbot import MCPClient
+    import openai.types.chat  # noqa: F401  openai 的导入约 0.5 秒，不计入第一轮
+
+    replay = TrafficReplay(path, latency=latency)
+    queries = replay.queries()
+    turn_ms, session_s, mismatches = [], [], 0
+    for _ in range(repeat):
+        replay.rewind()
+        chatbot = MCPClient("replay", parallel_tool_calls=parallel_tool_calls, traffic=replay)
+        start = time.perf_counter()
+        # 屏蔽流式输出和工具调用日志，只保留统计
+        with contextlib.redirect_stdout(io.StringIO()):
+            for query in queries:
+                turn_start = time.perf_counter()
+                await chatbot.process_query(query, await chatbot.get_mcp_tools(), on_token=lambda text: None)
+                turn_ms.append((time.perf_counter() - turn_start) * 1000)
+        session_s.append(time.perf_counter() - start)
+        mismatches += replay.mismatches
+        await chatbot.clean()
+
+    line = (f"[{latency:<8}] {repeat} 次 x {len(queries)} 轮 | 每轮 p50={statistics.median(turn_ms):8.2f}ms"
+            f" p99={percentile(turn_ms, 0.99):8.2f}ms | 请求不一致 {mismatches} 次")
+    if latency == "original":
+        overhead = statistics.median(session_s) - recorded_wait(replay)
+        line += f" | 每次会话 {statistics.median(session_s):.3f}s，其中客户端开销约 {overhead * 1000:.1f}ms"
+    print(line)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="回放录制的流量，测量客户端开销")
+    parser.add_argument("--log", help="录制日志的路径，不存在时先用假 LLM 录制")
+    parser.add_argument("--repeat", type=int, default=20, help="zero 模式的回放次数（original 模式为 3 次）")
+    parser.add_argument("--latency", choices=["zero", "original", "both"], default="both")
+    parser.add_argument("--parallel-tool-calls", action="store_true", help="同一轮的工具调用并发执行（录制和回放时须一致）")
+    args = parser.parse_args()
+
+    path = args.log or os.path.join(tempfile.mkdtemp(), "session.jsonl.gz")
+    if not os.path.exists(path):
+        os.environ.setdefault("KIMI_API_KEY", "benchmark")
+        await record(path, args.parallel_tool_calls)
+    if args.latency in ("zero", "both"):
+        await run_replay(path, "zero", args.repeat, args.parallel_tool_calls)
+    if args.latency in ("original", "both"):
+        await run_replay(path, "original", 3, args.parallel_tool_calls)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,183 @@
+"""
+多个 server 副本之间的客户端负载均衡：吞吐扩展和故障副本的摘除 / 恢复
+
+使用方法：python benchmarks/bench_replicas.py [--replicas 3] [--calls 300] [--concurrency 24] [--records 5000]
+                                              [--strategy p2c|least_outstanding] [--skip-failover]
+
+每个副本是一个独立的 fastmcp_server_streamhttp.py 进程（MCP_PORT 指定随机空闲端口，关闭限流）：
+1. 吞吐：SimpleMCPClient 以固定并发调用 calculate_bmi_batch（每次 records 条记录，CPU 密集），
+   分别连接 1 个副本和全部副本，输出吞吐、延迟和每个副本的请求数 / 延迟统计。
+   吞吐能随副本数增加的前提是机器有多个 CPU 核，单核机器上只能看到请求被均匀分配
+2. 故障转移：持续调用期间杀掉第一个副本，1 秒后在同一端口重新启动，
+   每 0.5 秒输出一次成功 / 失败次数和各副本新增的请求数，观察副本被摘除、调用转到其他副本、重启后重新加入
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from stub_upstream import free_port
+
+from simple_mcp_client import SimpleMCPClient
+
+SERVER_SCRIPT = os.path.join(ROOT, "fastmcp_server_streamhttp.py")
+
+
+class ReplicaProcess:
+    """一个在独立进程中运行的 server 副本"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}/my-custom-path"
+        self.process = None
+
+    def start(self, timeout: float = 30.0):
+        env = dict(os.environ, MCP_ENV="production", MCP_PORT=str(self.port), MCP_RATE_LIMIT="0")
+        self.process = subprocess.Popen(
+            [sys.executable, SERVER_SCRIPT], cwd=ROOT, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"副本 {self.port} 启动失败，退出码 {self.process.returncode}")
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=0.05):
+                    return
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError(f"副本 {self.port} {timeout:g} 秒内没有开始监听")
+
+    def kill(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+
+def emit(line: str):
+    """输出到真正的 stdout（调用期间 stdout 被重定向以屏蔽 SimpleMCPClient 的打印）"""
+    sys.__stdout__.write(line + "\n")
+    sys.__stdout__.flush()
+
+
+def make_args(records: int, rng: random.Random) -> dict:
+    return {"records": [
+        {"weight_kg": round(rng.uniform(40, 120), 1), "height_m": round(rng.uniform(1.4, 2.0), 2)}
+        for _ in range(records)
+    ]}
+
+
+async def throughput(urls, args, calls: int, concurrency: int, strategy: str):
+    async with SimpleMCPClient(urls, pool_size=2, strategy=strategy) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+        samples = []
+
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                result = await client.call_tool("calculate_bmi_batch", args)
+                assert result["success"], result["error"]
+                samples.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        # SimpleMCPClient 会打印每次调用的原始结果，这里屏蔽掉以免影响计时
+        with contextlib.redirect_stdout(io.StringIO()):
+            await asyncio.gather(*(one() for _ in range(calls)))
+        wall = time.perf_counter() - start
+        ordered = sorted(samples)
+        print(
+            f"[{len(urls)} 个副本] {calls / wall:7.1f} req/s"
+            f" p50={statistics.median(samples):7.1f}ms p99={ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]:7.1f}ms"
+        )
+        if len(urls) > 1:
+            for url, stats in client.pool.stats().items():
+                print(f"    {url}: requests={stats['requests']} p50={stats['latency_p50_ms']}ms p95={stats['latency_p95_ms']}ms")
+
+
+async def failover(replicas, strategy: str, concurrency: int, duration: float = 10.0):
+    urls = [replica.url for replica in replicas]
+    victim = replicas[0]
+    async with SimpleMCPClient(urls, pool_size=1, strategy=strategy) as client:
+        balancer = client.pool.balancer
+        balancer.ejection_time = 2.0
+        counts = {"ok": 0, "failed": 0}
+        stop = time.perf_counter() + duration
+
+        async def worker():
+            while time.perf_counter() < stop:
+                result = await client.call_tool("calculate_bmi", {"weight_kg": 70, "height_m": 1.75})
+                counts["ok" if result["success"] else "failed"] += 1
+
+        async def chaos():
+            await asyncio.sleep(1.5)
+            emit(f"  -- 杀掉副本 {victim.port}")
+            await asyncio.to_thread(victim.kill)
+            await asyncio.sleep(1.0)
+            await asyncio.to_thread(victim.start)
+            emit(f"  -- 副本 {victim.port} 已在同一端口重新启动")
+
+        async def monitor():
+            previous_counts = dict(counts)
+            previous = {r.url: r.requests for r in balancer.replicas}
+            start = time.perf_counter()
+            while time.perf_counter() < stop:
+                await asyncio.sleep(0.5)
+                now = time.perf_counter() - start
+                per_replica = " ".join(
+                    f"{r.url.split(':')[2].split('/')[0]}={r.requests - previous[r.url]:<4}"
+                    f"{'' if not r.ejected(balancer.clock()) else '(摘除)'}"
+                    for r in balancer.replicas
+                )
+                emit(f"  t={now:4.1f}s ok={counts['ok'] - previous_counts['ok']:<5}"
+                     f" failed={counts['failed'] - previous_counts['failed']:<3} {per_replica}")
+                previous_counts = dict(counts)
+                previous = {r.url: r.requests for r in balancer.replicas}
+
+        with contextlib.redirect_stdout(io.StringIO()) as captured:
+            await asyncio.gather(*(worker() for _ in range(concurrency)), chaos(), monitor())
+        ejections = [line for line in captured.getvalue().splitlines() if "摘除" in line]
+        print(f"  成功 {counts['ok']} 次，失败 {counts['failed']} 次；摘除记录: {ejections}")
+        for url, stats in client.pool.stats().items():
+            print(f"    {url}: requests={stats['requests']} failures={stats['failures']}"
+                  f" ejections={stats['ejections']} healthy={stats['healthy']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="多个 server 副本的客户端负载均衡")
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=24)
+    parser.add_argument("--records", type=int, default=5000, help="每次 calculate_bmi_batch 的记录数")
+    parser.add_argument("--strategy", choices=["p2c", "least_outstanding"], default="p2c")
+    parser.add_argument("--skip-failover", action="store_true")
+    args = parser.parse_args()
+
+    replicas = [ReplicaProcess(free_port()) for _ in range(max(2, args.replicas))]
+    try:
+        for replica in replicas:
+            replica.start()
+        tool_args = make_args(args.records, random.Random(0))
+        print(f"calculate_bmi_batch x {args.calls}（每次 {args.records} 条），并发 {args.concurrency}，"
+              f"策略 {args.strategy}，本机 {os.cpu_count()} 个 CPU 核")
+        await throughput([replicas[0].url], tool_args, args.calls, args.concurrency, args.strategy)
+        await throughput([r.url for r in replicas], tool_args, args.calls, args.concurrency, args.strategy)
+        if not args.skip_failover:
+            print("故障转移（每 0.5 秒）：")
+            await failover(replicas, args.strategy, concurrency=8)
+    finally:
+        for replica in replicas:
+            replica.kill()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
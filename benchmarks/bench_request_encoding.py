@@ -0,0 +1,114 @@
+"""
+长会话中每次 LLM 请求的大小和客户端序列化开销：SDK 序列化 vs 预编码的请求体
+
+使用方法：python benchmarks/bench_request_encoding.py [--turns 40] [--repeat 3]
+
+在本地启动假 LLM（不加延迟）、模拟 wttr.in 的上游和 fastmcp_server_streamhttp.py 的 server，
+用 fastmcp_client_streamhttp_chatbot.MCPClient 连续进行 turns 轮对话（历史预算足够大，历史一直增长，每轮都调用工具）：
+- sdk:     传入普通的 AsyncOpenAI，消息交给 openai SDK 做类型转换和 JSON 序列化
+- encoded: create_llm_client 创建的客户端，请求体由 message_store.MessageStore 缓存的片段拼接
+两种模式发送的都是修剪后的消息（去掉 null 字段）；另外单独输出 model_dump() 与修剪后的一条工具调用回复的大小。
+输出每次请求的平均字节数（假 LLM 收到的请求体）和主线程 CPU 时间（time.thread_time，
+假 LLM 和 MCP server 在其他线程中运行，不计入）。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_llm import FakeLLM
+from local_server import LocalMCPServer
+from stub_upstream import StubUpstream
+
+QUERIES = [
+    "帮我算一下BMI，体重70公斤身高1.75米",
+    "北京和上海今天的天气怎么样？",
+    "现在是什么时间？",
+    "深圳和广州的天气如何？顺便告诉我今天的日期",
+]
+
+
+async def run_session(url: str, llm_url: str, mode: str, turns: int, fake: FakeLLM):
+    from openai import AsyncOpenAI
+
+    from fastmcp_client_streamhttp_chatbot import MCPClient
+
+    llm = AsyncOpenAI(api_key="benchmark", base_url=llm_url) if mode == "sdk" else None
+    chatbot = MCPClient(url, llm=llm, history_token_budget=1_000_000)
+    available_tools = await chatbot.get_mcp_tools()
+    # 预热：建立 MCP 会话和 LLM 连接，不计入
+    with contextlib.redirect_stdout(io.StringIO()):
+        await chatbot.process_query(QUERIES[0], available_tools, on_token=lambda text: None)
+    chatbot.conversation_history.clear()
+
+    first = len(fake.request_bytes)
+    cpu_start, wall_start = time.thread_time(), time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(turns):
+            await chatbot.process_query(QUERIES[i % len(QUERIES)], available_tools, on_token=lambda text: None)
+    cpu = time.thread_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    sizes = fake.request_bytes[first:]
+    await chatbot.clean()
+    return sizes, cpu, wall
+
+
+def dump_sizes():
+    """一条带工具调用的回复：model_dump() 与去掉 null 字段后的 JSON 大小"""
+    from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+    from openai.types.chat.chat_completion_message_tool_call import Function
+
+    from message_store import compact_message, encode_json
+
+    message = ChatCompletionMessage(role="assistant", content=None, tool_calls=[
+        ChatCompletionMessageToolCall(id="call_0123456789ab", type="function",
+                                      function=Function(name="get_weather", arguments='{"city":"北京","date":"今天"}'))
+    ])
+    return len(encode_json(message.model_dump())), len(encode_json(compact_message(message)))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="SDK 序列化 vs 预编码的请求体")
+    parser.add_argument("--turns", type=int, default=40, help="每次会话的对话轮数")
+    parser.add_argument("--repeat", type=int, default=3, help="每种模式重复的会话数")
+    args = parser.parse_args()
+
+    with StubUpstream(delay=0) as upstream, FakeLLM(first_token_delay=0, token_delay=0) as fake:
+        os.environ["WTTR_ENDPOINT"] = upstream.url
+        os.environ["WTTR_CACHE_TTL"] = "0"
+        os.environ["LLM_BASE_URL"] = fake.base_url
+        os.environ["KIMI_API_KEY"] = "benchmark"
+        import fastmcp_server_streamhttp
+
+        with LocalMCPServer(fastmcp_server_streamhttp.mcp, path="/my-custom-path/") as server:
+            results = {}
+            for _ in range(args.repeat):
+                for mode in ("sdk", "encoded"):
+                    sizes, cpu, wall = await run_session(server.url, fake.base_url, mode, args.turns, fake)
+                    results.setdefault(mode, []).append((sizes, cpu, wall))
+
+    requests = len(results["encoded"][0][0])
+    print(f"{args.turns} 轮对话 x {args.repeat} 次，每次会话 {requests} 次 LLM 请求")
+    for mode, runs in results.items():
+        sizes = runs[-1][0]
+        cpu_per_request = statistics.median(cpu / len(s) for s, cpu, _ in runs) * 1000
+        print(
+            f"[{mode:<7}] 每次请求 平均 {statistics.mean(sizes) / 1024:6.1f}KB 最后一次 {sizes[-1] / 1024:6.1f}KB"
+            f" | 主线程 CPU {cpu_per_request:6.2f}ms/请求"
+            f" | 每次会话 {statistics.median(wall for _, _, wall in runs):.2f}s"
+        )
+    sdk_cpu = statistics.median(cpu / len(s) for s, cpu, _ in results["sdk"])
+    encoded_cpu = statistics.median(cpu / len(s) for s, cpu, _ in results["encoded"])
+    print(f"预编码每次请求节省 CPU {(sdk_cpu - encoded_cpu) * 1000:.2f}ms（{(1 - encoded_cpu / sdk_cpu) * 100:.0f}%）")
+    full, compact = dump_sizes()
+    print(f"一条工具调用回复：model_dump() {full} 字节，去掉 null 字段后 {compact} 字节（之后每次请求都会重发）")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
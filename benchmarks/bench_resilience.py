@@ -0,0 +1,101 @@
+"""
+get_weather 上游容错对比：重试、对冲请求、熔断器
+
+使用方法：python benchmarks/bench_resilience.py [--requests 400] [--concurrency 10]
+
+用带故障注入的 wttr.in 替身（stub_upstream.StubUpstream）直接驱动 WeatherBackend（关闭结果缓存），
+每个场景分别用"不启用"和"启用"该手段的后端各跑一遍，输出成功率和 p50/p99/max 延迟：
+- errors: 20% 的请求返回 503，对比不重试 / 最多重试 2 次
+- tail:   5% 的请求慢 1 秒，对比不对冲 / 150ms 后发对冲请求
+- hang:   5% 的请求挂起不返回，对比只靠 10 秒读取超时 / 1 秒单次超时后重试
+- outage: 上游全部返回 503，对比关闭熔断（阈值无限大）/ 连续 5 次失败后熔断
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stub_upstream import StubUpstream
+
+from resilience import CircuitBreaker, RetryPolicy
+from ttl_cache import TTLCache
+from weather_backend import WeatherBackend
+
+
+def make_backend(endpoint: str, **kwargs: Any) -> WeatherBackend:
+    kwargs.setdefault("retry", RetryPolicy(attempts=1))
+    kwargs.setdefault("breaker", CircuitBreaker("bench", failure_threshold=10 ** 9))
+    return WeatherBackend(endpoint=endpoint, max_in_flight=100, max_connections=100, cache=TTLCache(ttl=0), **kwargs)
+
+
+async def run(backend: WeatherBackend, requests: int, concurrency: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    failures = 0
+
+    async def one(i: int):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await backend.fetch(f"city{i}", "今天")
+            except Exception:
+                failures += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    await backend.aclose()
+    ordered = sorted(latencies)
+    return {
+        "success": (requests - failures) / requests,
+        "p50": statistics.median(ordered),
+        "p99": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+        "max": ordered[-1],
+    }
+
+
+def report(scenario: str, label: str, result: Dict[str, Any]):
+    print(
+        f"[{scenario:<6} {label:<14}] 成功率 {result['success']:6.1%}"
+        f"  p50={result['p50']:8.1f}ms p99={result['p99']:8.1f}ms max={result['max']:8.1f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="get_weather 上游容错对比")
+    parser.add_argument("--requests", type=int, default=400, help="每组的请求数")
+    parser.add_argument("--concurrency", type=int, default=10, help="并发数")
+    args = parser.parse_args()
+    n, c = args.requests, args.concurrency
+
+    with StubUpstream(delay=0.02, error_rate=0.2) as upstream:
+        report("errors", "不重试", await run(make_backend(upstream.url), n, c))
+        report("errors", "重试 2 次", await run(make_backend(upstream.url, retry=RetryPolicy(attempts=3)), n, c))
+
+    with StubUpstream(delay=0.02, slow_rate=0.05, slow_delay=1.0) as upstream:
+        report("tail", "不对冲", await run(make_backend(upstream.url), n, c))
+        report("tail", "150ms 对冲", await run(make_backend(upstream.url, hedge_after=0.15), n, c))
+
+    with StubUpstream(delay=0.02, hang_rate=0.05) as upstream:
+        report("hang", "10s 读取超时", await run(make_backend(upstream.url, deadline=None), n, c))
+        report("hang", "1s 超时+重试", await run(
+            make_backend(upstream.url, read_timeout=1.0, retry=RetryPolicy(attempts=3)), n, c
+        ))
+
+    with StubUpstream(delay=0.02) as upstream:
+        upstream.down = True
+        report("outage", "无熔断", await run(make_backend(upstream.url, retry=RetryPolicy(attempts=3)), n, c))
+        before = upstream.request_count
+        report("outage", "熔断", await run(make_backend(
+            upstream.url, retry=RetryPolicy(attempts=3), breaker=CircuitBreaker("bench", failure_threshold=5)
+        ), n, c))
+        print(f"  熔断后上游只收到 {upstream.request_count - before} 个请求（共 {n} 次查询）")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""
+SimpleMCPClient 并发调用对比：每次调用新建连接 vs 会话池
+
+使用方法：python benchmarks/bench_simple_client_pool.py [--calls 200] [--concurrency 50] [--pool-size 4]
+
+在本地启动 fastmcp_server_streamhttp.py 的 server，以固定并发调用 calculate_bmi，
+统计吞吐和延迟：
+- baseline: 旧实现，每次 call_tool 都 async with Client(url)
+- pooled:   SimpleMCPClient，async with 生命周期 + MCPSessionPool
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+from fastmcp import Client
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from local_server import LocalMCPServer
+
+import fastmcp_server_streamhttp
+from simple_mcp_client import SimpleMCPClient
+
+BMI_ARGS = {"weight_kg": 70, "height_m": 1.75}
+
+
+async def baseline_call(url: str):
+    async with Client(url) as client:
+        await client.call_tool("calculate_bmi", BMI_ARGS)
+
+
+async def drive(label: str, call, calls: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await call()
+            samples.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    # SimpleMCPClient 会打印每次调用的原始结果，这里屏蔽掉以免影响计时
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(one() for _ in range(calls)))
+    wall = time.perf_counter() - start
+    ordered = sorted(samples)
+    print(
+        f"[{label:<8}] {calls / wall:8.1f} req/s"
+        f" p50={statistics.median(samples):7.1f}ms"
+        f" p99={ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]:7.1f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="SimpleMCPClient 会话池对比")
+    parser.add_argument("--calls", type=int, default=200, help="总调用次数")
+    parser.add_argument("--concurrency", type=int, default=50, help="并发数")
+    parser.add_argument("--pool-size", type=int, default=4, help="会话池大小")
+    args = parser.parse_args()
+
+    with LocalMCPServer(fastmcp_server_streamhttp.mcp, path="/my-custom-path/") as server:
+        await drive("baseline", lambda: baseline_call(server.url), args.calls, args.concurrency)
+
+        async with SimpleMCPClient(server.url, pool_size=args.pool_size) as client:
+            async def pooled_call():
+                result = await client.call_tool("calculate_bmi", BMI_ARGS)
+                assert result["success"], result["error"]
+
+            await drive("pooled", pooled_call, args.calls, args.concurrency)
+            print(f"pooled 会话池状态: {client.pool.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
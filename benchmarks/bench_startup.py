@@ -0,0 +1,131 @@
+"""
+server 和聊天机器人的启动时间
+
+使用方法：python benchmarks/bench_startup.py [--repeat 5] [--profile development|production|both]
+
+每次都启动一个新的 python 进程：
+- server: 从启动进程到监听端口第一次接受 TCP 连接的时间（MCP_PORT 指定随机空闲端口）
+- 聊天机器人: 从启动进程到输出 "用户: " 输入提示的时间，随后输入 quit 退出。
+  聊天机器人连接的是本进程后台线程里的 server；没有设置 KIMI_API_KEY 时使用占位值，不会请求 LLM
+profile 对应 MCP_ENV（development / production，见 server_config.py）。
+输出每一项的最小值和中位数。
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from local_server import LocalMCPServer
+from stub_upstream import free_port
+
+import fastmcp_server_sse
+import fastmcp_server_streamhttp
+
+SERVERS = [
+    ("streamhttp", "fastmcp_server_streamhttp.py"),
+    ("sse", "fastmcp_server_sse.py"),
+    ("cline", os.path.join("fastmcp_server_Cline", "get_weather_server_sse.py")),
+    ("unified", "fastmcp_server_unified.py"),
+]
+
+PROMPT = "用户: ".encode("utf-8")
+
+
+def child_env(profile: str, **extra: str) -> dict:
+    env = dict(os.environ, MCP_ENV=profile, PYTHONUNBUFFERED="1", **extra)
+    env.setdefault("KIMI_API_KEY", "bench-placeholder")
+    return env
+
+
+def time_server(script: str, profile: str, timeout: float = 30.0) -> float:
+    """启动 server 进程，返回第一次成功建立 TCP 连接的时间（秒）"""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, script)],
+        cwd=ROOT,
+        env=child_env(profile, MCP_PORT=str(port)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"{script} 启动失败，退出码 {process.returncode}")
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=0.05):
+                    return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.005)
+        raise TimeoutError(f"{script} {timeout:g} 秒内没有开始监听")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def time_chatbot(script: str, server_url: str, profile: str, timeout: float = 30.0) -> float:
+    """启动聊天机器人进程，返回输出输入提示的时间（秒）"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, script), server_url],
+        cwd=ROOT,
+        env=child_env(profile),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    output = b""
+    try:
+        while PROMPT not in output:
+            chunk = os.read(process.stdout.fileno(), 4096)
+            if not chunk:
+                raise RuntimeError(f"{script} 没有输出输入提示就退出了: {output.decode('utf-8', 'replace')[-300:]}")
+            output += chunk
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError(f"{script} {timeout:g} 秒内没有输出输入提示")
+        elapsed = time.perf_counter() - start
+        process.stdin.write(b"quit\n")
+        process.stdin.flush()
+        return elapsed
+    finally:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def report(name: str, samples: list):
+    print(f"  {name:<12} min {min(samples) * 1000:7.0f}ms  median {statistics.median(samples) * 1000:7.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="server 和聊天机器人的启动时间")
+    parser.add_argument("--repeat", type=int, default=5, help="每一项的重复次数")
+    parser.add_argument("--profile", choices=["development", "production", "both"], default="both")
+    args = parser.parse_args()
+    profiles = ["development", "production"] if args.profile == "both" else [args.profile]
+
+    with LocalMCPServer(fastmcp_server_streamhttp.mcp, path="/my-custom-path/") as streamhttp_server, \
+            LocalMCPServer(fastmcp_server_sse.mcp, transport="sse") as sse_server:
+        chatbots = [
+            ("streamhttp", "fastmcp_client_streamhttp_chatbot.py", streamhttp_server.url),
+            ("sse", "mcp_client_sse_chatbot.py", sse_server.url),
+        ]
+        for profile in profiles:
+            print(f"[{profile}] server: 启动到接受第一个连接")
+            for name, script in SERVERS:
+                report(name, [time_server(script, profile) for _ in range(args.repeat)])
+            print(f"[{profile}] 聊天机器人: 启动到显示输入提示")
+            for name, script, url in chatbots:
+                report(name, [time_chatbot(script, url, profile) for _ in range(args.repeat)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+get_weather 阻塞 vs 异步对比测试
+
+使用方法：python benchmarks/bench_weather_backend.py [--weather 20] [--light 50] [--delay 0.2]
+
+在本地启动一个延迟可控的 wttr.in 替身，然后用内存传输直接驱动 FastMCP server，
+同时并发发起 get_weather 和 calculate_bmi / get_current_time 调用，
+分别统计两类调用的 p50 / p99 延迟：
+- baseline: 旧实现，同步工具里调用 requests.get
+- async:    fastmcp_server_streamhttp.py 中基于 weather_backend 的新实现
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import requests
+from fastmcp import Client, FastMCP
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stub_upstream import StubUpstream
+
+
+def build_baseline_server(endpoint: str) -> FastMCP:
+    """按旧实现构造一个 server：get_weather 为同步 requests.get"""
+    from datetime import datetime
+
+    mcp = FastMCP("baseline")
+
+    @mcp.tool()
+    def calculate_bmi(weight_kg: float, height_m: float) -> float:
+        return weight_kg / (height_m ** 2)
+
+    @mcp.tool()
+    def get_current_time() -> str:
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    @mcp.tool()
+    def get_weather(city: str, date: str):
+        response = requests.get(f"{endpoint}/{city}")
+        return response.text
+
+    return mcp
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_mixed_workload(mcp: FastMCP, weather_calls: int, light_calls: int):
+    """并发发起混合调用，返回 {类别: [延迟毫秒]}"""
+    latencies = {"weather": [], "light": []}
+
+    async with Client(mcp) as client:
+        async def timed(kind, name, args):
+            start = time.perf_counter()
+            await client.call_tool(name, args)
+            latencies[kind].append((time.perf_counter() - start) * 1000)
+
+        tasks = []
+        for i in range(weather_calls):
+            tasks.append(timed("weather", "get_weather", {"city": f"city{i}", "date": "今天"}))
+        for i in range(light_calls):
+            if i % 2:
+                tasks.append(timed("light", "calculate_bmi", {"weight_kg": 70, "height_m": 1.75}))
+            else:
+                tasks.append(timed("light", "get_current_time", {}))
+        start = time.perf_counter()
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - start
+
+    return latencies, wall
+
+
+def report(label: str, latencies, wall: float):
+    print(f"\n[{label}] 总耗时 {wall:.2f}s")
+    for kind, samples in latencies.items():
+        if not samples:
+            continue
+        print(
+            f"  {kind:<8} n={len(samples):<5}"
+            f" p50={statistics.median(samples):8.1f}ms"
+            f" p99={percentile(samples, 99):8.1f}ms"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="get_weather 阻塞 vs 异步对比")
+    parser.add_argument("--weather", type=int, default=20, help="并发 get_weather 调用数")
+    parser.add_argument("--light", type=int, default=50, help="并发 BMI/时间 调用数")
+    parser.add_argument("--delay", type=float, default=0.2, help="上游响应延迟（秒）")
+    args = parser.parse_args()
+
+    with StubUpstream(delay=args.delay) as upstream:
+        # 新实现在导入时读取 WTTR_ENDPOINT，必须在 import 之前设置
+        os.environ["WTTR_ENDPOINT"] = upstream.url
+        import fastmcp_server_streamhttp
+        from weather_backend import weather_backend
+
+        latencies, wall = await run_mixed_workload(
+            build_baseline_server(upstream.url), args.weather, args.light
+        )
+        report("baseline: requests.get", latencies, wall)
+
+        # server 在 MCP 会话开始时就在后台创建连接池（mcp_tools.warm_up_weather），这里等它完成，
+        # 只测稳定状态下两类调用的相互影响，不把进程启动后一次性的 SSL 初始化算进第一批调用
+        await weather_backend.get_client()
+        latencies, wall = await run_mixed_workload(
+            fastmcp_server_streamhttp.mcp, args.weather, args.light
+        )
+        report("async: weather_backend", latencies, wall)
+        await weather_backend.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
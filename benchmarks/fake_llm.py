@@ -0,0 +1,159 @@
+"""
+本地的 OpenAI 兼容假 LLM 服务，供 benchmarks 下的脚本使用
+
+POST /v1/chat/completions，支持 stream=true / false 和 tools。
+按简单规则决定回复，不需要外网和 API key：
+- 最后一条消息是用户提问时，根据关键词选择工具（BMI -> calculate_bmi，天气 -> get_weather，
+  时间/日期 -> get_current_time 或 get_today），一次回复中发出所有工具调用；没有匹配的工具时直接回答
+- 最后一条消息是工具结果时，汇总工具结果生成最终回答
+延迟可配置：first_token_delay 为首个片段前的等待，token_delay 为后续每个片段之间的等待。
+"""
+
+import asyncio
+import json
+import threading
+import time
+import uuid
+from typing import Any, Dict, List
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from stub_upstream import free_port
+
+CITIES = ["北京", "上海", "广州", "深圳", "London"]
+
+
+def plan_tool_calls(query: str, tool_names: List[str]) -> List[Dict[str, Any]]:
+    """根据用户问题中的关键词决定要调用的工具"""
+    calls = []
+    if "bmi" in query.lower() and "calculate_bmi" in tool_names:
+        calls.append(("calculate_bmi", {"weight_kg": 70, "height_m": 1.75}))
+    if "天气" in query and "get_weather" in tool_names:
+        cities = [city for city in CITIES if city in query] or ["北京"]
+        calls.extend(("get_weather", {"city": city, "date": "今天"}) for city in cities)
+    if any(word in query for word in ("时间", "日期", "几号")):
+        for name in ("get_current_time", "get_today"):
+            if name in tool_names:
+                calls.append((name, {}))
+                break
+    return [
+        {"id": f"call_{uuid.uuid4().hex[:12]}", "name": name, "arguments": json.dumps(args, ensure_ascii=False)}
+        for name, args in calls
+    ]
+
+
+def split_tokens(text: str, size: int = 2) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+class FakeLLM:
+    """
+    OpenAI 兼容的本地假 LLM 服务
+
+    使用示例：
+        with FakeLLM(first_token_delay=0.3, token_delay=0.01) as llm:
+            os.environ["LLM_BASE_URL"] = llm.base_url
+    """
+
+    def __init__(self, first_token_delay: float = 0.3, token_delay: float = 0.01):
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}/v1"
+        self.request_count = 0
+        self.request_bytes: List[int] = []
+        app = Starlette(routes=[Route("/v1/chat/completions", self._handle, methods=["POST"])])
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def _reply(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """决定这一次的回复：{"content": str | None, "tool_calls": [...]}"""
+        messages = body["messages"]
+        last = messages[-1]
+        if last["role"] == "tool":
+            results = []
+            for message in reversed(messages):
+                if message["role"] != "tool":
+                    break
+                results.append(str(message["content"])[:40])
+            return {"content": "根据工具返回的结果：" + "；".join(reversed(results)) + "。", "tool_calls": []}
+
+        tool_names = [tool["function"]["name"] for tool in body.get("tools") or []]
+        tool_calls = plan_tool_calls(str(last.get("content", "")), tool_names)
+        if tool_calls:
+            return {"content": None, "tool_calls": tool_calls}
+        return {"content": "你好，我是假的 LLM，这是一段直接回答。", "tool_calls": []}
+
+    async def _handle(self, request: Request):
+        raw = await request.body()
+        self.request_count += 1
+        self.request_bytes.append(len(raw))
+        body = json.loads(raw)
+        reply = self._reply(body)
+        finish_reason = "tool_calls" if reply["tool_calls"] else "stop"
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "fake")
+
+        if not body.get("stream"):
+            # 与流式模式的总耗时保持一致
+            pieces = len(split_tokens(reply["content"])) - 1 if reply["content"] else 0
+            pieces += sum(len(split_tokens(call["arguments"], 8)) for call in reply["tool_calls"])
+            await asyncio.sleep(self.first_token_delay + self.token_delay * pieces)
+            message: Dict[str, Any] = {"role": "assistant", "content": reply["content"]}
+            if reply["tool_calls"]:
+                message["tool_calls"] = [
+                    {"id": call["id"], "type": "function",
+                     "function": {"name": call["name"], "arguments": call["arguments"]}}
+                    for call in reply["tool_calls"]
+                ]
+            return JSONResponse({
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            })
+
+        def chunk(delta: Dict[str, Any], finish=None) -> str:
+            data = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        async def events():
+            await asyncio.sleep(self.first_token_delay)
+            yield chunk({"role": "assistant", "content": ""})
+            if reply["content"]:
+                for i, token in enumerate(split_tokens(reply["content"])):
+                    if i:
+                        await asyncio.sleep(self.token_delay)
+                    yield chunk({"content": token})
+            for index, call in enumerate(reply["tool_calls"]):
+                yield chunk({"tool_calls": [{"index": index, "id": call["id"], "type": "function",
+                                             "function": {"name": call["name"], "arguments": ""}}]})
+                for piece in split_tokens(call["arguments"], 8):
+                    await asyncio.sleep(self.token_delay)
+                    yield chunk({"tool_calls": [{"index": index, "function": {"arguments": piece}}]})
+            yield chunk({}, finish_reason)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    def start(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
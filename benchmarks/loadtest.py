@@ -0,0 +1,286 @@
+"""
+MCP server 和客户端的压测脚本
+
+使用方法：
+    python benchmarks/loadtest.py [--transports streamable-http sse] [--scenarios bmi weather chat]
+                                  [--concurrency 10 50] [--requests 500] [--output results.json]
+                                  [--baseline old.json] [--threshold 0.1]
+
+在进程内启动：
+- 注册全部工具的 MCP server（mcp_tools.create_mcp），每种传输一个
+- 本地 wttr.in 替身（stub_upstream.StubUpstream）
+- 本地假 LLM（fake_llm.FakeLLM），供 chat 场景使用
+
+对每种传输、场景和并发数，启动 concurrency 个虚拟用户，每个用户使用自己的 MCP 会话，
+合计发出 requests 个请求，统计：
+- req/s 和 p50/p95/p99 延迟
+- 握手耗时（建立连接 + initialize）
+- 每个会话占用的内存（tracemalloc 统计的客户端 + 服务端 Python 内存增量）
+- chat 场景额外统计首 token 时间
+
+结果写入 JSON 文件（--output）。传入 --baseline 时与之前的结果对比，
+吞吐下降或 p99 上升超过 threshold 的项目视为回归，脚本以退出码 1 结束。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_llm import CITIES, FakeLLM
+from local_server import LocalMCPServer
+from stub_upstream import StubUpstream
+
+from fastmcp import Client
+
+TRANSPORT_PATHS = {"streamable-http": "/my-custom-path/", "sse": "/sse"}
+SCENARIOS = ("bmi", "weather", "chat")
+CHAT_QUERY = "北京今天天气怎么样？顺便算一下70公斤1.75米的BMI"
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """返回 p50/p95/p99/mean（毫秒），保留一位小数"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    return {
+        "p50": round(statistics.median(ordered), 1),
+        "p95": round(pick(0.95), 1),
+        "p99": round(pick(0.99), 1),
+        "mean": round(statistics.fmean(ordered), 1),
+    }
+
+
+async def connect(url: str, handshakes: List[float]) -> Client:
+    start = time.perf_counter()
+    client = Client(url)
+    await client.__aenter__()
+    handshakes.append((time.perf_counter() - start) * 1000)
+    return client
+
+
+async def run_tool_scenario(url: str, scenario: str, concurrency: int, requests: int) -> Dict[str, Any]:
+    """concurrency 个会话并发调用工具，合计 requests 次"""
+    handshakes: List[float] = []
+    clients = await asyncio.gather(*(connect(url, handshakes) for _ in range(concurrency)))
+    latencies: List[float] = []
+    errors = 0
+
+    def args_for(i: int) -> Dict[str, Any]:
+        if scenario == "bmi":
+            return {"weight_kg": 50 + i % 50, "height_m": 1.75}
+        return {"city": CITIES[i % len(CITIES)], "date": "今天"}
+
+    tool_name = "calculate_bmi" if scenario == "bmi" else "get_weather"
+
+    async def user(index: int, client: Client):
+        nonlocal errors
+        for i in range(index, requests, concurrency):
+            start = time.perf_counter()
+            try:
+                await client.call_tool(tool_name, args_for(i))
+            except Exception:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(index, client) for index, client in enumerate(clients)))
+    wall = time.perf_counter() - start
+    await asyncio.gather(*(client.close() for client in clients))
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": round(len(latencies) / wall, 1),
+        "latency_ms": percentiles(latencies),
+        "handshake_ms": percentiles(handshakes),
+    }
+
+
+async def run_chat_scenario(url: str, concurrency: int, requests: int) -> Dict[str, Any]:
+    """concurrency 个聊天机器人并发对话，合计 requests 轮"""
+    from fastmcp_client_streamhttp_chatbot import MCPClient
+
+    bots = [MCPClient(url) for _ in range(concurrency)]
+    handshakes: List[float] = []
+
+    async def warm(bot: MCPClient):
+        start = time.perf_counter()
+        await bot.mcp_session.connect()
+        handshakes.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(warm(bot) for bot in bots))
+    latencies: List[float] = []
+    first_tokens: List[float] = []
+    errors = 0
+
+    async def user(index: int, bot: MCPClient):
+        nonlocal errors
+        available_tools = await bot.get_mcp_tools()
+        for _ in range(index, requests, concurrency):
+            bot.conversation_history.clear()
+            start = time.perf_counter()
+            try:
+                await bot.process_query(CHAT_QUERY, available_tools)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            if bot.last_turn_stats.get("time_to_first_token") is not None:
+                first_tokens.append(bot.last_turn_stats["time_to_first_token"] * 1000)
+
+    start = time.perf_counter()
+    # 聊天机器人会打印 token 和工具调用过程，这里屏蔽掉
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(user(index, bot) for index, bot in enumerate(bots)))
+    wall = time.perf_counter() - start
+    await asyncio.gather(*(bot.clean() for bot in bots))
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": round(len(latencies) / wall, 1),
+        "latency_ms": percentiles(latencies),
+        "time_to_first_token_ms": percentiles(first_tokens),
+        "handshake_ms": percentiles(handshakes),
+    }
+
+
+async def measure_session_memory(url: str, sessions: int) -> float:
+    """打开 sessions 个会话，返回平均每个会话的 Python 内存增量（KB）"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        clients = await asyncio.gather(*(connect(url, []) for _ in range(sessions)))
+        await asyncio.gather(*(client.ping() for client in clients))
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    await asyncio.gather(*(client.close() for client in clients))
+    return round((after - before) / sessions / 1024, 1)
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """对比两次结果，返回回归项的说明"""
+    old = {(r["transport"], r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        key = (result["transport"], result["scenario"], result["concurrency"])
+        if key not in old:
+            continue
+        before = old[key]
+        label = f"{key[0]}/{key[1]}/c={key[2]}"
+        if before["rps"] and result["rps"] < before["rps"] * (1 - threshold):
+            regressions.append(f"{label}: 吞吐 {before['rps']} -> {result['rps']} req/s")
+        old_p99 = before["latency_ms"].get("p99")
+        new_p99 = result["latency_ms"].get("p99")
+        if old_p99 and new_p99 and new_p99 > old_p99 * (1 + threshold):
+            regressions.append(f"{label}: p99 {old_p99} -> {new_p99} ms")
+    return regressions
+
+
+def print_result(result: Dict[str, Any]):
+    latency = result["latency_ms"]
+    handshake = result["handshake_ms"]
+    line = (
+        f"[{result['transport']:<15} {result['scenario']:<7} c={result['concurrency']:<4}]"
+        f" {result['rps']:8.1f} req/s"
+        f"  p50={latency.get('p50', 0):7.1f} p95={latency.get('p95', 0):7.1f} p99={latency.get('p99', 0):7.1f}ms"
+        f"  握手 p50={handshake.get('p50', 0):6.1f}ms  错误={result['errors']}"
+    )
+    if result.get("time_to_first_token_ms"):
+        line += f"  首token p50={result['time_to_first_token_ms']['p50']:.1f}ms"
+    print(line)
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="MCP server / 客户端压测")
+    parser.add_argument("--transports", nargs="+", default=list(TRANSPORT_PATHS), choices=list(TRANSPORT_PATHS))
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[10, 50], help="并发会话数，可以给多个")
+    parser.add_argument("--requests", type=int, default=500, help="每组工具调用的总请求数")
+    parser.add_argument("--chat-requests", type=int, default=50, help="每组 chat 场景的总轮数")
+    parser.add_argument("--memory-sessions", type=int, default=50, help="测量内存时打开的会话数")
+    parser.add_argument("--upstream-delay", type=float, default=0.05, help="wttr.in 替身的响应延迟（秒）")
+    parser.add_argument("--weather-cache-ttl", type=float, default=0, help="天气缓存 TTL，0 表示每次都请求上游")
+    parser.add_argument("--first-token-delay", type=float, default=0.1, help="假 LLM 首个片段前的延迟（秒）")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="假 LLM 片段之间的延迟（秒）")
+    parser.add_argument("--output", help="结果 JSON 文件路径")
+    parser.add_argument("--baseline", help="用于对比的历史结果 JSON 文件")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定回归的相对变化阈值")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": [],
+        "memory_per_session_kb": {},
+    }
+
+    with StubUpstream(delay=args.upstream_delay) as upstream, \
+            FakeLLM(args.first_token_delay, args.token_delay) as llm:
+        os.environ["WTTR_ENDPOINT"] = upstream.url
+        os.environ["WTTR_CACHE_TTL"] = str(args.weather_cache_ttl)
+        os.environ["LLM_BASE_URL"] = llm.base_url
+        os.environ["KIMI_API_KEY"] = "loadtest"
+        # 压测的所有会话来自同一个 IP，默认关闭按客户端的限流和并发上限，测的是 server 本身的吞吐
+        os.environ.setdefault("MCP_RATE_LIMIT", "0")
+        os.environ.setdefault("MCP_CLIENT_CONCURRENCY", "100000")
+        from mcp_tools import create_mcp
+
+        for transport in args.transports:
+            server = LocalMCPServer(create_mcp("loadtest"), transport=transport, path=TRANSPORT_PATHS[transport])
+            server.start()
+            try:
+                for scenario in args.scenarios:
+                    for concurrency in args.concurrency:
+                        if scenario == "chat":
+                            result = await run_chat_scenario(server.url, concurrency, args.chat_requests)
+                        else:
+                            result = await run_tool_scenario(server.url, scenario, concurrency, args.requests)
+                        result = {"transport": transport, "scenario": scenario, "concurrency": concurrency, **result}
+                        results["results"].append(result)
+                        print_result(result)
+                memory = await measure_session_memory(server.url, args.memory_sessions)
+                results["memory_per_session_kb"][transport] = memory
+                print(f"[{transport:<15} memory ] {memory:.1f} KB/会话（{args.memory_sessions} 个会话）")
+            finally:
+                server.stop(force=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("发现性能回归：")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"与 {args.baseline} 相比没有超过 {args.threshold:.0%} 的回归")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,61 @@
+"""
+在后台线程里启动 FastMCP server，供 benchmarks 下的脚本使用
+
+使用示例：
+    with LocalMCPServer(mcp, transport="streamable-http", path="/my-custom-path") as server:
+        client = SimpleMCPClient(server.url)
+"""
+
+import threading
+import time
+from typing import Optional
+
+import uvicorn
+from fastmcp import FastMCP
+
+from stub_upstream import free_port
+
+
+class LocalMCPServer:
+    """用 uvicorn 在后台线程运行的本地 MCP server"""
+
+    def __init__(
+        self,
+        mcp: FastMCP,
+        transport: str = "streamable-http",
+        path: Optional[str] = None,
+        port: Optional[int] = None,
+    ):
+        """
+        Args:
+            mcp: 要运行的 FastMCP 实例
+            transport: "streamable-http" 或 "sse"
+            path: 端点路径，默认 streamable-http 为 /mcp，sse 为 /sse
+            port: 监听端口，默认随机选择空闲端口
+        """
+        self.transport = transport
+        self.path = path or ("/sse" if transport == "sse" else "/mcp")
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}{self.path}"
+        app = mcp.http_app(path=self.path, transport=transport)
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+
+    def stop(self, force: bool = False):
+        """停止 server，force=True 时不等待已有连接结束（模拟 server 崩溃）"""
+        self._server.should_exit = True
+        self._server.force_exit = force
+        self._thread.join(timeout=5)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
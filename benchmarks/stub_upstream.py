@@ -0,0 +1,154 @@
+"""
+本地 wttr.in 替身服务，供 benchmarks 下的脚本使用
+
+在后台线程里用 uvicorn 启动一个 starlette 应用，
+对任意 /{city} 路径在固定延迟后返回一段天气文本，不依赖外网。
+请求带 format=j1 时返回与 wttr.in 结构相同的 JSON（当前实况、3 天预报，每天 8 个时段）。
+可以按比例注入故障（返回 503、挂起不返回、变慢），或者用 down=True 模拟上游整体不可用。
+"""
+
+import asyncio
+import random
+import socket
+import threading
+import time
+from datetime import date, timedelta
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wttr_j1_payload(city: str) -> dict:
+    """构造 wttr.in format=j1 格式的响应，字段与真实服务一致（只填了常用字段之外的一部分）"""
+    def hour(time_code: int, temp: int) -> dict:
+        return {
+            "time": str(time_code), "tempC": str(temp), "tempF": str(temp * 9 // 5 + 32),
+            "FeelsLikeC": str(temp + 1), "FeelsLikeF": str((temp + 1) * 9 // 5 + 32),
+            "HeatIndexC": str(temp + 1), "DewPointC": "12", "WindChillC": str(temp),
+            "windspeedKmph": "10", "windspeedMiles": "6", "winddirDegree": "45", "winddir16Point": "NE",
+            "WindGustKmph": "15", "humidity": "40", "visibility": "10", "pressure": "1012",
+            "cloudcover": "20", "precipMM": "0.0", "uvIndex": "5",
+            "chanceofrain": str(time_code // 300), "chanceofsnow": "0", "chanceofthunder": "0",
+            "chanceoffog": "0", "chanceofsunshine": "80", "chanceofovercast": "10",
+            "weatherCode": "113", "weatherDesc": [{"value": "Sunny"}], "lang_zh": [{"value": "晴"}],
+            "weatherIconUrl": [{"value": ""}],
+        }
+
+    today = date.today()
+    return {
+        "current_condition": [{
+            "temp_C": "25", "FeelsLikeC": "26", "humidity": "40", "windspeedKmph": "10",
+            "winddir16Point": "NE", "weatherDesc": [{"value": "Sunny"}], "lang_zh": [{"value": "晴"}],
+            "pressure": "1012", "visibility": "10", "uvIndex": "5", "cloudcover": "20",
+        }],
+        "nearest_area": [{"areaName": [{"value": city}], "country": [{"value": "China"}]}],
+        "request": [{"query": city, "type": "City"}],
+        "weather": [
+            {
+                "date": (today + timedelta(days=offset)).isoformat(),
+                "maxtempC": str(30 - offset), "mintempC": str(18 - offset), "avgtempC": str(24 - offset),
+                "sunHour": "11.0", "uvIndex": "6", "totalSnow_cm": "0.0",
+                "astronomy": [{"sunrise": "05:00 AM", "sunset": "07:30 PM", "moon_phase": "Waxing Gibbous"}],
+                "hourly": [hour(i * 300, 18 + i) for i in range(8)],
+            }
+            for offset in range(3)
+        ],
+    }
+
+
+class StubUpstream:
+    """
+    模拟 wttr.in 的本地 HTTP 服务
+
+    使用示例：
+        with StubUpstream(delay=0.2) as upstream:
+            os.environ["WTTR_ENDPOINT"] = upstream.url
+    """
+
+    def __init__(
+        self,
+        delay: float = 0.2,
+        body: str = "Weather report: 晴 25°C\n",
+        error_rate: float = 0.0,
+        hang_rate: float = 0.0,
+        slow_rate: float = 0.0,
+        slow_delay: float = 1.0,
+        seed: int = 0,
+    ):
+        """
+        Args:
+            delay: 每个请求的响应延迟（秒）
+            body: 返回的天气文本
+            error_rate: 返回 503 的请求比例
+            hang_rate: 挂起（直到客户端超时断开）的请求比例
+            slow_rate: 以 slow_delay 代替 delay 响应的请求比例
+            slow_delay: 慢请求的响应延迟（秒）
+            seed: 故障注入的随机种子，保证多次运行结果一致
+        """
+        self.delay = delay
+        self.body = body
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.down = False  # True 时所有请求都返回 503
+        self.faults = {"error": 0, "hang": 0, "slow": 0}
+        self._random = random.Random(seed)
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.request_count = 0
+        app = Starlette(routes=[Route("/{city:path}", self._handle)])
+        # 挂起的请求不会自己结束，停止时最多等 1 秒
+        config = uvicorn.Config(
+            app, host="127.0.0.1", port=self.port, log_level="warning", timeout_graceful_shutdown=1
+        )
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    async def _handle(self, request):
+        self.request_count += 1
+        roll = self._random.random()
+        if self.down or roll < self.error_rate:
+            self.faults["error"] += 1
+            return PlainTextResponse("injected failure", status_code=503)
+        roll -= self.error_rate
+        if roll < self.hang_rate:
+            self.faults["hang"] += 1
+            # 一直不返回，客户端超时断开后结束
+            while not await request.is_disconnected():
+                await asyncio.sleep(0.1)
+            return PlainTextResponse("", status_code=499)
+        roll -= self.hang_rate
+        if roll < self.slow_rate:
+            self.faults["slow"] += 1
+            await asyncio.sleep(self.slow_delay)
+        else:
+            await asyncio.sleep(self.delay)
+        city = request.path_params["city"]
+        if request.query_params.get("format") == "j1":
+            return JSONResponse(wttr_j1_payload(city))
+        return PlainTextResponse(f"{city}: {self.body}")
+
+    def start(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
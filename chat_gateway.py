@@ -0,0 +1,303 @@
+'''
+conda env mcp_env ,Python版本 3.10.18
+关闭 proxy
+使用方法：先把server启动，然后启动网关 : python chat_gateway.py http://127.0.0.1:8083/my-custom-path [port]
+
+多用户聊天网关
+chat_loop 只服务一个终端用户。网关在一个进程里托管大量相互独立的对话：
+1. 每个对话有自己的 MCPClient（只包含对话历史和统计），共享同一个 MCP 会话池、工具定义缓存和 LLM 连接池
+2. POST /chat 以 SSE 流式返回回答 token
+3. 每个对话的历史受 token 预算限制；对话数达到上限时淘汰最久未使用的空闲对话，空闲超时的对话定期清理
+4. 可选的 ResponseCache 在所有对话间共享，不同用户问同一个问题时直接返回缓存的回答
+
+接口：
+    POST   /chat                  {"query": "...", "session_id": "可选"} -> text/event-stream
+                                  事件依次为 session、token（多个）、done 或 error
+    DELETE /sessions/{session_id} 结束一个对话
+    GET    /stats                 网关状态
+'''
+
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+import uvicorn
+from dotenv import load_dotenv, find_dotenv
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from fastmcp_client_streamhttp_chatbot import MCPClient
+from mcp_session import MCPSessionPool
+from response_cache import ResponseCache
+from llm_stream import create_http_client, create_llm_client
+from resilience import ToolCallPolicy
+from turn_budget import TurnBudget
+from tool_catalog import ToolSchemaCache
+
+_ = load_dotenv(find_dotenv())
+
+
+class GatewayBusyError(Exception):
+    """对话数已达上限且没有可以淘汰的空闲对话"""
+
+
+class _ChatSession:
+    """网关内的一个对话"""
+
+    def __init__(self, client: MCPClient):
+        self.client = client
+        self.lock = asyncio.Lock()  # 同一对话的多个请求按顺序处理，保证历史一致
+        self.last_active = time.monotonic()
+        self.turns = 0
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class ChatGateway:
+    """
+    多用户聊天网关
+
+    使用示例：
+        gateway = ChatGateway("http://127.0.0.1:8083/my-custom-path")
+        uvicorn.run(gateway.app, port=8090)
+    """
+
+    def __init__(
+        self,
+        mcpserver_url: str,
+        max_sessions: int = 10000,
+        idle_timeout: float = 1800.0,
+        evict_interval: float = 60.0,
+        history_token_budget: int = 2000,
+        max_query_chars: int = 4000,
+        pool_size: int = 8,
+        llm_max_connections: int = 100,
+        parallel_tool_calls: bool = False,
+        tool_cache_ttl: Optional[float] = None,
+        response_cache: Optional[ResponseCache] = None,
+    ):
+        """
+        Args:
+            mcpserver_url: MCP服务器的URL地址
+            max_sessions: 同时保留的对话数上限
+            idle_timeout: 对话空闲多久（秒）后被清理
+            evict_interval: 空闲清理的执行间隔（秒）
+            history_token_budget: 每个对话历史的 token 上限
+            max_query_chars: 单条用户消息的最大长度
+            pool_size: 共享的 MCP 会话数
+            llm_max_connections: 共享的 LLM HTTP 连接数上限
+            parallel_tool_calls: 同一轮的多个工具调用是否并发执行
+            tool_cache_ttl: 工具定义缓存的有效期（秒）
+            response_cache: 所有对话共享的工具结果 / 回答缓存，None 表示不缓存（由调用方负责关闭）
+        """
+        self.mcpserver_url = mcpserver_url
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.evict_interval = evict_interval
+        self.history_token_budget = history_token_budget
+        self.max_query_chars = max_query_chars
+        self.parallel_tool_calls = parallel_tool_calls
+        self.response_cache = response_cache
+        # 支持发送预编码的请求体（见 message_store）
+        self.llm = create_llm_client(
+            os.getenv("KIMI_API_KEY"),
+            os.getenv("LLM_BASE_URL", "https://api.moonshot.cn/v1"),
+            http_client=create_http_client(
+                limits=httpx.Limits(max_connections=llm_max_connections, max_keepalive_connections=llm_max_connections)
+            ),
+        )
+        self.tool_cache = ToolSchemaCache(lambda: self.pool.list_tools(), ttl=tool_cache_ttl)
+        # 重试只由 tool_policy 负责，会话连接失败时直接抛出
+        self.pool = MCPSessionPool(
+            mcpserver_url, size=pool_size, retry=False, message_handler=self.tool_cache.message_handler
+        )
+        # 所有对话共用熔断器（每个 server 一个）：server 不可用时所有对话调用它的工具都快速失败
+        self.tool_policy = ToolCallPolicy.from_env()
+        self.turn_budget = TurnBudget.from_env()
+        self.sessions: "OrderedDict[str, _ChatSession]" = OrderedDict()  # 按最近使用排序
+        self.evicted = 0
+        self.expired = 0
+        self._evictor: Optional[asyncio.Task] = None
+        self.app = Starlette(
+            routes=[
+                Route("/chat", self._chat, methods=["POST"]),
+                Route("/sessions/{session_id}", self._end_session, methods=["DELETE"]),
+                Route("/stats", self._stats, methods=["GET"]),
+            ],
+            lifespan=self._lifespan,
+        )
+
+    @contextlib.asynccontextmanager
+    async def _lifespan(self, app: Starlette):
+        await self.start()
+        try:
+            yield
+        finally:
+            await self.close()
+
+    async def start(self):
+        """预热 MCP 会话池和工具缓存，并启动空闲清理任务"""
+        await self.pool.start()
+        await self.tool_cache.get()
+        if self._evictor is None or self._evictor.done():
+            self._evictor = asyncio.create_task(self._evict_loop())
+
+    def get_session(self, session_id: str) -> _ChatSession:
+        """返回已有对话或新建一个，达到上限时淘汰最久未使用的空闲对话"""
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.sessions.move_to_end(session_id)
+            return session
+        if len(self.sessions) >= self.max_sessions:
+            victim = next((sid for sid, s in self.sessions.items() if not s.lock.locked()), None)
+            if victim is None:
+                raise GatewayBusyError("对话数已达上限")
+            del self.sessions[victim]
+            self.evicted += 1
+        client = MCPClient(
+            self.mcpserver_url,
+            parallel_tool_calls=self.parallel_tool_calls,
+            history_token_budget=self.history_token_budget,
+            llm=self.llm,
+            mcp_session=self.pool,
+            tool_cache=self.tool_cache,
+            response_cache=self.response_cache,
+            tool_policy=self.tool_policy,
+            turn_budget=self.turn_budget,
+        )
+        session = _ChatSession(client)
+        self.sessions[session_id] = session
+        return session
+
+    def evict_idle(self):
+        """清理空闲超时的对话"""
+        now = time.monotonic()
+        for session_id, session in list(self.sessions.items()):
+            if not session.lock.locked() and now - session.last_active > self.idle_timeout:
+                del self.sessions[session_id]
+                self.expired += 1
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(self.evict_interval)
+            self.evict_idle()
+
+    async def stream_turn(self, session_id: str, session: _ChatSession, query: str) -> AsyncIterator[str]:
+        """处理一轮对话，以 SSE 事件的形式逐个返回 token"""
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        async def run() -> str:
+            try:
+                async with session.lock:
+                    available_tools = await self.tool_cache.get()
+                    answer = await session.client.process_query(query, available_tools, on_token=queue.put_nowait)
+                    session.turns += 1
+                    return answer
+            finally:
+                session.last_active = time.monotonic()
+                queue.put_nowait(done)
+
+        task = asyncio.create_task(run())
+        yield sse_event("session", {"session_id": session_id})
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            yield sse_event("token", {"text": item})
+        try:
+            answer = await task
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+            return
+        yield sse_event("done", {"answer": answer, "stats": session.client.last_turn_stats})
+
+    async def _chat(self, request: Request):
+        try:
+            body = await request.json()
+        except ValueError:
+            return JSONResponse({"error": "请求体不是合法的 JSON"}, status_code=400)
+        if not isinstance(body, dict):
+            return JSONResponse({"error": "请求体必须是 JSON 对象"}, status_code=400)
+        query = str(body.get("query") or "").strip()
+        if not query:
+            return JSONResponse({"error": "query 不能为空"}, status_code=400)
+        if len(query) > self.max_query_chars:
+            return JSONResponse({"error": f"query 超过 {self.max_query_chars} 个字符"}, status_code=413)
+        session_id = str(body.get("session_id") or uuid.uuid4().hex)
+        try:
+            session = self.get_session(session_id)
+        except GatewayBusyError as e:
+            return JSONResponse({"error": str(e)}, status_code=503)
+        session.last_active = time.monotonic()
+        return StreamingResponse(self.stream_turn(session_id, session, query), media_type="text/event-stream")
+
+    async def _end_session(self, request: Request):
+        session = self.sessions.pop(request.path_params["session_id"], None)
+        return JSONResponse({"deleted": session is not None})
+
+    async def _stats(self, request: Request):
+        return JSONResponse(self.stats())
+
+    def stats(self) -> Dict[str, Any]:
+        """返回网关状态"""
+        return {
+            "sessions": len(self.sessions),
+            "active_turns": sum(1 for session in self.sessions.values() if session.lock.locked()),
+            "history_tokens": sum(session.client.conversation_history.tokens() for session in self.sessions.values()),
+            "evicted": self.evicted,
+            "expired": self.expired,
+            "mcp_pool": self.pool.stats(),
+            "tool_cache_refreshes": self.tool_cache.refresh_count,
+            "response_cache": self.response_cache.stats() if self.response_cache is not None else None,
+            "tool_circuit": self.tool_policy.breaker_stats(),
+        }
+
+    async def close(self):
+        """停止清理任务并释放共享资源"""
+        if self._evictor is not None:
+            self._evictor.cancel()
+            try:
+                await self._evictor
+            except asyncio.CancelledError:
+                pass
+            self._evictor = None
+        self.sessions.clear()
+        await self.pool.close()
+        await self.llm.close()
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("使用方法: python chat_gateway.py <server_url> [port]")
+        print("例如: python chat_gateway.py http://127.0.0.1:8083/my-custom-path 8090")
+        sys.exit(1)
+
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8090
+    cache_path = os.getenv("MCP_RESPONSE_CACHE")
+    response_cache = ResponseCache(cache_path) if cache_path else None
+    gateway = ChatGateway(
+        sys.argv[1],
+        parallel_tool_calls=os.getenv("MCP_PARALLEL_TOOL_CALLS") == "1",
+        response_cache=response_cache,
+    )
+    try:
+        uvicorn.run(gateway.app, host="127.0.0.1", port=port)
+    finally:
+        if response_cache is not None:
+            response_cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+按 token 预算管理的对话历史
+
+原先 conversation_history 是一个无限增长的列表，每轮都把 system prompt 和全部历史重新发给模型，
+prompt token 数和延迟随会话长度线性增长。ConversationHistory：
+1. 用本地的粗略估算统计 token（中日韩字符按 1 个 token，其余字符按 4 个字符 1 个 token）
+2. 超出预算时从最早的一轮开始丢弃
+3. 可选的滚动摘要模式：把较早的几轮压缩成一条摘要消息，新的摘要会合并旧的摘要
+可以像列表一样迭代，messages.extend(history) 的用法保持不变；
+encoded() 返回修剪、编码后的历史（message_store.EncodedSegment），缓存到历史下一次变化。
+"""
+
+import json
+import re
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from llm_stream import chat_completion
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+    from message_store import EncodedSegment
+
+# 中日韩统一表意文字、标点和全角字符
+_CJK_PATTERN = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+# 每条消息除内容外的固定开销（role、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PREFIX = "以下是之前对话的摘要：\n"
+
+SUMMARY_PROMPT = (
+    "请把下面的对话（可能包含更早的摘要）压缩成一段简短的中文摘要，"
+    "保留用户的问题、工具查询到的关键数据（日期、城市、天气、计算结果等）和已经给出的结论，"
+    "不要添加对话中没有的信息。"
+)
+
+# 把一组消息（可能包含旧摘要）压缩成一段摘要文本的函数
+Summarizer = Callable[[List[Dict[str, Any]]], Awaitable[str]]
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """粗略估算一段文本的 token 数，不依赖具体模型的分词器"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    """估算单条消息的 token 数（包含内容和工具调用参数）"""
+    tokens = MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message.get("content"))
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function") or {}
+        tokens += estimate_tokens(function.get("name")) + estimate_tokens(function.get("arguments"))
+    return tokens
+
+
+def messages_tokens(messages: List[Dict[str, Any]], tools_json: str = "") -> int:
+    """估算一次请求的 prompt token 数：所有消息加上工具定义"""
+    return sum(message_tokens(message) for message in messages) + estimate_tokens(tools_json)
+
+
+class ConversationHistory:
+    """
+    按 token 预算管理的对话历史
+
+    使用示例：
+        history = ConversationHistory(token_budget=2000)
+        messages.extend(history)
+        await history.add_turn(query, answer)
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 4000,
+        summarizer: Optional[Summarizer] = None,
+        keep_recent_turns: int = 2,
+    ):
+        """
+        Args:
+            token_budget: 历史消息（含摘要）的 token 上限
+            summarizer: 传入时启用滚动摘要模式，超出预算的旧对话会被压缩成摘要而不是直接丢弃
+            keep_recent_turns: 摘要模式下始终保留原文的最近轮数
+        """
+        self.token_budget = token_budget
+        self.summarizer = summarizer
+        self.keep_recent_turns = keep_recent_turns
+        self.summary: Optional[str] = None
+        self._turns: List[List[Dict[str, Any]]] = []  # 每一轮是一组消息，通常为 user + assistant
+        self.dropped_turns = 0
+        self.dropped_tokens = 0
+        self.summarized_turns = 0
+        self._encoded: Optional["EncodedSegment"] = None  # encoded() 的缓存，历史变化时清空
+
+    def summary_message(self) -> Optional[Dict[str, Any]]:
+        if not self.summary:
+            return None
+        return {"role": "system", "content": SUMMARY_PREFIX + self.summary}
+
+    def to_messages(self) -> List[Dict[str, Any]]:
+        """返回发给模型的历史消息（摘要在最前面）"""
+        messages = []
+        summary = self.summary_message()
+        if summary is not None:
+            messages.append(summary)
+        for turn in self._turns:
+            messages.extend(turn)
+        return messages
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.to_messages())
+
+    def encoded(self) -> "EncodedSegment":
+        """修剪、编码后的历史消息，同一份历史在多轮请求之间只编码一次"""
+        if self._encoded is None:
+            from message_store import EncodedSegment
+
+            self._encoded = EncodedSegment(self.to_messages())
+        return self._encoded
+
+    def __len__(self) -> int:
+        return len(self.to_messages())
+
+    def tokens(self) -> int:
+        """当前历史的估算 token 数"""
+        return sum(message_tokens(message) for message in self.to_messages())
+
+    def clear(self):
+        self._turns.clear()
+        self.summary = None
+        self._encoded = None
+
+    async def add_turn(self, query: str, answer: Optional[str]):
+        """记录一轮对话，超出预算时压缩"""
+        self._turns.append([
+            {"role": "user", "content": query},
+            {"role": "assistant", "content": answer},
+        ])
+        await self.compact()
+
+    async def compact(self):
+        """把历史压缩到预算以内"""
+        self._encoded = None
+        if self.tokens() <= self.token_budget:
+            return
+        if self.summarizer is not None:
+            await self._summarize_old_turns()
+        # 没有摘要器、摘要失败或摘要后仍超出预算时，从最早的一轮开始丢弃
+        while self._turns and self.tokens() > self.token_budget:
+            turn = self._turns.pop(0)
+            self.dropped_turns += 1
+            self.dropped_tokens += sum(message_tokens(message) for message in turn)
+        if self.tokens() > self.token_budget:
+            self.summary = None
+
+    async def _summarize_old_turns(self):
+        old_count = len(self._turns) - self.keep_recent_turns
+        if old_count <= 0:
+            return
+        old_turns = self._turns[:old_count]
+        to_summarize = []
+        summary = self.summary_message()
+        if summary is not None:
+            to_summarize.append(summary)
+        for turn in old_turns:
+            to_summarize.extend(turn)
+        try:
+            self.summary = (await self.summarizer(to_summarize)).strip()
+        except Exception as e:
+            print(f"[历史摘要失败，改为直接截断: {e}]")
+            return
+        del self._turns[:old_count]
+        self.summarized_turns += old_count
+
+    def stats(self) -> Dict[str, Any]:
+        """返回历史的大小和压缩情况"""
+        return {
+            "history_messages": len(self),
+            "history_tokens": self.tokens(),
+            "dropped_turns": self.dropped_turns,
+            "dropped_tokens": self.dropped_tokens,
+            "summarized_turns": self.summarized_turns,
+        }
+
+
+def format_for_summary(messages: List[Dict[str, Any]]) -> str:
+    """把待摘要的消息整理成一段文本，作为摘要请求的输入"""
+    role_names = {"system": "摘要", "user": "用户", "assistant": "助手"}
+    lines = []
+    for message in messages:
+        content = message.get("content")
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False)
+        lines.append(f"{role_names.get(message['role'], message['role'])}: {content}")
+    return "\n".join(lines)
+
+
+def make_llm_summarizer(llm: Callable[[], "AsyncOpenAI"], model: str) -> Summarizer:
+    """
+    创建一个用 LLM 生成摘要的 summarizer（非流式，不打印输出）
+
+    llm 是返回 LLM 客户端的函数，第一次需要摘要时才调用，创建 summarizer 不会导入 openai 或建立连接
+    """
+
+    async def summarize(messages: List[Dict[str, Any]]) -> str:
+        completion = await chat_completion(
+            llm(),
+            model,
+            [
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": format_for_summary(messages)},
+            ],
+            stream=False,
+            on_token=None,
+        )
+        return completion.message.content or ""
+
+    return summarize
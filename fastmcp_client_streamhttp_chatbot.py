@@ -2,150 +2,343 @@
 conda env mcp_env ,Python版本 3.10.18
 关闭 proxy
 使用方法：先把server启动，然后启动chat_bot.py  : python chat_bot.py http://127.0.0.1:8083/my-custom-path
+同时连接多个server：python chat_bot.py bmi=http://127.0.0.1:8083/my-custom-path weather=sse+http://127.0.0.1:8000/toolmcp
+同一个server的多个副本：python chat_bot.py http://127.0.0.1:8083/my-custom-path,http://127.0.0.1:8084/my-custom-path
+录制 / 回放流量：MCP_RECORD_TRAFFIC=session.jsonl.gz python chat_bot.py <server_url>，之后 MCP_REPLAY_TRAFFIC=session.jsonl.gz python chat_bot.py
 
 MCP客户端 - 专注于list_tools() 和 call_tool() 两个核心方法
 再集成llm智能理解工具功能和参数返回具体使用参数
 '''
 
 import asyncio
-import json
 import sys
+import time
 
-from typing import List,Dict,Any,Optional
-from openai import OpenAI
+from typing import TYPE_CHECKING, List,Dict,Any,Optional,Callable,Sequence,Union
 # 加载环境变量
 import os
 from dotenv import load_dotenv, find_dotenv
 _ = load_dotenv(find_dotenv())
 
-from fastmcp import Client
+from tool_catalog import ToolSchemaCache
+from tool_router import MultiServerSession, create_session, parse_server_specs, tool_server
+from llm_stream import chat_completion, create_llm_client, make_token_printer
+from conversation_history import ConversationHistory, make_llm_summarizer
+from message_store import MessageStore, system_segment
+from tracing import traced, tracer
+from response_cache import ResponseCache
+from resilience import ToolCallPolicy
+from turn_budget import BUDGET_REASONS, TurnBudget, TurnToolMemo, force_answer_message
+from tool_dispatch import PARALLEL_MULTI_TASK_RULE, SEQUENTIAL_MULTI_TASK_RULE, dispatch_tool_calls
+from traffic_replay import TrafficRecorder, TrafficReplay, traffic_from_env
 
-
-from pydantic import BaseModel
-# 请求/响应模型
-class ToolCallRequest(BaseModel):
-    tool_name: str
-    arguments: Dict[str, Any]
-
-class ToolCallResponse(BaseModel):
-    result: str
-    success: bool
-    error: Optional[str] = None
-
-class ToolsResponse(BaseModel):
-    tools: List[Dict[str, Any]]
-    count: int
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
 
 
 class MCPClient:
-    def __init__(self, mcpserver_url: str):
+    def __init__(
+        self,
+        mcpserver_url: Union[str, Sequence[str]],
+        parallel_tool_calls: bool = False,
+        max_tool_concurrency: int = 4,
+        tool_timeout: Optional[float] = None,
+        stream: bool = True,
+        tool_cache_ttl: Optional[float] = None,
+        history_token_budget: int = 4000,
+        summarize_history: bool = False,
+        llm: Optional["AsyncOpenAI"] = None,
+        mcp_session: Optional[Any] = None,
+        tool_cache: Optional[ToolSchemaCache] = None,
+        response_cache: Optional[ResponseCache] = None,
+        tool_policy: Optional[ToolCallPolicy] = None,
+        turn_budget: Optional[TurnBudget] = None,
+        duplicate_tools: str = "first",
+        traffic: Optional[Union[TrafficRecorder, TrafficReplay]] = None,
+    ):
+        # mcpserver_url: 一个 server 的 URL，或多个 "[名称=][sse+]URL[,URL...]"（见 tool_router），多个时合并各 server 的工具，
+        #                逗号分隔的多个 URL 是同一个 server 的副本，调用在副本间负载均衡
+        # duplicate_tools: 多个 server 提供同名工具时的处理方式，"first" 或 "namespace"
+        # llm / mcp_session / tool_cache 可由调用方传入共享实例（例如 chat_gateway 的多个会话共用），
+        # 此时 clean() 不应由单个会话调用
+        # response_cache: 可选的工具结果 / 最终回答缓存，None 表示不缓存
+        # tool_policy: 工具调用的截止时间、重试、熔断和对冲策略，默认按环境变量创建
+        # turn_budget: 每轮的工具调用轮数、时间和 token 预算，默认按环境变量创建
+        # traffic: 录制（TrafficRecorder）或回放（TrafficReplay）LLM 和工具流量，回放时不连接 LLM 和 MCP server
         self.openai_api_key = os.getenv("KIMI_API_KEY")  # 调用模型的api_key
-        self.base_url = "https://api.moonshot.cn/v1"  # 调用模型url
-        self.model = "kimi-k2-0711-preview"  # 调用模型
-        self.llm = OpenAI(api_key=self.openai_api_key, base_url=self.base_url)
+        self.base_url = os.getenv("LLM_BASE_URL", "https://api.moonshot.cn/v1")  # 调用模型url
+        self.model = os.getenv("LLM_MODEL", "kimi-k2-0711-preview")  # 调用模型
+        self.traffic = traffic
+        if traffic is not None and llm is not None:
+            shared_llm = llm
+            llm = traffic.wrap_llm(lambda: shared_llm)
+        self._llm = llm  # 没有传入时在第一次请求 LLM 时创建，启动时不导入 openai
         self.mcpserver_url = mcpserver_url
-        self.conversation_history = [] # 新增一个列表来存储历史
+        # 工具定义缓存：收到 tools/list_changed 通知、TTL 到期或会话重连后才重新获取
+        self.tool_cache = tool_cache or ToolSchemaCache(
+            lambda: self.mcp_session.list_tools(),
+            ttl=tool_cache_ttl,
+            generation=lambda: self.mcp_session.connect_count,
+        )
+        # 长连接会话，首次使用时才建立，断线后下次调用时重连；多个 server 时并发连接，按工具名路由。
+        # 重试只由 tool_policy 负责，会话本身连接失败时直接抛出（retry=False）
+        if mcp_session is None:
+            specs = parse_server_specs([mcpserver_url] if isinstance(mcpserver_url, str) else mcpserver_url)
+            if len(specs) == 1:
+                # 一个 URL 为 PersistentMCPSession，逗号分隔的多个副本 URL 为 BalancedMCPSession
+                mcp_session = create_session(specs[0], retry=False, message_handler=self.tool_cache.message_handler)
+            else:
+                mcp_session = MultiServerSession(
+                    specs,
+                    duplicates=duplicate_tools,
+                    retry=False,
+                    on_change=self.tool_cache.invalidate,
+                    message_handler=self.tool_cache.message_handler,
+                )
+        if traffic is not None:
+            mcp_session = traffic.wrap_session(mcp_session)
+        self.mcp_session = mcp_session
+        # 按 token 预算管理的对话历史，可选把旧对话压缩成摘要
+        self.conversation_history = ConversationHistory(
+            token_budget=history_token_budget,
+            summarizer=make_llm_summarizer(lambda: self.llm, self.model) if summarize_history else None,
+        )
+        self.parallel_tool_calls = parallel_tool_calls  # 同一轮的多个工具调用是否并发执行
+        self.max_tool_concurrency = max_tool_concurrency  # 并发模式下每轮同时执行的工具调用上限
+        self.tool_timeout = tool_timeout  # 单个工具调用的超时时间（秒），None 表示不限制
+        self.stream = stream  # 是否流式输出LLM回复
+        self.last_turn_stats: Dict[str, Any] = {}  # 最近一轮的LLM调用统计（首token时间等）
+        self.response_cache = response_cache
+        self.tool_policy = tool_policy or ToolCallPolicy.from_env()
+        self.turn_budget = turn_budget or TurnBudget.from_env()
+        self._turn_tools: List[str] = []  # 本轮调用过的工具，决定回答缓存的有效期
+
+    @property
+    def llm(self) -> "AsyncOpenAI":
+        if self._llm is None:
+            create = lambda: create_llm_client(self.openai_api_key, self.base_url)
+            self._llm = create() if self.traffic is None else self.traffic.wrap_llm(create)
+        return self._llm
+
+    async def warm_up(self):
+        """在用户输入第一个问题期间加载 openai、连接 MCP server 并获取工具列表，失败时留到真正使用时再报错"""
+        try:
+            await asyncio.to_thread(lambda: self.llm)
+            await self.get_mcp_tools()
+        except Exception:
+            pass
 
     async def get_mcp_tools(self) -> List[Dict[str, Any]]:
-        async with Client(self.mcpserver_url) as client:
-            tool_list_response = await client.list_tools()
-        # print(f"tool_list_response:\n {tool_list_response}")
-        available_tools = [
-			{
-				"type": "function",
-				"function": {
-					"name": tool.name,
-					"description": tool.description,
-					"input_schema": tool.inputSchema
-				}
-			}
-			for tool in tool_list_response]
-
-        # print(f"\n已连接到服务器 (使用Streamable HTTP)，支持以下工具:", [tool.name for tool in tool_list_response])
-        
-        return available_tools
+        """返回OpenAI格式的工具列表（使用缓存，只有工具变化时才重新请求server）"""
+        return await self.tool_cache.get()
 
+    async def call_tool(self, tool_name: str, tool_args: Dict[str, Any]) -> str:
+        """调用单个工具并返回文本结果"""
+        self._turn_tools.append(tool_name)
+        if self.response_cache is not None:
+            cached = await self.response_cache.get_tool_result(tool_name, tool_args)
+            if cached is not None:
+                print(f"[工具结果命中缓存: {tool_name}，参数: {tool_args}]")
+                return cached
+        print(f"[正在调用工具: {tool_name}，参数: {tool_args}]")
+        # 截止时间、连接失败重试、熔断和对冲由 tool_policy 决定，多个 server 时每个 server 一个熔断器
+        result = await self.tool_policy.call(
+            tool_name,
+            lambda: self.mcp_session.call_tool(tool_name, tool_args),
+            server=tool_server(self.mcp_session, tool_name),
+        )
+        # print(f"tool_call_result:\n {result}")
+        tool_output = result.content[0].text
+        print(f"[工具返回结果: {tool_output[:200]}...]")
+        if self.response_cache is not None:
+            await self.response_cache.put_tool_result(tool_name, tool_args, tool_output)
+        return tool_output
 
-    async def process_query(self, query: str, available_tools: List) -> str:
+    @traced("chat.turn")
+    async def process_query(
+        self,
+        query: str,
+        available_tools: List,
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> str:
         """
         使用大模型处理查询，并支持多轮自主工具调用，直到任务完成。
+        on_token: 流式模式下接收回答 token 的回调，默认打印到终端
         """
+        multi_task_rule = PARALLEL_MULTI_TASK_RULE if self.parallel_tool_calls else SEQUENTIAL_MULTI_TASK_RULE
         system_prompt = (
             "你是一个名为'MCP智能助手'的AI。你的核心任务是准确地回答用户问题。"
             "你的行为准则如下：\n"
             "1. **优先使用工具**：对于任何涉及实时数据（如日期、天气）、计算（如BMI）或其他专业功能的问题，你必须优先调用相应的工具来获取最准确的信息。\n"
             "2. **严禁捏造**：绝对不允许在没有可靠数据来源的情况下编造事实，特别是日期、天气、计算结果等。\n"
             "3. **严禁向用户提问**：你绝对不允许询问用户任何问题。你需要自己分析所有的信息做出决策。\n"
-            "4. **多任务处理**：如果用户一次提出多个请求，你必须逐一处理。你一次只调用一个工具，在完成一个工具调用后，你需要回顾用户的完整请求，检查是否还有未完成的部分，并继续调用其他所需工具，直到所有任务都解决。\n"
+            f"{multi_task_rule}"
             "5. **总结汇报**：在所有工具调用完成后，将结果整合起来，给用户一个清晰、完整、流畅的最终答复。"
         )
         
-        messages = [
-            {"role": "system", "content": system_prompt}
-        ]
-        messages.extend(self.conversation_history)
+        # 修剪、预先编码的消息：system prompt 和历史使用缓存的编码，之后每次请求只编码新增的消息
+        messages = MessageStore(system_segment(system_prompt), self.conversation_history.encoded())
         messages.append({"role": "user", "content": query})
 
 
+        # time_to_first_token: 从本轮开始到用户看到第一个回答 token 的时间（秒）
+        # prompt_tokens: 每次 LLM 请求的估算 prompt token 数；tokens: 本轮 prompt + 回复的估算 token 总数
+        # tool_calls / deduped_tool_calls: 模型请求的工具调用数 / 其中复用本轮结果的次数
+        # budget_exhausted: 预算用完、强制生成回答时的原因（iterations / time / tokens），否则为 None
+        turn_stats = {
+            "llm_calls": 0, "time_to_first_token": None, "llm_seconds": 0.0, "prompt_tokens": [],
+            "answer_cache_hit": False, "iterations": 0, "tool_calls": 0, "deduped_tool_calls": 0,
+            "tokens": 0, "elapsed": 0.0, "budget_exhausted": None,
+        }
+        self.last_turn_stats = turn_stats
+        turn_start = time.perf_counter()
+        self._turn_tools = []
+
+        # 回答缓存只用于没有历史的问题，有历史时同一句话的含义可能依赖上下文
+        use_answer_cache = self.response_cache is not None and len(self.conversation_history) == 0
+        if use_answer_cache:
+            cached = await self.response_cache.get_answer(query)
+            if cached is not None:
+                print("[回答命中缓存]")
+                turn_stats["answer_cache_hit"] = True
+                turn_stats["time_to_first_token"] = time.perf_counter() - turn_start
+                if self.stream:
+                    (on_token or make_token_printer())(cached)
+                await self.conversation_history.add_turn(query, cached)
+                turn_stats["elapsed"] = time.perf_counter() - turn_start
+                turn_stats.update(self.conversation_history.stats())
+                return cached
+
+        memo = TurnToolMemo(self.call_tool)
+        # 工具列表来自缓存时直接使用缓存里预先编码的 JSON
+        tools_json = self.tool_cache.payload_json if available_tools is self.tool_cache.openai_tools else None
         while True:
-            
-            response = self.llm.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                tools=available_tools
+            prompt_tokens = messages.tokens + self.tool_cache.payload_tokens
+            # 预算用完时不再提供工具，让模型根据已有结果直接回答
+            final = turn_stats["budget_exhausted"] = self.turn_budget.exhausted(
+                turn_stats["iterations"], time.perf_counter() - turn_start, turn_stats["tokens"] + prompt_tokens
             )
-            response_message = response.choices[0].message
-            messages.append(response_message.model_dump())
-
-            if response.choices[0].finish_reason == "tool_calls":
-                print(f"\n[LLM决定调用工具...]")
-                for tool_call in response_message.tool_calls:
-                    tool_name = tool_call.function.name
-                    tool_args = json.loads(tool_call.function.arguments)
-                    print(f"[正在调用工具: {tool_name}，参数: {tool_args}]")
-                    async with Client(self.mcpserver_url) as client:
-                        result = await client.call_tool(tool_name, tool_args)
-                    # print(f"tool_call_result:\n {result}")
-                    tool_output = result.content[0].text
-                    print(f"[工具返回结果: {tool_output[:200]}...]")
-                    messages.append(
-                        {"role": "tool", 
-                          "content": tool_output, 
-                          "tool_call_id": tool_call.id})
-                continue
-            else:
-                print(f"\n[LLM认为任务完成，生成最终回答]")
-                self.conversation_history.append({"role": "user", "content": query})
-                self.conversation_history.append({"role": "assistant", "content": response_message.content})
-                return response_message.content
+            if final:
+                print(f"\n[本轮{BUDGET_REASONS[final]}预算已用完，不再调用工具，直接生成回答]")
+                messages.append(force_answer_message(final))
+                prompt_tokens = messages.tokens
+            turn_stats["iterations"] += 1
+            with tracer.span("chat.iteration", {"iteration": turn_stats["iterations"], "final": bool(final)}):
+                turn_stats["prompt_tokens"].append(prompt_tokens)
+                request_start = time.perf_counter()
+                # 进行中的请求也只能用本轮剩下的时间，到期后中断，下一次循环改为不带工具的收尾请求（收尾请求不限时）
+                remaining = None if final else self.turn_budget.remaining(time.perf_counter() - turn_start)
+                try:
+                    completion = await asyncio.wait_for(
+                        chat_completion(
+                            self.llm,
+                            self.model,
+                            messages,
+                            None if final else available_tools,
+                            stream=self.stream,
+                            on_token=on_token or make_token_printer(),
+                            tools_json=tools_json,
+                        ),
+                        remaining,
+                    )
+                except asyncio.TimeoutError:
+                    if remaining is None or self.turn_budget.remaining(time.perf_counter() - turn_start) > 0:
+                        raise
+                    print(f"\n[本轮时间预算已用完，中断 LLM 请求]")
+                    continue
+                turn_stats["llm_calls"] += 1
+                turn_stats["llm_seconds"] += completion.elapsed
+                if turn_stats["time_to_first_token"] is None and completion.time_to_first_token is not None:
+                    turn_stats["time_to_first_token"] = request_start - turn_start + completion.time_to_first_token
+                response_message = completion.message
+                turn_stats["tokens"] += prompt_tokens + messages.append(response_message)
+
+                if completion.finish_reason == "tool_calls" and not final:
+                    print(f"\n[LLM决定调用工具...]")
+                    tool_messages = await dispatch_tool_calls(
+                        response_message.tool_calls,
+                        memo.call,
+                        concurrent=self.parallel_tool_calls,
+                        max_concurrency=self.max_tool_concurrency,
+                        timeout=self.tool_timeout,
+                        time_budget=self.turn_budget.remaining(time.perf_counter() - turn_start),
+                    )
+                    messages.extend(tool_messages)
+                    turn_stats["tool_calls"] = memo.calls
+                    turn_stats["deduped_tool_calls"] = memo.deduped
+                    turn_stats["elapsed"] = time.perf_counter() - turn_start
+                    continue
+                else:
+                    print(f"\n[LLM认为任务完成，生成最终回答]")
+                    # 预算用完时的回答可能不完整，不缓存
+                    if use_answer_cache and not final:
+                        await self.response_cache.put_answer(query, response_message.content, self._turn_tools)
+                    await self.conversation_history.add_turn(query, response_message.content)
+                    turn_stats["elapsed"] = time.perf_counter() - turn_start
+                    turn_stats.update(self.conversation_history.stats())
+                    return response_message.content
 
     async def chat_loop(self):
         """运行交互式聊天循环"""
         print("\n===== MCP 客户端已启动 (输入 'quit' 退出) =====")
+        warm_up = asyncio.create_task(self.warm_up())
         while True:
             try:
-                query = input("\n用户: ").strip()
+                # input() 放到线程里执行，等待输入时不阻塞事件循环
+                query = (await asyncio.to_thread(input, "\n用户: ")).strip()
                 if query.lower() == 'quit':
                     print("正在退出...")
                     break
                 available_tools = await self.get_mcp_tools()
                 response = await self.process_query(query, available_tools)
-                print(f"\n助手: {response}")
+                if not self.stream:  # 流式模式下回答已经边生成边打印
+                    print(f"\n助手: {response}")
             except Exception as e:
                 print(f"发生错误: {str(e)}")
+        warm_up.cancel()
+
+    async def clean(self):
+        """清理资源"""
+        await self.mcp_session.close()
 
 async def main():
-    if len(sys.argv) < 2:
+    # 设置环境变量 MCP_RECORD_TRAFFIC=<文件路径> 录制 LLM 和工具流量，MCP_REPLAY_TRAFFIC=<文件路径> 回放（不需要 server 和网络）
+    traffic = traffic_from_env()
+    if len(sys.argv) < 2 and not isinstance(traffic, TrafficReplay):
         # 3. 修改使用说明和示例URL
-        print("使用方法: python chat_bot.py <server_url>")
+        print("使用方法: python chat_bot.py <server_url> [<server_url> ...]")
         print("例如 (Streamable HTTP): python chat_bot.py http://127.0.0.1:8083/my-custom-path")
+        print("多个server: python chat_bot.py bmi=http://127.0.0.1:8083/my-custom-path weather=sse+http://127.0.0.1:8000/toolmcp")
+        print("多个副本: python chat_bot.py http://127.0.0.1:8083/my-custom-path,http://127.0.0.1:8084/my-custom-path")
+        print("回放录制的流量: MCP_REPLAY_TRAFFIC=session.jsonl.gz python chat_bot.py")
         sys.exit(1)
 
-    client = MCPClient(sys.argv[1])
+    # 设置环境变量 MCP_PARALLEL_TOOL_CALLS=1 开启同一轮内工具调用的并发执行
+    # 设置环境变量 MCP_SUMMARIZE_HISTORY=1 在历史超出预算时压缩成摘要
+    # 设置环境变量 MCP_RESPONSE_CACHE=<文件路径> 开启工具结果 / 回答缓存，结果保存在该 SQLite 文件中
+    # 设置环境变量 MCP_DUPLICATE_TOOLS=namespace 让多个 server 的同名工具各自以 "<server>__<工具名>" 出现
+    cache_path = os.getenv("MCP_RESPONSE_CACHE")
+    response_cache = ResponseCache(cache_path) if cache_path else None
+    client = MCPClient(
+        sys.argv[1:] or ["replay"],
+        parallel_tool_calls=os.getenv("MCP_PARALLEL_TOOL_CALLS") == "1",
+        summarize_history=os.getenv("MCP_SUMMARIZE_HISTORY") == "1",
+        response_cache=response_cache,
+        duplicate_tools=os.getenv("MCP_DUPLICATE_TOOLS") or "first",
+        traffic=traffic,
+    )
     try:
         await client.chat_loop()
     except Exception as e:
         print(f"发生错误: {str(e)}")
+    finally:
+        await client.clean()
+        if traffic is not None:
+            print(f"[流量{'回放' if isinstance(traffic, TrafficReplay) else '录制'}统计: {traffic.stats()}]")
+            traffic.close()
+        if response_cache is not None:
+            print(f"[缓存统计: {response_cache.stats()}]")
+            response_cache.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
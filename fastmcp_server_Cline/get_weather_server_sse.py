@@ -1,39 +1,18 @@
 # conda env mcp_env ,Python版本 3.10.18
 # 关闭 proxy
 # 使用方法：用python 把server启动
-from datetime import datetime
-import requests
-from fastmcp import FastMCP
+import os
+import sys
 
-mcp = FastMCP("weather")
+# 共享的工具注册表位于上一级目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mcp_tools import create_mcp
+from server_config import ServerConfig
 
-
-@mcp.tool()
-def get_today():
-    """获取今天的日期。
-
-    Returns:
-        str: 当前的日期字符串，格式为 'YYYY.MM.DD'。
-    """
-    return datetime.today().strftime('%Y.%m.%d')
-
-
-@mcp.tool()
-def get_weather(city: str, date: str):
-    """获取指定城市在特定日期的天气情况。
-
-    Args:
-        city (str): 需要查询天气的城市名称，例如 "北京" 或 "London"。
-        date (str): 需要查询的日期，可以使用 "今天"、"明天" 等相对描述，或 "2023.10.27" 这样的具体日期。
-
-    Returns:
-        str: 包含该城市天气情况描述的原始文本。
-    """
-    endpoint = "https://wttr.in"
-
-    response = requests.get(f"{endpoint}/{city}")
-    return response.text
+config = ServerConfig.from_env(port=8000)
+mcp = create_mcp("weather", tools=["get_today", "get_weather"], **config.fastmcp_settings())
 
 
 if __name__ == '__main__':
-    mcp.run('sse', host='0.0.0.0', port=8000, path='/toolmcp')
+    config.configure_logging()
+    mcp.run('sse', **config.run_kwargs(path='/toolmcp'))
@@ -1,55 +1,18 @@
 # conda env mcp_env ,Python版本 3.10.18
 # 关闭 proxy
 # 使用方法：用python 把server启动
+# 工具定义在 mcp_tools.py，同时提供 SSE 和 streamable-http 的单进程版本见 fastmcp_server_unified.py
+# 生产环境：MCP_ENV=production python fastmcp_server_streamhttp.py（关闭 debug，JSON 采样日志，见 server_config.py）
 
-from datetime import datetime
-import requests
-from fastmcp import FastMCP
-mcp = FastMCP(debug = True)
+from mcp_tools import create_mcp
+from server_config import ServerConfig
 
-@mcp.tool()
-def calculate_bmi(weight_kg:float,height_m:float)->float:
-	"""通过给定的体重和身高计算BMI指数。
-
-    Args:
-        weight_kg (float): 用户的体重，单位为公斤(kg)。
-        height_m (float): 用户的身高，单位为米(m)。
-
-    Returns:
-        float: 计算得出的BMI指数值。
-    """
-	return weight_kg / (height_m ** 2)
-
-@mcp.tool()
-def get_current_time() -> str:
-    """获取当前时间
-
-    Returns:
-        str: 当前时间的字符串表示
-    """
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-@mcp.tool()
-def get_weather(city: str, date: str):
-    """获取指定城市在特定日期的天气情况。
-
-    Args:
-        city (str): 需要查询天气的城市名称，例如 "北京" 或 "London"。
-        date (str): 需要查询的日期，可以使用 "今天"、"明天" 等相对描述，或 "2023.10.27" 这样的具体日期。
-
-    Returns:
-        str: 包含该城市天气情况描述的原始文本。
-    """
-    endpoint = "https://wttr.in"
-
-    response = requests.get(f"{endpoint}/{city}")
-    return response.text
+config = ServerConfig.from_env(port=8083, debug=True, log_level="debug")
+mcp = create_mcp(tools=["calculate_bmi", "calculate_bmi_batch", "get_current_time", "get_weather"], **config.fastmcp_settings())
 
 if __name__ == "__main__":
+    config.configure_logging()
     mcp.run(
         transport="streamable-http",
-        host="0.0.0.0",
-        port=8083,
-        path="/my-custom-path",
-        log_level="debug",
+        **config.run_kwargs(path="/my-custom-path"),
     )
\ No newline at end of file
@@ -0,0 +1,79 @@
+# conda env mcp_env ,Python版本 3.10.18
+# 关闭 proxy
+# 使用方法：python fastmcp_server_unified.py
+"""
+在一个进程、一个端口上同时提供 SSE 和 streamable-http 两种传输
+
+原先 fastmcp_server_sse.py（8082）、fastmcp_server_streamhttp.py（8083）和
+fastmcp_server_Cline/get_weather_server_sse.py（8000）各自一个进程，各有一份天气缓存和连接池。
+这里用同一个工具注册表（mcp_tools.py）创建一个 FastMCP 实例，两种传输挂在同一个 ASGI 应用上：
+
+    streamable-http:  http://127.0.0.1:8083/my-custom-path
+    SSE:              http://127.0.0.1:8083/sse （消息 POST 到 /messages/）
+
+环境变量（另见 server_config.py 的 MCP_ENV、MCP_LOG_* 等）：
+    MCP_HOST     监听地址，默认 0.0.0.0
+    MCP_PORT     监听端口，默认 8083
+    MCP_WORKERS  工作进程数，默认 1。大于 1 时多个进程共用一个端口，每个进程有自己的缓存；
+                 streamable-http 改为无状态模式（任意进程都能处理任意请求），
+                 SSE 的长连接和消息 POST 可能落到不同进程，多进程时请只使用 streamable-http
+"""
+
+import contextlib
+import os
+
+import uvicorn
+from fastmcp.server.http import RequestContextMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+
+from mcp_tools import create_mcp
+from server_config import ServerConfig
+
+STREAMABLE_HTTP_PATH = "/my-custom-path"
+SSE_PATH = "/sse"
+
+
+def create_app(stateless_http: bool = False, debug: bool = False) -> Starlette:
+    """
+    创建同时挂载 SSE 和 streamable-http 的 ASGI 应用
+
+    Args:
+        stateless_http: streamable-http 是否使用无状态模式（多进程部署时需要）
+        debug: FastMCP 的 debug 模式
+    """
+    mcp = create_mcp("mcp-tools", **({"debug": True} if debug else {}))
+    streamable_app = mcp.http_app(
+        path=STREAMABLE_HTTP_PATH, transport="streamable-http", stateless_http=stateless_http
+    )
+    sse_app = mcp.http_app(path=SSE_PATH, transport="sse")
+
+    # SSE 应用没有 lifespan，只需要启动 streamable-http 的会话管理器
+    @contextlib.asynccontextmanager
+    async def lifespan(app: Starlette):
+        async with streamable_app.lifespan(app):
+            yield
+
+    return Starlette(
+        routes=[*streamable_app.routes, *sse_app.routes],
+        middleware=[Middleware(RequestContextMiddleware)],
+        lifespan=lifespan,
+    )
+
+
+WORKERS = int(os.getenv("MCP_WORKERS", "1"))
+config = ServerConfig.from_env(port=8083)
+# 多进程时每个工作进程都会导入本模块，日志配置放在模块级
+config.configure_logging()
+app = create_app(stateless_http=WORKERS > 1, debug=config.debug)
+
+if __name__ == "__main__":
+    if WORKERS > 1:
+        print(f"以 {WORKERS} 个工作进程启动，SSE 需要单进程部署，请使用 streamable-http 连接")
+    uvicorn.run(
+        "fastmcp_server_unified:app",
+        host=config.host,
+        port=config.port,
+        workers=WORKERS,
+        **config.uvicorn_config(),
+    )
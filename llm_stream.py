@@ -0,0 +1,283 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+异步、流式的 LLM 调用
+
+原先聊天机器人在 async 代码里调用同步的 OpenAI(...).chat.completions.create，
+整个补全期间事件循环被阻塞，用户也要等完整回答生成后才能看到内容。
+chat_completion() 基于 AsyncOpenAI：
+1. stream=True 时逐个打印到达的 token
+2. 增量拼接流式返回的 tool_calls 片段（按 index 合并 id / name / arguments）
+3. 记录首 token 时间（time to first token）和总耗时
+4. 最终组装成与非流式接口相同的 ChatCompletionMessage，调用方的处理逻辑保持不变
+
+openai 的导入需要约 0.5 秒，本模块和 create_llm_client() 都在第一次用到时才导入，
+聊天机器人可以先显示输入提示，在用户输入期间再加载。
+
+messages 为 message_store.MessageStore 且客户端由 create_llm_client() 创建时，请求体由已编码的片段拼接，
+不再经过 SDK 对整个消息列表的类型转换和 JSON 序列化（见 message_store）。
+"""
+
+import functools
+import json
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence
+
+from tracing import tracer
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+    from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+
+
+@dataclass
+class CompletionResult:
+    """一次 LLM 请求的结果和耗时"""
+    message: "ChatCompletionMessage"
+    finish_reason: Optional[str]
+    time_to_first_token: Optional[float]  # 秒，第一个文本内容到达的时间，只有工具调用时为 None
+    elapsed: float  # 秒，整个请求的耗时
+
+
+def print_token(text: str):
+    """默认的 token 输出方式：直接打印到终端，不换行"""
+    print(text, end="", flush=True)
+
+
+class _ToolCallBuilder:
+    """按 index 累积同一个工具调用的流式片段"""
+
+    def __init__(self):
+        self.id = ""
+        self.name = ""
+        self.arguments: List[str] = []
+
+    def add(self, delta: Any):
+        if delta.id:
+            self.id = delta.id
+        if delta.function is not None:
+            if delta.function.name:
+                self.name += delta.function.name
+            if delta.function.arguments:
+                self.arguments.append(delta.function.arguments)
+
+    def build(self) -> "ChatCompletionMessageToolCall":
+        from openai.types.chat import ChatCompletionMessageToolCall
+        from openai.types.chat.chat_completion_message_tool_call import Function
+
+        return ChatCompletionMessageToolCall(
+            id=self.id,
+            type="function",
+            function=Function(name=self.name, arguments="".join(self.arguments)),
+        )
+
+
+async def chat_completion(
+    llm: "AsyncOpenAI",
+    model: str,
+    messages: Sequence[Dict[str, Any]],
+    tools: Optional[List[Dict[str, Any]]] = None,
+    stream: bool = True,
+    on_token: Optional[Callable[[str], None]] = print_token,
+    tools_json: Optional[str] = None,
+) -> CompletionResult:
+    """
+    发送一次补全请求
+
+    Args:
+        llm: AsyncOpenAI 客户端
+        model: 模型名称
+        messages: 消息列表或 MessageStore
+        tools: 工具定义列表
+        stream: 是否使用流式接口
+        on_token: 流式模式下每收到一段文本内容时的回调，None 表示不输出
+        tools_json: tools 预先编码的 JSON（ToolSchemaCache.payload_json），发送预编码请求体时使用
+
+    Returns:
+        CompletionResult，其中 message 与非流式接口返回的 message 结构一致
+    """
+    with tracer.span("llm.completion", {"model": model, "stream": stream, "messages": len(messages)}) as span:
+        result = await _chat_completion(llm, model, messages, tools, stream, on_token, tools_json)
+        span.set_attribute("finish_reason", result.finish_reason)
+        if result.time_to_first_token is not None:
+            span.set_attribute("time_to_first_token_ms", round(result.time_to_first_token * 1000, 1))
+        return result
+
+
+async def _send(
+    llm: "AsyncOpenAI",
+    model: str,
+    messages: Sequence[Dict[str, Any]],
+    tools: Optional[List[Dict[str, Any]]],
+    stream: bool,
+    tools_json: Optional[str],
+) -> Any:
+    """客户端支持 create_encoded 且 messages 能直接生成请求体时发送预编码的请求体，否则交给 SDK 序列化"""
+    create_encoded = getattr(llm, "create_encoded", None)
+    if create_encoded is not None and hasattr(messages, "request_body"):
+        if tools and tools_json is None:
+            tools_json = json.dumps(tools, ensure_ascii=False, separators=(",", ":"))
+        return await create_encoded(messages.request_body(model, tools_json if tools else None, stream), stream=stream)
+    kwargs: Dict[str, Any] = {"model": model, "messages": messages if isinstance(messages, list) else list(messages)}
+    if tools:
+        kwargs["tools"] = tools
+    if stream:
+        kwargs["stream"] = True
+    return await llm.chat.completions.create(**kwargs)
+
+
+async def _chat_completion(
+    llm: "AsyncOpenAI",
+    model: str,
+    messages: Sequence[Dict[str, Any]],
+    tools: Optional[List[Dict[str, Any]]],
+    stream: bool,
+    on_token: Optional[Callable[[str], None]],
+    tools_json: Optional[str],
+) -> CompletionResult:
+    start = time.perf_counter()
+    if not stream:
+        response = await _send(llm, model, messages, tools, False, tools_json)
+        elapsed = time.perf_counter() - start
+        choice = response.choices[0]
+        time_to_first_token = elapsed if choice.message.content else None
+        return CompletionResult(choice.message, choice.finish_reason, time_to_first_token, elapsed)
+
+    content: List[str] = []
+    tool_calls: Dict[int, _ToolCallBuilder] = {}
+    finish_reason = None
+    first_token_at = None
+
+    response_stream = await _send(llm, model, messages, tools, True, tools_json)
+    async for chunk in response_stream:
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        delta = choice.delta
+        if delta is not None:
+            if delta.content:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                content.append(delta.content)
+                if on_token is not None:
+                    on_token(delta.content)
+            for tool_call_delta in delta.tool_calls or []:
+                tool_calls.setdefault(tool_call_delta.index, _ToolCallBuilder()).add(tool_call_delta)
+        if choice.finish_reason:
+            finish_reason = choice.finish_reason
+
+    from openai.types.chat import ChatCompletionMessage
+
+    elapsed = time.perf_counter() - start
+    message = ChatCompletionMessage(
+        role="assistant",
+        content="".join(content) if content else None,
+        tool_calls=[tool_calls[index].build() for index in sorted(tool_calls)] or None,
+    )
+    time_to_first_token = first_token_at - start if first_token_at is not None else None
+    return CompletionResult(message, finish_reason, time_to_first_token, elapsed)
+
+
+# create_encoded 发出的请求带这个请求头，值为请求体在 EncodedBodyClient.bodies 里的编号，发送前换上请求体并去掉请求头
+ENCODED_BODY_HEADER = "X-Encoded-Body"
+
+
+@functools.lru_cache(maxsize=None)
+def _encoded_http_client_class() -> type:
+    import itertools
+
+    import httpx
+    from openai import DefaultAsyncHttpxClient
+
+    class EncodedBodyClient(DefaultAsyncHttpxClient):
+        """openai 默认设置的 httpx 客户端，发送请求时把 create_encoded 的标记换成预编码的请求体"""
+
+        def __init__(self, **kwargs: Any):
+            super().__init__(**kwargs)
+            self.bodies: Dict[str, bytes] = {}
+            self._ids = itertools.count()
+
+        def register(self, body: bytes) -> str:
+            key = str(next(self._ids))
+            self.bodies[key] = body
+            return key
+
+        async def send(self, request: "httpx.Request", **kwargs: Any) -> "httpx.Response":
+            key = request.headers.get(ENCODED_BODY_HEADER)
+            if key is not None:
+                # SDK 按空请求体生成了请求（URL、认证和其余请求头），这里换上编码好的请求体，Content-Length 由 httpx 重新计算
+                skip = (ENCODED_BODY_HEADER.lower().encode(), b"content-length")
+                headers = [(name, value) for name, value in request.headers.raw if name.lower() not in skip]
+                request = httpx.Request(
+                    request.method, request.url, headers=headers, content=self.bodies[key], extensions=request.extensions
+                )
+            return await super().send(request, **kwargs)
+
+    return EncodedBodyClient
+
+
+@functools.lru_cache(maxsize=None)
+def _encoded_client_class() -> type:
+    from openai import AsyncOpenAI, AsyncStream
+    from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+    http_client_class = _encoded_http_client_class()
+
+    class EncodedAsyncOpenAI(AsyncOpenAI):
+        """可以直接发送预先编码的 chat/completions 请求体的 AsyncOpenAI，其余接口不变"""
+
+        def __init__(self, *, http_client: Any = None, **kwargs: Any):
+            if http_client is None:
+                http_client = http_client_class()
+            super().__init__(http_client=http_client, **kwargs)
+            if isinstance(http_client, http_client_class):
+                self._encoded_http_client = http_client
+            else:
+                # 调用方传入的普通 httpx 客户端不会替换请求体，chat_completion 改走 SDK 的序列化
+                self.create_encoded = None
+
+        async def create_encoded(self, body: bytes, stream: bool = False) -> Any:
+            # 与 chat.completions.create 返回相同的 ChatCompletion / AsyncStream[ChatCompletionChunk]，重试和超时设置也相同；
+            # 重试时 SDK 重新生成请求，标记不变，所以请求体保留到 post 返回
+            key = self._encoded_http_client.register(body)
+            try:
+                return await self.post(
+                    "/chat/completions",
+                    cast_to=ChatCompletion,
+                    options={"headers": {ENCODED_BODY_HEADER: key}},
+                    stream=stream,
+                    stream_cls=AsyncStream[ChatCompletionChunk],
+                )
+            finally:
+                del self._encoded_http_client.bodies[key]
+
+    return EncodedAsyncOpenAI
+
+
+def create_http_client(**kwargs: Any) -> "httpx.AsyncClient":
+    """创建 create_llm_client 使用的 httpx 客户端（openai 的默认设置，支持预编码的请求体），kwargs 例如 limits"""
+    return _encoded_http_client_class()(**kwargs)
+
+
+def create_llm_client(api_key: Optional[str], base_url: Optional[str], **client_kwargs: Any) -> "AsyncOpenAI":
+    """
+    创建 AsyncOpenAI 客户端（支持发送预编码的请求体），调用时才导入 openai；client_kwargs 透传给 AsyncOpenAI。
+    需要自定义连接池时用 create_http_client() 创建 http_client，传入其他 httpx 客户端时不发送预编码的请求体
+    """
+    return _encoded_client_class()(api_key=api_key, base_url=base_url, **client_kwargs)
+
+
+def make_token_printer(prefix: str = "\n助手: ") -> Callable[[str], None]:
+    """创建一个 token 回调：第一次收到内容时先打印前缀，之后原样打印"""
+    started = False
+
+    def on_token(text: str):
+        nonlocal started
+        if not started:
+            print(prefix, end="")
+            started = True
+        print_token(text)
+
+    return on_token
@@ -1,156 +1,378 @@
 # conda env mcp_env ,Python版本 3.10.18
 # 关闭 proxy
 # 使用方法：先把server启动，然后启动chat_bot.py  : python chat_bot.py http://127.0.0.1:8082/sse
+# 同时连接多个server：python chat_bot.py tools=http://127.0.0.1:8082/sse weather=sse+http://127.0.0.1:8000/toolmcp
+# 同一个server的多个副本（逗号分隔，调用在副本间负载均衡）：python chat_bot.py http://127.0.0.1:8082/sse,http://127.0.0.1:8092/sse
+# 录制 / 回放 LLM 和工具流量：MCP_RECORD_TRAFFIC=session.jsonl.gz python chat_bot.py <server_url>，之后 MCP_REPLAY_TRAFFIC=session.jsonl.gz python chat_bot.py
 
 import asyncio
-import json
 import sys
+import time
 import os
-from typing import Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
 from contextlib import AsyncExitStack
 
-from openai import OpenAI
 from dotenv import load_dotenv, find_dotenv
 
-from mcp import ClientSession
-from mcp.client.sse import sse_client
+from mcp_session import send_call_tool
+from tool_catalog import ToolSchemaCache
+from tool_router import MultiServerSession, parse_server_specs, tool_server
+from llm_stream import chat_completion, create_llm_client, make_token_printer
+from conversation_history import ConversationHistory, make_llm_summarizer
+from message_store import MessageStore, system_segment
+from tracing import inject, traced, tracer
+from response_cache import ResponseCache
+from resilience import ToolCallPolicy
+from turn_budget import BUDGET_REASONS, TurnBudget, TurnToolMemo, force_answer_message
+from tool_dispatch import PARALLEL_MULTI_TASK_RULE, SEQUENTIAL_MULTI_TASK_RULE, dispatch_tool_calls
+from traffic_replay import TrafficRecorder, TrafficReplay, traffic_from_env
+
+if TYPE_CHECKING:
+    from mcp import ClientSession
+    from openai import AsyncOpenAI
 
 # 加载环境变量
 _ = load_dotenv(find_dotenv())
 
 class MCPClient:
-    def __init__(self):
-        """初始化MCP客户端"""
+    def __init__(
+        self,
+        parallel_tool_calls: bool = False,
+        max_tool_concurrency: int = 4,
+        tool_timeout: Optional[float] = None,
+        stream: bool = True,
+        tool_cache_ttl: Optional[float] = None,
+        history_token_budget: int = 4000,
+        summarize_history: bool = False,
+        response_cache: Optional[ResponseCache] = None,
+        tool_policy: Optional[ToolCallPolicy] = None,
+        turn_budget: Optional[TurnBudget] = None,
+        traffic: Optional[Union[TrafficRecorder, TrafficReplay]] = None,
+    ):
+        """
+        初始化MCP客户端
+
+        Args:
+            parallel_tool_calls: 同一轮 LLM 回复中的多个工具调用是否并发执行
+            max_tool_concurrency: 并发模式下每轮同时执行的工具调用上限
+            tool_timeout: 单个工具调用的超时时间（秒），None 表示不限制
+            stream: 是否流式输出LLM回复（边生成边打印）
+            tool_cache_ttl: 工具定义缓存的有效期（秒），None 表示只在收到 tools/list_changed 通知时刷新
+            history_token_budget: 对话历史的 token 上限，超出时从最早的一轮开始丢弃
+            summarize_history: 超出预算时先用 LLM 把较早的对话压缩成摘要，而不是直接丢弃
+            response_cache: 可选的工具结果 / 最终回答缓存，None 表示不缓存
+            tool_policy: 工具调用的截止时间、重试、熔断和对冲策略，默认按环境变量创建（ToolCallPolicy.from_env）
+            turn_budget: 每轮的工具调用轮数、时间和 token 预算，默认按环境变量创建（TurnBudget.from_env）
+            traffic: 录制（TrafficRecorder）或回放（TrafficReplay）LLM 和工具流量，只对 connect_to_servers 的连接生效
+        """
         self.exit_stack = AsyncExitStack()
         self.openai_api_key = os.getenv("KIMI_API_KEY")  # 调用模型的api_key
-        self.base_url = "https://api.moonshot.cn/v1"  # 调用模型url
-        self.model = "kimi-k2-0711-preview"  # 调用模型
-        self.client = OpenAI(api_key=self.openai_api_key, base_url=self.base_url)
-        self.session: Optional[ClientSession] = None  # Optional提醒用户该属性是可选的，可能为None
-        self.conversation_history = [] # 新增一个列表来存储历史
+        self.base_url = os.getenv("LLM_BASE_URL", "https://api.moonshot.cn/v1")  # 调用模型url
+        self.model = os.getenv("LLM_MODEL", "kimi-k2-0711-preview")  # 调用模型
+        self.traffic = traffic
+        self._client: Optional["AsyncOpenAI"] = None  # 第一次请求 LLM 时才创建，启动时不导入 openai
+        self.session: Optional["ClientSession"] = None  # Optional提醒用户该属性是可选的，可能为None
+        self.router: Optional[MultiServerSession] = None  # 连接多个服务器时使用，代替 self.session
+        # 按 token 预算管理的对话历史，可选把旧对话压缩成摘要
+        self.conversation_history = ConversationHistory(
+            token_budget=history_token_budget,
+            summarizer=make_llm_summarizer(lambda: self.client, self.model) if summarize_history else None,
+        )
+        self.parallel_tool_calls = parallel_tool_calls
+        self.max_tool_concurrency = max_tool_concurrency
+        self.tool_timeout = tool_timeout
+        self.stream = stream
+        self.last_turn_stats: Dict[str, Any] = {}  # 最近一轮的LLM调用统计（首token时间等）
+        self.tool_cache = ToolSchemaCache(self.list_tools, ttl=tool_cache_ttl)
+        self.response_cache = response_cache
+        self.tool_policy = tool_policy or ToolCallPolicy.from_env()
+        self.turn_budget = turn_budget or TurnBudget.from_env()
+        self._turn_tools: List[str] = []  # 本轮调用过的工具，决定回答缓存的有效期
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        if self._client is None:
+            create = lambda: create_llm_client(self.openai_api_key, self.base_url)
+            self._client = create() if self.traffic is None else self.traffic.wrap_llm(create)
+        return self._client
+
+    async def warm_up(self):
+        """在用户输入第一个问题期间加载 openai 并创建 LLM 客户端"""
+        try:
+            await asyncio.to_thread(lambda: self.client)
+        except Exception:
+            pass
 
     async def connect_to_sse_server(self, server_url):
         """连接到MCP服务器并初始化会话"""
+        from mcp import ClientSession
+        from mcp.client.sse import sse_client
+
         # 连接sse服务端，因为是基于http协议的，需要传入url
         sse_transport = await self.exit_stack.enter_async_context(sse_client(server_url))
         self.write, self.read = sse_transport
-        self.session = await self.exit_stack.enter_async_context(ClientSession(self.write, self.read))
+        # 服务端发来 tools/list_changed 通知时，由 tool_cache 使缓存失效
+        self.session = await self.exit_stack.enter_async_context(
+            ClientSession(self.write, self.read, message_handler=self.tool_cache.message_handler)
+        )
         await self.session.initialize()  # 与服务器建立sse连接
         
-        # 列出MCP服务器上的工具
+        # 列出MCP服务器上的工具（同时填充工具缓存）
+        await self.tool_cache.get()
+        print(f"\n已连接到服务器，支持以下工具:", [tool.name for tool in self.tool_cache.tools]) # 打印服务端可用的工具
+
+    async def connect_to_servers(self, server_specs: List[str], duplicate_tools: str = "first"):
+        """
+        并发连接多个MCP服务器（"[名称=][sse+]URL"，见 tool_router），合并工具列表，工具调用按工具名路由
+
+        一个服务器响应慢时不等它，就绪后再加入工具列表
+        """
+        self.router = MultiServerSession(
+            parse_server_specs(server_specs),
+            duplicates=duplicate_tools,
+            retry=False,  # 重试由 tool_policy 负责
+            on_change=self.tool_cache.invalidate,
+            message_handler=self.tool_cache.message_handler,
+        )
+        if self.traffic is not None:
+            self.router = self.traffic.wrap_session(self.router)
+        await self.tool_cache.get()
+        print(f"\n已连接到服务器，支持以下工具:", [tool.name for tool in self.tool_cache.tools])
+
+    async def list_tools(self):
+        """从服务器获取工具列表"""
+        if self.router is not None:
+            return await self.router.list_tools()
         response = await self.session.list_tools()
-        tools = response.tools
-        print(f"\n已连接到服务器，支持以下工具:", [tool.name for tool in tools]) # 打印服务端可用的工具
+        return response.tools
+
+    async def call_tool(self, tool_name: str, tool_args: Dict[str, Any]) -> str:
+        """执行单个工具并返回文本结果"""
+        self._turn_tools.append(tool_name)
+        if self.response_cache is not None:
+            cached = await self.response_cache.get_tool_result(tool_name, tool_args)
+            if cached is not None:
+                print(f"[工具结果命中缓存: {tool_name}，参数: {tool_args}]")
+                return cached
+        print(f"[正在调用工具: {tool_name}，参数: {tool_args}]")
+        if self.router is not None:
+            # 多个服务器：发到拥有该工具的服务器会话，工具报错时抛出 ToolError；每个服务器一个熔断器
+            result = await self.tool_policy.call(
+                tool_name,
+                lambda: self.router.call_tool(tool_name, tool_args),
+                server=tool_server(self.router, tool_name),
+            )
+            is_error = result.is_error
+        else:
+            # trace 上下文通过请求的 _meta 传给 server
+            with tracer.span("mcp.call_tool", {"tool": tool_name}):
+                # 截止时间、熔断和对冲由 tool_policy 决定；这个 ClientSession 断开后不会重连，重试没有意义
+                result = await self.tool_policy.call(
+                    tool_name, lambda: send_call_tool(self.session, tool_name, tool_args, inject()), retry=False
+                )
+            is_error = result.isError
+        tool_output = result.content[0].text
+        print(f"[工具返回结果: {tool_output[:100]}...]") # 打印部分结果以防过长
+        # 工具报错的结果不缓存
+        if self.response_cache is not None and not is_error:
+            await self.response_cache.put_tool_result(tool_name, tool_args, tool_output)
+        return tool_output
 
+    @traced("chat.turn")
     async def process_query(self, query: str) -> str:
         """
         使用大模型处理查询，并支持多轮自主工具调用，直到任务完成。
         """
+        multi_task_rule = PARALLEL_MULTI_TASK_RULE if self.parallel_tool_calls else SEQUENTIAL_MULTI_TASK_RULE
         system_prompt = (
             "你是一个名为'MCP智能助手'的AI。你的核心任务是准确地回答用户问题。"
             "你的行为准则如下：\n"
             "1. **优先使用工具**：对于任何涉及实时数据（如日期、天气）、计算（如BMI）或其他专业功能的问题，你必须优先调用相应的工具来获取最准确的信息。\n"
             "2. **严禁捏造**：绝对不允许在没有可靠数据来源的情况下编造事实，特别是日期、天气、计算结果等。\n"
             "3. **严禁向用户提问**：你绝对不允许询问用户任何问题。你需要自己分析所有的信息做出决策。\n"
-            "4. **多任务处理**：如果用户一次提出多个请求，你必须逐一处理。你一次只调用一个工具，在完成一个工具调用后，你需要回顾用户的完整请求，检查是否还有未完成的部分，并继续调用其他所需工具，直到所有任务都解决。\n"
+            f"{multi_task_rule}"
             "5. **总结汇报**：在所有工具调用完成后，将结果整合起来，给用户一个清晰、完整、流畅的最终答复。"
         )
         
-        messages = [
-            {"role": "system", "content": system_prompt}
-        ]
-        messages.extend(self.conversation_history)
+        # 修剪、预先编码的消息：system prompt 和历史使用缓存的编码，之后每次请求只编码新增的消息
+        messages = MessageStore(system_segment(system_prompt), self.conversation_history.encoded())
         messages.append({"role": "user", "content": query})
         
-        # 从服务器获取可用工具的描述
-        tool_list_response = await self.session.list_tools()
-        available_tools = [
-            {
-                "type": "function",
-                "function": {
-                    "name": tool.name,
-                    "description": tool.description,
-                    "input_schema": tool.inputSchema
-                }
-            }
-            for tool in tool_list_response.tools
-        ]
-
-        # 循环与LLM交互，直到它提供最终答案而不是工具调用
+        # 可用工具的描述（来自缓存，工具变化时才重新请求服务器）
+        available_tools = await self.tool_cache.get()
+
+        # time_to_first_token: 从本轮开始到用户看到第一个回答 token 的时间（秒）
+        # prompt_tokens: 每次 LLM 请求的估算 prompt token 数；tokens: 本轮 prompt + 回复的估算 token 总数
+        # tool_calls / deduped_tool_calls: 模型请求的工具调用数 / 其中复用本轮结果的次数
+        # budget_exhausted: 预算用完、强制生成回答时的原因（iterations / time / tokens），否则为 None
+        turn_stats = {
+            "llm_calls": 0, "time_to_first_token": None, "llm_seconds": 0.0, "prompt_tokens": [],
+            "answer_cache_hit": False, "iterations": 0, "tool_calls": 0, "deduped_tool_calls": 0,
+            "tokens": 0, "elapsed": 0.0, "budget_exhausted": None,
+        }
+        self.last_turn_stats = turn_stats
+        turn_start = time.perf_counter()
+        self._turn_tools = []
+
+        # 回答缓存只用于没有历史的问题，有历史时同一句话的含义可能依赖上下文
+        use_answer_cache = self.response_cache is not None and len(self.conversation_history) == 0
+        if use_answer_cache:
+            cached = await self.response_cache.get_answer(query)
+            if cached is not None:
+                print("[回答命中缓存]")
+                turn_stats["answer_cache_hit"] = True
+                turn_stats["time_to_first_token"] = time.perf_counter() - turn_start
+                if self.stream:
+                    make_token_printer()(cached)
+                await self.conversation_history.add_turn(query, cached)
+                turn_stats["elapsed"] = time.perf_counter() - turn_start
+                turn_stats.update(self.conversation_history.stats())
+                return cached
+
+        # 同一轮内参数相同的工具调用只执行一次
+        memo = TurnToolMemo(self.call_tool)
+        # 循环与LLM交互，直到它提供最终答案而不是工具调用，或者本轮预算用完
         while True:
-            # 向LLM发送当前对话历史和可用工具
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                tools=available_tools
+            prompt_tokens = messages.tokens + self.tool_cache.payload_tokens
+            # 预算用完时不再提供工具，让模型根据已有结果直接回答
+            final = turn_stats["budget_exhausted"] = self.turn_budget.exhausted(
+                turn_stats["iterations"], time.perf_counter() - turn_start, turn_stats["tokens"] + prompt_tokens
             )
+            if final:
+                print(f"\n[本轮{BUDGET_REASONS[final]}预算已用完，不再调用工具，直接生成回答]")
+                messages.append(force_answer_message(final))
+                prompt_tokens = messages.tokens
+            turn_stats["iterations"] += 1
+            with tracer.span("chat.iteration", {"iteration": turn_stats["iterations"], "final": bool(final)}):
+                # 向LLM发送当前对话历史和可用工具（异步请求，流式模式下边生成边打印）
+                turn_stats["prompt_tokens"].append(prompt_tokens)
+                request_start = time.perf_counter()
+                # 进行中的请求也只能用本轮剩下的时间，到期后中断，下一次循环改为不带工具的收尾请求（收尾请求不限时）
+                remaining = None if final else self.turn_budget.remaining(time.perf_counter() - turn_start)
+                try:
+                    completion = await asyncio.wait_for(
+                        chat_completion(
+                            self.client,
+                            self.model,
+                            messages,
+                            None if final else available_tools,
+                            stream=self.stream,
+                            on_token=make_token_printer(),
+                            tools_json=self.tool_cache.payload_json,
+                        ),
+                        remaining,
+                    )
+                except asyncio.TimeoutError:
+                    if remaining is None or self.turn_budget.remaining(time.perf_counter() - turn_start) > 0:
+                        raise
+                    print(f"\n[本轮时间预算已用完，中断 LLM 请求]")
+                    continue
+                turn_stats["llm_calls"] += 1
+                turn_stats["llm_seconds"] += completion.elapsed
+                if turn_stats["time_to_first_token"] is None and completion.time_to_first_token is not None:
+                    turn_stats["time_to_first_token"] = request_start - turn_start + completion.time_to_first_token
+
+                response_message = completion.message
+                # 必须将模型的回复（即使是工具调用请求）也添加到历史中（去掉 null 字段后编码）
+                turn_stats["tokens"] += prompt_tokens + messages.append(response_message)
 
-            response_message = response.choices[0].message
-            # 必须将模型的回复（即使是工具调用请求）也添加到历史中
-            messages.append(response_message.model_dump())
-
-            # 检查LLM是否要求调用工具
-            if response.choices[0].finish_reason == "tool_calls":
-                print(f"\n[LLM决定调用工具...]")
-                # 遍历所有被请求的工具调用
-                for tool_call in response_message.tool_calls:
-                    tool_name = tool_call.function.name
-                    tool_args = json.loads(tool_call.function.arguments)
-                    
-                    # 执行工具
-                    print(f"[正在调用工具: {tool_name}，参数: {tool_args}]")
-                    result = await self.session.call_tool(tool_name, tool_args)
-                    tool_output = result.content[0].text
-                    print(f"[工具返回结果: {tool_output[:100]}...]") # 打印部分结果以防过长
-                    
-                    # 将工具执行结果添加到对话历史中，以便LLM进行下一步决策
-                    messages.append({
-                        "role": "tool",
-                        "content": tool_output,
-                        "tool_call_id": tool_call.id,
-                    })
-                # 继续下一次循环，让LLM根据工具结果进行下一步操作
-                continue
-            else:
-                # 如果LLM没有要求调用工具，说明它已经生成了最终答案
-                print(f"\n[LLM认为任务完成，生成最终回答]")
-                self.conversation_history.append({"role": "user", "content": query})
-                self.conversation_history.append({"role": "assistant", "content": response_message.content})
-                return response_message.content
+                # 检查LLM是否要求调用工具
+                if completion.finish_reason == "tool_calls" and not final:
+                    print(f"\n[LLM决定调用工具...]")
+                    # 执行所有被请求的工具调用（按配置顺序或并发执行），单个失败会变成错误消息
+                    tool_messages = await dispatch_tool_calls(
+                        response_message.tool_calls,
+                        memo.call,
+                        concurrent=self.parallel_tool_calls,
+                        max_concurrency=self.max_tool_concurrency,
+                        timeout=self.tool_timeout,
+                        time_budget=self.turn_budget.remaining(time.perf_counter() - turn_start),
+                    )
+                    # 将工具执行结果按原始顺序添加到对话历史中，以便LLM进行下一步决策
+                    messages.extend(tool_messages)
+                    turn_stats["tool_calls"] = memo.calls
+                    turn_stats["deduped_tool_calls"] = memo.deduped
+                    turn_stats["elapsed"] = time.perf_counter() - turn_start
+                    # 继续下一次循环，让LLM根据工具结果进行下一步操作
+                    continue
+                else:
+                    # 如果LLM没有要求调用工具（或预算已用完），说明它已经生成了最终答案
+                    print(f"\n[LLM认为任务完成，生成最终回答]")
+                    # 预算用完时的回答可能不完整，不缓存
+                    if use_answer_cache and not final:
+                        await self.response_cache.put_answer(query, response_message.content, self._turn_tools)
+                    await self.conversation_history.add_turn(query, response_message.content)
+                    turn_stats["elapsed"] = time.perf_counter() - turn_start
+                    turn_stats.update(self.conversation_history.stats())
+                    return response_message.content
 
     async def chat_loop(self):
         """运行交互式聊天循环"""
         print("\n===== MCP 客户端已启动 (输入 'quit' 退出) =====")
+        warm_up = asyncio.create_task(self.warm_up())
 
         while True:
             try:
-                query = input("\n用户: ").strip()
+                # input() 放到线程里执行，等待输入时不阻塞事件循环
+                query = (await asyncio.to_thread(input, "\n用户: ")).strip()
                 if query.lower() == 'quit':
                     print("正在退出...")
                     break
                 
                 # 开始处理查询
                 response = await self.process_query(query)
-                print(f"\n助手: {response}")
+                if not self.stream:  # 流式模式下回答已经边生成边打印
+                    print(f"\n助手: {response}")
             except Exception as e:
                 print(f"发生错误: {str(e)}")
+        warm_up.cancel()
 
     async def clean(self):
         """清理资源"""
+        if self.router is not None:
+            await self.router.close()
         await self.exit_stack.aclose()
 
 async def main():
-    if len(sys.argv) < 2:
-        print("使用方法: python chat_bot.py <server_url>")
+    # 设置环境变量 MCP_RECORD_TRAFFIC=<文件路径> 录制 LLM 和工具流量，MCP_REPLAY_TRAFFIC=<文件路径> 回放（不需要 server 和网络）
+    traffic = traffic_from_env()
+    if len(sys.argv) < 2 and not isinstance(traffic, TrafficReplay):
+        print("使用方法: python chat_bot.py <server_url> [<server_url> ...]")
         print("例如: python chat_bot.py http://127.0.0.1:8082/sse")
+        print("多个服务器: python chat_bot.py tools=http://127.0.0.1:8082/sse weather=sse+http://127.0.0.1:8000/toolmcp")
+        print("多个副本: python chat_bot.py http://127.0.0.1:8082/sse,http://127.0.0.1:8092/sse")
+        print("回放录制的流量: MCP_REPLAY_TRAFFIC=session.jsonl.gz python chat_bot.py")
         sys.exit(1)
 
-    client = MCPClient()
+    # 设置环境变量 MCP_PARALLEL_TOOL_CALLS=1 开启同一轮内工具调用的并发执行
+    # 设置环境变量 MCP_SUMMARIZE_HISTORY=1 在历史超出预算时压缩成摘要
+    # 设置环境变量 MCP_RESPONSE_CACHE=<文件路径> 开启工具结果 / 回答缓存，结果保存在该 SQLite 文件中
+    cache_path = os.getenv("MCP_RESPONSE_CACHE")
+    response_cache = ResponseCache(cache_path) if cache_path else None
+    client = MCPClient(
+        parallel_tool_calls=os.getenv("MCP_PARALLEL_TOOL_CALLS") == "1",
+        summarize_history=os.getenv("MCP_SUMMARIZE_HISTORY") == "1",
+        response_cache=response_cache,
+        traffic=traffic,
+    )
     try:
-        await client.connect_to_sse_server(sys.argv[1])
+        server_specs = sys.argv[1:] or ["replay"]
+        specs = parse_server_specs(server_specs)
+        # 录制 / 回放只包装 connect_to_servers 使用的会话
+        if len(specs) > 1 or len(specs[0].replicas) > 1 or traffic is not None:
+            # 设置环境变量 MCP_DUPLICATE_TOOLS=namespace 让同名工具各自以 "<server>__<工具名>" 出现
+            await client.connect_to_servers(server_specs, duplicate_tools=os.getenv("MCP_DUPLICATE_TOOLS") or "first")
+        else:
+            await client.connect_to_sse_server(specs[0].url)
         await client.chat_loop()
     finally:
         await client.clean()
+        if traffic is not None:
+            print(f"[流量{'回放' if isinstance(traffic, TrafficReplay) else '录制'}统计: {traffic.stats()}]")
+            traffic.close()
+        if response_cache is not None:
+            print(f"[缓存统计: {response_cache.stats()}]")
+            response_cache.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,371 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+长连接的 MCP 会话
+
+原先每次 list_tools / call_tool 都要 async with Client(url)，
+每个工具调用都付出一次完整的 连接 + initialize 握手。
+PersistentMCPSession 在第一次使用时才建立连接，之后所有调用复用同一个会话，
+传输层断开时自动重连并重试一次。多个协程可以并发地在同一个会话上发请求。
+调用方自己负责重试时（ToolCallPolicy、ReplicaBalancer）传入 retry=False：连接错误时只丢弃连接并抛出，
+下一次调用再重连，每次调用只发送一次请求，避免几层重试叠加成倍地放大请求数。
+
+注意：会话断开时，底层 SDK 不会让已发出的请求失败，而是一直等到超时，
+所以这里在等待结果的同时定期检查连接状态，发现断开后立即放弃并重连。
+
+fastmcp / mcp / httpx 在第一次连接或判断错误时才导入，聊天机器人启动时不必等待这些模块加载。
+"""
+
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import anyio
+
+from tracing import inject, tracer
+
+if TYPE_CHECKING:
+    import mcp.types
+    from fastmcp import Client
+    from fastmcp.client.client import CallToolResult
+    from mcp import ClientSession
+
+T = TypeVar("T")
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """判断异常是否由连接断开引起（可以通过重连恢复）"""
+    import httpx
+    import mcp.types
+    from mcp.shared.exceptions import McpError
+
+    # 这些异常表示传输层出了问题，而不是工具本身执行失败
+    if isinstance(error, (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream,
+                          httpx.TransportError, ConnectionError)):
+        return True
+    if isinstance(error, McpError) and error.error.code == mcp.types.CONNECTION_CLOSED:
+        return True
+    if isinstance(error, httpx.HTTPStatusError) and error.response.status_code in (404, 502, 503):
+        # 服务端重启后旧的 session id 失效会返回 404
+        return True
+    if isinstance(error, RuntimeError) and "not connected" in str(error):
+        return True
+    # fastmcp 把连接失败包装成 RuntimeError("Client failed to connect: ...")，原始异常（可能在 ExceptionGroup 里）在 __cause__ 中
+    causes = list(getattr(error, "exceptions", ()))
+    if error.__cause__ is not None:
+        causes.append(error.__cause__)
+    return any(is_connection_error(cause) for cause in causes)
+
+
+async def send_call_tool(
+    session: "ClientSession",
+    tool_name: str,
+    arguments: Dict[str, Any],
+    meta: Optional[Dict[str, Any]] = None,
+) -> "mcp.types.CallToolResult":
+    """
+    发送 tools/call 请求，并在请求的 _meta 中附带额外字段（例如 traceparent）
+
+    ClientSession.call_tool 不支持设置 _meta，这里直接构造请求，返回原始的 CallToolResult
+    """
+    import mcp.types
+
+    params = mcp.types.CallToolRequestParams(name=tool_name, arguments=arguments)
+    if meta:
+        params.meta = mcp.types.RequestParams.Meta(**meta)
+    request = mcp.types.ClientRequest(mcp.types.CallToolRequest(method="tools/call", params=params))
+    return await session.send_request(request, mcp.types.CallToolResult)
+
+
+async def _call_tool_traced(client: "Client", tool_name: str, arguments: Dict[str, Any]) -> "CallToolResult":
+    """与 Client.call_tool 相同（工具报错时抛出 ToolError），但把当前 trace 上下文传给 server"""
+    from fastmcp.client.client import CallToolResult
+    from fastmcp.exceptions import ToolError
+
+    result = await send_call_tool(client.session, tool_name, arguments, inject())
+    if result.isError:
+        raise ToolError(result.content[0].text if result.content else "工具调用失败")
+    return CallToolResult(
+        content=result.content,
+        structured_content=result.structuredContent,
+        data=result.structuredContent,
+        is_error=False,
+    )
+
+
+class PersistentMCPSession:
+    """
+    懒加载、自动重连的 MCP 长连接会话
+
+    使用示例：
+        session = PersistentMCPSession("http://127.0.0.1:8083/my-custom-path")
+        tools = await session.list_tools()
+        result = await session.call_tool("get_current_time", {})
+        await session.close()
+    """
+
+    def __init__(
+        self,
+        server_url: str,
+        timeout: Optional[float] = None,
+        health_check_interval: float = 0.5,
+        transport: Optional[str] = None,
+        retry: bool = True,
+        **client_kwargs: Any,
+    ):
+        """
+        Args:
+            server_url: MCP服务器的URL地址
+            timeout: 单个请求的超时时间（秒），None 表示不限制
+            health_check_interval: 等待结果期间检查连接状态的间隔（秒）
+            transport: "sse" 时强制使用 SSE；None 时由 fastmcp 按 URL 判断（以 /sse 结尾为 SSE，否则为 streamable-http）
+            retry: 连接错误时是否重连并重试一次；由上层负责重试时为 False，只丢弃连接并抛出
+            client_kwargs: 透传给 fastmcp.Client 的其他参数，例如 message_handler
+        """
+        self.server_url = server_url
+        self.transport = transport
+        self.retry = retry
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.client_kwargs = client_kwargs
+        self._client: Optional["Client"] = None
+        self._lock = asyncio.Lock()
+        self.connect_count = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._client is not None and self._client.is_connected()
+
+    async def connect(self) -> "Client":
+        """建立连接（已连接时直接返回），并发调用只会触发一次握手"""
+        if self.connected:
+            return self._client
+        async with self._lock:
+            if self.connected:
+                return self._client
+            await self._reset()
+            from fastmcp import Client
+            from fastmcp.client.transports import SSETransport
+
+            target = SSETransport(self.server_url) if self.transport == "sse" else self.server_url
+            client = Client(target, timeout=self.timeout, **self.client_kwargs)
+            with tracer.span("mcp.connect", {"server": self.server_url}):
+                await client.__aenter__()
+            self._client = client
+            self.connect_count += 1
+            return client
+
+    async def _reset(self):
+        """丢弃当前连接（忽略关闭时的错误，连接可能早已断开）"""
+        client, self._client = self._client, None
+        if client is not None:
+            try:
+                await client.close()
+            except Exception:
+                pass
+
+    async def _watch(self, client: "Client", operation: Callable[["Client"], Awaitable[T]]) -> T:
+        """执行操作，期间会话断开则立即抛出 ConnectionError"""
+        task = asyncio.ensure_future(operation(client))
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self.health_check_interval)
+                if done:
+                    return task.result()
+                if not client.is_connected():
+                    raise ConnectionError(f"MCP 会话已断开: {self.server_url}")
+        finally:
+            if not task.done():
+                task.cancel()
+
+    async def _run(self, operation: Callable[["Client"], Awaitable[T]]) -> T:
+        """在会话上执行操作，遇到连接错误时丢弃连接，retry 为 True 时重连并重试一次"""
+        client = await self.connect()
+        try:
+            return await self._watch(client, operation)
+        except Exception as e:
+            # 工具本身报错时会话仍然可用，直接抛出
+            if client.is_connected() and not is_connection_error(e):
+                raise
+            async with self._lock:
+                # 其他协程可能已经完成了重连
+                if self._client is client:
+                    await self._reset()
+            if not self.retry:
+                raise
+        client = await self.connect()
+        return await self._watch(client, operation)
+
+    async def list_tools(self) -> List["mcp.types.Tool"]:
+        """获取服务器提供的工具列表"""
+        with tracer.span("mcp.list_tools", {"server": self.server_url}):
+            return await self._run(lambda client: client.list_tools())
+
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> "CallToolResult":
+        """调用指定工具，trace 上下文通过请求的 _meta 传给 server"""
+        with tracer.span("mcp.call_tool", {"server": self.server_url, "tool": tool_name}):
+            return await self._run(lambda client: _call_tool_traced(client, tool_name, arguments))
+
+    async def ping(self) -> bool:
+        """检查会话是否可用"""
+        return await self._run(lambda client: client.ping())
+
+    async def close(self):
+        """关闭会话"""
+        async with self._lock:
+            await self._reset()
+
+
+class _PooledSession:
+    """连接池中的一个会话及其使用情况"""
+
+    def __init__(self, session: PersistentMCPSession):
+        self.session = session
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+
+
+class MCPSessionPool:
+    """
+    同一个 server URL 的 MCP 会话池
+
+    - start() 时预先建立 size 个会话（预热）
+    - 每次调用选择当前并发请求最少的会话，所有会话都忙且未达到 size 时再新建
+    - 后台定期 ping 空闲会话做健康检查，失败的会话会被重建
+    - 空闲超过 idle_timeout 的会话会被关闭，但至少保留 min_size 个
+
+    使用示例：
+        pool = MCPSessionPool("http://127.0.0.1:8083/my-custom-path", size=4)
+        await pool.start()
+        result = await pool.call_tool("get_current_time", {})
+        await pool.close()
+    """
+
+    def __init__(
+        self,
+        server_url: str,
+        size: int = 4,
+        min_size: int = 1,
+        idle_timeout: float = 300.0,
+        health_check_interval: float = 30.0,
+        timeout: Optional[float] = None,
+        retry: bool = True,
+        **client_kwargs: Any,
+    ):
+        """
+        Args:
+            server_url: MCP服务器的URL地址
+            size: 会话数上限，也是 start() 时预热的会话数
+            min_size: 空闲淘汰后至少保留的会话数
+            idle_timeout: 会话空闲多久（秒）后被关闭
+            health_check_interval: 健康检查和空闲淘汰的执行间隔（秒）
+            timeout: 单个请求的超时时间（秒），None 表示不限制
+            retry: 会话遇到连接错误时是否重连并重试一次，见 PersistentMCPSession
+            client_kwargs: 透传给每个会话的 fastmcp.Client 参数，例如 message_handler
+        """
+        self.server_url = server_url
+        self.retry = retry
+        self.client_kwargs = client_kwargs
+        self.size = max(1, size)
+        self.min_size = max(0, min(min_size, self.size))
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self._slots: List[_PooledSession] = []
+        self._maintainer: Optional[asyncio.Task] = None
+        self.evicted = 0
+        self.health_check_failures = 0
+
+    def _new_slot(self) -> _PooledSession:
+        slot = _PooledSession(PersistentMCPSession(
+            self.server_url, timeout=self.timeout, retry=self.retry, **self.client_kwargs
+        ))
+        self._slots.append(slot)
+        return slot
+
+    async def start(self):
+        """预热 size 个会话并启动后台维护任务"""
+        while len(self._slots) < self.size:
+            self._new_slot()
+        await asyncio.gather(*(slot.session.connect() for slot in self._slots))
+        if self._maintainer is None or self._maintainer.done():
+            self._maintainer = asyncio.create_task(self._maintain())
+
+    def _pick(self) -> _PooledSession:
+        """选择并发请求最少的会话，必要时扩容"""
+        if not self._slots:
+            return self._new_slot()
+        slot = min(self._slots, key=lambda s: s.in_flight)
+        if slot.in_flight > 0 and len(self._slots) < self.size:
+            return self._new_slot()
+        return slot
+
+    async def _run(self, operation: Callable[[PersistentMCPSession], Awaitable[T]]) -> T:
+        slot = self._pick()
+        slot.in_flight += 1
+        try:
+            return await operation(slot.session)
+        finally:
+            slot.in_flight -= 1
+            slot.last_used = time.monotonic()
+
+    async def list_tools(self) -> List["mcp.types.Tool"]:
+        """获取服务器提供的工具列表"""
+        return await self._run(lambda session: session.list_tools())
+
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> "CallToolResult":
+        """调用指定工具"""
+        return await self._run(lambda session: session.call_tool(tool_name, arguments))
+
+    async def _maintain(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await self.evict_idle()
+            await self.health_check()
+
+    async def evict_idle(self):
+        """关闭空闲超时的会话，至少保留 min_size 个"""
+        now = time.monotonic()
+        for slot in list(self._slots):
+            if len(self._slots) <= self.min_size:
+                break
+            if slot.in_flight == 0 and now - slot.last_used > self.idle_timeout:
+                self._slots.remove(slot)
+                self.evicted += 1
+                await slot.session.close()
+
+    async def health_check(self):
+        """ping 所有空闲会话，失败的会话关闭后在下次使用时重建"""
+        async def check(slot: _PooledSession):
+            if slot.in_flight or not slot.session.connected:
+                return
+            try:
+                await asyncio.wait_for(slot.session.ping(), timeout=self.health_check_interval)
+            except Exception:
+                self.health_check_failures += 1
+                await slot.session.close()
+
+        await asyncio.gather(*(check(slot) for slot in list(self._slots)))
+
+    def stats(self) -> Dict[str, Any]:
+        """返回连接池状态"""
+        return {
+            "sessions": len(self._slots),
+            "connected": sum(1 for slot in self._slots if slot.session.connected),
+            "in_flight": sum(slot.in_flight for slot in self._slots),
+            "handshakes": sum(slot.session.connect_count for slot in self._slots),
+            "evicted": self.evicted,
+            "health_check_failures": self.health_check_failures,
+        }
+
+    async def close(self):
+        """停止后台任务并关闭所有会话"""
+        if self._maintainer is not None:
+            self._maintainer.cancel()
+            try:
+                await self._maintainer
+            except asyncio.CancelledError:
+                pass
+            self._maintainer = None
+        slots, self._slots = self._slots, []
+        await asyncio.gather(*(slot.session.close() for slot in slots))
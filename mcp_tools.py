@@ -0,0 +1,197 @@
+# conda env mcp_env ,Python版本 3.10.18
+"""
+所有 MCP server 共用的工具注册表
+
+calculate_bmi、get_weather、get_today、get_current_time 原先在三个 server 文件里各复制一份。
+这里只定义一次，create_mcp() 按需要的工具列表创建 FastMCP 实例：
+
+    mcp = create_mcp(tools=["calculate_bmi", "get_weather"])
+
+calculate_bmi_batch 是 calculate_bmi 的批量版本，一次调用计算整批记录。
+同一进程里创建的多个实例共享 weather_backend 的缓存和 HTTP 连接池。
+每个实例都带有 TracingMiddleware（每次工具调用一个 span）、AdmissionMiddleware（限流和并发上限，按环境变量配置）
+和 GET /metrics（Prometheus 文本格式）。同步工具按 tool_executor.ToolExecution 的策略在事件循环、线程池或进程池中执行
+（默认 calculate_bmi_batch 放到线程池），并监测事件循环延迟。
+"""
+
+import contextlib
+import math
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+from fastmcp import Context, FastMCP
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+
+from admission import AdmissionMiddleware
+from tool_executor import LoopLagMiddleware, ToolExecution
+from tracing import TracingMiddleware, metrics
+from weather_backend import weather_backend
+
+
+def bmi_input_error(weight_kg: Optional[float], height_m: Optional[float]) -> Optional[str]:
+    """
+    检查 calculate_bmi_batch 的一条记录，合法时返回 None，否则返回错误说明
+
+    参数类型由 MCP 的参数校验保证（不是数字的调用整个被拒绝），这里只检查 records 中缺少的字段和取值范围
+    """
+    if weight_kg is None:
+        return "缺少 weight_kg"
+    if height_m is None:
+        return "缺少 height_m"
+    if weight_kg <= 0:
+        return f"体重必须大于 0: {weight_kg}"
+    if height_m <= 0:
+        return f"身高必须大于 0: {height_m}"
+    return None
+
+
+def calculate_bmi(weight_kg: float, height_m: float) -> float:
+    """通过给定的体重和身高计算BMI指数。
+
+    Args:
+        weight_kg (float): 用户的体重，单位为公斤(kg)。
+        height_m (float): 用户的身高，单位为米(m)。
+
+    Returns:
+        float: 计算得出的BMI指数值。
+    """
+    return weight_kg / (height_m ** 2)
+
+
+def calculate_bmi_batch(
+    weights_kg: Optional[List[float]] = None,
+    heights_m: Optional[List[float]] = None,
+    records: Optional[List[Dict[str, float]]] = None,
+) -> Dict[str, Any]:
+    """批量计算BMI指数，一次调用处理多条记录。
+
+    传入 weights_kg 和 heights_m 两个等长数组，或者 records 列表（每项包含 weight_kg 和 height_m）。
+    不合法的记录（例如身高小于等于 0）不影响其他记录，对应位置的结果为 null，并在 errors 中说明。
+
+    Args:
+        weights_kg (list[float]): 体重数组，单位为公斤(kg)。
+        heights_m (list[float]): 身高数组，单位为米(m)，与 weights_kg 等长。
+        records (list[dict]): 记录列表，例如 [{"weight_kg": 70, "height_m": 1.75}]。
+
+    Returns:
+        dict: {"count": 记录数, "valid": 合法记录数, "bmi": 与输入顺序一致的结果数组,
+               "errors": [{"index": 下标, "error": 错误说明}]}
+    """
+    if records is not None:
+        if weights_kg is not None or heights_m is not None:
+            raise ValueError("records 与 weights_kg / heights_m 只能二选一")
+        weights_kg = [record.get("weight_kg") for record in records]
+        heights_m = [record.get("height_m") for record in records]
+    elif weights_kg is None or heights_m is None:
+        raise ValueError("需要同时提供 weights_kg 和 heights_m，或者提供 records")
+    elif len(weights_kg) != len(heights_m):
+        raise ValueError(f"weights_kg 和 heights_m 长度不一致: {len(weights_kg)} != {len(heights_m)}")
+
+    # 一次遍历完成校验和计算。numpy 不是本项目的依赖，不做向量化：
+    # 逐条计算的开销远小于逐条调用 calculate_bmi 的 MCP 往返（见 benchmarks/bench_bmi_batch.py）
+    bmi: List[Optional[float]] = []
+    errors: List[Dict[str, Any]] = []
+    for index, (weight, height) in enumerate(zip(weights_kg, heights_m)):
+        error = bmi_input_error(weight, height)
+        if error is None:
+            squared = height * height
+            value = weight / squared if squared > 0 else math.inf
+            if math.isfinite(value):
+                bmi.append(value)
+                continue
+            # 极小的身高平方后下溢为 0，或者相除后溢出
+            error = f"BMI 超出可表示的范围: weight_kg={weight}, height_m={height}"
+        bmi.append(None)
+        errors.append({"index": index, "error": error})
+    return {"count": len(bmi), "valid": len(bmi) - len(errors), "bmi": bmi, "errors": errors}
+
+
+def get_current_time() -> str:
+    """获取当前时间
+
+    Returns:
+        str: 当前时间的字符串表示
+    """
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def get_today():
+    """获取今天的日期。
+
+    Returns:
+        str: 当前的日期字符串，格式为 'YYYY.MM.DD'。
+    """
+    return datetime.today().strftime('%Y.%m.%d')
+
+
+async def get_weather(city: str, date: str, ctx: Optional[Context] = None):
+    """获取指定城市在特定日期的天气情况。
+
+    Args:
+        city (str): 需要查询天气的城市名称，例如 "北京" 或 "London"。
+        date (str): 需要查询的日期，可以使用 "今天"、"明天" 等相对描述，或 "2023.10.27" 这样的具体日期，可查询今天起 3 天。
+
+    Returns:
+        str: 一行天气摘要，包含当天天气、气温范围、降水概率和当前实况。
+    """
+    # 客户端在请求里带了 progressToken 时才会真正发送进度通知
+    if ctx is not None:
+        await ctx.report_progress(0, 2, f"正在查询 {city} 的天气")
+    result = await weather_backend.fetch(city, date)
+    if ctx is not None:
+        await ctx.report_progress(2, 2, "查询完成")
+    return result
+
+
+TOOLS: Dict[str, Callable[..., Any]] = {
+    tool.__name__: tool
+    for tool in (calculate_bmi, calculate_bmi_batch, get_current_time, get_today, get_weather)
+}
+
+
+def create_mcp(
+    name: Optional[str] = None,
+    tools: Optional[Iterable[str]] = None,
+    execution: Optional[ToolExecution] = None,
+    **settings: Any,
+) -> FastMCP:
+    """
+    创建注册了指定工具的 FastMCP 实例
+
+    Args:
+        name: server 名称
+        tools: 要注册的工具名称，None 表示注册全部工具
+        execution: 各工具的执行方式（inline / thread / process），默认按环境变量创建
+        settings: 透传给 FastMCP 的其他参数
+
+    Returns:
+        FastMCP 实例
+    """
+    tool_names = list(tools if tools is not None else TOOLS)
+    if "get_weather" in tool_names:
+        settings.setdefault("lifespan", warm_up_weather)
+    mcp = FastMCP(name, **settings)
+    execution = execution or ToolExecution.from_env()
+    for tool_name in tool_names:
+        mcp.tool(execution.wrap(TOOLS[tool_name]))
+    mcp.add_middleware(LoopLagMiddleware())
+    mcp.add_middleware(TracingMiddleware())
+    # 在 tracing 之内，被拒绝的调用也会记录为出错的 span
+    mcp.add_middleware(AdmissionMiddleware.from_env())
+    mcp.custom_route("/metrics", methods=["GET"])(metrics_endpoint)
+    return mcp
+
+
+@contextlib.asynccontextmanager
+async def warm_up_weather(server: FastMCP) -> AsyncIterator[Dict[str, Any]]:
+    """MCP 会话开始时在后台创建 wttr.in 的连接池（已经创建时什么也不做），第一次 get_weather 不用再等"""
+    weather_backend.warm_up()
+    yield {}
+
+
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    """Prometheus 格式的指标：各 span 的耗时直方图、错误数和天气缓存统计"""
+    for key, value in weather_backend.stats().items():
+        metrics.set_gauge(f"weather_cache_{key}", value)
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
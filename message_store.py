@@ -0,0 +1,112 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+一轮对话的消息列表：修剪、预先编码，用已编码的片段拼接请求体
+
+原先 process_query 把 response_message.model_dump()（包含 refusal、audio、function_call、annotations 等 null 字段）
+追加到 messages，每次 LLM 请求时 openai SDK 再把整个不断增长的列表按类型定义转换一遍、重新序列化，
+工具定义也每次作为 dict 列表重新编码。MessageStore：
+1. 追加消息时去掉值为 None 的字段（content 除外），并立即编码成 JSON，估算的 token 数也只算一次
+2. system prompt 和对话历史是可复用的 EncodedSegment：system prompt 按内容缓存，
+   历史由 ConversationHistory.encoded() 缓存到下一次变化，每轮开始时不再重新编码
+3. 每个片段保存为 UTF-8 字节，request_body() 用一次 b"".join 拼出请求体，消息不再重新编码；
+   工具定义使用 ToolSchemaCache.payload_json
+llm_stream.chat_completion 在 LLM 客户端支持 create_encoded（create_llm_client 创建的客户端）时直接发送请求体，
+其余客户端（调用方传入的 AsyncOpenAI、traffic_replay 的录制 / 回放包装）仍然走 SDK 的序列化，发送的是修剪后的消息。
+可以像列表一样迭代和按下标访问。
+"""
+
+import functools
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+from conversation_history import message_tokens
+
+
+def compact_message(message: Any) -> Dict[str, Any]:
+    """把 pydantic 消息或 dict 转成去掉 None 字段的 dict，content 始终保留（有的兼容接口要求每条消息都有 content）"""
+    if hasattr(message, "model_dump"):
+        compact = message.model_dump(exclude_none=True)
+        compact.setdefault("content", None)
+        return compact
+    return {key: value for key, value in message.items() if value is not None or key == "content"}
+
+
+def encode_json(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+class EncodedSegment:
+    """一段已经修剪和编码的连续消息，可以被多次请求复用"""
+
+    __slots__ = ("messages", "data", "tokens")
+
+    def __init__(self, messages: List[Any]):
+        self.messages = [compact_message(message) for message in messages]
+        self.data = ",".join(encode_json(message) for message in self.messages).encode("utf-8")
+        self.tokens = sum(message_tokens(message) for message in self.messages)
+
+
+@functools.lru_cache(maxsize=8)
+def system_segment(system_prompt: str) -> EncodedSegment:
+    """system prompt 对一个聊天机器人实例通常是常量，按内容缓存编码结果"""
+    return EncodedSegment([{"role": "system", "content": system_prompt}])
+
+
+class MessageStore:
+    """
+    一次 process_query 的消息列表
+
+    使用示例：
+        messages = MessageStore(system_segment(prompt), history.encoded())
+        messages.append({"role": "user", "content": query})
+        body = messages.request_body(model, tool_cache.payload_json, stream=True)
+    """
+
+    def __init__(self, *segments: EncodedSegment):
+        self._messages: List[Dict[str, Any]] = []
+        self._parts: List[bytes] = []  # 已编码的片段：整段 segment 或单条消息，第一个之外都带前导逗号
+        self.tokens = 0  # 全部消息的估算 token 数
+        self.request_bytes: List[int] = []  # 每次 request_body() 的大小
+        for segment in segments:
+            if segment.messages:
+                self._messages.extend(segment.messages)
+                self._add_part(segment.data)
+                self.tokens += segment.tokens
+
+    def append(self, message: Any) -> int:
+        """追加一条消息（pydantic 对象或 dict），返回它的估算 token 数"""
+        message = compact_message(message)
+        tokens = message_tokens(message)
+        self._messages.append(message)
+        self._add_part(encode_json(message).encode("utf-8"))
+        self.tokens += tokens
+        return tokens
+
+    def _add_part(self, data: bytes):
+        self._parts.append(b"," + data if self._parts else data)
+
+    def extend(self, messages: List[Any]):
+        for message in messages:
+            self.append(message)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._messages)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        return self._messages[index]
+
+    def request_body(self, model: str, tools_json: Optional[str] = None, stream: bool = False) -> bytes:
+        """拼出 chat/completions 的请求体，tools_json 为预先编码的工具列表；消息片段只在这里复制一次"""
+        head = f'{{"model":{encode_json(model)},"messages":['.encode("utf-8")
+        tail = "]"
+        if tools_json:
+            tail += f',"tools":{tools_json}'
+        if stream:
+            tail += ',"stream":true'
+        body = b"".join([head, *self._parts, (tail + "}").encode("utf-8")])
+        self.request_bytes.append(len(body))
+        return body
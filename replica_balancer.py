@@ -0,0 +1,328 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+同一个 MCP server 多个副本之间的客户端负载均衡
+
+为了横向扩展工具吞吐，可以在不同端口上运行多个 fastmcp_server_streamhttp.py（MCP_PORT 指定端口），
+客户端原先只能连接一个 URL。ReplicaBalancer 在副本列表上做客户端负载均衡：
+1. 选择副本：strategy="least_outstanding" 选择当前未完成请求最少的副本（相同时随机选择）；
+   strategy="p2c"（默认）随机取两个副本，选其中未完成请求少的一个，副本多、客户端多时避免所有请求同时涌向同一个副本
+2. 被动摘除：一个副本连续 failure_threshold 次连接失败后被摘除 ejection_time 秒，期间不再分配请求；
+   到期后重新加入，加入后第一次调用又失败时立即再次摘除，摘除时间翻倍（最长 max_ejection_time 秒），成功一次后恢复
+3. 连接失败的调用改到另一个副本重试一次；工具本身报错说明副本可以正常响应，不算失败、不重试。
+   聊天机器人由 ToolCallPolicy 负责重试，这时传入 retry=False（max_attempts=1），每次调用只发到一个副本，
+   失败记入该副本的健康状态后直接抛出，由上层的下一次尝试重新选择副本
+4. 所有副本都被摘除时，仍然选择最早到期的那个副本尝试，而不是直接失败
+5. stats() 返回每个副本的状态、未完成请求数、请求 / 失败 / 摘除次数和延迟（EWMA、p50、p95）
+
+BalancedMCPSession 与 PersistentMCPSession 的接口相同，每个副本一个长连接会话，可以直接作为 MCPClient 的 mcp_session；
+SimpleMCPClient 传入多个 URL 时每个副本使用一个 MCPSessionPool。副本的会话都不自己重试（retry=False），
+换副本重试由 ReplicaBalancer 负责，或者在 retry=False 时交给上层。
+"""
+
+import asyncio
+import random
+import statistics
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Generic, List, Optional, Sequence, TypeVar
+
+from mcp_session import MCPSessionPool, PersistentMCPSession, is_connection_error
+from tracing import metrics
+
+if TYPE_CHECKING:
+    import mcp.types
+    from fastmcp.client.client import CallToolResult
+
+T = TypeVar("T")
+S = TypeVar("S")
+
+STRATEGIES = ("p2c", "least_outstanding")
+
+
+class Replica(Generic[S]):
+    """一个副本：连接对象（会话或会话池）、健康状态和延迟统计"""
+
+    def __init__(self, url: str, target: S, window: int = 256):
+        self.url = url
+        self.target = target
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejection_streak = 0  # 连续摘除次数，决定下一次摘除的时长
+        self.ejected_until = 0.0
+        self.latency_ewma: Optional[float] = None  # 秒
+        self.latencies: "deque[float]" = deque(maxlen=window)
+
+    def ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+
+    def record_latency(self, seconds: float, alpha: float = 0.3):
+        self.latencies.append(seconds)
+        self.latency_ewma = seconds if self.latency_ewma is None else alpha * seconds + (1 - alpha) * self.latency_ewma
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+        entry: Dict[str, Any] = {
+            "healthy": not self.ejected(now),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "ejected_for": round(max(0.0, self.ejected_until - now), 3),
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 2) if self.latency_ewma is not None else None,
+            "latency_p50_ms": round(statistics.median(ordered) * 1000, 2) if ordered else None,
+            "latency_p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2)
+            if ordered else None,
+        }
+        if hasattr(self.target, "stats"):
+            entry["target"] = self.target.stats()
+        return entry
+
+
+class ReplicaBalancer(Generic[S]):
+    """
+    在多个副本之间分配调用，被动摘除连接失败的副本
+
+    使用示例：
+        balancer = ReplicaBalancer({url: PersistentMCPSession(url) for url in urls})
+        result = await balancer.run(lambda session: session.call_tool("get_current_time", {}))
+        print(balancer.stats())
+    """
+
+    def __init__(
+        self,
+        targets: Dict[str, S],
+        strategy: str = "p2c",
+        failure_threshold: int = 2,
+        ejection_time: float = 5.0,
+        max_ejection_time: float = 60.0,
+        max_attempts: int = 2,
+        rng: Optional[random.Random] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            targets: 副本 URL -> 该副本的连接对象（PersistentMCPSession 或 MCPSessionPool）
+            strategy: "p2c"（随机两选一）或 "least_outstanding"（未完成请求最少）
+            failure_threshold: 连续多少次连接失败后摘除副本
+            ejection_time: 第一次摘除的时长（秒），之后每次连续摘除翻倍
+            max_ejection_time: 摘除时长上限（秒）
+            max_attempts: 一次调用最多尝试的副本数（连接失败时换副本重试）
+            rng: p2c 使用的随机数生成器，测试时可以固定种子
+            clock: 时钟函数，测试时可以替换
+        """
+        if not targets:
+            raise ValueError("至少需要一个副本")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy 只能是 {' 或 '.join(STRATEGIES)}: {strategy}")
+        self.replicas: List[Replica[S]] = [Replica(url, target) for url, target in targets.items()]
+        self.strategy = strategy
+        self.failure_threshold = max(1, failure_threshold)
+        self.ejection_time = ejection_time
+        self.max_ejection_time = max_ejection_time
+        self.max_attempts = max(1, max_attempts)
+        self.rng = rng or random.Random()
+        self.clock = clock
+
+    def pick(self, exclude: Sequence[Replica] = ()) -> Replica[S]:
+        """选择一个副本；没有可用副本时选择摘除最早到期的副本"""
+        now = self.clock()
+        candidates = [r for r in self.replicas if r not in exclude and not r.ejected(now)]
+        if not candidates:
+            candidates = [r for r in self.replicas if r not in exclude] or self.replicas
+            return min(candidates, key=lambda r: r.ejected_until)
+        if self.strategy == "p2c" and len(candidates) > 2:
+            candidates = self.rng.sample(candidates, 2)
+        # 未完成请求数相同时随机选择：如果按延迟选，一次偶然的慢请求（例如包含握手）会让空闲副本一直分不到请求
+        fewest = min(r.outstanding for r in candidates)
+        return self.rng.choice([r for r in candidates if r.outstanding == fewest])
+
+    def _success(self, replica: Replica, elapsed: float):
+        replica.record_latency(elapsed)
+        replica.consecutive_failures = 0
+        replica.ejection_streak = 0
+
+    def _failure(self, replica: Replica):
+        replica.failures += 1
+        replica.consecutive_failures += 1
+        metrics.inc("replica_failures_total", labels={"replica": replica.url})
+        now = self.clock()
+        if replica.ejected(now):
+            # 摘除之前已经发出的请求陆续失败，不重复摘除
+            return
+        # 摘除到期重新加入的副本（ejection_streak > 0）只要再失败一次就再次摘除
+        if replica.consecutive_failures >= self.failure_threshold or replica.ejection_streak > 0:
+            duration = self.eject(replica)
+            print(f"[副本 {replica.url} 连接失败，摘除 {duration:g} 秒]")
+
+    def eject(self, replica: Replica) -> float:
+        """摘除副本，返回摘除时长（秒）；连续摘除时翻倍"""
+        duration = min(self.max_ejection_time, self.ejection_time * 2 ** replica.ejection_streak)
+        replica.ejected_until = self.clock() + duration
+        replica.ejection_streak += 1
+        replica.ejections += 1
+        replica.consecutive_failures = 0
+        metrics.inc("replica_ejections_total", labels={"replica": replica.url})
+        return duration
+
+    async def run(self, operation: Callable[[S], Awaitable[T]]) -> T:
+        """在选出的副本上执行操作，连接失败时换一个副本重试"""
+        tried: List[Replica[S]] = []
+        while True:
+            replica = self.pick(exclude=tried)
+            tried.append(replica)
+            replica.outstanding += 1
+            replica.requests += 1
+            start = self.clock()
+            try:
+                result = await operation(replica.target)
+            except Exception as e:
+                if not is_connection_error(e):
+                    # 工具本身报错：副本正常响应了
+                    self._success(replica, self.clock() - start)
+                    raise
+                self._failure(replica)
+                if len(tried) >= min(self.max_attempts, len(self.replicas)):
+                    raise
+                continue
+            finally:
+                replica.outstanding -= 1
+            self._success(replica, self.clock() - start)
+            return result
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """每个副本的健康状态、负载和延迟"""
+        now = self.clock()
+        return {replica.url: replica.stats(now) for replica in self.replicas}
+
+
+def _balancer_options(retry: bool, balancer_kwargs: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """ReplicaBalancer 的参数：retry 为 False 时每次调用只尝试一个副本"""
+    options = dict(balancer_kwargs or {})
+    if not retry:
+        options["max_attempts"] = 1
+    return options
+
+
+class _BalancedTargets:
+    """BalancedMCPSession 和 BalancedMCPSessionPool 共用的调用接口"""
+
+    balancer: ReplicaBalancer
+
+    async def list_tools(self) -> List["mcp.types.Tool"]:
+        """获取工具列表（各副本运行同一份代码，任选一个）"""
+        return await self.balancer.run(lambda target: target.list_tools())
+
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> "CallToolResult":
+        """在选出的副本上调用工具"""
+        return await self.balancer.run(lambda target: target.call_tool(tool_name, arguments))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """每个副本的健康状态、负载和延迟"""
+        return self.balancer.stats()
+
+    async def close(self):
+        await asyncio.gather(*(replica.target.close() for replica in self.balancer.replicas), return_exceptions=True)
+
+
+class BalancedMCPSession(_BalancedTargets):
+    """
+    同一个 MCP server 多个副本的会话，接口与 PersistentMCPSession 相同
+
+    使用示例：
+        session = BalancedMCPSession(["http://127.0.0.1:8083/my-custom-path", "http://127.0.0.1:8084/my-custom-path"])
+        result = await session.call_tool("calculate_bmi", {"weight_kg": 70, "height_m": 1.75})
+        print(session.stats())
+        await session.close()
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        strategy: str = "p2c",
+        timeout: Optional[float] = None,
+        transport: Optional[str] = None,
+        retry: bool = True,
+        balancer_kwargs: Optional[Dict[str, Any]] = None,
+        **client_kwargs: Any,
+    ):
+        """
+        Args:
+            urls: 副本的 URL 列表
+            strategy: 副本选择策略，见 ReplicaBalancer
+            timeout: 单个请求的超时时间（秒）
+            transport: "sse" 时强制使用 SSE，见 PersistentMCPSession
+            retry: 连接失败时是否换一个副本重试；由上层负责重试时为 False
+            balancer_kwargs: 透传给 ReplicaBalancer 的其他参数，例如 failure_threshold、ejection_time
+            client_kwargs: 透传给每个会话的 fastmcp.Client 参数，例如 message_handler
+        """
+        self.server_url = ",".join(urls)
+        self.balancer: ReplicaBalancer[PersistentMCPSession] = ReplicaBalancer(
+            {
+                url: PersistentMCPSession(url, timeout=timeout, transport=transport, retry=False, **client_kwargs)
+                for url in urls
+            },
+            strategy=strategy,
+            **_balancer_options(retry, balancer_kwargs),
+        )
+
+    @property
+    def connect_count(self) -> int:
+        """所有副本会话的连接次数之和（ToolSchemaCache 的 generation）"""
+        return sum(replica.target.connect_count for replica in self.balancer.replicas)
+
+    @property
+    def connected(self) -> bool:
+        return any(replica.target.connected for replica in self.balancer.replicas)
+
+    async def ping(self) -> bool:
+        return await self.balancer.run(lambda session: session.ping())
+
+
+class BalancedMCPSessionPool(_BalancedTargets):
+    """
+    每个副本一个 MCPSessionPool，接口与 MCPSessionPool 相同（SimpleMCPClient 使用）
+
+    使用示例：
+        pool = BalancedMCPSessionPool(["http://127.0.0.1:8083/my-custom-path", "http://127.0.0.1:8084/my-custom-path"])
+        await pool.start()
+        result = await pool.call_tool("get_current_time", {})
+        await pool.close()
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        strategy: str = "p2c",
+        retry: bool = True,
+        balancer_kwargs: Optional[Dict[str, Any]] = None,
+        **pool_kwargs: Any,
+    ):
+        """
+        Args:
+            urls: 副本的 URL 列表
+            strategy: 副本选择策略，见 ReplicaBalancer
+            retry: 连接失败时是否换一个副本重试；由上层负责重试时为 False
+            balancer_kwargs: 透传给 ReplicaBalancer 的其他参数
+            pool_kwargs: 透传给每个 MCPSessionPool 的参数，例如 size、idle_timeout
+        """
+        self.server_url = ",".join(urls)
+        self.balancer: ReplicaBalancer[MCPSessionPool] = ReplicaBalancer(
+            {url: MCPSessionPool(url, retry=False, **pool_kwargs) for url in urls},
+            strategy=strategy,
+            **_balancer_options(retry, balancer_kwargs),
+        )
+
+    async def start(self):
+        """预热所有副本的会话池；启动失败的副本先摘除，全部失败时抛出第一个错误"""
+        replicas = self.balancer.replicas
+        results = await asyncio.gather(*(replica.target.start() for replica in replicas), return_exceptions=True)
+        errors = [(replica, result) for replica, result in zip(replicas, results) if isinstance(result, BaseException)]
+        if len(errors) == len(replicas):
+            raise errors[0][1]
+        for replica, error in errors:
+            print(f"[副本 {replica.url} 启动失败: {error}]")
+            self.balancer.eject(replica)
@@ -0,0 +1,309 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+工具调用和上游请求的容错：截止时间、带抖动的重试、熔断器、对冲请求
+
+一次卡住的 wttr.in 请求或 MCP 连接原先会让整轮对话一直等下去。call_resilient() 把这几种手段组合起来：
+1. deadline: 整个调用（含所有重试）的截止时间，到期抛出 asyncio.TimeoutError
+2. RetryPolicy: 只对可重试的错误（连接失败、超时、5xx）重试，间隔为指数退避 + 全抖动，
+   避免大量客户端在同一时刻一起重试
+3. CircuitBreaker: 连续失败达到阈值后熔断，reset_timeout 内的调用直接抛出 CircuitOpenError，
+   之后放行一个试探请求，成功则恢复
+4. hedge_after: 请求超过该时间还没返回时再发一个相同的请求，取先成功的一个，降低尾延迟。
+   只能用于幂等操作
+
+ToolCallPolicy 按工具名决定截止时间和是否允许重试 / 对冲，每个 MCP server 一个熔断器，供两个聊天机器人的 call_tool 使用。
+工具调用只由它重试一层：它下面的会话、副本均衡和多 server 路由都以 retry=False 创建，连接失败时直接抛出，
+一次调用最多发送 retry.attempts 次请求（对冲除外）；
+weather_backend 对 wttr.in 的请求也通过 call_resilient 发出。
+
+ToolCallPolicy.from_env() 读取的环境变量（均为可选）：
+    MCP_TOOL_DEADLINE      工具调用的截止时间（秒），默认 30
+    MCP_TOOL_RETRIES       幂等工具连接失败后的重试次数，默认 2
+    MCP_TOOL_HEDGE_AFTER   幂等工具的对冲等待时间（秒），默认不对冲
+"""
+
+import asyncio
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, Optional, TypeVar
+
+from mcp_session import is_connection_error
+from tracing import metrics
+
+T = TypeVar("T")
+
+# 只连接一个 server 时熔断器使用的名称
+DEFAULT_SERVER = "mcp"
+
+# 本仓库的工具都是只读的，重复执行没有副作用
+IDEMPOTENT_TOOLS: FrozenSet[str] = frozenset(
+    {"calculate_bmi", "calculate_bmi_batch", "get_current_time", "get_today", "get_weather"}
+)
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，调用被直接拒绝"""
+
+
+class RetryPolicy:
+    """
+    重试策略：最多 attempts 次尝试，第 n 次重试前等待 [0, min(max_delay, base_delay * 2^n)] 内的随机时间
+    """
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.1, max_delay: float = 2.0):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, retry: int) -> float:
+        """第 retry 次重试（从 0 开始）前的等待时间"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retry)))
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    closed:    正常放行，连续失败 failure_threshold 次后转为 open
+    open:      直接拒绝，reset_timeout 秒后转为 half_open
+    half_open: 只放行一个试探请求，成功转为 closed，失败重新 open
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """调用前检查，熔断时抛出 CircuitOpenError；返回这次调用是否为 half_open 状态的试探请求"""
+        if self.state == "open" and self.clock() - self.opened_at >= self.reset_timeout:
+            self._set_state("half_open")
+        if self.state == "closed":
+            return False
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        metrics.inc("circuit_rejections_total", labels={"circuit": self.name})
+        raise CircuitOpenError(f"{self.name} 熔断中，{self.reset_timeout:g} 秒内不再请求")
+
+    def record_success(self):
+        self.failures = 0
+        self._probing = False
+        if self.state != "closed":
+            self._set_state("closed")
+
+    def release_probe(self):
+        """试探请求被取消，没有结果：不计入成功或失败，让下一个调用重新试探"""
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+            self._set_state("open")
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.set_gauge("circuit_open", 1 if state == "open" else 0, labels={"circuit": self.name})
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+async def hedged(operation: Callable[[], Awaitable[T]], hedge_after: Optional[float]) -> T:
+    """
+    执行 operation，hedge_after 秒后还没完成时再发起一次，返回先成功的结果并取消另一个
+
+    两个都失败时抛出最后一个错误；第一个请求在对冲开始前就失败时直接抛出
+    """
+    first = asyncio.ensure_future(operation())
+    if hedge_after is None:
+        return await first
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            metrics.inc("hedged_requests_total")
+            tasks.add(asyncio.ensure_future(operation()))
+        error: Optional[BaseException] = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def call_resilient(
+    operation: Callable[[], Awaitable[T]],
+    *,
+    deadline: Optional[float] = None,
+    retry: Optional[RetryPolicy] = None,
+    retryable: Callable[[BaseException], bool] = lambda e: True,
+    breaker: Optional[CircuitBreaker] = None,
+    hedge_after: Optional[float] = None,
+    attempt_timeout: Optional[float] = None,
+) -> T:
+    """
+    带截止时间、重试、熔断和对冲地执行 operation
+
+    Args:
+        operation: 每次尝试调用一次，返回新的 awaitable
+        deadline: 整个调用的截止时间（秒），None 表示不限制
+        retry: 重试策略，None 表示不重试
+        retryable: 判断错误是否可重试；不可重试的错误说明上游是健康的（例如参数错误），不计入熔断
+        breaker: 熔断器
+        hedge_after: 对冲等待时间（秒），None 表示不对冲
+        attempt_timeout: 单次尝试的超时时间（秒），超时视为可重试的错误
+    """
+    end = None if deadline is None else time.monotonic() + deadline
+    attempts = retry.attempts if retry is not None else 1
+    for attempt in range(attempts):
+        probe = breaker.allow() if breaker is not None else False
+        timeout = attempt_timeout
+        if end is not None:
+            remaining = end - time.monotonic()
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        try:
+            result = await asyncio.wait_for(hedged(operation, hedge_after), timeout)
+        except asyncio.CancelledError:
+            # 被外层取消（run_tool_call 的超时、单轮截止时间）：不知道上游是否健康，
+            # 但试探请求必须释放，否则熔断器一直停在 half_open，拒绝之后所有的调用
+            if probe:
+                breaker.release_probe()
+            raise
+        except Exception as e:
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            if not timed_out and not retryable(e):
+                if breaker is not None:
+                    breaker.record_success()
+                raise
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt + 1 >= attempts:
+                raise
+            delay = retry.delay(attempt)
+            if end is not None and time.monotonic() + delay >= end:
+                raise
+            metrics.inc("retries_total")
+            await asyncio.sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
+    raise AssertionError("unreachable")
+
+
+class ToolCallPolicy:
+    """
+    按工具决定的调用策略：截止时间、重试、对冲，以及每个 server 一个的熔断器
+
+    一个 server（或它的全部副本）不可用时只熔断这个 server 的工具，其他 server 的工具照常调用。
+
+    使用示例：
+        policy = ToolCallPolicy(deadlines={"get_weather": 15}, hedge_after=2.0)
+        result = await policy.call("get_weather", lambda: session.call_tool("get_weather", args), server="weather")
+    """
+
+    def __init__(
+        self,
+        deadlines: Optional[Dict[str, float]] = None,
+        default_deadline: Optional[float] = 30.0,
+        idempotent_tools: Iterable[str] = IDEMPOTENT_TOOLS,
+        retry: Optional[RetryPolicy] = None,
+        retryable: Callable[[BaseException], bool] = is_connection_error,
+        hedge_after: Optional[float] = None,
+        attempt_timeout: Optional[float] = None,
+        breaker_factory: Optional[Callable[[str], CircuitBreaker]] = None,
+    ):
+        """
+        Args:
+            deadlines: 各工具的截止时间（秒），未列出的工具使用 default_deadline
+            default_deadline: 默认截止时间（秒），None 表示不限制
+            idempotent_tools: 可以安全重试、对冲的工具，其他工具只执行一次
+            retry: 幂等工具的重试策略，默认最多 3 次
+            retryable: 判断错误是否可重试，默认只重试连接断开，工具本身报错不重试
+            hedge_after: 幂等工具的对冲等待时间（秒），None 表示不对冲
+            attempt_timeout: 单次尝试的超时时间（秒），超时后在截止时间内重试
+            breaker_factory: 按 server 名称创建熔断器，默认连续 5 次失败后熔断 30 秒
+        """
+        self.deadlines = dict(deadlines or {})
+        self.default_deadline = default_deadline
+        self.idempotent_tools = frozenset(idempotent_tools)
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.retryable = retryable
+        self.hedge_after = hedge_after
+        self.attempt_timeout = attempt_timeout
+        self.breaker_factory = breaker_factory or (lambda server: CircuitBreaker(f"mcp:{server}"))
+        self.breakers: Dict[str, CircuitBreaker] = {}  # server 名称 -> 熔断器
+
+    @classmethod
+    def from_env(cls) -> "ToolCallPolicy":
+        """根据环境变量创建策略"""
+        hedge_after = os.getenv("MCP_TOOL_HEDGE_AFTER")
+        return cls(
+            default_deadline=float(os.getenv("MCP_TOOL_DEADLINE", "30")),
+            retry=RetryPolicy(attempts=int(os.getenv("MCP_TOOL_RETRIES", "2")) + 1),
+            hedge_after=float(hedge_after) if hedge_after else None,
+        )
+
+    def deadline(self, tool_name: str) -> Optional[float]:
+        return self.deadlines.get(tool_name, self.default_deadline)
+
+    def breaker(self, server: Optional[str] = None) -> CircuitBreaker:
+        """server 的熔断器，第一次使用时创建；None 表示只连接了一个 server"""
+        server = server or DEFAULT_SERVER
+        breaker = self.breakers.get(server)
+        if breaker is None:
+            breaker = self.breakers[server] = self.breaker_factory(server)
+        return breaker
+
+    def breaker_stats(self) -> Dict[str, Any]:
+        return {server: breaker.stats() for server, breaker in self.breakers.items()}
+
+    async def call(
+        self,
+        tool_name: str,
+        operation: Callable[[], Awaitable[T]],
+        server: Optional[str] = None,
+        retry: bool = True,
+    ) -> T:
+        """
+        按该工具的策略执行 operation
+
+        Args:
+            tool_name: 工具名称，决定截止时间和是否允许重试 / 对冲
+            operation: 每次尝试调用一次，返回新的 awaitable
+            server: 提供该工具的 server 名称（决定使用哪个熔断器）
+            retry: False 时即使是幂等工具也不重试，用于断开后不会重连的会话（重试只会再失败一次）
+        """
+        idempotent = tool_name in self.idempotent_tools
+        return await call_resilient(
+            operation,
+            deadline=self.deadline(tool_name),
+            retry=self.retry if idempotent and retry else None,
+            retryable=self.retryable,
+            breaker=self.breaker(server),
+            hedge_after=self.hedge_after if idempotent else None,
+            attempt_timeout=self.attempt_timeout if idempotent else None,
+        )
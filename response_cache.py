@@ -0,0 +1,330 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+聊天机器人的工具结果缓存和最终回答缓存
+
+用户经常重复问几乎一样的问题（"北京今天天气"、同一组数字的 BMI），每次都要完整走一遍 LLM 请求和工具调用。
+ResponseCache 在 MCPClient 里提供两层可选缓存：
+1. 工具结果：key 为 (工具名, 规范化后的参数)，按工具设置有效期：
+   calculate_bmi 这类确定性工具长期有效，get_weather 等时效性工具几分钟后过期，get_current_time 不缓存。
+   参数中的"今天"/"明天"换算成绝对日期后再作为 key，23:55 缓存的"今天"过了午夜不会被当成新的"今天"
+2. 最终回答：查询先规范化（全角转半角、忽略大小写、去掉标点和空白），再去掉"请帮我查一下""吗"这类客套词，
+   剩下的内容（城市、日期词、否定词、数字……）必须是完全相同的字符，只允许语序和客套词不同；
+   在同一组内容中按字符二元组的 Jaccard 相似度比较语序，达到阈值且未过期时直接返回上次的回答，
+   跳过 LLM 和工具调用。"南京"、"明天"、"不出门"这类只改了几个字的问题不会命中"北京今天"的回答。
+   回答的有效期取本轮用到的工具中最短的一个，用到不可缓存的工具时不缓存回答；
+   没有调用工具的回答默认不缓存（无从判断它是否依赖时间），问题里有"今天"/"明天"时回答最晚在当天午夜过期。
+   只在对话历史为空时使用：有历史时同一句话（"那明天呢"）的含义依赖上下文
+
+两层缓存都存放在 SQLite 里（path 为 None 时在内存中），超过 max_bytes 时按最久未使用的顺序淘汰。
+命中、未命中次数记录在 stats() 和 tracing.metrics（response_cache_hits_total / response_cache_misses_total）中。
+"""
+
+import asyncio
+import json
+import math
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from tracing import metrics
+
+# 各工具结果的有效期（秒）：None 表示不过期（确定性工具），0 表示不缓存。未列出的工具不缓存
+DEFAULT_TOOL_TTLS: Dict[str, Optional[float]] = {
+    "calculate_bmi": None,
+    "calculate_bmi_batch": None,
+    "get_weather": 600,
+    "get_today": 60,
+    "get_current_time": 0,
+}
+
+_NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+# 不影响问题含义的客套词和语气词，比较问题内容时去掉；长的写在前面，优先匹配
+_FILLER_PATTERN = re.compile("|".join([
+    "我想知道", "告诉我", "请问", "帮我", "帮忙", "麻烦", "查询", "一下", "请", "查", "吗", "呢", "吧", "啊", "呀", "的", "了",
+]))
+
+
+def canonical_arguments(arguments: Dict[str, Any], today: Optional[date] = None) -> str:
+    """
+    参数的规范形式：键排序，字符串去首尾空白，整数值的浮点数写成整数（70.0 与 70 视为相同）
+
+    给出 today 时，值为"今天"/"明天"等相对日期的字符串换算成绝对日期（与 weather_backend 的换算一致）
+    """
+    # 推迟导入：weather_backend 会加载 httpx，聊天机器人启动时用不到
+    from weather_backend import RELATIVE_DATES, normalize_weather_key
+
+    def normalize(value: Any) -> Any:
+        if isinstance(value, dict):
+            return {key: normalize(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [normalize(item) for item in value]
+        if isinstance(value, str):
+            text = value.strip()
+            if today is not None and text.casefold() in RELATIVE_DATES:
+                return normalize_weather_key("", text, today)[1]
+            return text
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        return value
+
+    return json.dumps(normalize(arguments), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def normalize_query(query: str) -> str:
+    """全角转半角、casefold，去掉标点和空白"""
+    text = unicodedata.normalize("NFKC", query).casefold()
+    return "".join(ch for ch in text if ch.isalnum() or ch == ".")
+
+
+def query_features(normalized: str) -> Tuple[Tuple[Tuple[str, ...], str], FrozenSet[str]]:
+    """
+    返回 (内容签名, 字符二元组集合)
+
+    内容签名为 (数字序列, 去掉客套词后排好序的字符)：签名不同的问题内容不同，不参与相似度比较；
+    二元组取自去掉客套词后的内容，只用来区分语序（"北京到上海" 与 "上海到北京"）
+    """
+    content = _FILLER_PATTERN.sub("", normalized)
+    signature = (tuple(_NUMBER_PATTERN.findall(content)), "".join(sorted(content)))
+    bigrams = frozenset(content[i:i + 2] for i in range(max(1, len(content) - 1)))
+    return signature, bigrams
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class _SQLiteStore:
+    """
+    带过期时间和总大小上限的 key-value 存储
+
+    所有方法都是同步的，由 ResponseCache 放到线程里执行；一个连接配一把锁
+    """
+
+    def __init__(self, path: Optional[str], max_bytes: int):
+        self.max_bytes = max_bytes
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, kind TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires_at REAL, last_access REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+
+    def get(self, key: str, now: float) -> Optional[str]:
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            return value
+
+    def put(self, key: str, kind: str, value: str, expires_at: Optional[float], now: float) -> List[str]:
+        """写入一条记录，返回因超出大小上限被淘汰的 key"""
+        size = len(key.encode("utf-8")) + len(value.encode("utf-8"))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, kind, value, expires_at, last_access, size)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, value, expires_at, now, size),
+            )
+            return self._evict(now)
+
+    def _evict(self, now: float) -> List[str]:
+        evicted = [key for (key,) in self._conn.execute(
+            "SELECT key FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        )]
+        self._conn.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return evicted
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            evicted.append(key)
+            total -= size
+        return evicted
+
+    def items(self, kind: str, now: float) -> List[Tuple[str, str]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT key, value FROM entries WHERE kind = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (kind, now),
+            ).fetchall()
+
+    def usage(self) -> Tuple[int, int]:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """
+    工具结果 + 最终回答缓存
+
+    使用示例：
+        cache = ResponseCache("response_cache.sqlite3", max_bytes=8 * 1024 * 1024)
+        client = MCPClient(url, response_cache=cache)
+        ...
+        print(cache.stats())
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_bytes: int = 8 * 1024 * 1024,
+        tool_ttls: Optional[Dict[str, Optional[float]]] = None,
+        answer_ttl: Optional[float] = None,
+        similarity_threshold: float = 0.85,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        初始化缓存
+
+        Args:
+            path: SQLite 文件路径，None 表示只放在内存中
+            max_bytes: 所有条目的总字节数上限，超出时按最久未使用的顺序淘汰
+            tool_ttls: 各工具结果的有效期（秒），默认 DEFAULT_TOOL_TTLS
+            answer_ttl: 最终回答的最长有效期（秒）；None 表示取本轮所用工具中最短的有效期，
+                没有调用工具的回答不缓存
+            similarity_threshold: 内容相同的两个查询，语序的相似度达到该值才视为同一个问题
+            clock: 时间函数；跨进程持久化，所以用墙上时间
+        """
+        self.tool_ttls = dict(DEFAULT_TOOL_TTLS if tool_ttls is None else tool_ttls)
+        self.answer_ttl = answer_ttl
+        self.similarity_threshold = similarity_threshold
+        self.clock = clock
+        self._store = _SQLiteStore(path, max_bytes)
+        # 相似度索引：内容签名 -> {answer key: 二元组集合}，内容不同的查询不参与比较
+        self._index: Dict[Tuple[Tuple[str, ...], str], Dict[str, FrozenSet[str]]] = {}
+        for key, _ in self._store.items("answer", clock()):
+            self._index_add(key)
+        self._counts = {(kind, outcome): 0 for kind in ("tool", "answer") for outcome in ("hits", "misses")}
+
+    def _index_add(self, key: str):
+        signature, bigrams = query_features(key[len("answer:"):])
+        self._index.setdefault(signature, {})[key] = bigrams
+
+    def _index_remove(self, keys: Iterable[str]):
+        for key in keys:
+            if key.startswith("answer:"):
+                signature, _ = query_features(key[len("answer:"):])
+                bucket = self._index.get(signature)
+                if bucket is not None:
+                    bucket.pop(key, None)
+                    if not bucket:
+                        del self._index[signature]
+
+    def _record(self, kind: str, hit: bool):
+        outcome = "hits" if hit else "misses"
+        self._counts[(kind, outcome)] += 1
+        metrics.inc(f"response_cache_{outcome}_total", labels={"kind": kind})
+
+    def tool_ttl(self, tool_name: str) -> Optional[float]:
+        """工具结果的有效期：None 为不过期，0 为不缓存"""
+        return self.tool_ttls.get(tool_name, 0)
+
+    def cacheable(self, tool_name: str) -> bool:
+        return self.tool_ttl(tool_name) != 0
+
+    def _tool_key(self, tool_name: str, arguments: Dict[str, Any], now: float) -> str:
+        today = datetime.fromtimestamp(now).date()
+        return f"tool:{tool_name}:{canonical_arguments(arguments, today)}"
+
+    async def get_tool_result(self, tool_name: str, arguments: Dict[str, Any]) -> Optional[str]:
+        """查找工具结果，不可缓存的工具直接返回 None（不计入未命中）"""
+        if not self.cacheable(tool_name):
+            return None
+        now = self.clock()
+        key = self._tool_key(tool_name, arguments, now)
+        value = await asyncio.to_thread(self._store.get, key, now)
+        self._record("tool", value is not None)
+        return value
+
+    async def put_tool_result(self, tool_name: str, arguments: Dict[str, Any], output: str):
+        ttl = self.tool_ttl(tool_name)
+        if ttl == 0:
+            return
+        now = self.clock()
+        key = self._tool_key(tool_name, arguments, now)
+        expires_at = None if ttl is None else now + ttl
+        evicted = await asyncio.to_thread(self._store.put, key, "tool", output, expires_at, now)
+        self._index_remove(evicted)
+
+    async def get_answer(self, query: str) -> Optional[str]:
+        """在相似度索引中查找与 query 相当的问题，返回其仍有效的回答"""
+        normalized = normalize_query(query)
+        signature, bigrams = query_features(normalized)
+        best_key, best_score = None, 0.0
+        for key, candidate in self._index.get(signature, {}).items():
+            score = jaccard(bigrams, candidate)
+            if score > best_score:
+                best_key, best_score = key, score
+        value = None
+        if best_key is not None and best_score >= self.similarity_threshold:
+            value = await asyncio.to_thread(self._store.get, best_key, self.clock())
+            if value is None:  # 已过期
+                self._index_remove([best_key])
+        self._record("answer", value is not None)
+        return value
+
+    async def put_answer(self, query: str, answer: str, tools_used: Iterable[str] = ()):
+        """
+        保存最终回答，有效期取 answer_ttl 和本轮所用工具有效期中最短的一个
+
+        answer_ttl 为 None 且本轮没有调用工具时不保存；问题里有"今天"/"明天"等相对日期时最晚在当天午夜过期
+
+        Args:
+            query: 用户问题
+            answer: 最终回答
+            tools_used: 本轮调用过的工具名称
+        """
+        from weather_backend import RELATIVE_DATES
+
+        ttls = [self.tool_ttl(name) for name in tools_used]
+        if not answer or 0 in ttls or (not ttls and self.answer_ttl is None):
+            return
+        limits = [t for t in ttls if t is not None]
+        if self.answer_ttl is not None:
+            limits.append(self.answer_ttl)
+        now = self.clock()
+        normalized = normalize_query(query)
+        expires_at = now + min(limits) if limits else None
+        if any(word in normalized for word in RELATIVE_DATES):
+            midnight = datetime.combine(datetime.fromtimestamp(now).date() + timedelta(days=1), datetime.min.time())
+            expires_at = min(expires_at or math.inf, midnight.timestamp())
+        key = f"answer:{normalized}"
+        evicted = await asyncio.to_thread(self._store.put, key, "answer", answer, expires_at, now)
+        self._index_remove(evicted)
+        if key not in evicted:
+            self._index_add(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率、条目数和占用字节数"""
+        entries, size = self._store.usage()
+        result: Dict[str, Any] = {"entries": entries, "bytes": size}
+        for kind in ("tool", "answer"):
+            hits, misses = self._counts[(kind, "hits")], self._counts[(kind, "misses")]
+            result[f"{kind}_hits"] = hits
+            result[f"{kind}_misses"] = misses
+            result[f"{kind}_hit_rate"] = hits / (hits + misses) if hits + misses else 0.0
+        return result
+
+    def close(self):
+        self._store.close()
@@ -0,0 +1,192 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+MCP server 的运行配置：开发 / 生产两种模式，以及生产环境的结构化、采样日志
+
+原先各 server 把 debug=True、log_level="debug" 写死在代码里，每个请求都输出多行调试日志和访问日志。
+ServerConfig.from_env() 从环境变量读取监听地址、端口和日志设置，各 server 通过参数给出自己的开发默认值。
+MCP_ENV=production 时的默认值：
+1. 关闭 debug 和启动横幅，日志级别 warning，不输出访问日志
+2. 日志为单行 JSON（time、level、logger、message，在 span 内时带 trace_id / span_id），
+   FastMCP 的 Rich 日志和 uvicorn 的日志都改为经过同一个 handler 输出
+3. INFO 及以下的日志按 MCP_LOG_SAMPLE_RATE 采样（被保留的记录带 sample_rate 字段，便于按比例还原数量），
+   WARNING 及以上全部保留
+开发模式（默认）保持原来的文本日志。
+
+环境变量（均为可选）：
+    MCP_ENV              development（默认）或 production
+    MCP_HOST             监听地址，默认 0.0.0.0
+    MCP_PORT             监听端口，默认为各 server 原来的端口
+    MCP_DEBUG            1 / 0 开启或关闭 FastMCP 的 debug 模式
+    MCP_LOG_LEVEL        日志级别（debug / info / warning / error），production 默认 warning
+    MCP_LOG_FORMAT       text 或 json，production 默认 json；采样只对 json 格式生效
+    MCP_LOG_SAMPLE_RATE  INFO 及以下日志的采样率（0 ~ 1），production 默认 0.1
+    MCP_ACCESS_LOG       1 / 0 开启或关闭 uvicorn 访问日志，production 默认关闭
+"""
+
+import json
+import logging
+import os
+import random
+from typing import Any, Callable, Dict, Optional
+
+from admission import http_limits
+from tracing import current_span
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if not value:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+class SamplingFilter(logging.Filter):
+    """INFO 及以下的日志按 rate 的比例保留，WARNING 及以上全部保留"""
+
+    def __init__(self, rate: float, rng: Callable[[], float] = random.random):
+        super().__init__()
+        self.rate = rate
+        self.rng = rng
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or self.rate >= 1 or self.rng() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一行 JSON"""
+
+    def __init__(self, sample_rate: float = 1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.levelno < logging.WARNING and self.sample_rate < 1:
+            entry["sample_rate"] = self.sample_rate
+        span = current_span()
+        if span is not None:
+            entry["trace_id"] = span.trace_id
+            entry["span_id"] = span.span_id
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ServerConfig:
+    """
+    server 的监听地址和日志配置
+
+    使用示例：
+        config = ServerConfig.from_env(port=8083, debug=True, log_level="debug")
+        config.configure_logging()
+        mcp = create_mcp(**config.fastmcp_settings())
+        mcp.run(transport="streamable-http", **config.run_kwargs())
+    """
+
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: int = 8083,
+        production: bool = False,
+        debug: bool = False,
+        log_level: str = "info",
+        log_format: str = "text",
+        log_sample_rate: float = 1.0,
+        access_log: bool = True,
+    ):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口
+            production: 是否为生产模式（不显示启动横幅）
+            debug: FastMCP 的 debug 模式
+            log_level: 日志级别
+            log_format: text 保持 FastMCP / uvicorn 原来的日志，json 为单行 JSON 并支持采样
+            log_sample_rate: json 格式下 INFO 及以下日志的采样率
+            access_log: 是否输出 uvicorn 访问日志
+        """
+        self.host = host
+        self.port = port
+        self.production = production
+        self.debug = debug
+        self.log_level = log_level.lower()
+        self.log_format = log_format
+        self.log_sample_rate = min(max(log_sample_rate, 0.0), 1.0)
+        self.access_log = access_log
+
+    @classmethod
+    def from_env(cls, port: int, debug: bool = False, log_level: str = "info") -> "ServerConfig":
+        """
+        根据环境变量创建配置
+
+        Args:
+            port: MCP_PORT 未设置时的端口
+            debug: 开发模式下 MCP_DEBUG 未设置时是否开启 debug
+            log_level: 开发模式下 MCP_LOG_LEVEL 未设置时的日志级别
+        """
+        # 空字符串（例如 .env 里留空的项）视为未设置
+        production = (os.getenv("MCP_ENV") or "development").lower() in ("production", "prod")
+        return cls(
+            host=os.getenv("MCP_HOST") or "0.0.0.0",
+            port=int(os.getenv("MCP_PORT") or port),
+            production=production,
+            debug=_env_flag("MCP_DEBUG", debug and not production),
+            log_level=os.getenv("MCP_LOG_LEVEL") or ("warning" if production else log_level),
+            log_format=os.getenv("MCP_LOG_FORMAT") or ("json" if production else "text"),
+            log_sample_rate=float(os.getenv("MCP_LOG_SAMPLE_RATE") or (0.1 if production else 1.0)),
+            access_log=_env_flag("MCP_ACCESS_LOG", not production),
+        )
+
+    @property
+    def structured(self) -> bool:
+        return self.log_format == "json"
+
+    def configure_logging(self):
+        """json 格式时把 root、FastMCP 和 uvicorn 的日志统一成一个采样的 JSON handler；text 格式不做改动"""
+        if not self.structured:
+            return
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter(self.log_sample_rate))
+        handler.addFilter(SamplingFilter(self.log_sample_rate))
+        root = logging.getLogger()
+        for existing in root.handlers[:]:
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(self.log_level.upper())
+        # FastMCP 导入时给自己的 logger 装了 Rich handler 并关闭了向上传递
+        for name in ("FastMCP", "uvicorn", "uvicorn.error", "uvicorn.access"):
+            logger = logging.getLogger(name)
+            for existing in logger.handlers[:]:
+                logger.removeHandler(existing)
+            logger.setLevel(logging.NOTSET)
+            logger.propagate = True
+
+    def fastmcp_settings(self) -> Dict[str, Any]:
+        """create_mcp() 的额外参数；FastMCP 对构造时传入 debug 给出弃用警告，关闭时不传"""
+        return {"debug": True} if self.debug else {}
+
+    def uvicorn_config(self) -> Dict[str, Any]:
+        """uvicorn 的参数：连接数上限、日志级别、访问日志；json 格式时不让 uvicorn 改写日志配置"""
+        config: Dict[str, Any] = {**http_limits(), "log_level": self.log_level, "access_log": self.access_log}
+        if self.structured:
+            config["log_config"] = None
+        return config
+
+    def run_kwargs(self, path: Optional[str] = None) -> Dict[str, Any]:
+        """FastMCP.run() 的 HTTP 传输参数"""
+        kwargs: Dict[str, Any] = {
+            "host": self.host,
+            "port": self.port,
+            "log_level": self.log_level,
+            "show_banner": not self.production,
+            "uvicorn_config": self.uvicorn_config(),
+        }
+        if path is not None:
+            kwargs["path"] = path
+        return kwargs
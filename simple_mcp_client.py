@@ -8,8 +8,15 @@ conda env mcp_env ,Python版本 3.10.18
 """
 
 import asyncio
-from typing import List, Dict, Any, Optional
-from fastmcp import Client
+import logging
+from typing import List, Dict, Any, Optional, AsyncIterator, Iterable, Sequence, Tuple, Union
+from mcp_session import MCPSessionPool
+from replica_balancer import BalancedMCPSessionPool
+
+logger = logging.getLogger(__name__)
+
+# 批量调用中的一项：(tool_name, arguments) 或 {"tool_name": ..., "arguments": {...}}
+ToolCallItem = Union[Tuple[str, Dict[str, Any]], Dict[str, Any]]
 
 
 class SimpleMCPClient:
@@ -19,21 +26,65 @@ class SimpleMCPClient:
     核心功能：
     1. list_tools() - 获取服务器提供的所有工具及其描述
     2. call_tool() - 调用指定工具并返回结果
+    3. call_tools_batch() / call_tools_stream() - 并发批量调用多个工具
+    
+    内部维护一个会话池（mcp_session.MCPSessionPool），调用之间复用已握手的会话，
+    多个调用可以并发地分摊到池中的会话上。
+    传入同一个 server 多个副本的 URL 列表时，每个副本一个会话池，调用由 replica_balancer 在副本间负载均衡，
+    连接失败的副本被暂时摘除，client.pool.stats() 返回各副本的延迟统计。
     
     使用示例：
-        client = SimpleMCPClient("http://127.0.0.1:8083/my-custom-path")
-        tools = await client.list_tools()
-        result = await client.call_tool("get_weather", {"city": "北京", "date": "今天"})
+        async with SimpleMCPClient("http://127.0.0.1:8083/my-custom-path") as client:
+            tools = await client.list_tools()
+            result = await client.call_tool("get_weather", {"city": "北京", "date": "今天"})
+    
+    不使用 async with 也可以直接调用，此时会话在第一次调用时才建立，用完后需要 await client.close()
     """
     
-    def __init__(self, server_url: str):
+    def __init__(
+        self,
+        server_url: Union[str, Sequence[str]],
+        pool_size: int = 4,
+        min_pool_size: int = 1,
+        idle_timeout: float = 300.0,
+        health_check_interval: float = 30.0,
+        strategy: str = "p2c",
+    ):
         """
         初始化MCP客户端
         
         Args:
-            server_url: MCP服务器的URL地址
+            server_url: MCP服务器的URL地址，或同一个服务器多个副本的URL列表
+            pool_size: 会话池大小，进入 async with 时预热这么多个会话（多个副本时为每个副本的大小）
+            min_pool_size: 空闲淘汰后至少保留的会话数
+            idle_timeout: 会话空闲多久（秒）后被关闭
+            health_check_interval: 健康检查间隔（秒）
+            strategy: 多个副本时的选择策略，"p2c" 或 "least_outstanding"（见 replica_balancer）
         """
         self.server_url = server_url
+        pool_kwargs = dict(
+            size=pool_size,
+            min_size=min_pool_size,
+            idle_timeout=idle_timeout,
+            health_check_interval=health_check_interval,
+        )
+        if isinstance(server_url, str):
+            self.pool = MCPSessionPool(server_url, **pool_kwargs)
+        elif len(server_url) == 1:
+            self.pool = MCPSessionPool(server_url[0], **pool_kwargs)
+        else:
+            self.pool = BalancedMCPSessionPool(server_url, strategy=strategy, **pool_kwargs)
+    
+    async def __aenter__(self):
+        await self.pool.start()
+        return self
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+    
+    async def close(self):
+        """关闭会话池中的所有会话"""
+        await self.pool.close()
     
     async def list_tools(self) -> List[Dict[str, Any]]:
         """
@@ -45,9 +96,8 @@ class SimpleMCPClient:
             - description: 工具描述
             - parameters: 工具参数schema
         """
-        async with Client(self.server_url) as client:
-            tool_list_response = await client.list_tools()
-        print(f"tool_list_response:\n {tool_list_response}")
+        tool_list_response = await self.pool.list_tools()
+        logger.debug("tool_list_response:\n %s", tool_list_response)
         '''
         tool_list_response:
         [Tool(
@@ -109,9 +159,9 @@ class SimpleMCPClient:
             - error: 错误信息（如果有）
         """
         try:
-            async with Client(self.server_url) as client:
-                result = await client.call_tool(tool_name, arguments)
-            print(f"tool_call_result:\n {result}")
+            result = await self.pool.call_tool(tool_name, arguments)
+            # 批量调用时每一项都会走到这里，完整的返回结构只在 debug 日志里输出
+            logger.debug("tool_call_result:\n %s", result)
             '''
             tool_call_result:
             CallToolResult(
@@ -132,52 +182,164 @@ class SimpleMCPClient:
                 "result": None,
                 "error": str(e)
             }
+
+    @staticmethod
+    def _normalize_call(call: ToolCallItem) -> Tuple[Optional[str], Dict[str, Any], Optional[str]]:
+        """返回 (tool_name, arguments, error)；格式不对时 error 为错误说明，只让这一项失败，不影响同一批的其他调用"""
+        try:
+            if isinstance(call, dict):
+                tool_name = call.get("tool_name") or call.get("name")
+                arguments = call.get("arguments") or {}
+            else:
+                tool_name, arguments = call
+        except (TypeError, ValueError):
+            return None, {}, f"无效的工具调用: {call!r}"
+        if not isinstance(tool_name, str) or not isinstance(arguments, dict):
+            return (tool_name if isinstance(tool_name, str) else None), {}, f"无效的工具调用: {call!r}"
+        return tool_name, arguments, None
+
+    async def call_tools_stream(
+        self,
+        calls: Iterable[ToolCallItem],
+        max_concurrency: int = 8,
+        deadline: Optional[float] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        并发执行多个工具调用，按完成顺序逐个返回结果
+        
+        请求通过会话池分摊到一个或多个会话上，同一会话上的多个请求并发进行（不等待前一个返回）。
+        
+        Args:
+            calls: 工具调用列表，每项为 (tool_name, arguments) 或 {"tool_name": ..., "arguments": {...}}
+            max_concurrency: 同时进行的调用上限
+            deadline: 整批调用的截止时间（秒），到期后未完成的调用被取消并返回错误
+            
+        Yields:
+            与 call_tool 相同的结果字典，另外包含 index（在 calls 中的下标）和 tool_name；
+            格式不对的项不发送，最先返回 success 为 False 的结果
+        """
+        requests = [self._normalize_call(call) for call in calls]
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        
+        async def run(index: int, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                result = await self.call_tool(tool_name, arguments)
+            return {"index": index, "tool_name": tool_name, **result}
+        
+        tasks = {
+            asyncio.ensure_future(run(index, tool_name, arguments)): index
+            for index, (tool_name, arguments, error) in enumerate(requests)
+            if error is None
+        }
+        loop = asyncio.get_running_loop()
+        end = loop.time() + deadline if deadline is not None else None
+        pending = set(tasks)
+        try:
+            for index, (tool_name, _, error) in enumerate(requests):
+                if error is not None:
+                    yield {"index": index, "tool_name": tool_name, "success": False, "result": None, "error": error}
+            while pending:
+                timeout = None if end is None else max(0.0, end - loop.time())
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        # 截止时间到了仍未完成的调用：等待取消完成（释放会话池中的占用）后返回错误
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in sorted(pending, key=tasks.get):
+            index = tasks[task]
+            yield {
+                "index": index,
+                "tool_name": requests[index][0],
+                "success": False,
+                "result": None,
+                "error": f"超过截止时间 {deadline}s，调用已取消",
+            }
     
+    async def call_tools_batch(
+        self,
+        calls: Iterable[ToolCallItem],
+        max_concurrency: int = 8,
+        deadline: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        并发执行多个工具调用，按输入顺序返回结果
+        
+        Args:
+            calls: 工具调用列表，每项为 (tool_name, arguments) 或 {"tool_name": ..., "arguments": {...}}
+            max_concurrency: 同时进行的调用上限
+            deadline: 整批调用的截止时间（秒），到期后未完成的调用返回错误
+            
+        Returns:
+            与 calls 一一对应的结果列表，每项包含 index、tool_name、success、result、error
+        """
+        calls = list(calls)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(calls)
+        async for item in self.call_tools_stream(calls, max_concurrency=max_concurrency, deadline=deadline):
+            results[item["index"]] = item
+        return results
+
 
 # 使用示例
 async def example_usage():
     """使用示例"""
-    client = SimpleMCPClient("http://127.0.0.1:8083/my-custom-path")
-    
-    # 1. 获取工具列表
-    print("=== 获取工具列表 ===")
-    tools = await client.list_tools()
-    print(f"function tools:\n {tools}")
-    '''
-    打印结果：
-    [{
-        'name': 'calculate_bmi',
-        'description': '通过给定的体重和身高计算BMI指数。\n\nArgs:\n    weight_kg (float): 用户的体重，单位为公斤(kg)。\n    height_m (float): 用户的身高，单位为米(m)。\n\nReturns:\n    float: 计算得出的BMI指数值。',
-        'parameters': {
-            'properties': {
-                'weight_kg': {
-                    'title': 'Weight Kg',
-                    'type': 'number'
+    async with SimpleMCPClient("http://127.0.0.1:8083/my-custom-path") as client:
+        # 1. 获取工具列表
+        print("=== 获取工具列表 ===")
+        tools = await client.list_tools()
+        print(f"function tools:\n {tools}")
+        '''
+        打印结果：
+        [{
+            'name': 'calculate_bmi',
+            'description': '通过给定的体重和身高计算BMI指数。\n\nArgs:\n    weight_kg (float): 用户的体重，单位为公斤(kg)。\n    height_m (float): 用户的身高，单位为米(m)。\n\nReturns:\n    float: 计算得出的BMI指数值。',
+            'parameters': {
+                'properties': {
+                    'weight_kg': {
+                        'title': 'Weight Kg',
+                        'type': 'number'
+                        },
+                    'height_m': {
+                        'title': 'Height M',
+                        'type': 'number'
+                        }
                     },
-                'height_m': {
-                    'title': 'Height M',
-                    'type': 'number'
-                    }
-                },
-            'required': ['weight_kg', 'height_m'],
-            'type': 'object'
-            }
-    }]
-    '''
-    # 2. 调用工具
-    print("\n=== 调用工具示例 ===")
+                'required': ['weight_kg', 'height_m'],
+                'type': 'object'
+                }
+        }]
+        '''
+        # 2. 调用工具
+        print("\n=== 调用工具示例 ===")
     
-    # 获取当前时间
-    result = await client.call_tool("get_current_time", {})
-    print(f"当前时间:\n {result}")
-    # {'success': True, 'result': '2025-07-15 17:17:16', 'error': None}
-    # 计算BMI
-    result = await client.call_tool("calculate_bmi", {"weight_kg": 70, "height_m": 1.75})
-    print(f"BMI计算结果:\n {result}")
+        # 获取当前时间
+        result = await client.call_tool("get_current_time", {})
+        print(f"当前时间:\n {result}")
+        # {'success': True, 'result': '2025-07-15 17:17:16', 'error': None}
+        # 计算BMI
+        result = await client.call_tool("calculate_bmi", {"weight_kg": 70, "height_m": 1.75})
+        print(f"BMI计算结果:\n {result}")
     
-    # 获取天气
-    #result = await client.call_tool("get_weather", {"city": "北京", "date": "今天"})
-    #print(f"天气查询结果:\n {result}")
+        # 获取天气
+        #result = await client.call_tool("get_weather", {"city": "北京", "date": "今天"})
+        #print(f"天气查询结果:\n {result}")
+
+        # 3. 批量调用：多个城市的天气和其他工具一起并发执行，结果按输入顺序返回
+        print("\n=== 批量调用示例 ===")
+        calls = [("get_weather", {"city": city, "date": "今天"}) for city in ["北京", "上海", "广州"]]
+        calls.append({"tool_name": "calculate_bmi", "arguments": {"weight_kg": 70, "height_m": 1.75}})
+        results = await client.call_tools_batch(calls, max_concurrency=4, deadline=30)
+        for item in results:
+            print(f"{item['tool_name']}: success={item['success']} result={item['result']} error={item['error']}")
+
+        # 流式模式：哪个先完成就先处理哪个
+        async for item in client.call_tools_stream(calls, deadline=30):
+            print(f"完成 #{item['index']} {item['tool_name']}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,10 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+测试使用仓库根目录下的模块，运行方式：python -m pytest -q
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
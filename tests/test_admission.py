@@ -0,0 +1,83 @@
+"""
+admission：客户端按对端 IP 区分，自己设置的 X-Client-Id 不能绕过限流；跟踪的客户端数有上限；
+构造函数和 from_env() 的默认值相同
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from admission import AdmissionError, AdmissionMiddleware, client_id, http_limits
+
+
+def context(peer, headers=None, tool="get_today"):
+    request = SimpleNamespace(headers=headers or {}, client=SimpleNamespace(host=peer))
+    fastmcp_context = SimpleNamespace(request_context=SimpleNamespace(request=request))
+    return SimpleNamespace(fastmcp_context=fastmcp_context, message=SimpleNamespace(name=tool))
+
+
+async def call_next(context):
+    return "ok"
+
+
+def test_client_header_only_trusted_behind_proxy():
+    assert client_id(context("10.0.0.5", {"x-client-id": "alice"})) == "10.0.0.5"
+    proxies = frozenset({"10.0.0.1"})
+    assert client_id(context("10.0.0.1", {"x-client-id": "alice"}), proxies) == "alice"
+    assert client_id(context("10.0.0.1", {"x-forwarded-for": "1.2.3.4, 5.6.7.8"}), proxies) == "5.6.7.8"
+    assert client_id(context("10.0.0.5", {"x-forwarded-for": "1.2.3.4"}), proxies) == "10.0.0.5"
+
+
+def test_changing_client_header_does_not_bypass_rate_limit():
+    middleware = AdmissionMiddleware(rate=1, burst=2)
+
+    async def run():
+        for i in range(2):
+            await middleware.on_request(context("10.0.0.5", {"x-client-id": f"c{i}"}), call_next)
+        with pytest.raises(AdmissionError) as error:
+            await middleware.on_request(context("10.0.0.5", {"x-client-id": "c2"}), call_next)
+        return error.value.error.data["status"]
+
+    assert asyncio.run(run()) == 429
+    assert middleware.stats()["clients"] == 1
+
+
+def test_tracked_clients_are_capped_even_when_busy():
+    middleware = AdmissionMiddleware(rate=0, max_clients=3)
+    async def run():
+        gate = asyncio.Event()
+
+        async def blocked(context):
+            await gate.wait()
+            return "ok"
+
+        # 3 个客户端都有正在执行的调用
+        calls = [asyncio.ensure_future(middleware.on_call_tool(context(f"10.0.0.{i}"), blocked)) for i in range(3)]
+        await asyncio.sleep(0)
+        for i in range(3, 10):
+            await middleware.on_request(context(f"10.0.0.{i}"), call_next)
+            assert middleware.stats()["clients"] <= 3
+        gate.set()
+        return await asyncio.gather(*calls)
+
+    assert asyncio.run(run()) == ["ok"] * 3
+    assert middleware.stats()["clients"] == 3
+
+
+def settings(middleware):
+    return (
+        middleware.rate, middleware.burst, middleware.client_concurrency, middleware.max_queue,
+        middleware.queue_timeout, {name: limiter.limit for name, limiter in middleware.tool_limiters.items()},
+    )
+
+
+def test_constructor_and_env_defaults_match(monkeypatch):
+    for name in ("MCP_RATE_LIMIT", "MCP_RATE_BURST", "MCP_CLIENT_CONCURRENCY", "MCP_TOOL_CONCURRENCY",
+                 "MCP_QUEUE_SIZE", "MCP_QUEUE_TIMEOUT", "MCP_MAX_CONNECTIONS"):
+        monkeypatch.delenv(name, raising=False)
+    assert settings(AdmissionMiddleware.from_env()) == settings(AdmissionMiddleware())
+    assert http_limits() == {"limit_concurrency": 1000}
+
+    monkeypatch.setenv("MCP_TOOL_CONCURRENCY", "")
+    assert AdmissionMiddleware.from_env().tool_limiters == {}
@@ -0,0 +1,34 @@
+"""
+chat_gateway：不合法的请求体返回 400，不创建对话
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from chat_gateway import ChatGateway
+
+
+@pytest.mark.parametrize("content, status", [
+    (b"[]", 400),
+    (b'"query"', 400),
+    (b"null", 400),
+    (b"{not json", 400),
+    (b'{"query": "  "}', 400),
+    (b'{"query": "' + b"a" * 5000 + b'"}', 413),
+])
+def test_invalid_bodies_are_rejected(monkeypatch, content, status):
+    monkeypatch.setenv("KIMI_API_KEY", "test")
+    gateway = ChatGateway("http://127.0.0.1:1/mcp")
+
+    async def post():
+        # 不经过 lifespan，不会连接 MCP server
+        transport = httpx.ASGITransport(app=gateway.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+            return await client.post("/chat", content=content, headers={"content-type": "application/json"})
+
+    response = asyncio.run(post())
+    assert response.status_code == status
+    assert "error" in response.json()
+    assert not gateway.sessions
@@ -0,0 +1,121 @@
+"""
+conversation_history：超出预算时从最早的一轮开始丢弃、滚动摘要替换旧的几轮、
+encoded() 的缓存在历史变化后失效；开启滚动摘要时，LLM 客户端要等到第一次需要摘要时才创建
+"""
+
+import asyncio
+
+import pytest
+
+import fastmcp_client_streamhttp_chatbot
+import mcp_client_sse_chatbot
+from conversation_history import SUMMARY_PREFIX, ConversationHistory, estimate_tokens, make_llm_summarizer
+
+
+# 每条消息 4 + 40 / 4 = 14 个 token，每轮 28 个
+TEXT = "a" * 40
+
+
+def add_turns(history, *names):
+    async def main():
+        for name in names:
+            await history.add_turn(f"{name}{TEXT}", f"{name}{TEXT}")
+
+    asyncio.run(main())
+
+
+def user_messages(history):
+    return [message["content"][0] for message in history if message["role"] == "user"]
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("你好") == 2
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+    assert estimate_tokens(None) == 0
+
+
+def test_oldest_turns_are_dropped_to_fit_the_budget():
+    history = ConversationHistory(token_budget=60)
+    add_turns(history, "a", "b")
+    assert user_messages(history) == ["a", "b"]
+    add_turns(history, "c")
+    assert user_messages(history) == ["b", "c"]
+    assert history.tokens() <= 60
+    assert history.stats()["dropped_turns"] == 1
+    assert history.stats()["dropped_tokens"] == 30
+
+
+def test_rolling_summary_replaces_old_turns_and_folds_in_the_previous_summary():
+    seen = []
+
+    async def summarizer(messages):
+        seen.append(messages)
+        return f" 摘要{len(seen)} "
+
+    history = ConversationHistory(token_budget=70, summarizer=summarizer, keep_recent_turns=1)
+    add_turns(history, "a", "b", "c")
+    messages = history.to_messages()
+    assert messages[0] == {"role": "system", "content": SUMMARY_PREFIX + "摘要1"}
+    assert user_messages(history) == ["c"]
+    assert [message["content"][0] for message in seen[0]] == ["a", "a", "b", "b"]
+
+    add_turns(history, "d", "e")
+    # 每次新的摘要请求都以上一次的摘要开头
+    assert len(seen) >= 2
+    for index in range(1, len(seen)):
+        assert seen[index][0]["content"] == SUMMARY_PREFIX + f"摘要{index}"
+    assert history.summary == f"摘要{len(seen)}"
+    assert user_messages(history) == ["e"]
+    assert history.stats()["summarized_turns"] == 4
+    assert history.stats()["dropped_turns"] == 0
+
+
+def test_failed_summary_falls_back_to_dropping():
+    async def summarizer(messages):
+        raise RuntimeError("LLM 不可用")
+
+    history = ConversationHistory(token_budget=60, summarizer=summarizer, keep_recent_turns=1)
+    add_turns(history, "a", "b", "c")
+    assert history.summary is None
+    assert user_messages(history) == ["b", "c"]
+    assert history.stats()["dropped_turns"] == 1
+
+
+def test_encoded_is_cached_until_the_history_changes():
+    history = ConversationHistory(token_budget=1000)
+    add_turns(history, "a")
+    first = history.encoded()
+    assert history.encoded() is first
+    add_turns(history, "b")
+    second = history.encoded()
+    assert second is not first
+    assert [message["content"][0] for message in second.messages] == ["a", "a", "b", "b"]
+    history.clear()
+    assert history.encoded().messages == []
+
+
+class _Created(Exception):
+    pass
+
+
+def test_summarizer_resolves_client_on_first_use():
+    calls = []
+
+    def llm():
+        calls.append(1)
+        raise _Created()
+
+    summarize = make_llm_summarizer(llm, "model")
+    assert calls == []
+    with pytest.raises(_Created):
+        asyncio.run(summarize([{"role": "user", "content": "你好"}]))
+    assert calls == [1]
+
+
+def test_chatbots_do_not_create_llm_client_for_summarizer():
+    streamhttp = fastmcp_client_streamhttp_chatbot.MCPClient("http://127.0.0.1:1/mcp", summarize_history=True)
+    sse = mcp_client_sse_chatbot.MCPClient(summarize_history=True)
+    assert streamhttp.conversation_history.summarizer is not None
+    assert streamhttp._llm is None
+    assert sse._client is None
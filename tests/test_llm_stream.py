@@ -0,0 +1,101 @@
+"""
+llm_stream：流式 token 的拼接和回调、按 index 合并分片到达的 tool_calls、非流式结果
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from llm_stream import chat_completion
+
+
+def chunk(delta, finish_reason=None):
+    return ChatCompletionChunk.model_validate({
+        "id": "c", "object": "chat.completion.chunk", "created": 0, "model": "m",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    })
+
+
+def tool_delta(index, id=None, name=None, arguments=None):
+    function = {}
+    if name is not None:
+        function["name"] = name
+    if arguments is not None:
+        function["arguments"] = arguments
+    item = {"index": index, "function": function}
+    if id is not None:
+        item["id"] = id
+        item["type"] = "function"
+    return {"tool_calls": [item]}
+
+
+class FakeLLM:
+    """只实现 chat.completions.create，记录请求参数"""
+
+    def __init__(self, response):
+        self.response = response
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        if not kwargs.get("stream"):
+            return self.response
+
+        async def stream():
+            for item in self.response:
+                await asyncio.sleep(0)
+                yield item
+
+        return stream()
+
+
+def test_streamed_content_is_joined_and_reported_token_by_token():
+    llm = FakeLLM([
+        chunk({"role": "assistant", "content": ""}),
+        chunk({"content": "你"}),
+        chunk({"content": "好"}),
+        chunk({}, finish_reason="stop"),
+    ])
+    tokens = []
+    result = asyncio.run(chat_completion(llm, "m", [{"role": "user", "content": "hi"}], on_token=tokens.append))
+    assert tokens == ["你", "好"]
+    assert result.message.content == "你好"
+    assert result.message.tool_calls is None
+    assert result.finish_reason == "stop"
+    assert result.time_to_first_token is not None
+    assert llm.requests[0]["stream"] is True and "tools" not in llm.requests[0]
+
+
+def test_interleaved_tool_call_fragments_are_merged_by_index():
+    llm = FakeLLM([
+        chunk(tool_delta(0, id="call_a", name="get_weather", arguments="")),
+        chunk(tool_delta(1, id="call_b", name="get_today", arguments="{")),
+        chunk(tool_delta(0, arguments='{"city": ')),
+        chunk(tool_delta(1, arguments="}")),
+        chunk(tool_delta(0, arguments='"北京", "date": "今天"}')),
+        chunk({}, finish_reason="tool_calls"),
+    ])
+    tools = [{"type": "function", "function": {"name": "get_weather", "parameters": {}}}]
+    result = asyncio.run(chat_completion(llm, "m", [], tools=tools, on_token=None))
+    calls = result.message.tool_calls
+    assert [(call.id, call.function.name) for call in calls] == [("call_a", "get_weather"), ("call_b", "get_today")]
+    assert calls[0].function.arguments == '{"city": "北京", "date": "今天"}'
+    assert calls[1].function.arguments == "{}"
+    assert result.message.content is None
+    assert result.finish_reason == "tool_calls"
+    assert result.time_to_first_token is None
+    assert llm.requests[0]["tools"] == tools
+
+
+def test_non_streaming_returns_the_sdk_message():
+    completion = ChatCompletion.model_validate({
+        "id": "c", "object": "chat.completion", "created": 0, "model": "m",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "好的"}, "finish_reason": "stop"}],
+    })
+    llm = FakeLLM(completion)
+    result = asyncio.run(chat_completion(llm, "m", [], stream=False, on_token=None))
+    assert result.message.content == "好的"
+    assert result.finish_reason == "stop"
+    assert "stream" not in llm.requests[0]
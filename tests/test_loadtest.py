@@ -0,0 +1,44 @@
+"""
+benchmarks/loadtest：分位数统计和与历史结果的回归对比
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from loadtest import compare, percentiles
+
+
+def result(rps, p99, transport="sse", scenario="bmi", concurrency=10):
+    return {
+        "transport": transport, "scenario": scenario, "concurrency": concurrency,
+        "rps": rps, "latency_ms": {"p99": p99},
+    }
+
+
+def test_percentiles():
+    stats = percentiles([float(value) for value in range(1, 101)])
+    assert stats == {"p50": 50.5, "p95": 96.0, "p99": 100.0, "mean": 50.5}
+    assert percentiles([]) == {}
+
+
+def test_compare_flags_throughput_and_p99_regressions_beyond_threshold():
+    baseline = {"results": [result(100, 50), result(100, 50, scenario="weather"), result(100, 50, concurrency=50)]}
+    current = {"results": [
+        result(91, 54.9),                        # 都在 10% 以内
+        result(89, 56, scenario="weather"),      # 吞吐和 p99 都回归
+        result(100, 50, scenario="chat"),        # 基线里没有，不比较
+    ]}
+    regressions = compare(current, baseline, threshold=0.1)
+    assert regressions == [
+        "sse/weather/c=10: 吞吐 100 -> 89 req/s",
+        "sse/weather/c=10: p99 50 -> 56 ms",
+    ]
+
+
+@pytest.mark.parametrize("before, after", [(0, 10), (None, 10)])
+def test_compare_ignores_missing_baseline_numbers(before, after):
+    baseline = {"results": [result(0, before)]}
+    assert compare({"results": [result(0, after)]}, baseline, threshold=0.1) == []
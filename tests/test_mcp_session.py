@@ -0,0 +1,195 @@
+"""
+mcp_session：懒连接、并发首次调用只握手一次、连接错误时重连重试、工具错误不重连；
+会话池按并发数选择和扩容、空闲淘汰、健康检查
+"""
+
+import asyncio
+
+import fastmcp
+import pytest
+from fastmcp import FastMCP
+
+from mcp_session import MCPSessionPool, PersistentMCPSession
+
+
+class FakeClient:
+    """代替 fastmcp.Client，记录握手次数，可以模拟连接断开"""
+
+    handshakes = 0
+
+    def __init__(self, target, timeout=None, **kwargs):
+        self.target = target
+        self.alive = False
+
+    async def __aenter__(self):
+        FakeClient.handshakes += 1
+        await asyncio.sleep(0.01)
+        self.alive = True
+        return self
+
+    def is_connected(self):
+        return self.alive
+
+    async def close(self):
+        self.alive = False
+
+    async def ping(self):
+        return True
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    FakeClient.handshakes = 0
+    monkeypatch.setattr(fastmcp, "Client", FakeClient)
+    return FakeClient
+
+
+def test_connects_lazily_and_once_for_concurrent_first_calls(fake_client):
+    session = PersistentMCPSession("http://server/mcp")
+    assert fake_client.handshakes == 0
+
+    async def main():
+        await asyncio.gather(*(session.ping() for _ in range(5)))
+
+    asyncio.run(main())
+    assert fake_client.handshakes == 1
+    assert session.connect_count == 1
+
+
+def test_reconnects_and_retries_once_after_connection_error(fake_client):
+    session = PersistentMCPSession("http://server/mcp")
+    attempts = []
+
+    async def operation(client):
+        attempts.append(client)
+        if len(attempts) == 1:
+            client.alive = False
+            raise ConnectionError("dropped")
+        return "ok"
+
+    assert asyncio.run(session._run(operation)) == "ok"
+    assert len(attempts) == 2
+    assert attempts[0] is not attempts[1]
+    assert session.connect_count == 2
+
+
+def test_tool_error_on_live_session_is_not_retried(fake_client):
+    session = PersistentMCPSession("http://server/mcp")
+    attempts = []
+
+    async def operation(client):
+        attempts.append(client)
+        raise ValueError("bad arguments")
+
+    with pytest.raises(ValueError):
+        asyncio.run(session._run(operation))
+    assert len(attempts) == 1
+    assert session.connect_count == 1
+
+
+def test_request_stuck_on_dropped_session_fails_fast(fake_client):
+    session = PersistentMCPSession("http://server/mcp", health_check_interval=0.01)
+    attempts = []
+
+    async def operation(client):
+        attempts.append(client)
+        if len(attempts) == 1:
+            # 连接断开后 SDK 不会让请求失败，只会一直等待
+            client.alive = False
+            await asyncio.sleep(60)
+        return "ok"
+
+    async def main():
+        return await asyncio.wait_for(session._run(operation), timeout=5)
+
+    assert asyncio.run(main()) == "ok"
+    assert len(attempts) == 2
+
+
+def test_call_tool_round_trip_in_memory():
+    server = FastMCP("test")
+
+    @server.tool()
+    def add(a: int, b: int) -> int:
+        return a + b
+
+    async def main():
+        session = PersistentMCPSession(server)
+        try:
+            result = await session.call_tool("add", {"a": 1, "b": 2})
+            tools = await session.list_tools()
+            return result, tools, session.connect_count
+        finally:
+            await session.close()
+
+    result, tools, handshakes = asyncio.run(main())
+    assert result.data == {"result": 3}
+    assert [tool.name for tool in tools] == ["add"]
+    assert handshakes == 1
+
+
+def test_pool_spreads_concurrent_calls_and_grows_up_to_size(fake_client):
+    pool = MCPSessionPool("http://server/mcp", size=3)
+    used = []
+
+    async def operation(session):
+        used.append(session)
+        await asyncio.sleep(0.05)
+
+    async def main():
+        await asyncio.gather(*(pool._run(operation) for _ in range(6)))
+        await pool.close()
+
+    asyncio.run(main())
+    assert len(set(map(id, used))) == 3
+    # 每个会话分到两个调用
+    assert sorted(used.count(session) for session in set(used)) == [2, 2, 2]
+
+
+def test_pool_reuses_idle_session(fake_client):
+    pool = MCPSessionPool("http://server/mcp", size=3)
+
+    async def main():
+        for _ in range(3):
+            await pool._run(lambda session: session.ping())
+        stats = pool.stats()
+        await pool.close()
+        return stats
+
+    stats = asyncio.run(main())
+    assert stats["sessions"] == 1
+    assert stats["handshakes"] == 1
+
+
+def test_pool_evicts_idle_sessions_down_to_min_size(fake_client):
+    pool = MCPSessionPool("http://server/mcp", size=3, min_size=1, idle_timeout=0.0)
+
+    async def main():
+        await pool.start()
+        await pool.evict_idle()
+        stats = pool.stats()
+        await pool.close()
+        return stats
+
+    stats = asyncio.run(main())
+    assert stats["sessions"] == 1
+    assert stats["evicted"] == 2
+
+
+def test_pool_health_check_closes_failing_sessions(fake_client, monkeypatch):
+    pool = MCPSessionPool("http://server/mcp", size=2, health_check_interval=1.0)
+
+    async def failing_ping(self):
+        raise ConnectionError("unreachable")
+
+    async def main():
+        await pool.start()
+        monkeypatch.setattr(FakeClient, "ping", failing_ping)
+        await pool.health_check()
+        stats = pool.stats()
+        await pool.close()
+        return stats
+
+    stats = asyncio.run(main())
+    assert stats["connected"] == 0
+    assert stats["health_check_failures"] == 2
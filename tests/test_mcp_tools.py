@@ -0,0 +1,85 @@
+"""
+mcp_tools：calculate_bmi 保持原来的行为，calculate_bmi_batch 的不合法记录只影响自己、参数类型由 server 校验；
+create_mcp 只注册指定的工具，统一 server 在同一个应用上挂载两种传输
+"""
+
+import asyncio
+
+import pytest
+from fastmcp import Client
+
+from mcp_tools import TOOLS, calculate_bmi, calculate_bmi_batch, create_mcp
+
+
+def call_in_memory(mcp, operation):
+    async def main():
+        async with Client(mcp) as client:
+            return await operation(client)
+
+    return asyncio.run(main())
+
+
+def test_calculate_bmi_keeps_original_behaviour():
+    assert calculate_bmi(70, 1.75) == pytest.approx(22.857, abs=1e-3)
+    # 原来就接受的输入（例如超过 3 米的身高）不因为批量工具的校验而被拒绝
+    assert calculate_bmi(70, 3.5) == pytest.approx(5.714, abs=1e-3)
+
+
+def test_batch_reports_invalid_rows_in_place():
+    result = calculate_bmi_batch(records=[
+        {"weight_kg": 70, "height_m": 1.75},
+        {"weight_kg": 70, "height_m": 0},
+        {"weight_kg": 70},
+        {"weight_kg": 50, "height_m": 1.6},
+        {"weight_kg": 70, "height_m": 3.5},
+        {"weight_kg": 70, "height_m": 1e-200},
+    ])
+    assert result["count"] == 6 and result["valid"] == 3
+    assert result["bmi"][1] is None and result["bmi"][2] is None and result["bmi"][5] is None
+    assert result["bmi"][3] == pytest.approx(19.53, abs=1e-2)
+    # 与 calculate_bmi 一致，不限制身高上限
+    assert result["bmi"][4] == pytest.approx(5.714, abs=1e-3)
+    assert [error["index"] for error in result["errors"]] == [1, 2, 5]
+    assert result["errors"][1]["error"] == "缺少 height_m"
+
+
+def test_batch_arguments_are_validated_by_the_server():
+    mcp = create_mcp("test", tools=["calculate_bmi_batch"])
+
+    async def operation(client):
+        result = await client.call_tool("calculate_bmi_batch", {"records": [{"weight_kg": 70}]})
+        rejected = await client.call_tool_mcp("calculate_bmi_batch", {"weights_kg": ["70"], "heights_m": [1.7]})
+        return result.data, rejected
+
+    data, rejected = call_in_memory(mcp, operation)
+    assert data["bmi"] == [None] and data["errors"] == [{"index": 0, "error": "缺少 height_m"}]
+    # 不是数字的参数在调用工具之前就被拒绝
+    assert rejected.isError
+    assert "is not of type 'number'" in rejected.content[0].text
+
+
+def test_create_mcp_registers_only_the_requested_tools():
+    mcp = create_mcp("test", tools=["calculate_bmi", "get_today"])
+
+    async def operation(client):
+        tools = await client.list_tools()
+        result = await client.call_tool("calculate_bmi", {"weight_kg": 70, "height_m": 1.75})
+        return [tool.name for tool in tools], result.data
+
+    names, bmi = call_in_memory(mcp, operation)
+    assert sorted(names) == ["calculate_bmi", "get_today"]
+    assert bmi == pytest.approx(22.857, abs=1e-3)
+
+
+def test_create_mcp_registers_every_tool_by_default():
+    async def operation(client):
+        return {tool.name for tool in await client.list_tools()}
+
+    assert call_in_memory(create_mcp("test"), operation) == set(TOOLS)
+
+
+def test_unified_app_serves_both_transports():
+    from fastmcp_server_unified import SSE_PATH, STREAMABLE_HTTP_PATH, create_app
+
+    paths = {getattr(route, "path", None) for route in create_app().routes}
+    assert {STREAMABLE_HTTP_PATH, SSE_PATH, "/messages", "/metrics"} <= paths
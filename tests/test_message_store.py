@@ -0,0 +1,124 @@
+"""
+message_store：消息去掉 null 字段后编码，拼出的请求体与 SDK 序列化的内容相同；
+create_llm_client 创建的客户端原样发送预编码的请求体（流式 / 非流式都能解析），传入普通 httpx 客户端时走 SDK 序列化
+"""
+
+import asyncio
+import json
+
+import httpx
+from openai.types.chat import ChatCompletionMessage
+
+from conversation_history import message_tokens
+from llm_stream import ENCODED_BODY_HEADER, chat_completion, create_http_client, create_llm_client
+from message_store import EncodedSegment, MessageStore, compact_message, system_segment
+
+TOOLS = [{"type": "function", "function": {"name": "get_today", "parameters": {"type": "object"}}}]
+TOOLS_JSON = json.dumps(TOOLS, ensure_ascii=False, separators=(",", ":"))
+TOOL_CALL = ChatCompletionMessage.model_validate({
+    "role": "assistant", "content": None,
+    "tool_calls": [{"id": "call_1", "type": "function", "function": {"name": "get_today", "arguments": "{}"}}],
+})
+
+
+def store():
+    history = EncodedSegment([{"role": "user", "content": "你好"}, {"role": "assistant", "content": "你好！"}])
+    messages = MessageStore(system_segment("你是助手"), EncodedSegment([]), history)
+    messages.append({"role": "user", "content": "今天几号", "name": None})
+    messages.append(TOOL_CALL)
+    messages.append({"role": "tool", "tool_call_id": "call_1", "content": "2025-07-15"})
+    return messages
+
+
+def test_body_matches_the_json_of_the_compacted_messages():
+    messages = store()
+    assert len(messages) == 6
+    assert messages[3] == {"role": "user", "content": "今天几号"}
+    assert messages[4] == compact_message(TOOL_CALL)
+    assert "refusal" not in messages[4] and messages[4]["content"] is None
+    assert messages.tokens == sum(message_tokens(message) for message in messages)
+
+    body = messages.request_body("m", TOOLS_JSON, stream=True)
+    assert json.loads(body) == {"model": "m", "messages": list(messages), "tools": TOOLS, "stream": True}
+    plain = messages.request_body("m")
+    assert json.loads(plain) == {"model": "m", "messages": list(messages)}
+    assert messages.request_bytes == [len(body), len(plain)]
+
+    # 之后追加的消息出现在下一次的请求体里
+    messages.append({"role": "assistant", "content": "今天是 7 月 15 日"})
+    assert json.loads(messages.request_body("m"))["messages"][-1]["content"] == "今天是 7 月 15 日"
+    assert json.loads(MessageStore().request_body("m")) == {"model": "m", "messages": []}
+
+
+def completion_json(content):
+    return {
+        "id": "r", "object": "chat.completion", "created": 0, "model": "m",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }
+
+
+def sse(*contents):
+    lines = []
+    for content in contents:
+        chunk = {
+            "id": "c", "object": "chat.completion.chunk", "created": 0, "model": "m",
+            "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+        }
+        lines.append(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+    lines.append("data: [DONE]\n\n")
+    return "".join(lines).encode("utf-8")
+
+
+def run_against(http_client, stream, failures=0):
+    """用 chat_completion 发送 store() 的消息，返回回答和 LLM 收到的请求；前 failures 次请求返回 500"""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if len(requests) <= failures:
+            return httpx.Response(500, json={"error": {"message": "busy"}})
+        if json.loads(request.content).get("stream"):
+            return httpx.Response(200, content=sse("今天", "是 15 日"), headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, json=completion_json("今天是 15 日"))
+
+    http_client = http_client(transport=httpx.MockTransport(handler))
+    llm = create_llm_client("key", "http://llm.test/v1", http_client=http_client, max_retries=failures)
+    messages = store()
+
+    async def main():
+        try:
+            return await chat_completion(llm, "m", messages, tools=TOOLS, stream=stream, on_token=lambda text: None)
+        finally:
+            await http_client.aclose()
+
+    result = asyncio.run(main())
+    return result, requests, messages, llm
+
+
+def test_encoded_body_is_sent_as_is():
+    for stream in (False, True):
+        result, requests, messages, llm = run_against(create_http_client, stream)
+        assert result.message.content == "今天是 15 日"
+        (request,) = requests
+        assert request.url == "http://llm.test/v1/chat/completions"
+        assert request.content == messages.request_body("m", TOOLS_JSON, stream)
+        assert request.headers["content-length"] == str(len(request.content))
+        assert request.headers["content-type"] == "application/json"
+        assert request.headers["authorization"] == "Bearer key"
+        assert ENCODED_BODY_HEADER.lower() not in request.headers
+        assert llm._encoded_http_client.bodies == {}
+
+
+def test_retried_request_sends_the_same_body():
+    result, requests, messages, llm = run_against(create_http_client, stream=False, failures=1)
+    assert result.message.content == "今天是 15 日"
+    assert len(requests) == 2
+    assert requests[0].content == requests[1].content == messages.request_body("m", TOOLS_JSON)
+    assert llm._encoded_http_client.bodies == {}
+
+
+def test_plain_http_client_falls_back_to_sdk_serialization():
+    result, requests, messages, llm = run_against(httpx.AsyncClient, stream=False)
+    assert llm.create_encoded is None
+    assert result.message.content == "今天是 15 日"
+    assert json.loads(requests[0].content)["messages"] == list(messages)
@@ -0,0 +1,153 @@
+"""
+replica_balancer：p2c / least_outstanding 的副本选择、连接失败换副本重试（max_attempts=1 时不重试）、
+连续失败后摘除，重新加入后再失败时摘除时间翻倍，全部摘除时选择最早到期的副本
+"""
+
+import asyncio
+import random
+
+import pytest
+
+from replica_balancer import BalancedMCPSession, ReplicaBalancer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class Target:
+    def __init__(self, name):
+        self.name = name
+        self.down = False
+        self.calls = 0
+
+    async def call(self, bad=False):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError(f"{self.name} down")
+        if bad:
+            raise ValueError("参数错误")
+        return self.name
+
+
+def balancer(names=("a", "b", "c"), **kwargs):
+    kwargs.setdefault("rng", random.Random(0))
+    kwargs.setdefault("clock", FakeClock())
+    return ReplicaBalancer({name: Target(name) for name in names}, **kwargs)
+
+
+def by_url(pool):
+    return {replica.url: replica for replica in pool.replicas}
+
+
+def test_p2c_never_picks_the_most_loaded_replica():
+    pool = balancer()
+    replicas = by_url(pool)
+    replicas["a"].outstanding, replicas["b"].outstanding, replicas["c"].outstanding = 0, 1, 5
+    picks = [pool.pick().url for _ in range(300)]
+    assert set(picks) == {"a", "b"}
+    # a 与 b、a 与 c 两种组合都选 a，只有抽到 b 与 c 时选 b
+    assert picks.count("a") > picks.count("b")
+
+
+def test_least_outstanding_picks_the_idlest_replica():
+    pool = balancer(strategy="least_outstanding")
+    replicas = by_url(pool)
+    replicas["a"].outstanding, replicas["b"].outstanding, replicas["c"].outstanding = 2, 1, 3
+    assert {pool.pick().url for _ in range(50)} == {"b"}
+    with pytest.raises(ValueError):
+        balancer(strategy="round_robin")
+
+
+def test_connection_error_retries_on_another_replica():
+    pool = balancer(names=("a", "b"))
+    replicas = by_url(pool)
+    replicas["a"].target.down = True
+    results = [asyncio.run(pool.run(lambda target: target.call())) for _ in range(10)]
+    assert results == ["b"] * 10
+    assert replicas["a"].failures >= 1
+    assert replicas["a"].outstanding == replicas["b"].outstanding == 0
+
+
+def test_single_attempt_raises_and_tool_errors_are_not_failures():
+    pool = balancer(names=("a", "b"), max_attempts=1, failure_threshold=3)
+    for replica in pool.replicas:
+        replica.target.down = True
+    with pytest.raises(ConnectionError):
+        asyncio.run(pool.run(lambda target: target.call()))
+    assert sum(replica.target.calls for replica in pool.replicas) == 1
+
+    for replica in pool.replicas:
+        replica.target.down = False
+    with pytest.raises(ValueError):
+        asyncio.run(pool.run(lambda target: target.call(bad=True)))
+    assert sum(replica.target.calls for replica in pool.replicas) == 2
+    # 工具本身报错说明副本正常响应，不计入失败
+    assert sum(replica.failures for replica in pool.replicas) == 1
+
+
+def test_ejection_backs_off_and_recovers():
+    clock = FakeClock()
+    pool = balancer(names=("a", "b"), max_attempts=1, clock=clock, ejection_time=5, max_ejection_time=12)
+    a = by_url(pool)["a"]
+    a.target.down = True
+
+    async def call_on_a():
+        # 排除其他副本，强制在 a 上执行
+        original = pool.pick
+        pool.pick = lambda exclude=(): original(exclude=[*exclude, by_url(pool)["b"]])
+        try:
+            return await pool.run(lambda target: target.call())
+        finally:
+            pool.pick = original
+
+    def fail_on_a():
+        with pytest.raises(ConnectionError):
+            asyncio.run(call_on_a())
+
+    fail_on_a()
+    assert not a.ejected(clock())
+    fail_on_a()
+    assert a.ejected(clock()) and a.ejected_until == clock() + 5
+    assert {pool.pick().url for _ in range(20)} == {"b"}
+
+    # 到期后重新加入，再失败一次就再次摘除，时长翻倍
+    clock.now += 5
+    assert not a.ejected(clock())
+    fail_on_a()
+    assert a.ejected_until == clock() + 10
+    clock.now += 10
+    fail_on_a()
+    assert a.ejected_until == clock() + 12  # 不超过 max_ejection_time
+    assert a.ejections == 3
+
+    # 成功一次后恢复：之后又要连续失败 failure_threshold 次才摘除
+    clock.now += 12
+    a.target.down = False
+    assert asyncio.run(call_on_a()) == "a"
+    a.target.down = True
+    fail_on_a()
+    assert not a.ejected(clock())
+    assert pool.stats()["a"]["ejections"] == 3
+
+
+def test_all_ejected_picks_the_earliest_to_return():
+    clock = FakeClock()
+    pool = balancer(clock=clock)
+    replicas = by_url(pool)
+    for offset, name in ((30, "a"), (10, "b"), (20, "c")):
+        replicas[name].ejected_until = clock() + offset
+    assert pool.pick().url == "b"
+    assert pool.pick(exclude=[replicas["b"]]).url == "c"
+    assert pool.stats()["b"]["healthy"] is False
+
+
+def test_balanced_session_under_policy_tries_one_replica_per_call():
+    session = BalancedMCPSession(["http://a/mcp", "http://b/mcp"], retry=False)
+    assert session.balancer.max_attempts == 1
+    assert all(replica.target.retry is False for replica in session.balancer.replicas)
+    assert BalancedMCPSession(["http://a/mcp", "http://b/mcp"]).balancer.max_attempts == 2
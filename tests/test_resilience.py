@@ -0,0 +1,170 @@
+"""
+resilience：熔断器的试探请求被取消后能继续试探，每个 server 使用单独的熔断器；
+ToolCallPolicy 是唯一的重试层，会话、副本均衡和多 server 路由叠在下面时一次失败的调用只发送 attempts 次请求
+"""
+
+import asyncio
+
+import fastmcp
+import pytest
+
+import fastmcp_client_streamhttp_chatbot
+from mcp_session import PersistentMCPSession
+from replica_balancer import BalancedMCPSession
+from resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, ToolCallPolicy, call_resilient
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+async def fail():
+    raise ConnectionError("down")
+
+
+async def succeed():
+    return "ok"
+
+
+def open_breaker(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10, clock=clock)
+
+    async def trip():
+        with pytest.raises(ConnectionError):
+            await call_resilient(fail, breaker=breaker)
+
+    asyncio.run(trip())
+    assert breaker.state == "open"
+    return breaker
+
+
+def test_cancelled_probe_does_not_wedge_half_open():
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    clock.now = 10
+
+    async def run():
+        # 试探请求被外层的超时取消
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(call_resilient(lambda: asyncio.sleep(10), breaker=breaker), 0.01)
+        assert breaker.state == "half_open"
+        return [await call_resilient(succeed, breaker=breaker) for _ in range(3)]
+
+    assert asyncio.run(run()) == ["ok"] * 3
+    assert breaker.state == "closed"
+
+
+def test_half_open_allows_only_one_probe():
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    clock.now = 10
+
+    async def run():
+        probe = asyncio.ensure_future(call_resilient(lambda: asyncio.sleep(0.01, "ok"), breaker=breaker))
+        await asyncio.sleep(0)
+        with pytest.raises(CircuitOpenError):
+            await call_resilient(succeed, breaker=breaker)
+        return await probe
+
+    assert asyncio.run(run()) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_breakers_are_per_server():
+    policy = ToolCallPolicy(
+        retry=RetryPolicy(attempts=1),
+        breaker_factory=lambda server: CircuitBreaker(server, failure_threshold=1),
+    )
+
+    async def run():
+        with pytest.raises(ConnectionError):
+            await policy.call("get_weather", fail, server="weather")
+        with pytest.raises(CircuitOpenError):
+            await policy.call("get_weather", succeed, server="weather")
+        return await policy.call("calculate_bmi", succeed, server="bmi")
+
+    assert asyncio.run(run()) == "ok"
+    assert {server: stats["state"] for server, stats in policy.breaker_stats().items()} == {
+        "weather": "open", "bmi": "closed",
+    }
+
+
+class DownClient:
+    """代替 fastmcp.Client：握手成功，但每个请求都因连接断开失败，记录每次请求发往的 URL"""
+
+    sends = []
+
+    def __init__(self, target, timeout=None, **kwargs):
+        self.target = target
+        self.session = self
+
+    async def __aenter__(self):
+        return self
+
+    def is_connected(self):
+        return True
+
+    async def close(self):
+        pass
+
+    async def send_request(self, request, result_type):
+        DownClient.sends.append(self.target)
+        raise ConnectionError("dropped")
+
+
+@pytest.fixture
+def down_client(monkeypatch):
+    DownClient.sends = []
+    monkeypatch.setattr(fastmcp, "Client", DownClient)
+    return DownClient
+
+
+def policy_with_three_attempts():
+    return ToolCallPolicy(retry=RetryPolicy(attempts=3, base_delay=0))
+
+
+def failed_call(session, retry=True):
+    policy = policy_with_three_attempts()
+
+    async def run():
+        with pytest.raises(ConnectionError):
+            await policy.call("get_weather", lambda: session.call_tool("get_weather", {"city": "北京"}), retry=retry)
+
+    asyncio.run(run())
+
+
+def test_session_under_policy_sends_once_per_attempt(down_client):
+    session = PersistentMCPSession("http://a/mcp", retry=False)
+    failed_call(session)
+    assert len(down_client.sends) == 3
+    assert session.connect_count == 3
+
+
+def test_balanced_session_under_policy_sends_once_per_attempt(down_client):
+    session = BalancedMCPSession(["http://a/mcp", "http://b/mcp"], retry=False)
+    failed_call(session)
+    assert len(down_client.sends) == 3
+
+
+def test_policy_call_with_retry_off_sends_once(down_client):
+    failed_call(PersistentMCPSession("http://a/mcp", retry=False), retry=False)
+    assert len(down_client.sends) == 1
+
+
+def test_chatbot_tool_call_sends_at_most_policy_attempts(down_client):
+    client = fastmcp_client_streamhttp_chatbot.MCPClient(
+        ["a=http://a/mcp", "b=http://b1/mcp,http://b2/mcp"], tool_policy=policy_with_three_attempts()
+    )
+    # 两个 server 都提供 get_weather：每次重试发到下一个 server，而不是在每一层各自重试
+    client.mcp_session.routes = {"get_weather": [("a", "get_weather"), ("b", "get_weather")]}
+
+    async def run():
+        with pytest.raises(ConnectionError):
+            await client.call_tool("get_weather", {"city": "北京"})
+
+    asyncio.run(run())
+    assert [url.split("/")[2] for url in down_client.sends] in (["a", "b1", "a"], ["a", "b2", "a"])
@@ -0,0 +1,120 @@
+"""
+response_cache 的回答缓存：只改了城市、日期词或否定词的问题不能命中；
+相对日期参数按当天换算后作为 key，回答的有效期跟随所用工具，跨过午夜的"今天"不会命中
+"""
+
+import asyncio
+from datetime import datetime
+
+from response_cache import ResponseCache
+
+CACHED = "请帮我查询一下北京今天的天气情况，我下午要出门，需要带伞吗"
+
+
+def lookup(*queries):
+    async def run():
+        cache = ResponseCache()
+        await cache.put_answer(CACHED, "北京今天晴，不用带伞", ["get_weather"])
+        results = [await cache.get_answer(query) for query in queries]
+        cache.close()
+        return results
+
+    return asyncio.run(run())
+
+
+def test_near_misses_do_not_hit():
+    assert lookup(
+        "请帮我查询一下南京今天的天气情况，我下午要出门，需要带伞吗",
+        "请帮我查询一下北京明天的天气情况，我下午要出门，需要带伞吗",
+        "请帮我查询一下北京今天的天气情况，我下午不出门，需要带伞吗",
+        "请帮我查询一下北京今天的天气情况，我上午要出门，需要带伞吗",
+    ) == [None, None, None, None]
+
+
+def test_rephrased_question_hits():
+    assert lookup(
+        "请帮我查询一下北京今天的天气情况，我下午要出门，需要带伞吗",
+        "帮我查一下北京今天天气情况 我下午要出门 需要带伞吗？",
+        "北京今天的天气情况，我下午要出门，需要带伞",
+    ) == ["北京今天晴，不用带伞"] * 3
+
+
+def test_numbers_and_word_order_must_match():
+    async def run():
+        cache = ResponseCache(answer_ttl=3600)
+        await cache.put_answer("体重70公斤身高1.75米的BMI是多少", "22.86", ["calculate_bmi"])
+        await cache.put_answer("从北京到上海要多久", "4.5 小时")
+        results = [
+            await cache.get_answer("体重70公斤身高1.75米的BMI是多少？"),
+            await cache.get_answer("体重75公斤身高1.70米的BMI是多少"),
+            await cache.get_answer("从上海到北京要多久"),
+        ]
+        cache.close()
+        return results
+
+    assert asyncio.run(run()) == ["22.86", None, None]
+
+
+class FakeClock:
+    def __init__(self, when):
+        self.now = when.timestamp()
+
+    def __call__(self):
+        return self.now
+
+
+WEATHER_TODAY = {"city": "北京", "date": "今天"}
+
+
+def test_relative_dates_in_tool_arguments_do_not_cross_midnight():
+    clock = FakeClock(datetime(2025, 7, 15, 23, 55))
+
+    async def run():
+        cache = ResponseCache(clock=clock)
+        await cache.put_tool_result("get_weather", WEATHER_TODAY, "北京 2025-07-15：晴")
+        await cache.put_tool_result("get_weather", {"city": "北京", "date": "明天"}, "北京 2025-07-16：小雨")
+        clock.now += 120
+        before_midnight = await cache.get_tool_result("get_weather", WEATHER_TODAY)
+        clock.now += 240  # 00:01，两条记录都还在有效期内
+        after_midnight = await cache.get_tool_result("get_weather", WEATHER_TODAY)
+        absolute = await cache.get_tool_result("get_weather", {"city": "北京", "date": "2025-07-16"})
+        cache.close()
+        return before_midnight, after_midnight, absolute
+
+    assert asyncio.run(run()) == ("北京 2025-07-15：晴", "北京 2025-07-16：小雨", "北京 2025-07-16：小雨")
+
+
+def test_answer_ttl_follows_the_tools_used():
+    clock = FakeClock(datetime(2025, 7, 15, 12, 0))
+
+    async def run():
+        cache = ResponseCache(clock=clock)
+        await cache.put_answer("从北京到上海要多久", "4.5 小时")
+        await cache.put_answer("北京这周天气怎么样", "多云", ["get_weather"])
+        await cache.put_answer("体重70公斤身高1.75米的BMI是多少", "22.86", ["calculate_bmi"])
+        await cache.put_answer("现在几点", "12:00", ["get_current_time"])
+        clock.now += 599
+        early = [await cache.get_answer(q) for q in ("从北京到上海要多久", "北京这周天气怎么样", "现在几点")]
+        clock.now += 86400
+        late = [await cache.get_answer(q) for q in ("北京这周天气怎么样", "体重70公斤身高1.75米的BMI是多少")]
+        cache.close()
+        return early, late
+
+    assert asyncio.run(run()) == ([None, "多云", None], [None, "22.86"])
+
+
+def test_answers_about_today_expire_at_midnight():
+    clock = FakeClock(datetime(2025, 7, 15, 23, 55))
+
+    async def run():
+        cache = ResponseCache(answer_ttl=3600, clock=clock)
+        await cache.put_answer(CACHED, "北京今天晴，不用带伞", ["get_weather"])
+        await cache.put_answer("今天适合跑步吗", "适合")
+        clock.now += 240
+        before = [await cache.get_answer(CACHED), await cache.get_answer("今天适合跑步吗")]
+        clock.now += 120
+        after = [await cache.get_answer(CACHED), await cache.get_answer("今天适合跑步吗")]
+        cache.close()
+        return before, after
+
+    assert asyncio.run(run()) == (["北京今天晴，不用带伞", "适合"], [None, None])
@@ -0,0 +1,74 @@
+"""
+simple_mcp_client：批量调用中格式不对的项只让这一项失败，不影响其他调用；批量调用不向标准输出打印结果
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from simple_mcp_client import SimpleMCPClient
+
+
+class StubPool:
+    def __init__(self):
+        self.called = []
+
+    async def call_tool(self, tool_name, arguments):
+        self.called.append(tool_name)
+        if tool_name == "broken":
+            raise RuntimeError("工具出错")
+        return SimpleNamespace(content=[SimpleNamespace(text=f"{tool_name} ok")])
+
+
+CALLS = [
+    ("get_today", {}),
+    {"tool_name": "calculate_bmi", "arguments": "not a dict"},
+    "get_current_time",
+    ("broken", {}),
+    {"arguments": {}},
+    {"name": "get_current_time"},
+]
+
+
+def client_with_stub():
+    client = SimpleMCPClient("http://127.0.0.1:1/mcp")
+    client.pool = StubPool()
+    return client
+
+
+def test_batch_returns_per_item_errors_for_invalid_items():
+    client = client_with_stub()
+    results = asyncio.run(client.call_tools_batch(CALLS))
+    assert [item["index"] for item in results] == list(range(len(CALLS)))
+    assert [item["success"] for item in results] == [True, False, False, False, False, True]
+    assert results[1]["tool_name"] == "calculate_bmi"
+    assert results[1]["error"].startswith("无效的工具调用")
+    assert results[2]["tool_name"] is None and results[4]["tool_name"] is None
+    assert results[3]["error"] == "工具出错"
+    assert results[5]["result"] == "get_current_time ok"
+    # 格式不对的项没有发送
+    assert sorted(client.pool.called) == ["broken", "get_current_time", "get_today"]
+
+
+def test_batch_does_not_print_results(capsys):
+    client = client_with_stub()
+    asyncio.run(client.call_tools_batch([("get_today", {})] * 3))
+    assert capsys.readouterr().out == ""
+
+
+def test_stream_yields_every_item_once():
+    client = client_with_stub()
+
+    async def run():
+        return [item async for item in client.call_tools_stream(CALLS, max_concurrency=2)]
+
+    items = asyncio.run(run())
+    assert sorted(item["index"] for item in items) == list(range(len(CALLS)))
+    assert {item["index"] for item in items if not item["success"]} == {1, 2, 3, 4}
+
+
+@pytest.mark.parametrize("call", [None, ("only_name",), ("a", {}, "extra")])
+def test_malformed_shapes_are_errors(call):
+    tool_name, arguments, error = SimpleMCPClient._normalize_call(call)
+    assert error is not None and arguments == {}
@@ -0,0 +1,93 @@
+"""
+tool_catalog：缓存的工具列表只在变更通知、TTL 到期、重连或刷新期间收到通知时重新获取
+"""
+
+import asyncio
+import json
+
+import mcp.types
+
+from tool_catalog import ToolSchemaCache
+
+
+class FakeServer:
+    def __init__(self):
+        self.fetches = 0
+        self.names = ["get_today"]
+
+    async def list_tools(self):
+        self.fetches += 1
+        await asyncio.sleep(0.01)
+        return [mcp.types.Tool(name=name, description=name, inputSchema={"type": "object"}) for name in self.names]
+
+
+def list_changed():
+    return mcp.types.ServerNotification(mcp.types.ToolListChangedNotification(method="notifications/tools/list_changed"))
+
+
+def test_concurrent_gets_fetch_once_and_later_gets_use_the_cache():
+    server = FakeServer()
+    cache = ToolSchemaCache(server.list_tools)
+
+    async def main():
+        await asyncio.gather(*(cache.get() for _ in range(5)))
+        return await cache.get()
+
+    tools = asyncio.run(main())
+    assert server.fetches == 1
+    assert tools[0]["function"]["name"] == "get_today"
+    assert json.loads(cache.payload_json) == tools
+    assert cache.payload_tokens > 0
+
+
+def test_list_changed_notification_invalidates():
+    server = FakeServer()
+    cache = ToolSchemaCache(server.list_tools)
+
+    async def main():
+        await cache.get()
+        await cache.message_handler(mcp.types.ServerNotification(
+            mcp.types.ResourceListChangedNotification(method="notifications/resources/list_changed")
+        ))
+        await cache.get()
+        server.names = ["get_today", "get_weather"]
+        await cache.message_handler(list_changed())
+        return await cache.get()
+
+    tools = asyncio.run(main())
+    assert server.fetches == 2
+    assert [tool["function"]["name"] for tool in tools] == ["get_today", "get_weather"]
+
+
+def test_notification_during_refresh_keeps_the_cache_stale():
+    server = FakeServer()
+    cache = ToolSchemaCache(server.list_tools)
+
+    async def main():
+        refresh = asyncio.ensure_future(cache.get())
+        await asyncio.sleep(0)
+        cache.invalidate()
+        await refresh
+        await cache.get()
+
+    asyncio.run(main())
+    assert server.fetches == 2
+
+
+def test_ttl_and_generation_changes_invalidate():
+    server = FakeServer()
+    generation = [0]
+    cache = ToolSchemaCache(server.list_tools, ttl=60, generation=lambda: generation[0])
+
+    async def main():
+        await cache.get()
+        cache._fetched_at -= 59
+        await cache.get()
+        cache._fetched_at -= 2
+        await cache.get()
+        generation[0] += 1
+        await cache.get()
+
+    asyncio.run(main())
+    assert server.fetches == 3
+    assert cache.refresh_count == 3
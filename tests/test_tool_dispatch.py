@@ -0,0 +1,55 @@
+"""
+tool_dispatch：单个调用被取消只变成一条错误消息，整轮被取消时继续向上抛出
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from tool_dispatch import dispatch_tool_calls
+
+
+def tool_call(call_id, name, arguments=None):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=json.dumps(arguments or {})))
+
+
+async def call_tool(name, arguments):
+    if name == "cancelled":
+        raise asyncio.CancelledError()
+    if name == "slow":
+        await asyncio.sleep(10)
+    return f"{name} ok"
+
+
+@pytest.mark.parametrize("concurrent", [False, True])
+def test_cancelled_call_becomes_error_message(concurrent):
+    calls = [tool_call("a", "cancelled"), tool_call("b", "fast"), tool_call("c", "slow")]
+    messages = asyncio.run(dispatch_tool_calls(calls, call_tool, concurrent=concurrent, timeout=0.05))
+    assert [message["tool_call_id"] for message in messages] == ["a", "b", "c"]
+    assert messages[0]["content"] == "工具 cancelled 调用被取消"
+    assert messages[1]["content"] == "fast ok"
+    assert messages[2]["content"] == "工具 slow 调用超时（0.05 秒）"
+
+
+def test_cancelling_the_turn_still_propagates():
+    started = []
+
+    async def slow_tool(name, arguments):
+        started.append(name)
+        try:
+            await asyncio.sleep(10)
+        finally:
+            started.append("cleaned up")
+
+    async def run():
+        turn = asyncio.ensure_future(dispatch_tool_calls([tool_call("a", "slow")], slow_tool))
+        await asyncio.sleep(0.01)
+        turn.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await turn
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert started == ["slow", "cleaned up"]
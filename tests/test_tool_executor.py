@@ -0,0 +1,120 @@
+"""
+tool_executor：inline 工具原样注册，thread / process 工具的参数 schema 不变、在池中执行且不阻塞事件循环；
+名额和队列都满时拒绝（queue_full / queue_timeout），事件循环延迟的测量
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from fastmcp import Client
+
+from admission import AdmissionError
+from mcp_tools import calculate_bmi, create_mcp
+from tool_executor import LoopLagMonitor, ToolExecution, WorkerPool
+
+
+def blocking(seconds: float) -> int:
+    time.sleep(seconds)
+    return threading.get_ident()
+
+
+async def ticking_while(coro, interval=0.01):
+    """执行 coro，同时统计事件循环在这期间能完成多少次 interval 秒的 sleep"""
+    ticks = 0
+    task = asyncio.ensure_future(coro)
+    while not task.done():
+        await asyncio.sleep(interval)
+        ticks += 1
+    return await task, ticks
+
+
+def test_wrap_keeps_inline_tools_and_offloads_the_others():
+    execution = ToolExecution({"blocking": "thread"})
+    assert execution.wrap(calculate_bmi) is calculate_bmi
+    wrapped = execution.wrap(blocking)
+    assert wrapped.__name__ == "blocking"
+
+    async def main():
+        return await ticking_while(wrapped(seconds=0.2))
+
+    thread_id, ticks = asyncio.run(main())
+    assert thread_id != threading.get_ident()
+    assert ticks >= 5
+    assert execution.stats()["pools"]["thread"]["completed"] == 1
+    execution.shutdown()
+
+
+def test_invalid_policies_are_rejected():
+    with pytest.raises(ValueError):
+        ToolExecution({"blocking": "gpu"})
+
+    async def get_weather():
+        return "晴"
+
+    with pytest.raises(ValueError):
+        ToolExecution({"get_weather": "thread"}).wrap(get_weather)
+
+
+def test_full_queue_is_rejected_and_queue_wait_is_bounded():
+    async def main():
+        pool = WorkerPool("thread", workers=1, max_queue=1, queue_timeout=0.1)
+        running = asyncio.ensure_future(pool.run(blocking, {"seconds": 0.3}))
+        await asyncio.sleep(0.02)
+        queued = asyncio.ensure_future(pool.run(blocking, {"seconds": 0}))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionError) as full:
+            await pool.run(blocking, {"seconds": 0})
+        with pytest.raises(AdmissionError) as timed_out:
+            await queued
+        await running
+        pool.shutdown()
+        return full.value.error.data, timed_out.value.error.data
+
+    full, timed_out = asyncio.run(main())
+    assert (full["status"], full["reason"]) == (503, "queue_full")
+    assert timed_out["reason"] == "queue_timeout"
+
+
+def test_process_tool_has_the_same_schema_and_result():
+    async def call(execution):
+        server = create_mcp("test", tools=["calculate_bmi"], execution=execution)
+        async with Client(server) as client:
+            tools = await client.list_tools()
+            result = await client.call_tool("calculate_bmi", {"weight_kg": 70, "height_m": 1.75})
+        return tools[0].inputSchema, result.data
+
+    execution = ToolExecution({"calculate_bmi": "process"}, process_workers=1)
+    try:
+        offloaded = asyncio.run(call(execution))
+    finally:
+        execution.shutdown()
+    assert offloaded == asyncio.run(call(ToolExecution()))
+    assert execution.stats()["pools"]["process"]["completed"] == 1
+
+
+def test_env_policies(monkeypatch):
+    monkeypatch.setenv("MCP_TOOL_EXECUTION", "calculate_bmi_batch=process, get_today = thread")
+    monkeypatch.setenv("MCP_THREAD_WORKERS", "2")
+    execution = ToolExecution.from_env()
+    assert execution.policy("calculate_bmi_batch") == "process"
+    assert execution.policy("get_today") == "thread"
+    assert execution.policy("calculate_bmi") == "inline"
+    assert execution.pools["thread"].workers == 2
+
+
+def test_loop_lag_monitor_measures_blocking():
+    monitor = LoopLagMonitor(interval=0.01)
+
+    async def main():
+        monitor.start()
+        await asyncio.sleep(0.03)
+        time.sleep(0.1)  # 阻塞事件循环
+        await asyncio.sleep(0.03)
+        monitor._task.cancel()
+
+    asyncio.run(main())
+    stats = monitor.stats()
+    assert stats["max_ms"] >= 80
+    assert stats["p50_ms"] < stats["max_ms"]
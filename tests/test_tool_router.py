@@ -0,0 +1,164 @@
+"""
+tool_router：server 写法的解析、多个 server 工具列表的合并（first / namespace）、慢 server 就绪后加入、
+按工具名路由，连接失败时改用下一个提供同名工具的 server（retry=False 时留给上层的下一次尝试）
+"""
+
+import asyncio
+
+import mcp.types
+import pytest
+
+from tool_router import MultiServerSession, ServerSpec, parse_server_specs, tool_server
+
+
+class FakeSession:
+    """代替每个 server 的会话：提供固定的工具，可以模拟连接失败、工具报错或响应慢"""
+
+    def __init__(self, name, tools, delay=0.0, down=False):
+        self.name = name
+        self.tools = tools
+        self.delay = delay
+        self.down = down
+        self.calls = []
+        self.connect_count = 0
+        self.connected = False
+
+    async def list_tools(self):
+        await asyncio.sleep(self.delay)
+        if self.down:
+            raise ConnectionError(f"{self.name} down")
+        return [mcp.types.Tool(name=name, description=name, inputSchema={"type": "object"}) for name in self.tools]
+
+    async def call_tool(self, tool_name, arguments):
+        self.calls.append(tool_name)
+        if self.down:
+            raise ConnectionError(f"{self.name} down")
+        if arguments.get("bad"):
+            raise ValueError("参数错误")
+        return f"{self.name}:{tool_name}"
+
+    async def close(self):
+        pass
+
+
+def router(*sessions, **kwargs):
+    specs = [ServerSpec(session.name, f"http://{session.name}/mcp") for session in sessions]
+    multi = MultiServerSession(specs, **kwargs)
+    multi.sessions = {session.name: session for session in sessions}
+    return multi
+
+
+def test_parse_server_specs():
+    specs = parse_server_specs([
+        "bmi=http://127.0.0.1:8083/mcp,http://127.0.0.1:8084/mcp",
+        "weather=sse+http://127.0.0.1:8000/toolmcp",
+        "http://127.0.0.1:8082/sse",
+        "a b=http://x/mcp",
+    ])
+    assert [(spec.name, spec.transport) for spec in specs] == [
+        ("bmi", None), ("weather", "sse"), ("server3", None), ("a_b", None),
+    ]
+    assert specs[0].replicas == ["http://127.0.0.1:8083/mcp", "http://127.0.0.1:8084/mcp"]
+    assert specs[1].url == "http://127.0.0.1:8000/toolmcp"
+    with pytest.raises(ValueError):
+        parse_server_specs(["a=http://x/mcp", "a=http://y/mcp"])
+
+
+@pytest.mark.parametrize("duplicates, names", [
+    ("first", ["calculate_bmi", "get_weather", "get_today"]),
+    ("namespace", ["calculate_bmi", "bmi__get_weather", "weather__get_weather", "get_today"]),
+])
+def test_tools_are_merged_and_routed_by_name(duplicates, names):
+    bmi = FakeSession("bmi", ["calculate_bmi", "get_weather"])
+    weather = FakeSession("weather", ["get_weather", "get_today"])
+    multi = router(bmi, weather, duplicates=duplicates)
+
+    async def main():
+        tools = await multi.list_tools()
+        results = [await multi.call_tool(name, {}) for name in names]
+        return tools, results
+
+    tools, results = asyncio.run(main())
+    assert [tool.name for tool in tools] == names
+    assert results[0] == "bmi:calculate_bmi"
+    assert results[-1] == "weather:get_today"
+    if duplicates == "first":
+        assert results[1] == "bmi:get_weather"
+        assert multi.routes["get_weather"] == [("bmi", "get_weather"), ("weather", "get_weather")]
+    else:
+        assert results[1:3] == ["bmi:get_weather", "weather:get_weather"]
+        assert tools[2].description == "[weather] get_weather"
+    assert tool_server(multi, "get_today") == "weather"
+
+
+def test_slow_server_joins_later_and_failed_server_is_reported():
+    changes = []
+    fast = FakeSession("fast", ["get_today"])
+    slow = FakeSession("slow", ["get_weather"], delay=0.2)
+    down = FakeSession("down", ["calculate_bmi"], down=True)
+    multi = router(fast, slow, down, ready_timeout=0.05, on_change=lambda: changes.append(1))
+
+    async def main():
+        first = await multi.list_tools()
+        await asyncio.sleep(0.3)
+        second = await multi.list_tools()
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert [tool.name for tool in first] == ["get_today"]
+    assert changes == [1]
+    assert [tool.name for tool in second] == ["get_today", "get_weather"]
+    assert multi.errors == {"down": "down down"}
+
+
+def test_failover_within_the_call_when_retry_is_on():
+    primary = FakeSession("primary", ["get_weather"])
+    backup = FakeSession("backup", ["get_weather"])
+    multi = router(primary, backup)
+
+    async def main():
+        await multi.list_tools()
+        primary.down = True
+        return await multi.call_tool("get_weather", {})
+
+    assert asyncio.run(main()) == "backup:get_weather"
+    assert primary.calls == backup.calls == ["get_weather"]
+    assert multi.server_for("get_weather") == "backup"
+
+
+def test_failover_is_left_to_the_next_attempt_when_retry_is_off():
+    primary = FakeSession("primary", ["get_weather"])
+    backup = FakeSession("backup", ["get_weather"])
+    multi = router(primary, backup, retry=False)
+
+    async def main():
+        await multi.list_tools()
+        primary.down = True
+        with pytest.raises(ConnectionError):
+            await multi.call_tool("get_weather", {})
+        assert multi.server_for("get_weather") == "backup"
+        result = await multi.call_tool("get_weather", {})
+        # 工具目录刷新后恢复声明顺序
+        primary.down = False
+        await multi.list_tools()
+        return result, multi.server_for("get_weather")
+
+    assert asyncio.run(main()) == ("backup:get_weather", "primary")
+    assert (primary.calls, backup.calls) == (["get_weather"], ["get_weather"])
+
+
+def test_tool_error_does_not_fail_over():
+    primary = FakeSession("primary", ["get_weather"])
+    backup = FakeSession("backup", ["get_weather"])
+    multi = router(primary, backup)
+
+    async def main():
+        await multi.list_tools()
+        with pytest.raises(ValueError):
+            await multi.call_tool("get_weather", {"bad": True})
+        with pytest.raises(ValueError):
+            await multi.call_tool("unknown", {})
+
+    asyncio.run(main())
+    assert backup.calls == []
+    assert multi.server_for("get_weather") == "primary"
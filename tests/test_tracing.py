@@ -0,0 +1,123 @@
+"""
+tracing：span 的父子关系（含子任务）、traceparent 的解析和注入、通过 MCP _meta 传到 server、
+指标的直方图 / 错误计数和 Prometheus 输出、JSON Lines 导出
+"""
+
+import asyncio
+import json
+
+import pytest
+
+import tracing
+from mcp_session import PersistentMCPSession
+from mcp_tools import create_mcp
+from tracing import FileExporter, Metrics, Tracer, inject, parse_traceparent
+
+
+class CollectingExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+def by_name(spans):
+    return {span.name: span for span in spans}
+
+
+def test_nested_spans_and_child_tasks_share_the_trace():
+    exporter = CollectingExporter()
+    tracer = Tracer("test", exporter, Metrics())
+
+    async def child():
+        with tracer.span("child"):
+            await asyncio.sleep(0)
+
+    async def main():
+        with tracer.span("root"):
+            with tracer.span("inner"):
+                pass
+            await asyncio.gather(child(), child())
+        with tracer.span("other"):
+            pass
+
+    asyncio.run(main())
+    spans = exporter.spans
+    root = by_name(spans)["root"]
+    assert root.parent_id is None
+    assert by_name(spans)["inner"].parent_id == root.span_id
+    children = [span for span in spans if span.name == "child"]
+    assert len(children) == 2 and all(span.parent_id == root.span_id for span in children)
+    assert all(span.trace_id == root.trace_id for span in spans if span.name != "other")
+    assert by_name(spans)["other"].trace_id != root.trace_id
+    assert root.attributes["service"] == "test"
+
+
+def test_traceparent_round_trip():
+    tracer = Tracer("test", None, Metrics())
+    assert inject({"a": 1}) == {"a": 1}
+    with tracer.span("client") as client:
+        meta = inject()
+    assert parse_traceparent(meta["traceparent"]) == (client.trace_id, client.span_id)
+    with tracer.span("server", traceparent=meta["traceparent"]) as server:
+        pass
+    assert (server.trace_id, server.parent_id) == (client.trace_id, client.span_id)
+
+    assert parse_traceparent("not-a-traceparent") is None
+    with tracer.span("fresh", traceparent="01-bad") as fresh:
+        pass
+    assert fresh.parent_id is None
+
+
+def test_errors_and_durations_are_recorded_as_metrics():
+    metrics = Metrics(buckets=(0.1, 1.0))
+    tracer = Tracer("test", None, metrics)
+    with pytest.raises(ValueError):
+        with tracer.span("failing") as span:
+            raise ValueError("boom")
+    assert span.error == "ValueError('boom')"
+    metrics.observe("latency", 0.5, {"tool": "x"})
+    metrics.set_gauge("queue", 3)
+    text = metrics.render_prometheus()
+    assert 'mcp_span_errors_total{span="failing"} 1' in text
+    assert 'mcp_latency_bucket{tool="x",le="0.1"} 0' in text
+    assert 'mcp_latency_bucket{tool="x",le="1"} 1' in text
+    assert 'mcp_latency_bucket{tool="x",le="+Inf"} 1' in text
+    assert 'mcp_latency_sum{tool="x"} 0.5' in text
+    assert "# TYPE mcp_queue gauge\nmcp_queue 3" in text
+
+
+def test_file_exporter_writes_json_lines(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer("test", FileExporter(str(path)), Metrics())
+    with tracer.span("a", {"city": "北京"}):
+        pass
+    with tracer.span("b"):
+        pass
+    lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [line["name"] for line in lines] == ["a", "b"]
+    assert lines[0]["attributes"]["city"] == "北京"
+    assert lines[0]["duration_ms"] >= 0
+
+
+def test_server_tool_span_is_a_child_of_the_client_call(monkeypatch):
+    exporter = CollectingExporter()
+    monkeypatch.setattr(tracing.tracer, "exporter", exporter)
+    server = create_mcp("test", tools=["get_today"])
+
+    async def main():
+        session = PersistentMCPSession(server)
+        try:
+            with tracing.tracer.span("turn"):
+                await session.call_tool("get_today", {})
+        finally:
+            await session.close()
+
+    asyncio.run(main())
+    spans = by_name(exporter.spans)
+    client_call = spans["mcp.call_tool"]
+    server_tool = spans["tool.get_today"]
+    assert client_call.parent_id == spans["turn"].span_id
+    assert server_tool.trace_id == client_call.trace_id
+    assert server_tool.parent_id == client_call.span_id
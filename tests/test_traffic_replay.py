@@ -0,0 +1,159 @@
+"""
+traffic_replay：录制 LLM（流式 / 非流式）和 MCP 工具流量后回放得到相同的结果，
+请求与录制时不同时计数（strict 时报错），录制的错误按原来的类型重新抛出
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastmcp.exceptions import ToolError
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from mcp_session import PersistentMCPSession
+from mcp_tools import create_mcp
+from traffic_replay import ReplayError, TrafficRecorder, TrafficReplay, load_log
+
+QUERY = [{"role": "system", "content": "你是助手"}, {"role": "user", "content": "北京天气"}]
+FOLLOW_UP = [*QUERY, {"role": "assistant", "content": "晴"}, {"role": "user", "content": "那上海呢"}]
+
+
+def chunk(content, finish_reason=None):
+    return ChatCompletionChunk.model_validate({
+        "id": "c", "object": "chat.completion.chunk", "created": 0, "model": "m",
+        "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": finish_reason}],
+    })
+
+
+def completion(content):
+    return ChatCompletion.model_validate({
+        "id": "r", "object": "chat.completion", "created": 0, "model": "m",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    })
+
+
+class FakeLLM:
+    """流式请求依次返回 chunks，非流式请求返回 response；down 时模拟连接失败"""
+
+    def __init__(self, chunks=(), response=None, down=False):
+        self.chunks = chunks
+        self.response = response
+        self.down = down
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        if self.down:
+            raise ConnectionError("LLM down")
+        if not kwargs.get("stream"):
+            return self.response
+
+        async def stream():
+            for item in self.chunks:
+                await asyncio.sleep(0)
+                yield item
+
+        return stream()
+
+
+async def collect(stream):
+    return [item.choices[0].delta.content async for item in stream]
+
+
+def record(path, llm):
+    """录制一轮对话：流式提问、工具列表、工具调用（成功和报错）、非流式追问"""
+    recorder = TrafficRecorder(str(path))
+    wrapped = recorder.wrap_llm(lambda: llm)
+    session = recorder.wrap_session(PersistentMCPSession(create_mcp("test", tools=["calculate_bmi"])))
+
+    async def main():
+        try:
+            tokens = await collect(await wrapped.chat.completions.create(model="m", messages=QUERY, stream=True))
+            tools = await session.list_tools()
+            result = await session.call_tool("calculate_bmi", {"weight_kg": 70, "height_m": 1.75})
+            with pytest.raises(ToolError):
+                await session.call_tool("calculate_bmi", {"weight_kg": 70, "height_m": 0})
+            answer = await wrapped.chat.completions.create(model="m", messages=FOLLOW_UP)
+            return tokens, [tool.name for tool in tools], result.content[0].text, answer.choices[0].message.content
+        finally:
+            await session.close()
+            recorder.close()
+
+    return asyncio.run(main())
+
+
+def replay_turn(replay):
+    llm = replay.wrap_llm(lambda: pytest.fail("回放时不应创建 LLM 客户端"))
+    session = replay.wrap_session(None)
+
+    async def main():
+        tokens = await collect(await llm.chat.completions.create(model="m", messages=QUERY, stream=True))
+        tools = await session.list_tools()
+        result = await session.call_tool("calculate_bmi", {"height_m": 1.75, "weight_kg": 70})
+        with pytest.raises(ToolError):
+            await session.call_tool("calculate_bmi", {"weight_kg": 70, "height_m": 0})
+        answer = await llm.chat.completions.create(model="m", messages=FOLLOW_UP)
+        return tokens, [tool.name for tool in tools], result.content[0].text, answer.choices[0].message.content
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    path = tmp_path / "session.jsonl.gz"
+    llm = FakeLLM(chunks=[chunk("晴"), chunk("，25°C", finish_reason="stop")], response=completion("上海多云"))
+    return path, record(path, llm)
+
+
+def test_replay_returns_what_was_recorded(recorded):
+    path, original = recorded
+    kinds = [entry["k"] for entry in load_log(str(path))]
+    assert kinds == ["meta", "llm", "tools", "tool", "tool", "llm"]
+    assert original[0] == ["晴", "，25°C"]
+
+    replay = TrafficReplay(str(path), latency="zero")
+    assert replay.queries() == ["北京天气", "那上海呢"]
+    assert replay_turn(replay) == original
+    stats = replay.stats()
+    assert (stats["llm_requests"], stats["tool_calls"], stats["mismatches"]) == (2, 2, 0)
+    assert stats["remaining_llm"] == stats["remaining_tool_calls"] == 0
+
+    # 回放完之后再请求报错，rewind 后可以再回放一遍
+    with pytest.raises(ReplayError):
+        asyncio.run(replay.llm.chat.completions.create(model="m", messages=QUERY, stream=True))
+    replay.rewind()
+    assert replay_turn(replay) == original
+
+
+def test_changed_requests_are_counted_or_rejected(recorded):
+    path, _ = recorded
+    changed = [{"role": "system", "content": "新的 system prompt"}, QUERY[1]]
+
+    replay = TrafficReplay(str(path), latency="zero")
+    asyncio.run(replay.llm.chat.completions.create(model="m", messages=changed, stream=True))
+    assert replay.mismatches == 1
+
+    strict = TrafficReplay(str(path), latency="zero", strict=True)
+    with pytest.raises(ReplayError):
+        asyncio.run(strict.llm.chat.completions.create(model="m", messages=changed, stream=True))
+
+    # 流式与否和录制时不同、没有录制过的工具调用
+    with pytest.raises(ReplayError):
+        asyncio.run(TrafficReplay(str(path), latency="zero").llm.chat.completions.create(model="m", messages=QUERY))
+    with pytest.raises(ReplayError):
+        asyncio.run(replay.mcp_session.call_tool("calculate_bmi", {"weight_kg": 80, "height_m": 1.8}))
+
+
+def test_recorded_connection_error_is_raised_again(tmp_path):
+    path = tmp_path / "down.jsonl"
+    recorder = TrafficRecorder(str(path))
+    llm = recorder.wrap_llm(lambda: FakeLLM(down=True))
+    with pytest.raises(ConnectionError):
+        asyncio.run(llm.chat.completions.create(model="m", messages=QUERY))
+    recorder.close()
+    assert recorder.stats()["entries"] == {"meta": 1, "llm": 1}
+
+    replay = TrafficReplay(str(path), latency="zero")
+    with pytest.raises(ConnectionError, match="LLM down"):
+        asyncio.run(replay.llm.chat.completions.create(model="m", messages=QUERY))
+    with pytest.raises(ValueError):
+        TrafficReplay(str(path), latency="fast")
@@ -0,0 +1,119 @@
+"""
+ttl_cache：过期、按条目数 / 字节数的 LRU 淘汰、并发未命中合并
+"""
+
+import asyncio
+from datetime import date
+
+import pytest
+
+from ttl_cache import TTLCache
+from weather_backend import normalize_weather_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.set("k", "v")
+    clock.now = 9.9
+    assert cache.get("k") == (True, "v")
+    clock.now = 10.0
+    assert cache.get("k") == (False, None)
+    assert len(cache) == 0
+    assert cache.stats()["expirations"] == 1
+
+
+def test_evicts_least_recently_used_by_count_and_bytes():
+    cache = TTLCache(ttl=60, max_entries=2, max_bytes=10)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, "1")
+
+    cache.set("big", "x" * 9)
+    assert cache.total_bytes <= 10
+    assert cache.get("big") == (True, "x" * 9)
+    assert cache.get("c") == (False, None)
+    assert cache.get("a") == (True, "1")
+    assert cache.stats()["evictions"] == 2
+
+    cache.set("too_big", "x" * 11)
+    assert cache.get("too_big") == (False, None)
+
+
+def test_disabled_cache_stores_nothing():
+    cache = TTLCache(ttl=0)
+    cache.set("k", "v")
+    assert cache.get("k") == (False, None)
+
+
+def test_concurrent_misses_run_loader_once():
+    cache = TTLCache(ttl=60)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_load("k", loader) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["value"] * 5
+    assert calls == [1]
+    assert cache.stats()["coalesced"] == 4
+    assert cache.get("k") == (True, "value")
+
+
+def test_loader_error_reaches_every_waiter_and_is_not_cached():
+    cache = TTLCache(ttl=60)
+
+    async def loader():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_load("k", loader) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert cache.get("k") == (False, None)
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_load():
+    cache = TTLCache(ttl=60)
+
+    async def loader():
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def main():
+        impatient = asyncio.ensure_future(cache.get_or_load("k", loader))
+        patient = asyncio.ensure_future(cache.get_or_load("k", loader))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await impatient
+        return await patient
+
+    assert asyncio.run(main()) == "value"
+    assert cache.get("k") == (True, "value")
+
+
+def test_weather_key_normalizes_city_and_date():
+    today = date(2025, 7, 15)
+    assert normalize_weather_key(" London ", "今天", today) == ("london", "2025-07-15")
+    assert normalize_weather_key("london", "明天", today) == ("london", "2025-07-16")
+    assert normalize_weather_key("北京", "2025.7.16", today) == ("北京", "2025-07-16")
+    assert normalize_weather_key("北京", "2025年07月16日", today) == ("北京", "2025-07-16")
+    assert normalize_weather_key("北京", " 下周一 ", today) == ("北京", "下周一")
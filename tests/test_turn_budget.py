@@ -0,0 +1,162 @@
+"""
+turn_budget.TurnToolMemo：并发模式下重复的调用共享一次执行，超时不会变成逃出整轮的 CancelledError；
+TurnBudget 的时间预算也限制进行中的工具调用和 LLM 请求，到期后转为强制回答
+"""
+
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletion
+
+from fastmcp_client_streamhttp_chatbot import MCPClient
+from tool_dispatch import dispatch_tool_calls
+from turn_budget import TurnBudget, TurnToolMemo
+
+
+def tool_call(call_id, name, arguments=None):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=json.dumps(arguments or {})))
+
+
+def test_duplicates_share_one_execution():
+    executed = []
+
+    async def call_tool(name, arguments):
+        executed.append(name)
+        await asyncio.sleep(0.01)
+        return f"{name} {arguments['city']}"
+
+    memo = TurnToolMemo(call_tool)
+    calls = [tool_call("a", "get_weather", {"city": "北京"}), tool_call("b", "get_weather", {"city": " 北京 "})]
+    messages = asyncio.run(dispatch_tool_calls(calls, memo.call, concurrent=True))
+    assert executed == ["get_weather"]
+    assert (memo.calls, memo.deduped) == (2, 1)
+    assert messages[0]["content"] == "get_weather 北京"
+    assert messages[1]["content"].startswith("get_weather 北京\n")
+
+
+def test_duplicate_of_timed_out_call_gets_timeout_message():
+    cancelled = []
+
+    async def call_tool(name, arguments):
+        if name == "get_weather":
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(name)
+                raise
+        return "2025-01-01"
+
+    memo = TurnToolMemo(call_tool)
+    calls = [tool_call("a", "get_weather", {"city": "北京"}), tool_call("b", "get_today"),
+             tool_call("c", "get_weather", {"city": "北京"})]
+    messages = asyncio.run(dispatch_tool_calls(calls, memo.call, concurrent=True, timeout=0.3))
+    # 两个调用方都放弃后共享的执行才被取消
+    assert cancelled == ["get_weather"]
+    assert [message["content"] for message in messages] == [
+        "工具 get_weather 调用超时（0.3 秒）", "2025-01-01", "工具 get_weather 调用超时（0.3 秒）",
+    ]
+
+
+def test_one_caller_timing_out_does_not_cancel_the_other():
+    async def call_tool(name, arguments):
+        await asyncio.sleep(0.1)
+        return "晴"
+
+    async def run():
+        memo = TurnToolMemo(call_tool)
+        impatient = asyncio.wait_for(memo.call("get_weather", {"city": "北京"}), 0.01)
+        patient = memo.call("get_weather", {"city": "北京"})
+        return await asyncio.gather(impatient, patient, return_exceptions=True)
+
+    impatient, patient = asyncio.run(run())
+    assert isinstance(impatient, asyncio.TimeoutError)
+    assert patient.split("\n")[0] == "晴"
+
+
+def test_cancelled_execution_is_a_per_call_failure():
+    async def call_tool(name, arguments):
+        raise asyncio.CancelledError()
+
+    memo = TurnToolMemo(call_tool)
+    calls = [tool_call("a", "get_weather", {"city": "北京"}), tool_call("b", "get_weather", {"city": "北京"})]
+    messages = asyncio.run(dispatch_tool_calls(calls, memo.call, concurrent=True))
+    assert [message["content"] for message in messages] == ["工具 get_weather 调用超时"] * 2
+
+
+def completion(message, finish_reason):
+    return ChatCompletion.model_validate({
+        "id": "c", "object": "chat.completion", "created": 0, "model": "m",
+        "choices": [{"index": 0, "message": {"role": "assistant", **message}, "finish_reason": finish_reason}],
+    })
+
+
+WEATHER_CALL = completion({"content": None, "tool_calls": [{
+    "id": "call_1", "type": "function", "function": {"name": "get_weather", "arguments": '{"city": "北京"}'},
+}]}, "tool_calls")
+
+
+class ScriptedLLM:
+    """带工具的请求按 with_tools 处理（可以是一直不返回的协程），不带工具的收尾请求直接回答"""
+
+    def __init__(self, with_tools):
+        self.with_tools = with_tools
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        if "tools" in kwargs:
+            return await self.with_tools()
+        return completion({"content": "根据已有信息回答"}, "stop")
+
+
+class SlowSession:
+    connect_count = 0
+
+    def __init__(self):
+        self.cancelled = False
+
+    async def call_tool(self, tool_name, arguments):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+def run_turn(llm, session=None):
+    client = MCPClient("http://127.0.0.1:1/mcp", stream=False, llm=llm, mcp_session=session or SlowSession(),
+                       turn_budget=TurnBudget(max_seconds=0.3))
+    start = time.perf_counter()
+    answer = asyncio.run(client.process_query("北京天气", [{"type": "function", "function": {"name": "get_weather"}}]))
+    return client, answer, time.perf_counter() - start
+
+
+def test_slow_tool_is_cut_off_by_the_turn_budget():
+    async def with_tools():
+        return WEATHER_CALL
+
+    session = SlowSession()
+    llm = ScriptedLLM(with_tools)
+    client, answer, elapsed = run_turn(llm, session)
+    assert answer == "根据已有信息回答"
+    assert elapsed < 2
+    assert session.cancelled
+    assert client.last_turn_stats["budget_exhausted"] == "time"
+    # 被中断的工具调用仍然有对应的 tool 消息，收尾请求不带工具
+    tool_messages = [m for m in llm.requests[-1]["messages"] if m["role"] == "tool"]
+    assert [m["content"] for m in tool_messages] == ["工具 get_weather 没有完成：本轮时间预算已用完"]
+
+
+def test_slow_llm_request_is_cut_off_by_the_turn_budget():
+    async def with_tools():
+        await asyncio.sleep(10)
+
+    llm = ScriptedLLM(with_tools)
+    client, answer, elapsed = run_turn(llm)
+    assert answer == "根据已有信息回答"
+    assert elapsed < 2
+    assert [("tools" in request) for request in llm.requests] == [True, False]
+    assert client.last_turn_stats["budget_exhausted"] == "time"
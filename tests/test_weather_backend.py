@@ -0,0 +1,110 @@
+"""
+weather_backend：多个事件循环同时使用同一个后端时，各自的连接池互不干扰；
+wttr.in 的 JSON 精简成一行摘要，同一城市的不同日期共用一次上游请求，非 JSON 响应和 4xx 的处理
+"""
+
+import asyncio
+import os
+import sys
+import threading
+from datetime import date, timedelta
+
+import httpx
+import pytest
+
+from weather_backend import WeatherBackend
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from stub_upstream import wttr_j1_payload
+
+
+def backend_with(handler):
+    """上游请求交给 handler 处理的 WeatherBackend"""
+    backend = WeatherBackend(endpoint="http://wttr.test")
+    backend._new_client = lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return backend
+
+
+def fetch_all(backend, *queries):
+    async def main():
+        try:
+            return [await backend.fetch(city, day) for city, day in queries]
+        finally:
+            await backend.aclose()
+
+    return asyncio.run(main())
+
+
+def test_concurrent_loops_keep_their_own_client():
+    backend = WeatherBackend(endpoint="http://127.0.0.1:1")
+    both_ready = threading.Barrier(2, timeout=10)
+    results = {}
+
+    def serve(name):
+        async def main():
+            client = await backend.get_client()
+            semaphore = backend._loop_resources().semaphore
+            # 两个循环都拿到连接池之后，各自的连接池都还能用，同一循环再次获取得到同一个
+            await asyncio.to_thread(both_ready.wait)
+            results[name] = (client, semaphore, client.is_closed, await backend.get_client() is client)
+            await asyncio.to_thread(both_ready.wait)
+            await backend.aclose()
+
+        asyncio.run(main())
+
+    threads = [threading.Thread(target=serve, args=(name,)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    client_a, semaphore_a, closed_a, same_a = results["a"]
+    client_b, semaphore_b, closed_b, same_b = results["b"]
+    assert client_a is not client_b
+    assert semaphore_a is not semaphore_b
+    assert not closed_a and not closed_b
+    assert same_a and same_b
+    assert client_a.is_closed and client_b.is_closed
+
+
+def test_j1_response_becomes_one_line_and_dates_share_the_upstream_request():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json=wttr_j1_payload(request.url.path.strip("/")))
+
+    today = date.today()
+    backend = backend_with(handler)
+    results = fetch_all(backend, ("北京", "今天"), (" 北京 ", "明天"), ("北京", "2000-01-01"))
+
+    assert len(requests) == 1
+    assert requests[0].url.params["format"] == "j1" and requests[0].url.params["lang"] == "zh"
+    assert results[0] == (
+        f"北京 {today.isoformat()}：晴，18~30°C，降水概率 7%；当前 晴 25°C，体感 26°C，湿度 40%，东北风 10km/h"
+    )
+    assert results[1].startswith(f"北京 {(today + timedelta(days=1)).isoformat()}：晴，17~29°C")
+    assert results[2].startswith(f"北京 没有 2000-01-01 的预报（可查询 {today.isoformat()} 至")
+    assert all(len(result.encode("utf-8")) < 300 for result in results)
+    assert backend.stats()["hits"] == 2
+
+
+def test_non_json_body_is_stripped_and_truncated():
+    def handler(request):
+        return httpx.Response(200, text="\x1b[38;5;226m晴\x1b[0m   25°C\n" + "x" * 1000)
+
+    (result,) = fetch_all(backend_with(handler), ("北京", "今天"))
+    assert result.startswith("晴 25°C x")
+    assert len(result) == 501 and result.endswith("…")
+
+
+def test_client_errors_are_raised_without_retrying():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(404, text="Unknown location")
+
+    with pytest.raises(httpx.HTTPStatusError):
+        fetch_all(backend_with(handler), ("Atlantis", "今天"))
+    assert len(requests) == 1
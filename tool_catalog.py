@@ -0,0 +1,117 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+工具定义缓存
+
+原先 sse 聊天机器人在每次 process_query 里调用 list_tools()，streamhttp 聊天机器人每输入一行
+就调用一次 get_mcp_tools()，然后从头重建 OpenAI 格式的 tools 列表。
+ToolSchemaCache 按 server 缓存转换后的工具列表，并预先序列化一次：
+1. 收到 MCP 的 notifications/tools/list_changed 时失效
+2. 可选的 TTL 到期时失效
+3. 会话重连后（generation 变化）失效，因为重连后的 server 可能已经换了工具
+其余情况下直接返回缓存，不再请求 server。
+mcp.types 只用于类型标注和识别变更通知，在收到第一条 server 消息时才导入。
+"""
+
+import asyncio
+import json
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional
+
+from conversation_history import estimate_tokens
+
+if TYPE_CHECKING:
+    import mcp.types
+
+
+def openai_tool_format(tool: "mcp.types.Tool") -> Dict[str, Any]:
+    """把 MCP 工具定义转换成聊天机器人发给 LLM 的 tools 格式"""
+    return {
+        "type": "function",
+        "function": {
+            "name": tool.name,
+            "description": tool.description,
+            "input_schema": tool.inputSchema
+        }
+    }
+
+
+class ToolSchemaCache:
+    """
+    单个 MCP server 的工具定义缓存
+
+    使用示例：
+        cache = ToolSchemaCache(session.list_tools, ttl=600)
+        session = PersistentMCPSession(url, message_handler=cache.message_handler)
+        available_tools = await cache.get()
+    """
+
+    def __init__(
+        self,
+        fetch_tools: Callable[[], Awaitable[List["mcp.types.Tool"]]],
+        ttl: Optional[float] = None,
+        generation: Optional[Callable[[], Any]] = None,
+    ):
+        """
+        Args:
+            fetch_tools: 从 server 获取工具列表的函数
+            ttl: 缓存有效期（秒），None 表示只在收到变更通知时失效
+            generation: 返回当前连接"代数"的函数（例如重连次数），变化时缓存失效
+        """
+        self._fetch_tools = fetch_tools
+        self.ttl = ttl
+        self._generation = generation
+        self.tools: List["mcp.types.Tool"] = []
+        self.openai_tools: List[Dict[str, Any]] = []
+        self.payload_json = ""  # openai_tools 预先序列化后的 JSON，避免每次请求重新编码
+        self.payload_tokens = 0  # payload_json 的估算 token 数
+        self._epoch = 0  # 每次失效加一
+        self._cached_epoch: Optional[int] = None
+        self._cached_generation: Any = None
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self.refresh_count = 0
+
+    def is_fresh(self) -> bool:
+        if self._cached_epoch != self._epoch:
+            return False
+        if self._generation is not None and self._generation() != self._cached_generation:
+            return False
+        if self.ttl is not None and time.monotonic() - self._fetched_at > self.ttl:
+            return False
+        return True
+
+    async def get(self) -> List[Dict[str, Any]]:
+        """返回 OpenAI 格式的工具列表，缓存失效时才重新请求 server"""
+        if not self.is_fresh():
+            async with self._lock:
+                if not self.is_fresh():
+                    await self.refresh()
+        return self.openai_tools
+
+    async def refresh(self):
+        """重新获取工具列表并更新缓存"""
+        epoch = self._epoch
+        tools = await self._fetch_tools()
+        self.tools = list(tools)
+        self.openai_tools = [openai_tool_format(tool) for tool in self.tools]
+        self.payload_json = json.dumps(self.openai_tools, ensure_ascii=False, separators=(",", ":"))
+        self.payload_tokens = estimate_tokens(self.payload_json)
+        self._fetched_at = time.monotonic()
+        self._cached_generation = self._generation() if self._generation is not None else None
+        # 刷新期间如果收到了变更通知，epoch 已经变化，下次 get 仍会重新获取
+        self._cached_epoch = epoch
+        self.refresh_count += 1
+
+    def invalidate(self):
+        """使缓存失效"""
+        self._epoch += 1
+
+    async def message_handler(self, message: Any) -> None:
+        """MCP 会话的 message_handler：收到 tools/list_changed 通知时使缓存失效"""
+        import mcp.types
+
+        if isinstance(message, mcp.types.ServerNotification) and isinstance(
+            message.root, mcp.types.ToolListChangedNotification
+        ):
+            self.invalidate()
@@ -0,0 +1,121 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+一轮 LLM 回复中多个 tool_calls 的执行
+
+两个聊天机器人原先逐个 await 每个工具调用，一轮的耗时是所有调用之和。
+dispatch_tool_calls() 支持可选的并发模式：
+1. 同一轮内的工具调用并发执行，受 max_concurrency 限制
+2. 每个调用可设置超时，整批调用可设置总的时间预算（time_budget），到期时未完成的调用都按超时结束
+3. 结果消息仍按原始 tool_calls 的顺序返回
+4. 单个调用失败（参数解析失败、超时、工具报错、调用被取消）只会变成一条错误 tool 消息，不会中断整轮
+"""
+
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# 执行单个工具调用的函数：(工具名, 参数) -> 工具输出文本
+ToolCaller = Callable[[str, Dict[str, Any]], Awaitable[str]]
+
+# system prompt 中的多任务处理规则：顺序模式要求一次只调用一个工具，并发模式鼓励一次发出所有独立的调用
+SEQUENTIAL_MULTI_TASK_RULE = (
+    "4. **多任务处理**：如果用户一次提出多个请求，你必须逐一处理。你一次只调用一个工具，在完成一个工具调用后，你需要回顾用户的完整请求，检查是否还有未完成的部分，并继续调用其他所需工具，直到所有任务都解决。\n"
+)
+PARALLEL_MULTI_TASK_RULE = (
+    "4. **多任务处理**：如果用户一次提出多个相互独立的请求，你应当在同一次回复中同时发出所有需要的工具调用；只有后一个调用依赖前一个调用的结果时才分多次调用。完成后回顾用户的完整请求，检查是否还有未完成的部分，直到所有任务都解决。\n"
+)
+
+
+def tool_message(tool_call_id: str, content: str) -> Dict[str, Any]:
+    """构造一条 role=tool 的消息"""
+    return {"role": "tool", "content": content, "tool_call_id": tool_call_id}
+
+
+async def run_tool_call(
+    tool_call: Any,
+    call_tool: ToolCaller,
+    timeout: Optional[float] = None,
+    deadline: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    执行单个 tool_call，总是返回一条 tool 消息
+
+    Args:
+        tool_call: LLM 返回的 tool_call 对象（包含 id 和 function.name / function.arguments）
+        call_tool: 实际执行工具的函数
+        timeout: 超时时间（秒），None 表示不限制
+        deadline: 必须结束的时刻（事件循环的时钟），None 表示不限制
+
+    Returns:
+        tool 消息，失败时 content 为错误描述
+    """
+    tool_name = tool_call.function.name
+    loop = asyncio.get_running_loop()
+    limit = timeout
+    if deadline is not None:
+        remaining = max(0.0, deadline - loop.time())
+        limit = remaining if limit is None else min(limit, remaining)
+    call = None
+    try:
+        tool_args = json.loads(tool_call.function.arguments or "{}")
+        call = asyncio.ensure_future(asyncio.wait_for(call_tool(tool_name, tool_args), limit))
+        # asyncio.wait 在当前任务被取消时不会取消 call，据此区分"整轮被取消"和"这一个调用被取消"
+        await asyncio.wait({call})
+        tool_output = call.result()
+    except asyncio.TimeoutError:
+        if deadline is not None and loop.time() >= deadline:
+            tool_output = f"工具 {tool_name} 没有完成：本轮时间预算已用完"
+        else:
+            # timeout 为 None 时超时来自 call_tool 内部的截止时间（ToolCallPolicy）
+            tool_output = f"工具 {tool_name} 调用超时" + (f"（{timeout} 秒）" if timeout is not None else "")
+        print(f"[{tool_output}]")
+    except asyncio.CancelledError:
+        if call is None or not call.done():
+            # 当前任务被取消（整轮被取消）：一起取消这个调用，继续向上抛出
+            if call is not None:
+                call.cancel()
+            raise
+        # 调用本身被取消（例如工具内部取消了它等待的执行），只当成这一个调用失败
+        tool_output = f"工具 {tool_name} 调用被取消"
+        print(f"[{tool_output}]")
+    except Exception as e:
+        tool_output = f"工具 {tool_name} 调用失败: {e}"
+        print(f"[{tool_output}]")
+    return tool_message(tool_call.id, tool_output)
+
+
+async def dispatch_tool_calls(
+    tool_calls: List[Any],
+    call_tool: ToolCaller,
+    concurrent: bool = False,
+    max_concurrency: int = 4,
+    timeout: Optional[float] = None,
+    time_budget: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    执行一轮中的所有 tool_calls
+
+    Args:
+        tool_calls: LLM 返回的 tool_calls 列表
+        call_tool: 实际执行工具的函数
+        concurrent: 是否并发执行，False 时按顺序逐个执行
+        max_concurrency: 并发模式下同时执行的调用数上限
+        timeout: 每个调用的超时时间（秒）
+        time_budget: 所有调用加起来最多用的时间（秒），到期时未完成的调用按超时结束，None 表示不限制
+
+    Returns:
+        tool 消息列表，顺序与 tool_calls 一致；每个 tool_call 都有一条，到期时也不会缺少
+    """
+    deadline = None if time_budget is None else asyncio.get_running_loop().time() + time_budget
+    if not concurrent or len(tool_calls) <= 1:
+        return [await run_tool_call(tool_call, call_tool, timeout, deadline) for tool_call in tool_calls]
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def limited(tool_call):
+        async with semaphore:
+            return await run_tool_call(tool_call, call_tool, timeout, deadline)
+
+    # gather 按传入顺序返回结果，与完成先后无关
+    return await asyncio.gather(*(limited(tool_call) for tool_call in tool_calls))
@@ -0,0 +1,269 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+按工具声明的执行方式：在事件循环里直接执行、放到线程池，或放到进程池
+
+FastMCP 直接在事件循环线程里调用同步（def）工具，一个 CPU 密集或阻塞的调用（例如大批量的 calculate_bmi_batch、
+同步 HTTP 请求）执行期间，同一进程里所有 SSE / streamable-http 会话的 I/O 都要等它结束。
+ToolExecution 在注册工具时按策略包装同步工具：
+1. inline（默认）：与原来相同，在事件循环里执行，适合几微秒就能完成的工具
+2. thread：放到线程池执行，适合阻塞 I/O；CPU 密集的工具受 GIL 限制不会更快，但事件循环每隔几毫秒就能拿回 GIL
+3. process：放到进程池执行（spawn 方式启动，第一次调用时子进程需要导入本项目的模块），适合 CPU 密集的工具；
+   参数和返回值需要能被 pickle，工具必须是模块级函数
+每个池有 workers 个执行名额和有界队列（admission.BoundedLimiter）：名额用完时最多排队 max_queue 个、最多等 queue_timeout 秒，
+超出时返回"服务繁忙"错误（status 503），不会无限堆积。async 工具本来就不占用事件循环，只能是 inline。
+
+LoopLagMiddleware 在第一个请求到来时启动 LoopLagMonitor，定期测量事件循环延迟（计划 sleep 与实际唤醒时间之差）。
+指标（tracing.metrics）：按池的 executor_workers / executor_busy / executor_queue_depth / executor_utilization 仪表盘、
+executor_queue_wait_seconds 直方图、executor_rejections_total 计数，以及 event_loop_lag_seconds 直方图和 event_loop_lag_max_seconds 仪表盘。
+
+环境变量（均为可选）：
+    MCP_TOOL_EXECUTION           各工具的执行方式，默认 "calculate_bmi_batch=thread"，未列出的工具为 inline
+    MCP_THREAD_WORKERS           线程池大小，默认 4
+    MCP_PROCESS_WORKERS          进程池大小，默认为 CPU 核数
+    MCP_EXECUTOR_QUEUE           每个池的排队长度，默认 64
+    MCP_EXECUTOR_QUEUE_TIMEOUT   排队最长等待时间（秒），默认 5
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+import multiprocessing
+import os
+import statistics
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from fastmcp.server.middleware import Middleware, MiddlewareContext
+
+from admission import AdmissionError, BoundedLimiter
+from tracing import metrics
+
+POLICIES = ("inline", "thread", "process")
+
+
+class _PoolLimiter(BoundedLimiter):
+    """名额或排队数变化时更新所属池的指标"""
+
+    def __init__(self, pool: "WorkerPool", max_queue: int, queue_timeout: float):
+        super().__init__(f"{pool.kind} 工具池", pool.workers, max_queue, queue_timeout)
+        self.pool = pool
+
+    def _report(self, labels: Optional[Dict[str, str]]):
+        self.pool.report()
+
+
+class WorkerPool:
+    """
+    线程池或进程池，带执行名额和有界队列
+
+    执行器在第一次使用时才创建，只注册 inline 工具的 server 不会启动线程或进程
+    """
+
+    def __init__(self, kind: str, workers: int, max_queue: int = 64, queue_timeout: float = 5.0):
+        """
+        Args:
+            kind: "thread" 或 "process"
+            workers: 线程 / 进程数，也是同时执行的调用数上限
+            max_queue: 所有名额都在使用时最多排队的调用数
+            queue_timeout: 排队最长等待时间（秒）
+        """
+        if kind not in ("thread", "process"):
+            raise ValueError(f"kind 只能是 thread 或 process: {kind}")
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.limiter = _PoolLimiter(self, max_queue, queue_timeout)
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self.completed = 0
+        metrics.set_gauge("executor_workers", self.workers, {"pool": kind})
+
+    @property
+    def executor(self) -> concurrent.futures.Executor:
+        if self._executor is None:
+            if self.kind == "thread":
+                self._executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="mcp-tool")
+            else:
+                # fork 一个已经有事件循环和线程的进程并不安全，统一使用 spawn
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+        return self._executor
+
+    def report(self):
+        labels = {"pool": self.kind}
+        metrics.set_gauge("executor_busy", self.limiter.in_flight, labels)
+        metrics.set_gauge("executor_queue_depth", self.limiter.waiting, labels)
+        metrics.set_gauge("executor_utilization", self.limiter.in_flight / self.workers, labels)
+
+    async def run(self, fn: Callable[..., Any], kwargs: Dict[str, Any]) -> Any:
+        """在池中执行 fn(**kwargs)，名额和队列都满时抛出 AdmissionError"""
+        labels = {"pool": self.kind}
+        queued = time.perf_counter()
+        try:
+            async with self.limiter.slot(labels):
+                metrics.observe("executor_queue_wait_seconds", time.perf_counter() - queued, labels)
+                loop = asyncio.get_running_loop()
+                try:
+                    return await loop.run_in_executor(self.executor, functools.partial(fn, **kwargs))
+                finally:
+                    self.completed += 1
+        except AdmissionError as e:
+            metrics.inc("executor_rejections_total", labels={**labels, "reason": e.error.data["reason"]})
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "busy": self.limiter.in_flight,
+            "queued": self.limiter.waiting,
+            "completed": self.completed,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class ToolExecution:
+    """
+    各工具的执行方式
+
+    使用示例：
+        execution = ToolExecution({"calculate_bmi_batch": "process"}, process_workers=2)
+        mcp.tool(execution.wrap(calculate_bmi_batch))
+        print(execution.stats())
+    """
+
+    def __init__(
+        self,
+        policies: Optional[Dict[str, str]] = None,
+        thread_workers: int = 4,
+        process_workers: Optional[int] = None,
+        max_queue: int = 64,
+        queue_timeout: float = 5.0,
+    ):
+        """
+        Args:
+            policies: 工具名 -> "inline" / "thread" / "process"，未列出的工具为 inline
+            thread_workers: 线程池大小
+            process_workers: 进程池大小，默认为 CPU 核数
+            max_queue: 每个池的排队长度
+            queue_timeout: 排队最长等待时间（秒）
+        """
+        self.policies = dict(policies or {})
+        for tool_name, policy in self.policies.items():
+            if policy not in POLICIES:
+                raise ValueError(f"工具 {tool_name} 的执行方式只能是 {' / '.join(POLICIES)}: {policy}")
+        self.pools = {
+            "thread": WorkerPool("thread", thread_workers, max_queue, queue_timeout),
+            "process": WorkerPool("process", process_workers or os.cpu_count() or 1, max_queue, queue_timeout),
+        }
+
+    @classmethod
+    def from_env(cls) -> "ToolExecution":
+        """根据环境变量创建执行策略"""
+        policies = {}
+        for item in os.getenv("MCP_TOOL_EXECUTION", "calculate_bmi_batch=thread").split(","):
+            if "=" in item:
+                name, policy = item.split("=", 1)
+                policies[name.strip()] = policy.strip()
+        process_workers = os.getenv("MCP_PROCESS_WORKERS")
+        return cls(
+            policies,
+            thread_workers=int(os.getenv("MCP_THREAD_WORKERS", "4")),
+            process_workers=int(process_workers) if process_workers else None,
+            max_queue=int(os.getenv("MCP_EXECUTOR_QUEUE", "64")),
+            queue_timeout=float(os.getenv("MCP_EXECUTOR_QUEUE_TIMEOUT", "5")),
+        )
+
+    def policy(self, tool_name: str) -> str:
+        return self.policies.get(tool_name, "inline")
+
+    def wrap(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        """
+        按策略包装工具函数：inline 原样返回，否则返回签名相同的 async 函数（FastMCP 据此生成相同的参数 schema）
+        """
+        policy = self.policy(fn.__name__)
+        if policy == "inline":
+            return fn
+        if inspect.iscoroutinefunction(fn):
+            raise ValueError(f"async 工具 {fn.__name__} 不占用事件循环，只能使用 inline")
+        pool = self.pools[policy]
+
+        @functools.wraps(fn)
+        async def offloaded(**kwargs: Any) -> Any:
+            return await pool.run(fn, kwargs)
+
+        return offloaded
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policies": dict(self.policies),
+            "pools": {kind: pool.stats() for kind, pool in self.pools.items()},
+        }
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown()
+
+
+class LoopLagMonitor:
+    """
+    测量事件循环延迟：每隔 interval 秒 sleep 一次，实际唤醒比预定时间晚的部分就是延迟
+
+    同一时间只在一个事件循环上运行，在另一个循环上 start() 时改为监测新的循环
+    """
+
+    def __init__(self, interval: float = 0.05, window: int = 1200):
+        self.interval = interval
+        self.samples: "deque[float]" = deque(maxlen=window)
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """在当前事件循环上启动监测（已经在运行时不做任何事）"""
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            metrics.observe("event_loop_lag_seconds", lag)
+            metrics.set_gauge("event_loop_lag_max_seconds", self.max_lag)
+
+    def reset(self):
+        self.samples.clear()
+        self.max_lag = 0.0
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        """最近的延迟样本的 p50 / p99 / 最大值（毫秒）"""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"p50_ms": None, "p99_ms": None, "max_ms": None}
+        return {
+            "p50_ms": round(statistics.median(ordered) * 1000, 2),
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 2),
+            "max_ms": round(self.max_lag * 1000, 2),
+        }
+
+
+# 进程内共享的事件循环延迟监测
+loop_lag = LoopLagMonitor()
+
+
+class LoopLagMiddleware(Middleware):
+    """收到第一个请求时在 server 的事件循环上启动 loop_lag"""
+
+    async def on_request(self, context: MiddlewareContext, call_next):
+        loop_lag.start()
+        return await call_next(context)
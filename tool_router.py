@@ -0,0 +1,278 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+同时连接多个 MCP server，合并工具列表并按工具名路由调用
+
+聊天机器人原先只连接 sys.argv[1] 一个 server，而天气 server（fastmcp_server_Cline/get_weather_server_sse.py）
+和 BMI / 时间 server 是分开部署的。MultiServerSession 与 PersistentMCPSession 的接口相同，
+可以直接作为 MCPClient 的 mcp_session：
+1. 每个 server 一个 PersistentMCPSession，list_tools() 并发请求所有 server，
+   最多等 ready_timeout 秒；还没响应的 server 在后台继续连接，就绪后调用 on_change（使工具缓存失效），
+   下次获取工具列表时加入（之后每次获取没有及时响应时使用它上一次的工具列表），一个慢的 server 不会拖慢启动
+2. 合并后的目录以 (server, 工具名) 为单位，暴露给 LLM 的名称：
+   - 只有一个 server 提供的工具保持原名
+   - 多个 server 提供的同名工具（例如三个 server 都有 get_weather）：
+     duplicates="first"（默认）时只暴露一个原名，调用按 server 的声明顺序路由，
+     一个 server 连接失败后，之后的调用改用下一个（工具目录刷新后恢复声明顺序）；
+     retry=True 时本次调用也立即在下一个 server 上重试；retry=False 时直接抛出，
+     由上层（ToolCallPolicy）的下一次尝试发到下一个 server。
+     duplicates="namespace" 时每个都暴露为 "<server>__<工具名>"
+3. call_tool() 把调用发到拥有该工具的 server 会话，参数和返回值与 PersistentMCPSession 相同；
+   tool_server() 返回处理某个工具的 server 名称，聊天机器人的 ToolCallPolicy 按它为每个 server 使用单独的熔断器
+
+server 的写法为 "[名称=][sse+]URL[,URL...]"，例如：
+    bmi=http://127.0.0.1:8083/my-custom-path  weather=sse+http://127.0.0.1:8000/toolmcp
+URL 以 /sse 结尾时自动使用 SSE，其余路径默认 streamable-http，sse+ 前缀强制使用 SSE。
+逗号分隔的多个 URL 是同一个 server 的多个副本，由 replica_balancer.BalancedMCPSession 做负载均衡，例如：
+    bmi=http://127.0.0.1:8083/my-custom-path,http://127.0.0.1:8084/my-custom-path
+
+注意：namespace 模式下带前缀的工具名不在 response_cache / resilience 的工具列表里，不会被缓存或重试。
+"""
+
+import asyncio
+import re
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from mcp_session import PersistentMCPSession, is_connection_error
+from replica_balancer import BalancedMCPSession
+
+if TYPE_CHECKING:
+    import mcp.types
+    from fastmcp.client.client import CallToolResult
+
+_NAME_PATTERN = re.compile(r"[^A-Za-z0-9_-]")
+
+
+@dataclass
+class ServerSpec:
+    """一个 MCP server 的名称、地址和传输方式"""
+    name: str
+    url: str  # 多个副本时为逗号分隔的 URL 列表
+    transport: Optional[str] = None  # "sse" 或 None（按 URL 判断）
+
+    @property
+    def replicas(self) -> List[str]:
+        return [url.strip() for url in self.url.split(",") if url.strip()]
+
+
+def create_session(spec: ServerSpec, retry: bool = True, **kwargs: Any) -> Any:
+    """
+    一个 URL 时返回 PersistentMCPSession，多个副本时返回 BalancedMCPSession，kwargs 透传给会话
+
+    retry 为 False 时会话连接失败直接抛出，不重连重试、不换副本重试，由调用方（ToolCallPolicy）负责重试
+    """
+    replicas = spec.replicas
+    if len(replicas) == 1:
+        return PersistentMCPSession(replicas[0], transport=spec.transport, retry=retry, **kwargs)
+    return BalancedMCPSession(replicas, transport=spec.transport, retry=retry, **kwargs)
+
+
+def tool_server(session: Any, tool_name: str) -> Optional[str]:
+    """
+    处理该工具的 server 名称，ToolCallPolicy 据此为每个 server 使用单独的熔断器；
+    只连接一个 server 的会话（没有 server_for）返回 None
+    """
+    server_for = getattr(session, "server_for", None)
+    return server_for(tool_name) if server_for is not None else None
+
+
+def parse_server_specs(args: Sequence[str]) -> List[ServerSpec]:
+    """
+    解析 "[名称=][sse+]URL[,URL...]" 形式的 server 列表，没有名称时依次命名为 server1、server2 ...
+
+    名称只保留字母、数字、下划线和连字符（namespace 模式下会成为工具名的一部分）
+    """
+    specs: List[ServerSpec] = []
+    for index, arg in enumerate(args, start=1):
+        name, sep, url = arg.partition("=")
+        if not sep or "://" in name:
+            name, url = f"server{index}", arg
+        transport = None
+        if url.startswith("sse+"):
+            transport, url = "sse", url[len("sse+"):]
+        name = _NAME_PATTERN.sub("_", name.strip())
+        if any(spec.name == name for spec in specs):
+            raise ValueError(f"MCP server 名称重复: {name}")
+        specs.append(ServerSpec(name, url.strip(), transport))
+    return specs
+
+
+class MultiServerSession:
+    """
+    多个 MCP server 的聚合会话
+
+    使用示例：
+        session = MultiServerSession(parse_server_specs(["bmi=http://127.0.0.1:8083/my-custom-path",
+                                                         "weather=sse+http://127.0.0.1:8000/toolmcp"]))
+        tools = await session.list_tools()
+        result = await session.call_tool("get_weather", {"city": "北京", "date": "今天"})
+        await session.close()
+    """
+
+    def __init__(
+        self,
+        servers: Sequence[ServerSpec],
+        ready_timeout: float = 3.0,
+        duplicates: str = "first",
+        on_change: Optional[Callable[[], None]] = None,
+        timeout: Optional[float] = None,
+        retry: bool = True,
+        **client_kwargs: Any,
+    ):
+        """
+        Args:
+            servers: server 列表，同名工具按这个顺序决定优先级
+            ready_timeout: list_tools() 等待所有 server 的最长时间（秒），超时的 server 在后台继续连接
+            duplicates: 同名工具的处理方式，"first" 或 "namespace"
+            on_change: 后台连接的 server 就绪、工具目录需要更新时调用，通常是 ToolSchemaCache.invalidate
+            timeout: 每个会话单个请求的超时时间（秒）
+            retry: 连接失败时是否重试（会话重连、换副本、换 server）；由上层负责重试时为 False，每次调用只发送一次
+            client_kwargs: 透传给每个会话的 fastmcp.Client 参数，例如 message_handler
+        """
+        if duplicates not in ("first", "namespace"):
+            raise ValueError(f"duplicates 只能是 first 或 namespace: {duplicates}")
+        self.servers = list(servers)
+        self.ready_timeout = ready_timeout
+        self.duplicates = duplicates
+        self.on_change = on_change
+        self.sessions: Dict[str, Any] = {
+            spec.name: create_session(spec, retry=retry, timeout=timeout, **client_kwargs) for spec in self.servers
+        }
+        self.retry = retry
+        # 暴露给 LLM 的工具名 -> 按优先级排列的 [(server 名称, server 上的工具名)]
+        self.routes: Dict[str, List[Tuple[str, str]]] = {}
+        self.errors: Dict[str, str] = {}  # server 名称 -> 最近一次获取工具列表失败的原因
+        # server 名称 -> 最近一次成功获取的工具列表；这次获取还没完成时先用它
+        self._latest: Dict[str, List["mcp.types.Tool"]] = {}
+        self._pending: Dict[str, "asyncio.Task[List[mcp.types.Tool]]"] = {}
+        # 暴露给 LLM 的工具名 -> 当前使用 routes 中的第几个（前面的 server 连接失败后后移）
+        self._preferred: Dict[str, int] = {}
+
+    @property
+    def connect_count(self) -> int:
+        """所有会话的连接次数之和，任何一个会话重连都会变化（ToolSchemaCache 的 generation）"""
+        return sum(session.connect_count for session in self.sessions.values())
+
+    def _list_task(self, name: str) -> "asyncio.Task[List[mcp.types.Tool]]":
+        """获取某个 server 工具列表的任务，上一次还没完成时复用"""
+        task = self._pending.get(name)
+        if task is None:
+            task = asyncio.ensure_future(self.sessions[name].list_tools())
+            self._pending[name] = task
+            task.add_done_callback(lambda done: self._list_done(name, done))
+        return task
+
+    def _list_done(self, name: str, task: "asyncio.Task[List[mcp.types.Tool]]"):
+        if self._pending.get(name) is task:
+            del self._pending[name]
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.errors[name] = str(task.exception()) or type(task.exception()).__name__
+        else:
+            self.errors.pop(name, None)
+            self._latest[name] = task.result()
+
+    async def list_tools(self) -> List["mcp.types.Tool"]:
+        """并发获取所有 server 的工具列表并合并，返回带暴露名称的工具定义"""
+        tasks = {spec.name: self._list_task(spec.name) for spec in self.servers}
+        _, pending = await asyncio.wait(tasks.values(), timeout=self.ready_timeout)
+        if len(pending) == len(tasks):
+            # 一个都没有就绪时至少等到第一个
+            await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        results: Dict[str, List["mcp.types.Tool"]] = {}
+        for name, task in tasks.items():
+            if not task.done():
+                if name in self._latest:
+                    results[name] = self._latest[name]
+                    continue
+                print(f"[MCP server {name} 尚未就绪，就绪后加入工具列表]")
+                task.add_done_callback(self._late_ready)
+            elif task.cancelled() or task.exception() is not None:
+                print(f"[MCP server {name} 不可用: {self.errors.get(name, '已取消')}]")
+            else:
+                results[name] = task.result()
+        return self._merge(results)
+
+    def _late_ready(self, task: "asyncio.Task[List[mcp.types.Tool]]"):
+        if not task.cancelled() and task.exception() is None and self.on_change is not None:
+            self.on_change()
+
+    def _merge(self, results: Dict[str, List["mcp.types.Tool"]]) -> List["mcp.types.Tool"]:
+        owners: Dict[str, List[Tuple[str, "mcp.types.Tool"]]] = {}
+        for spec in self.servers:
+            for tool in results.get(spec.name, []):
+                owners.setdefault(tool.name, []).append((spec.name, tool))
+
+        routes: Dict[str, List[Tuple[str, str]]] = {}
+        merged: List["mcp.types.Tool"] = []
+        for tool_name, entries in owners.items():
+            if len(entries) == 1 or self.duplicates == "first":
+                routes[tool_name] = [(server, tool_name) for server, _ in entries]
+                merged.append(entries[0][1])
+                continue
+            for server, tool in entries:
+                exposed = f"{server}__{tool_name}"
+                routes[exposed] = [(server, tool_name)]
+                merged.append(tool.model_copy(update={
+                    "name": exposed,
+                    "description": f"[{server}] {tool.description or ''}".strip(),
+                }))
+        self.routes = routes
+        self._preferred = {}
+        return merged
+
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> "CallToolResult":
+        """
+        把调用发到拥有该工具的 server；连接失败时之后的调用改用下一个提供同名工具的 server，
+        retry 为 True 时本次调用也立即在下一个 server 上重试
+        """
+        routes = self.routes.get(tool_name)
+        if not routes:
+            raise ValueError(f"没有 MCP server 提供工具 {tool_name}")
+        start = self._preferred.get(tool_name, 0) % len(routes)
+        last_error: Optional[BaseException] = None
+        for offset in range(len(routes) if self.retry else 1):
+            index = (start + offset) % len(routes)
+            server, original_name = routes[index]
+            try:
+                return await self.sessions[server].call_tool(original_name, arguments)
+            except Exception as e:
+                if not is_connection_error(e):
+                    raise
+                last_error = e
+                if len(routes) > 1:
+                    self._preferred[tool_name] = (index + 1) % len(routes)
+                    print(f"[MCP server {server} 连接失败，改用下一个提供 {tool_name} 的 server]")
+        raise last_error
+
+    def server_for(self, tool_name: str) -> Optional[str]:
+        """当前处理该工具的 server 名称，工具不存在时返回 None"""
+        routes = self.routes.get(tool_name)
+        return routes[self._preferred.get(tool_name, 0) % len(routes)][0] if routes else None
+
+    def stats(self) -> Dict[str, Any]:
+        """各 server 的连接状态、提供的工具和最近的错误，多副本的 server 另外带各副本的统计"""
+        tools: Dict[str, List[str]] = {spec.name: [] for spec in self.servers}
+        for exposed, routes in self.routes.items():
+            for server, _ in routes:
+                tools[server].append(exposed)
+        stats: Dict[str, Any] = {}
+        for spec in self.servers:
+            session = self.sessions[spec.name]
+            stats[spec.name] = {
+                "url": spec.url,
+                "connected": session.connected,
+                "pending": spec.name in self._pending,
+                "tools": tools[spec.name],
+                "error": self.errors.get(spec.name),
+            }
+            if isinstance(session, BalancedMCPSession):
+                stats[spec.name]["replicas"] = session.stats()
+        return stats
+
+    async def close(self):
+        for task in list(self._pending.values()):
+            task.cancel()
+        await asyncio.gather(*(session.close() for session in self.sessions.values()), return_exceptions=True)
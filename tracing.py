@@ -0,0 +1,316 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+轻量的链路追踪和指标（OpenTelemetry 风格，不依赖额外的包）
+
+一轮对话变慢时，需要知道时间花在 LLM 请求、MCP 握手、call_tool 往返还是 get_weather 的上游请求上。
+1. tracer.span(name) 创建 span，同一个 asyncio 任务（及其创建的子任务）里嵌套的 span 自动成为子 span
+2. trace 上下文以 W3C traceparent 格式放在 MCP 请求的 _meta 里，从客户端传到 server，
+   server 端的 tool span 挂在客户端 call_tool span 之下
+3. 每个 span 结束时记录到 metrics（按名称统计耗时直方图和错误数），server 在 /metrics 暴露 Prometheus 文本格式
+4. 导出方式由环境变量决定，全部离线可用：
+       MCP_TRACE_EXPORTER=console   打印到标准错误
+       MCP_TRACE_EXPORTER=file      以 JSON Lines 追加到 MCP_TRACE_FILE（默认 traces.jsonl）
+       不设置                        不导出 span，只记录 metrics
+"""
+
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+_TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+# 耗时直方图的桶边界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Span:
+    """一次被追踪的操作"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start_time", "_start", "duration", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self) -> str:
+        """W3C traceparent 头的值"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str]]:
+    """解析 traceparent，返回 (trace_id, parent_span_id)，格式不对时返回 None"""
+    if not value:
+        return None
+    match = _TRACEPARENT_PATTERN.match(value.strip())
+    return (match.group(1), match.group(2)) if match else None
+
+
+def inject(meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """把当前 trace 上下文写入 MCP 请求的 _meta"""
+    meta = dict(meta or {})
+    span = current_span()
+    if span is not None:
+        meta["traceparent"] = span.traceparent
+    return meta
+
+
+class Metrics:
+    """
+    进程内的指标注册表：计数器、耗时直方图和仪表盘，输出 Prometheus 文本格式
+
+    label 以排好序的 (key, value) 元组保存，多线程下用锁保护
+    """
+
+    def __init__(self, prefix: str = "mcp", buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._histograms: Dict[str, Dict[Tuple, List[float]]] = {}  # [各桶计数..., sum, count]
+        self._gauges: Dict[str, Dict[Tuple, float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(labels: Optional[Dict[str, Any]]) -> Tuple:
+        return tuple(sorted((labels or {}).items()))
+
+    def inc(self, name: str, value: float = 1.0, labels: Optional[Dict[str, Any]] = None):
+        key = self._labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None):
+        key = self._labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            data = series.get(key)
+            if data is None:
+                data = series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def set_gauge(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            self._gauges.setdefault(name, {})[self._labels(labels)] = value
+
+    @staticmethod
+    def _format_labels(labels: Tuple, extra: Tuple = ()) -> str:
+        items = labels + extra
+        if not items:
+            return ""
+        body = ",".join(f'{k}="{str(v)}"' for k, v in items)
+        return "{" + body + "}"
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式"""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {full} counter")
+                lines.extend(f"{full}{self._format_labels(k)} {v:g}" for k, v in sorted(series.items()))
+            for name, series in sorted(self._gauges.items()):
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {full} gauge")
+                lines.extend(f"{full}{self._format_labels(k)} {v:g}" for k, v in sorted(series.items()))
+            for name, series in sorted(self._histograms.items()):
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {full} histogram")
+                for key, data in sorted(series.items()):
+                    for bound, count in zip(self.buckets, data):
+                        lines.append(f"{full}_bucket{self._format_labels(key, (('le', f'{bound:g}'),))} {count:g}")
+                    lines.append(f"{full}_bucket{self._format_labels(key, (('le', '+Inf'),))} {data[-1]:g}")
+                    lines.append(f"{full}_sum{self._format_labels(key)} {data[-2]:g}")
+                    lines.append(f"{full}_count{self._format_labels(key)} {data[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+
+class ConsoleExporter:
+    """把结束的 span 打印到标准错误"""
+
+    def export(self, span: Span):
+        parent = span.parent_id or "-"
+        status = f" error={span.error}" if span.error else ""
+        print(
+            f"[trace {span.trace_id[:8]} {span.span_id[:8]}<-{parent[:8]}] {span.name}"
+            f" {span.duration * 1000:.1f}ms {span.attributes}{status}",
+            file=sys.stderr,
+        )
+
+
+class FileExporter:
+    """把结束的 span 以 JSON Lines 追加到文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class Tracer:
+    """
+    创建 span 并在结束时导出、记录指标
+
+    使用示例：
+        with tracer.span("llm.completion", {"model": model}) as span:
+            ...
+            span.set_attribute("finish_reason", finish_reason)
+    """
+
+    def __init__(self, service_name: str = "mcp", exporter: Any = None, metrics: Optional[Metrics] = None):
+        self.service_name = service_name
+        self.exporter = exporter
+        self.metrics = metrics if metrics is not None else Metrics()
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        """根据环境变量创建 tracer"""
+        kind = os.getenv("MCP_TRACE_EXPORTER", "").lower()
+        exporter: Any = None
+        if kind == "console":
+            exporter = ConsoleExporter()
+        elif kind == "file":
+            exporter = FileExporter(os.getenv("MCP_TRACE_FILE", "traces.jsonl"))
+        return cls(os.getenv("MCP_SERVICE_NAME", "mcp"), exporter)
+
+    @contextlib.contextmanager
+    def span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = None,
+        traceparent: Optional[str] = None,
+    ) -> Iterator[Span]:
+        """
+        创建一个 span
+
+        Args:
+            name: span 名称
+            attributes: 附加属性
+            traceparent: 远端传来的 trace 上下文，传入时以它为父 span
+        """
+        remote = parse_traceparent(traceparent)
+        parent = current_span()
+        if remote is not None:
+            trace_id, parent_id = remote
+        elif parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            trace_id, parent_id = os.urandom(16).hex(), None
+        span = Span(name, trace_id, parent_id, dict(attributes or {}))
+        span.attributes.setdefault("service", self.service_name)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self._finish(span)
+
+    def _finish(self, span: Span):
+        span.duration = time.perf_counter() - span._start
+        labels = {"span": span.name}
+        self.metrics.observe("span_duration_seconds", span.duration, labels)
+        if span.error is not None:
+            self.metrics.inc("span_errors_total", labels=labels)
+        if self.exporter is not None:
+            try:
+                self.exporter.export(span)
+            except Exception as e:
+                print(f"[span 导出失败: {e}]", file=sys.stderr)
+
+
+# 进程内共享的默认 tracer
+tracer = Tracer.from_env()
+metrics = tracer.metrics
+
+
+def traced(name: str) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """把整个异步函数包在一个 span 里的装饰器"""
+
+    def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            with tracer.span(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _create_tracing_middleware_class() -> type:
+    # 聊天机器人也导入本模块，fastmcp 的导入需要约 0.6 秒，只在 server 端用到中间件时才加载
+    from fastmcp.server.middleware import Middleware, MiddlewareContext
+
+    class TracingMiddleware(Middleware):
+        """server 端中间件：每次工具调用一个 span，父 span 来自请求 _meta 中的 traceparent"""
+
+        async def on_call_tool(self, context: MiddlewareContext, call_next):
+            traceparent = None
+            if context.fastmcp_context is not None:
+                try:
+                    meta = context.fastmcp_context.request_context.meta
+                except ValueError:
+                    meta = None
+                traceparent = getattr(meta, "traceparent", None)
+            with tracer.span(f"tool.{context.message.name}", {"tool": context.message.name}, traceparent=traceparent):
+                return await call_next(context)
+
+    return TracingMiddleware
+
+
+def __getattr__(name: str) -> Any:
+    """from tracing import TracingMiddleware 时才创建中间件类"""
+    if name == "TracingMiddleware":
+        globals()[name] = _create_tracing_middleware_class()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,495 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+录制 / 回放聊天机器人的 LLM 和 MCP 工具流量
+
+process_query 的每次运行都依赖在线的 Kimi 接口和 wttr.in，延迟和回答每次都不同，
+客户端自身的开销（序列化、历史管理、工具调度）很难在可重复的条件下比较。
+1. 录制（TrafficRecorder）：包装 AsyncOpenAI 客户端和 MCP 会话，把每次 LLM 请求 / 回复
+   （流式回复逐个片段记录到达时间，包括 tool_calls 片段）和每次 call_tool / list_tools 写入 JSON Lines 日志，
+   路径以 .gz 结尾时用 gzip 压缩。请求只记录消息数、大小和摘要，不保存完整的消息列表
+2. 回放（TrafficReplay）：不连接网络，LLM 回复按录制顺序依次返回，工具结果按 (工具名, 参数) 匹配；
+   latency="original" 时按录制时的间隔返回（首片段等待、片段间隔、工具耗时），"zero" 时立即返回。
+   请求摘要与录制时不同说明客户端发出的请求变了（例如改了 system prompt 或历史处理），计入 mismatches，
+   strict=True 时直接报错
+两者的接口相同：wrap_llm() / wrap_session() 分别返回包装后的 LLM 客户端和 MCP 会话，
+MCPClient 的 traffic 参数接受其中任意一个。回放时不会创建真正的 LLM 客户端，也不会连接 MCP server。
+
+日志格式（每行一个 JSON 对象，k 为类型，t 为相对录制开始的秒数）：
+    {"k": "meta", "version": 1, "created": ...}
+    {"k": "tools", "t": ..., "latency": ..., "tools": [...]}
+    {"k": "llm", "t": ..., "req": {"model", "messages", "tools", "bytes", "digest"}, "query": ...,
+     "head": {...}, "chunks": [[间隔, choices], ...]}           # 流式，head 为各片段相同的 id / model 等字段
+    {"k": "llm", "t": ..., "req": {...}, "latency": ..., "response": {...}}   # 非流式
+    {"k": "tool", "t": ..., "name": ..., "args": {...}, "latency": ..., "content": [...], "structured": ..., "is_error": ...}
+出错的请求记录 "error": {"type", "message"}，回放时重新抛出。
+query 为用户的提问（只在一轮对话的第一次请求中记录），回放脚本据此重新提问。
+
+环境变量（均为可选，traffic_from_env）：
+    MCP_RECORD_TRAFFIC    录制日志的路径，设置后录制
+    MCP_REPLAY_TRAFFIC    回放日志的路径，设置后回放（优先于录制）
+    MCP_REPLAY_LATENCY    回放延迟，original（默认）或 zero
+"""
+
+import asyncio
+import functools
+import gzip
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from conversation_history import SUMMARY_PROMPT
+from mcp_session import is_connection_error
+
+if TYPE_CHECKING:
+    import mcp.types
+    from fastmcp.client.client import CallToolResult
+
+LOG_VERSION = 1
+LATENCY_MODES = ("original", "zero")
+
+
+class ReplayError(RuntimeError):
+    """回放日志里没有对应的录制，或录制时的请求本身出错"""
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _tool_key(name: str, arguments: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+    return name, json.dumps(arguments or {}, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def describe_request(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """LLM 请求的摘要：消息数、工具数、请求体大小和内容摘要（相同的请求得到相同的摘要）"""
+    body = json.dumps(
+        {"model": kwargs.get("model"), "messages": kwargs.get("messages"), "tools": kwargs.get("tools")},
+        ensure_ascii=False, sort_keys=True, default=str,
+    ).encode("utf-8")
+    return {
+        "model": kwargs.get("model"),
+        "messages": len(kwargs.get("messages") or []),
+        "tools": len(kwargs.get("tools") or []),
+        "bytes": len(body),
+        "digest": hashlib.sha1(body).hexdigest()[:16],
+    }
+
+
+def _last_query(messages: Optional[List[Dict[str, Any]]]) -> Optional[str]:
+    """一轮对话的第一次请求以用户提问结尾；压缩历史的摘要请求也以 user 消息结尾，但不是用户的提问"""
+    if not messages or messages[-1].get("role") != "user" or messages[0].get("content") == SUMMARY_PROMPT:
+        return None
+    return messages[-1].get("content")
+
+
+def _error(e: BaseException) -> Dict[str, Any]:
+    return {"type": type(e).__name__, "message": str(e), "connection": is_connection_error(e)}
+
+
+def _raise(error: Dict[str, Any]):
+    """按录制时的类型重新抛出：工具报错为 ToolError，连接错误为 ConnectionError（resilience 据此重试），其余为 ReplayError"""
+    if error.get("type") == "ToolError":
+        from fastmcp.exceptions import ToolError
+
+        raise ToolError(error["message"])
+    if error.get("connection"):
+        raise ConnectionError(error["message"])
+    raise ReplayError(f"{error['type']}: {error['message']}")
+
+
+@functools.lru_cache(maxsize=None)
+def _content_adapter() -> Any:
+    import mcp.types
+    from pydantic import TypeAdapter
+
+    return TypeAdapter(mcp.types.ContentBlock)
+
+
+class TrafficRecorder:
+    """
+    把 LLM 和 MCP 工具流量写入日志
+
+    使用示例：
+        recorder = TrafficRecorder("session.jsonl.gz")
+        client = MCPClient(url, traffic=recorder)
+        ...
+        recorder.close()
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = _open(path, "w")
+        self._start = time.perf_counter()
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.write({"k": "meta", "version": LOG_VERSION, "created": time.time()})
+
+    def now(self) -> float:
+        return round(time.perf_counter() - self._start, 4)
+
+    def write(self, entry: Dict[str, Any]):
+        self.counts[entry["k"]] += 1
+        self._file.write(_dumps(entry) + "\n")
+        self._file.flush()
+
+    def wrap_llm(self, create: Callable[[], Any]) -> "RecordingLLM":
+        """create 返回真正的 AsyncOpenAI 客户端"""
+        return RecordingLLM(create(), self)
+
+    def wrap_session(self, session: Any) -> "RecordingMCPSession":
+        return RecordingMCPSession(session, self)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": self.path, "entries": dict(self.counts)}
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class _RecordingStream:
+    """包装流式回复，逐个片段记录到达间隔，迭代结束时写入一条 llm 记录"""
+
+    def __init__(self, stream: Any, entry: Dict[str, Any], start: float, recorder: TrafficRecorder):
+        self._stream = stream
+        self._entry = entry
+        self._last = start
+        self._recorder = recorder
+        entry["chunks"] = []
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        chunks = self._entry["chunks"]
+        try:
+            async for chunk in self._stream:
+                now = time.perf_counter()
+                data = chunk.model_dump(exclude_unset=True)
+                choices = data.pop("choices", [])
+                head = self._entry.setdefault("head", data)
+                item = [round(now - self._last, 4), choices]
+                if data != head:
+                    item.append(data)
+                chunks.append(item)
+                self._last = now
+                yield chunk
+        except Exception as e:
+            self._entry["error"] = _error(e)
+            raise
+        finally:
+            self._recorder.write(self._entry)
+
+
+class RecordingLLM:
+    """与 AsyncOpenAI 相同的 chat.completions.create 接口，其余属性转给原客户端"""
+
+    # 录制需要完整的请求参数，不转给原客户端的 create_encoded，chat_completion 改走 chat.completions.create
+    create_encoded = None
+
+    def __init__(self, llm: Any, recorder: TrafficRecorder):
+        self._llm = llm
+        self.recorder = recorder
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._llm, name)
+
+    async def _create(self, **kwargs: Any) -> Any:
+        entry: Dict[str, Any] = {"k": "llm", "t": self.recorder.now(), "req": describe_request(kwargs)}
+        query = _last_query(kwargs.get("messages"))
+        if query is not None:
+            entry["query"] = query
+        start = time.perf_counter()
+        try:
+            response = await self._llm.chat.completions.create(**kwargs)
+        except Exception as e:
+            entry["latency"] = round(time.perf_counter() - start, 4)
+            entry["error"] = _error(e)
+            self.recorder.write(entry)
+            raise
+        if kwargs.get("stream"):
+            return _RecordingStream(response, entry, start, self.recorder)
+        entry["latency"] = round(time.perf_counter() - start, 4)
+        entry["response"] = response.model_dump(exclude_unset=True)
+        self.recorder.write(entry)
+        return response
+
+
+class RecordingMCPSession:
+    """与 PersistentMCPSession 接口相同，记录 list_tools / call_tool，其余属性转给原会话"""
+
+    def __init__(self, session: Any, recorder: TrafficRecorder):
+        self._session = session
+        self.recorder = recorder
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._session, name)
+
+    @property
+    def connect_count(self) -> int:
+        return self._session.connect_count
+
+    async def list_tools(self) -> List["mcp.types.Tool"]:
+        entry: Dict[str, Any] = {"k": "tools", "t": self.recorder.now()}
+        start = time.perf_counter()
+        try:
+            tools = await self._session.list_tools()
+        except Exception as e:
+            entry["error"] = _error(e)
+            raise
+        else:
+            entry["tools"] = [tool.model_dump(mode="json", exclude_none=True) for tool in tools]
+            return tools
+        finally:
+            entry["latency"] = round(time.perf_counter() - start, 4)
+            self.recorder.write(entry)
+
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> "CallToolResult":
+        entry: Dict[str, Any] = {"k": "tool", "t": self.recorder.now(), "name": tool_name, "args": arguments}
+        start = time.perf_counter()
+        try:
+            result = await self._session.call_tool(tool_name, arguments)
+        except Exception as e:
+            entry["error"] = _error(e)
+            raise
+        else:
+            entry["content"] = [block.model_dump(mode="json", exclude_none=True) for block in result.content]
+            entry["structured"] = result.structured_content
+            entry["is_error"] = result.is_error
+            return result
+        finally:
+            entry["latency"] = round(time.perf_counter() - start, 4)
+            self.recorder.write(entry)
+
+    async def close(self):
+        await self._session.close()
+
+
+def load_log(path: str) -> List[Dict[str, Any]]:
+    """读取录制日志"""
+    with _open(path, "r") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    if not entries or entries[0].get("k") != "meta":
+        raise ValueError(f"{path} 不是流量录制日志")
+    if entries[0].get("version") != LOG_VERSION:
+        raise ValueError(f"{path} 的日志版本 {entries[0].get('version')} 不受支持")
+    return entries
+
+
+class TrafficReplay:
+    """
+    回放录制的流量
+
+    使用示例：
+        replay = TrafficReplay("session.jsonl.gz", latency="zero")
+        client = MCPClient("replay", traffic=replay)
+        for query in replay.queries():
+            await client.process_query(query, await client.get_mcp_tools())
+        print(replay.stats())
+    """
+
+    def __init__(self, path: str, latency: str = "original", strict: bool = False):
+        """
+        Args:
+            path: 录制日志的路径
+            latency: "original" 按录制时的间隔返回，"zero" 立即返回
+            strict: 请求摘要与录制时不同时抛出 ReplayError，否则只计数
+        """
+        if latency not in LATENCY_MODES:
+            raise ValueError(f"latency 只能是 {' / '.join(LATENCY_MODES)}: {latency}")
+        self.path = path
+        self.latency = latency
+        self.strict = strict
+        self.entries = load_log(path)
+        self._reset()
+        self.llm = ReplayLLM(self)
+        self.mcp_session = ReplayMCPSession(self)
+
+    def _reset(self):
+        self._llm: Deque[Dict[str, Any]] = deque(e for e in self.entries if e["k"] == "llm")
+        self._tools: Deque[Dict[str, Any]] = deque(e for e in self.entries if e["k"] == "tools" and "tools" in e)
+        self._calls: Dict[Tuple[str, str], Deque[Dict[str, Any]]] = defaultdict(deque)
+        for entry in self.entries:
+            if entry["k"] == "tool":
+                self._calls[_tool_key(entry["name"], entry["args"])].append(entry)
+        self.llm_requests = 0
+        self.tool_calls = 0
+        self.mismatches = 0
+
+    def rewind(self):
+        """从头再回放一遍（例如基准测试重复多次）"""
+        self._reset()
+
+    def queries(self) -> List[str]:
+        """录制时用户依次提出的问题"""
+        return [entry["query"] for entry in self.entries if entry["k"] == "llm" and "query" in entry]
+
+    async def sleep(self, seconds: float):
+        if self.latency == "original" and seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def next_llm(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        if not self._llm:
+            raise ReplayError(f"录制的 {self.llm_requests} 次 LLM 请求已经回放完")
+        entry = self._llm.popleft()
+        self.llm_requests += 1
+        if describe_request(kwargs)["digest"] != entry["req"]["digest"]:
+            self.mismatches += 1
+            if self.strict:
+                raise ReplayError(f"第 {self.llm_requests} 次 LLM 请求与录制时不同")
+        return entry
+
+    def next_tools(self) -> Dict[str, Any]:
+        if not self._tools:
+            raise ReplayError("日志里没有录制到工具列表")
+        # 最后一次录制的工具列表保留，之后的 list_tools 都返回它
+        return self._tools.popleft() if len(self._tools) > 1 else self._tools[0]
+
+    def next_call(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        calls = self._calls.get(_tool_key(tool_name, arguments))
+        if not calls:
+            raise ReplayError(f"日志里没有 {tool_name}({arguments}) 的录制结果")
+        self.tool_calls += 1
+        return calls.popleft()
+
+    def wrap_llm(self, create: Callable[[], Any]) -> "ReplayLLM":
+        """返回回放的 LLM 客户端，不调用 create"""
+        return self.llm
+
+    def wrap_session(self, session: Any) -> "ReplayMCPSession":
+        """返回回放的 MCP 会话，session 不会被使用（没有连接过的会话不需要关闭）"""
+        return self.mcp_session
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "latency": self.latency,
+            "llm_requests": self.llm_requests,
+            "tool_calls": self.tool_calls,
+            "mismatches": self.mismatches,
+            "remaining_llm": len(self._llm),
+            "remaining_tool_calls": sum(len(calls) for calls in self._calls.values()),
+        }
+
+    def close(self):
+        pass
+
+
+class _ReplayStream:
+    """按录制的间隔逐个返回流式片段"""
+
+    def __init__(self, entry: Dict[str, Any], replay: TrafficReplay):
+        self._entry = entry
+        self._replay = replay
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        from openai.types.chat import ChatCompletionChunk
+
+        head = self._entry.get("head", {})
+        # 按相对请求开始的时间点等待，每次 sleep 多睡的部分不会在几百个片段上累积
+        loop = asyncio.get_running_loop()
+        due = loop.time()
+        for item in self._entry["chunks"]:
+            due += item[0]
+            await self._replay.sleep(due - loop.time())
+            data = {**head, **item[2]} if len(item) > 2 else dict(head)
+            data["choices"] = item[1]
+            # 与 openai SDK 解析响应的方式相同：构造对象但不做校验
+            yield ChatCompletionChunk.construct(**data)
+        if "error" in self._entry:
+            _raise(self._entry["error"])
+
+    async def close(self):
+        pass
+
+
+class ReplayLLM:
+    """与 AsyncOpenAI 相同的 chat.completions.create 接口，按录制顺序返回回复"""
+
+    def __init__(self, replay: TrafficReplay):
+        self.replay = replay
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs: Any) -> Any:
+        entry = self.replay.next_llm(kwargs)
+        if "error" in entry and "chunks" not in entry:
+            # 请求在收到回复之前就失败了
+            await self.replay.sleep(entry.get("latency", 0))
+            _raise(entry["error"])
+        if "chunks" in entry:
+            if not kwargs.get("stream"):
+                raise ReplayError("录制时是流式请求，回放时不是")
+            return _ReplayStream(entry, self.replay)
+        if kwargs.get("stream"):
+            raise ReplayError("录制时是非流式请求，回放时是流式")
+        await self.replay.sleep(entry.get("latency", 0))
+        from openai.types.chat import ChatCompletion
+
+        return ChatCompletion.construct(**entry["response"])
+
+
+class ReplayMCPSession:
+    """与 PersistentMCPSession 接口相同，工具列表和调用结果来自录制日志"""
+
+    connect_count = 1
+
+    def __init__(self, replay: TrafficReplay):
+        self.replay = replay
+
+    async def list_tools(self) -> List["mcp.types.Tool"]:
+        import mcp.types
+
+        entry = self.replay.next_tools()
+        await self.replay.sleep(entry.get("latency", 0))
+        return [mcp.types.Tool.model_validate(tool) for tool in entry["tools"]]
+
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> "CallToolResult":
+        from fastmcp.client.client import CallToolResult
+
+        entry = self.replay.next_call(tool_name, arguments)
+        await self.replay.sleep(entry.get("latency", 0))
+        if "error" in entry:
+            _raise(entry["error"])
+        adapter = _content_adapter()
+        return CallToolResult(
+            content=[adapter.validate_python(block) for block in entry["content"]],
+            structured_content=entry.get("structured"),
+            is_error=entry.get("is_error", False),
+        )
+
+    async def ping(self) -> bool:
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return self.replay.stats()
+
+    async def close(self):
+        pass
+
+
+def traffic_from_env() -> Optional[Union[TrafficRecorder, TrafficReplay]]:
+    """根据环境变量创建录制器或回放器，都没有设置时返回 None"""
+    replay_path = os.getenv("MCP_REPLAY_TRAFFIC")
+    if replay_path:
+        return TrafficReplay(replay_path, latency=os.getenv("MCP_REPLAY_LATENCY", "original"))
+    record_path = os.getenv("MCP_RECORD_TRAFFIC")
+    if record_path:
+        return TrafficRecorder(record_path)
+    return None
@@ -0,0 +1,173 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+进程内的 TTL + LRU 缓存
+
+特点：
+1. 每个条目带过期时间，过期后视为未命中
+2. 同时限制条目数和总字节数，超出时按最久未使用的顺序淘汰
+3. get_or_load() 合并并发未命中：同一个 key 同时有 N 个请求时只执行一次加载（每个事件循环各自合并）
+4. 记录 hit / miss / eviction 等计数，方便观察命中率
+5. 可以被不同线程里的多个事件循环共用，条目的读写由锁保护
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+def default_sizeof(value: Any) -> int:
+    """估算缓存值占用的字节数"""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class TTLCache:
+    """
+    带 TTL 的 LRU 缓存
+
+    使用示例：
+        cache = TTLCache(ttl=300, max_entries=1024, max_bytes=16 * 1024 * 1024)
+        text = await cache.get_or_load("北京", lambda: fetch("北京"))
+        print(cache.stats())
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        max_entries: int = 1024,
+        max_bytes: int = 16 * 1024 * 1024,
+        sizeof: Callable[[Any], int] = default_sizeof,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        初始化缓存
+
+        Args:
+            ttl: 条目存活时间（秒），<= 0 表示不缓存
+            max_entries: 最大条目数
+            max_bytes: 所有条目的总字节数上限
+            sizeof: 计算单个值字节数的函数
+            clock: 时间函数，默认 time.monotonic
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.clock = clock
+        # key -> (过期时间, 值, 字节数)，顺序即 LRU 顺序，末尾为最近使用
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, int]]" = OrderedDict()
+        # (事件循环, key) -> 正在加载的任务；任务只能在创建它的循环里等待，不同循环的未命中各自加载
+        self._inflight: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        查询缓存
+
+        Returns:
+            (是否命中, 值)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            expires_at, value, _ = entry
+            if expires_at <= self.clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def set(self, key: Hashable, value: Any):
+        """写入缓存，必要时淘汰最久未使用的条目"""
+        if not self.enabled:
+            return
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            # 单个值就超过上限，直接不缓存
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self.clock() + self.ttl, value, size)
+            self.total_bytes += size
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        命中则直接返回，否则调用 loader 加载并写入缓存
+
+        同一个 key 的并发未命中只会触发一次 loader，其他请求等待同一个结果；
+        loader 抛出的异常会传给所有等待者，且不会被缓存。
+        """
+        hit, value = self.get(key)
+        if hit:
+            return value
+
+        inflight_key = (asyncio.get_running_loop(), key)
+        task = self._inflight.get(inflight_key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(loader())
+            self._inflight[inflight_key] = task
+            task.add_done_callback(lambda t: self._on_loaded(inflight_key, t))
+        # shield: 单个调用方被取消时不影响其他等待同一结果的调用方
+        return await asyncio.shield(task)
+
+    def _on_loaded(self, inflight_key: Tuple[asyncio.AbstractEventLoop, Hashable], task: asyncio.Task):
+        self._inflight.pop(inflight_key, None)
+        if task.cancelled():
+            return
+        if task.exception() is None:
+            self.set(inflight_key[1], task.result())
+
+    def _remove(self, key: Hashable):
+        _, _, size = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存的统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "coalesced": self.coalesced,
+        }
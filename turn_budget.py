@@ -0,0 +1,160 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+单轮对话的迭代 / 时间 / token 预算，以及同一轮内重复工具调用的去重
+
+process_query 原先是 while True：模型一直请求工具时，一轮对话的延迟和 token 都没有上限。
+1. TurnBudget: 每轮最多 max_iterations 次带工具的 LLM 请求、max_seconds 秒、max_tokens 个（估算的）token，
+   每次请求 LLM 之前检查；进行中的 LLM 请求和工具调用也只能用掉剩下的时间（remaining()），到期即中断
+2. 预算用完时不再提供工具，追加 force_answer_message() 要求模型根据已有的工具结果直接回答，
+   这一次收尾请求不受预算限制，保证每轮都有回答
+3. TurnToolMemo: 同一轮内工具名和参数都相同的调用只执行一次，之后的调用复用结果，并提示模型不要再重复；
+   并发模式下同时发出的相同调用共享同一次执行，其中一个超时不会影响其他还在等待的调用。失败的调用不复用，之后可以重试
+
+TurnBudget.from_env() 读取的环境变量（均为可选）：
+    MCP_MAX_ITERATIONS      每轮最多的工具调用轮数，默认 8
+    MCP_TURN_TIMEOUT        每轮的时间预算（秒），默认 120
+    MCP_TURN_TOKEN_BUDGET   每轮的 token 预算（prompt + 回复的估算值），默认不限制
+"""
+
+import asyncio
+import os
+from typing import Any, Dict, Optional
+
+from response_cache import canonical_arguments
+from tool_dispatch import ToolCaller
+
+# 预算用完的原因 -> 提示模型时的说法
+BUDGET_REASONS = {"iterations": "工具调用轮数", "time": "时间", "tokens": "token"}
+
+
+class TurnBudget:
+    """
+    单轮对话的预算，不保存状态，可以在多个对话间共享
+
+    使用示例：
+        budget = TurnBudget(max_iterations=5, max_seconds=30)
+        reason = budget.exhausted(iterations=5, elapsed=3.2, tokens=1800)  # "iterations"
+    """
+
+    def __init__(
+        self,
+        max_iterations: Optional[int] = 8,
+        max_seconds: Optional[float] = 120.0,
+        max_tokens: Optional[int] = None,
+    ):
+        """
+        Args:
+            max_iterations: 每轮最多的带工具 LLM 请求次数，None 表示不限制
+            max_seconds: 每轮的时间预算（秒），None 表示不限制
+            max_tokens: 每轮所有 LLM 请求的估算 token 总数（含下一次请求的 prompt），None 表示不限制
+        """
+        self.max_iterations = max_iterations
+        self.max_seconds = max_seconds
+        self.max_tokens = max_tokens
+
+    @classmethod
+    def from_env(cls) -> "TurnBudget":
+        """根据环境变量创建预算"""
+        max_tokens = os.getenv("MCP_TURN_TOKEN_BUDGET")
+        return cls(
+            max_iterations=int(os.getenv("MCP_MAX_ITERATIONS") or 8),
+            max_seconds=float(os.getenv("MCP_TURN_TIMEOUT") or 120),
+            max_tokens=int(max_tokens) if max_tokens else None,
+        )
+
+    def exhausted(self, iterations: int, elapsed: float, tokens: int) -> Optional[str]:
+        """
+        检查下一次带工具的 LLM 请求是否超出预算
+
+        Args:
+            iterations: 本轮已经完成的带工具 LLM 请求次数
+            elapsed: 本轮已经过的时间（秒）
+            tokens: 本轮已用的 token 加上下一次请求的 prompt token
+
+        Returns:
+            超出时返回原因（BUDGET_REASONS 的 key），否则返回 None
+        """
+        if self.max_iterations is not None and iterations >= self.max_iterations:
+            return "iterations"
+        if self.max_seconds is not None and elapsed >= self.max_seconds:
+            return "time"
+        if self.max_tokens is not None and tokens > self.max_tokens:
+            return "tokens"
+        return None
+
+    def remaining(self, elapsed: float) -> Optional[float]:
+        """本轮还剩的时间（秒），用作进行中的 LLM 请求和工具调用的超时；不限制时间时返回 None"""
+        if self.max_seconds is None:
+            return None
+        return max(0.0, self.max_seconds - elapsed)
+
+
+def force_answer_message(reason: str) -> Dict[str, Any]:
+    """预算用完时追加的系统消息，要求模型不再调用工具、直接给出回答"""
+    return {
+        "role": "system",
+        "content": (
+            f"本轮的{BUDGET_REASONS.get(reason, reason)}预算已经用完，不能再调用工具。"
+            "请根据已经获得的工具结果直接给出最终回答，并说明哪些部分没有完成。"
+        ),
+    }
+
+
+class TurnToolMemo:
+    """
+    一轮对话内的工具调用去重，每轮新建一个
+
+    使用示例：
+        memo = TurnToolMemo(self.call_tool)
+        tool_messages = await dispatch_tool_calls(tool_calls, memo.call)
+        print(memo.calls, memo.deduped)
+    """
+
+    def __init__(self, call_tool: ToolCaller):
+        self._call_tool = call_tool
+        self._results: Dict[str, "asyncio.Task[str]"] = {}
+        self._waiters: Dict["asyncio.Task[str]", int] = {}  # 每次共享执行还在等待的调用方数量
+        self.calls = 0  # 模型请求的工具调用次数（含重复的）
+        self.deduped = 0  # 复用结果、没有实际执行的次数
+
+    async def call(self, tool_name: str, arguments: Dict[str, Any]) -> str:
+        """与 call_tool 相同的签名，重复的调用返回第一次的结果"""
+        self.calls += 1
+        key = f"{tool_name}:{canonical_arguments(arguments)}"
+        task = self._results.get(key)
+        if task is not None:
+            self.deduped += 1
+            print(f"[重复的工具调用，复用本轮结果: {tool_name}，参数: {arguments}]")
+            result = await self._wait(task)
+            return f"{result}\n（本轮已经用相同参数调用过 {tool_name}，结果相同，不需要再次调用）"
+        task = asyncio.ensure_future(self._call_tool(tool_name, arguments))
+        self._results[key] = task
+        task.add_done_callback(lambda done: self._forget_failure(key, done))
+        return await self._wait(task)
+
+    async def _wait(self, task: "asyncio.Task[str]") -> str:
+        """
+        等待共享的执行
+
+        第一个调用方和重复的调用方都通过 shield 等待：某个调用方超时（run_tool_call 的 wait_for 取消它）
+        不会取消其他调用方还在等待的执行，最后一个调用方放弃时才取消这次执行。
+        执行本身被取消时按超时处理，由 run_tool_call 变成这一个调用的错误消息，而不是让 CancelledError 中断整轮
+        """
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                raise asyncio.TimeoutError() from None
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    task.cancel()
+
+    def _forget_failure(self, key: str, task: "asyncio.Task[str]"):
+        if (task.cancelled() or task.exception() is not None) and self._results.get(key) is task:
+            del self._results[key]
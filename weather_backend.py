@@ -0,0 +1,392 @@
+"""
+conda env mcp_env ,Python版本 3.10.18
+
+异步天气后端 - 供各个 FastMCP server 的 get_weather 工具共享使用
+
+原先的 get_weather 在同步工具里直接调用 requests.get，而且没有超时，
+一次慢的 wttr.in 响应就会卡住整个 FastMCP 事件循环，其他会话的 BMI、时间查询也只能排队。
+这里改用 httpx.AsyncClient：
+1. 每个事件循环共享一个 keep-alive 连接池，所有工具调用复用连接。创建连接池（加载 CA 证书、构造 SSL 上下文，
+   约 100ms 的同步开销）放在线程里，由 warm_up() 在 MCP 会话开始时提前进行，不占用第一次 get_weather 的时间
+2. 分别设置连接超时和读取超时
+3. 用信号量限制每个事件循环同时打到上游的请求数
+4. TTL + LRU 结果缓存，key 为归一化后的城市，并发未命中合并为一次上游请求
+5. 整体截止时间、带抖动的重试（连接失败、超时、5xx、429）、熔断器和可选的对冲请求（resilience.py），
+   wttr.in 不可用时快速失败，而不是让每个 get_weather 都等满超时
+6. 请求 wttr.in 的 JSON 格式（format=j1），只保留模型需要的字段，
+   返回一行文本，例如 "北京 2025-07-15：晴，18~30°C，降水概率 10%；当前 25°C，体感 26°C，湿度 40%，东北风 10km/h"。
+   原先返回的 ANSI 彩色文本有上万字节，全部作为工具结果发给 LLM
+
+可通过环境变量调整（均为可选）：
+    WTTR_ENDPOINT             上游地址，默认 https://wttr.in
+    WTTR_CONNECT_TIMEOUT      连接超时（秒），默认 3
+    WTTR_READ_TIMEOUT         读取超时（秒），默认 10
+    WTTR_MAX_CONNECTIONS      连接池最大连接数，默认 20
+    WTTR_MAX_IN_FLIGHT        同时进行的上游请求上限，默认 10
+    WTTR_CACHE_TTL            缓存有效期（秒），默认 300，设为 0 关闭缓存
+    WTTR_CACHE_MAX_ENTRIES    缓存最大条目数，默认 1024
+    WTTR_CACHE_MAX_BYTES      缓存最大字节数，默认 16MB
+    WTTR_LANG                 天气描述的语言，默认 zh
+    WTTR_DEADLINE             一次查询（含重试）的截止时间（秒），默认 15
+    WTTR_RETRIES              失败后的重试次数，默认 2
+    WTTR_HEDGE_AFTER          请求超过该时间（秒）未返回时再发一个对冲请求，默认不对冲
+    WTTR_BREAKER_THRESHOLD    连续失败多少次后熔断，默认 5
+    WTTR_BREAKER_RESET        熔断持续时间（秒），默认 30
+"""
+
+import asyncio
+import json
+import os
+import re
+import threading
+import weakref
+from datetime import date as date_cls, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from resilience import CircuitBreaker, RetryPolicy, call_resilient
+from tracing import tracer
+from ttl_cache import TTLCache
+
+# 相对日期描述 -> 相对今天的天数偏移
+RELATIVE_DATES = {
+    "今天": 0, "今日": 0, "today": 0,
+    "明天": 1, "明日": 1, "tomorrow": 1,
+    "后天": 2,
+    "昨天": -1, "yesterday": -1,
+}
+
+_DATE_PATTERN = re.compile(r"^(\d{4})[.\-/年](\d{1,2})[.\-/月](\d{1,2})日?$")
+_ANSI_PATTERN = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+
+# 上游没有返回 JSON 时，原始文本最多保留的字符数
+MAX_RAW_CHARS = 500
+
+# 16 方位风向 -> 中文
+WIND_DIRECTIONS = {
+    "N": "北", "NNE": "北东北", "NE": "东北", "ENE": "东东北",
+    "E": "东", "ESE": "东东南", "SE": "东南", "SSE": "南东南",
+    "S": "南", "SSW": "南西南", "SW": "西南", "WSW": "西西南",
+    "W": "西", "WNW": "西西北", "NW": "西北", "NNW": "北西北",
+}
+
+
+def normalize_weather_key(city: str, date: str, today: Optional[date_cls] = None) -> Tuple[str, str]:
+    """
+    归一化城市和日期
+
+    缓存 key 只用归一化后的城市（wttr.in 一次返回该城市近几天的预报），日期用来从缓存的摘要中选出对应的那一天。
+
+    - 城市去除首尾空白并 casefold，"London" 和 "london " 视为同一城市
+    - "今天"/"明天" 等相对日期换算成绝对日期，"2023.10.27"、"2023-10-27" 等写法统一为 ISO 格式
+    - 无法识别的日期描述原样保留（去空白并 casefold）
+
+    Args:
+        city: 城市名称
+        date: 日期描述
+        today: 计算相对日期时使用的"今天"，默认取系统当前日期
+
+    Returns:
+        (归一化城市, 归一化日期)
+    """
+    city_key = city.strip().casefold()
+    date_text = date.strip().casefold()
+    today = today or date_cls.today()
+
+    if date_text in RELATIVE_DATES:
+        return city_key, (today + timedelta(days=RELATIVE_DATES[date_text])).isoformat()
+
+    match = _DATE_PATTERN.match(date_text)
+    if match:
+        try:
+            year, month, day = (int(part) for part in match.groups())
+            return city_key, date_cls(year, month, day).isoformat()
+        except ValueError:
+            pass
+    return city_key, date_text
+
+
+def _description(entry: Dict[str, Any], lang: str) -> str:
+    """取天气描述，优先使用 lang_xx 字段里的本地化文本"""
+    for field in (f"lang_{lang}", "weatherDesc"):
+        values = entry.get(field) or []
+        if values and values[0].get("value"):
+            return values[0]["value"].strip()
+    return ""
+
+
+def parse_wttr_json(data: Dict[str, Any], lang: str = "zh") -> Dict[str, Any]:
+    """
+    把 wttr.in format=j1 的响应（几十 KB，含逐小时数据）精简为模型需要的字段
+
+    Returns:
+        {"area": 地名, "current": {...}, "days": {ISO 日期: {...}}}
+    """
+    if not isinstance(data, dict):
+        raise ValueError("不是 wttr.in 的 JSON 格式")
+    current = (data.get("current_condition") or [{}])[0]
+    areas = data.get("nearest_area") or []
+    area = ""
+    if areas:
+        area = ((areas[0].get("areaName") or [{}])[0].get("value") or "").strip()
+
+    days: Dict[str, Dict[str, Any]] = {}
+    for day in data.get("weather") or []:
+        hourly: List[Dict[str, Any]] = day.get("hourly") or []
+        # 8 个三小时时段，取中午的描述代表全天
+        noon = hourly[len(hourly) // 2] if hourly else {}
+        days[day.get("date", "")] = {
+            "desc": _description(noon, lang),
+            "min_c": day.get("mintempC"),
+            "max_c": day.get("maxtempC"),
+            "rain_chance": max((int(h.get("chanceofrain") or 0) for h in hourly), default=None),
+        }
+    return {
+        "area": area,
+        "current": {
+            "desc": _description(current, lang),
+            "temp_c": current.get("temp_C"),
+            "feels_like_c": current.get("FeelsLikeC"),
+            "humidity": current.get("humidity"),
+            "wind_dir": current.get("winddir16Point"),
+            "wind_kmph": current.get("windspeedKmph"),
+        },
+        "days": days,
+    }
+
+
+def format_weather(city: str, date_key: str, summary: Dict[str, Any]) -> str:
+    """
+    把 parse_wttr_json() 的结果格式化为一行文本
+
+    Args:
+        city: 用户传入的城市名称
+        date_key: 归一化后的日期
+        summary: parse_wttr_json() 的结果
+    """
+    parts = []
+    day = summary["days"].get(date_key)
+    if day is not None:
+        text = f"{city} {date_key}：{day['desc']}，{day['min_c']}~{day['max_c']}°C"
+        if day["rain_chance"] is not None:
+            text += f"，降水概率 {day['rain_chance']}%"
+        parts.append(text)
+    elif summary["days"]:
+        available = sorted(summary["days"])
+        parts.append(f"{city} 没有 {date_key} 的预报（可查询 {available[0]} 至 {available[-1]}）")
+    current = summary["current"]
+    wind = WIND_DIRECTIONS.get(current["wind_dir"] or "", current["wind_dir"] or "")
+    parts.append(
+        f"当前 {current['desc']} {current['temp_c']}°C，体感 {current['feels_like_c']}°C，"
+        f"湿度 {current['humidity']}%，{wind}风 {current['wind_kmph']}km/h"
+    )
+    return "；".join(parts)
+
+
+def compact_raw_text(text: str, limit: int = MAX_RAW_CHARS) -> str:
+    """上游返回非 JSON 时的兜底：去掉 ANSI 颜色码、合并空白并截断"""
+    text = " ".join(_ANSI_PATTERN.sub("", text).split())
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def is_retryable_upstream_error(error: BaseException) -> bool:
+    """连接失败、超时、5xx 和 429 可以重试；其他 4xx（例如城市不存在）重试也没有用"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return isinstance(error, httpx.TransportError)
+
+
+class _LoopResources:
+    """一个事件循环上的连接池和并发上限，它们都只能在创建它们的循环里使用"""
+
+    def __init__(self, max_in_flight: int):
+        self.client: Optional[httpx.AsyncClient] = None
+        self.creating: Optional["asyncio.Future[httpx.AsyncClient]"] = None  # 正在线程里创建的连接池
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+
+
+class WeatherBackend:
+    """
+    共享连接池的异步天气查询后端
+
+    使用示例：
+        backend = WeatherBackend()
+        text = await backend.fetch("北京", "今天")
+        await backend.aclose()
+    """
+
+    def __init__(
+        self,
+        endpoint: str = "https://wttr.in",
+        connect_timeout: float = 3.0,
+        read_timeout: float = 10.0,
+        max_connections: int = 20,
+        max_in_flight: int = 10,
+        cache: Optional[TTLCache] = None,
+        lang: str = "zh",
+        deadline: Optional[float] = 15.0,
+        retry: Optional[RetryPolicy] = None,
+        hedge_after: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        """
+        初始化天气后端
+
+        Args:
+            endpoint: 上游天气服务地址
+            connect_timeout: 建立连接的超时时间（秒）
+            read_timeout: 等待响应数据的超时时间（秒）
+            max_connections: 连接池最大连接数
+            max_in_flight: 每个事件循环同时进行的上游请求上限，超出的请求在本地排队
+            cache: 结果缓存，默认使用 5 分钟 TTL 的 TTLCache
+            lang: 天气描述的语言（wttr.in 的 lang 参数）
+            deadline: 一次查询（含所有重试）的截止时间（秒），None 表示不限制
+            retry: 重试策略，默认最多 3 次尝试
+            hedge_after: 对冲等待时间（秒），None 表示不对冲
+            breaker: 熔断器，默认连续 5 次失败后熔断 30 秒
+        """
+        self.endpoint = endpoint.rstrip("/")
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+        self.max_in_flight = max_in_flight
+        # 按事件循环分开的连接池和信号量。同一进程里可能同时有多个事件循环在使用这个后端
+        # （例如不同线程里的多个 server），各用各的，互不关闭对方还在使用的连接。
+        # 循环结束并被回收后条目自动消失，连接池随之丢弃：asyncio 的 transport 被垃圾回收时会关闭自己的 socket
+        self._resources: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopResources]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._resources_lock = threading.Lock()
+        self.cache = cache if cache is not None else TTLCache()
+        self.lang = lang
+        self.deadline = deadline
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.hedge_after = hedge_after
+        self.breaker = breaker if breaker is not None else CircuitBreaker("wttr")
+
+    @classmethod
+    def from_env(cls) -> "WeatherBackend":
+        """根据环境变量创建后端实例"""
+        return cls(
+            endpoint=os.getenv("WTTR_ENDPOINT", "https://wttr.in"),
+            connect_timeout=float(os.getenv("WTTR_CONNECT_TIMEOUT", "3")),
+            read_timeout=float(os.getenv("WTTR_READ_TIMEOUT", "10")),
+            max_connections=int(os.getenv("WTTR_MAX_CONNECTIONS", "20")),
+            max_in_flight=int(os.getenv("WTTR_MAX_IN_FLIGHT", "10")),
+            cache=TTLCache(
+                ttl=float(os.getenv("WTTR_CACHE_TTL", "300")),
+                max_entries=int(os.getenv("WTTR_CACHE_MAX_ENTRIES", "1024")),
+                max_bytes=int(os.getenv("WTTR_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+            ),
+            lang=os.getenv("WTTR_LANG", "zh"),
+            deadline=float(os.getenv("WTTR_DEADLINE", "15")),
+            retry=RetryPolicy(attempts=int(os.getenv("WTTR_RETRIES", "2")) + 1),
+            hedge_after=float(os.getenv("WTTR_HEDGE_AFTER")) if os.getenv("WTTR_HEDGE_AFTER") else None,
+            breaker=CircuitBreaker(
+                "wttr",
+                failure_threshold=int(os.getenv("WTTR_BREAKER_THRESHOLD", "5")),
+                reset_timeout=float(os.getenv("WTTR_BREAKER_RESET", "30")),
+            ),
+        )
+
+    def _new_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+
+    def warm_up(self):
+        """在线程里开始创建当前事件循环的连接池（已经创建或正在创建时什么也不做），不等待完成；需要在事件循环里调用"""
+        resources = self._loop_resources()
+        if (resources.client is None or resources.client.is_closed) and resources.creating is None:
+            resources.creating = asyncio.ensure_future(asyncio.to_thread(self._new_client))
+            # 创建失败时由下一次 get_client() 重试并抛出，这里只取走异常，避免"exception was never retrieved"
+            resources.creating.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+    async def get_client(self) -> httpx.AsyncClient:
+        """当前事件循环共享的 AsyncClient，第一次使用时创建，并发的第一次调用共用同一次创建"""
+        resources = self._loop_resources()
+        if resources.client is None or resources.client.is_closed:
+            self.warm_up()
+            creating = resources.creating
+            try:
+                # shield: 某个调用被取消时不取消其他调用还在等待的创建
+                client = await asyncio.shield(creating)
+            finally:
+                if resources.creating is creating and creating.done():
+                    resources.creating = None
+            if resources.client is None or resources.client.is_closed:
+                resources.client = client
+        return resources.client
+
+    def _loop_resources(self) -> _LoopResources:
+        loop = asyncio.get_running_loop()
+        resources = self._resources.get(loop)
+        if resources is None:
+            with self._resources_lock:
+                resources = self._resources.get(loop)
+                if resources is None:
+                    resources = self._resources[loop] = _LoopResources(self.max_in_flight)
+        return resources
+
+    async def fetch(self, city: str, date: str) -> str:
+        """
+        查询指定城市的天气
+
+        Args:
+            city: 城市名称
+            date: 日期描述，wttr.in 提供今天起 3 天的预报
+
+        Returns:
+            一行天气摘要；上游返回的不是 JSON 时，返回精简后的原始文本
+        """
+        city_key, date_key = normalize_weather_key(city, date)
+        # wttr.in 一次返回该城市近几天的数据，缓存按城市存放，"今天"和"明天"共用一次上游请求
+        cached = await self.cache.get_or_load(city_key, lambda: self._fetch_upstream(city_key))
+        summary = json.loads(cached)
+        if "raw" in summary:
+            return summary["raw"]
+        return format_weather(city.strip(), date_key, summary)
+
+    async def _fetch_upstream(self, city: str) -> str:
+        """请求上游，返回精简后的 JSON 摘要（缓存中存放的就是它）"""
+        response = await call_resilient(
+            lambda: self._request(city),
+            deadline=self.deadline,
+            retry=self.retry,
+            retryable=is_retryable_upstream_error,
+            breaker=self.breaker,
+            hedge_after=self.hedge_after,
+        )
+        try:
+            summary = parse_wttr_json(response.json(), self.lang)
+        except ValueError:
+            summary = {"raw": compact_raw_text(response.text)}
+        return json.dumps(summary, ensure_ascii=False, separators=(",", ":"))
+
+    async def _request(self, city: str) -> httpx.Response:
+        """发出一次上游请求，非 2xx 响应抛出 HTTPStatusError"""
+        with tracer.span("wttr.request", {"city": city}) as span:
+            client = await self.get_client()
+            async with self._loop_resources().semaphore:
+                response = await client.get(
+                    f"{self.endpoint}/{city}", params={"format": "j1", "lang": self.lang}
+                )
+            span.set_attribute("status_code", response.status_code)
+            span.set_attribute("response_bytes", len(response.content))
+            response.raise_for_status()
+        return response
+
+    def stats(self) -> dict:
+        """返回缓存命中/未命中/淘汰等统计"""
+        return self.cache.stats()
+
+    async def aclose(self):
+        """关闭当前事件循环的连接池"""
+        resources = self._resources.pop(asyncio.get_running_loop(), None)
+        if resources is not None and resources.client is not None:
+            await resources.client.aclose()
+
+
+# 进程内共享的默认实例，各个 server 的 get_weather 直接使用它
+weather_backend = WeatherBackend.from_env()